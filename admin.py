@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Administrador de Usuarios + Estadísticas
+# =========================================================
+
+import re
+import time
+
+import pandas as pd
+import streamlit as st
+
+from attempt_stats import ADMIN_STATS_BACKEND, facet_kpis, read_rollup, rebuild_rollup
+from attempt_writer import get_attempt_writer
+from ia_cache import cache_stats
+from ia_ratelimit import get_rate_limiter
+from ia_router import get_router
+from progress_writer import get_progress_writer
+from storage import bulk_create_users, create_user, delete_user, get_startup_report, update_user, validate_new_user
+from tagged_cache import cache_tag_stats, invalidate, tagged_cache
+
+# ===========================
+# Módulo: Administrador de Usuarios (Mongo) + Estadísticas
+# ===========================
+
+USERS_PAGE_SIZE = 25
+PICKER_LIMIT = 20
+
+
+def _users_filter(prefix: str, role: str | None) -> dict:
+    # Prefijo anclado (^...) sobre username: Mongo lo resuelve con el índice
+    q = {}
+    if prefix:
+        q["username"] = {"$regex": "^" + re.escape(prefix.strip().lower())}
+    if role:
+        q["role"] = role
+    return q
+
+
+@tagged_cache("users", ttl=15)
+def get_users_page(_users_col, prefix: str = "", role: str | None = None, after: str | None = None,
+                   limit: int = USERS_PAGE_SIZE):
+    """
+    Una página de usuarios ordenada por username, paginando por cursor
+    (username > after) en lugar de skip. Devuelve (filas, hay_siguiente).
+    """
+    q = _users_filter(prefix, role)
+    if after is not None:
+        q.setdefault("username", {})["$gt"] = after
+    rows = list(_users_col.find(q, {"_id": 0, "username": 1, "role": 1, "created_at": 1})
+                .sort("username", 1).limit(limit + 1))
+    return rows[:limit], len(rows) > limit
+
+
+@tagged_cache("users", ttl=15)
+def search_usernames(_users_col, prefix: str, limit: int = PICKER_LIMIT):
+    # _users_col no se hashea: la clave usa su full_name (ver tagged_cache)
+    q = _users_filter(prefix, None)
+    return [u["username"] for u in _users_col.find(q, {"username": 1, "_id": 0}).sort("username", 1).limit(limit)]
+
+
+def user_picker(users_col, label: str, key: str):
+    """Búsqueda por prefijo + selectbox con las primeras coincidencias (no toda la lista)."""
+    prefix = st.text_input(f"Buscar usuario a {label} (prefijo)", key=f"{key}_q")
+    usernames = search_usernames(users_col, prefix)
+    if not usernames:
+        st.info("No hay usuarios que coincidan." if prefix else "No hay usuarios.")
+        return None
+    if len(usernames) == PICKER_LIMIT:
+        st.caption(f"Mostrando los primeros {PICKER_LIMIT}; escribe más letras para acotar.")
+    return st.selectbox(f"Selecciona el usuario a {label}", usernames, key=f"{key}_select")
+
+
+def users_table(users_col):
+    """Tabla paginada con búsqueda por prefijo y filtro de rol (todo en Mongo)."""
+    f1, f2 = st.columns([2, 1])
+    prefix = f1.text_input("Buscar por usuario (prefijo)", key="admin_users_q")
+    rol_opt = f2.selectbox("Rol", ["Todos", "user", "admin"], key="admin_users_role")
+    role = None if rol_opt == "Todos" else rol_opt
+
+    # Pila de cursores: inicio de cada página visitada; se reinicia si cambia el filtro
+    filtro = (prefix.strip().lower(), role)
+    if st.session_state.get("admin_users_filter") != filtro:
+        st.session_state["admin_users_filter"] = filtro
+        st.session_state["admin_users_cursors"] = [None]
+    cursores = st.session_state["admin_users_cursors"]
+
+    rows, hay_siguiente = get_users_page(users_col, filtro[0], role, cursores[-1])
+    if rows:
+        st.data_editor(pd.DataFrame(rows), disabled=True, use_container_width=True, key="admin_users_table")
+    else:
+        st.info("Sin usuarios para este filtro.")
+
+    b1, b2, b3 = st.columns([1, 1, 2])
+    if b1.button("◀ Anterior", disabled=len(cursores) == 1, key="admin_users_prev"):
+        cursores.pop()
+        st.rerun()
+    if b2.button("Siguiente ▶", disabled=not hay_siguiente, key="admin_users_next"):
+        cursores.append(rows[-1]["username"])
+        st.rerun()
+    b3.caption(f"Página {len(cursores)} · {USERS_PAGE_SIZE} por página")
+
+
+def parse_roster(archivo) -> tuple[list, list]:
+    """
+    Lee el CSV (columnas username, password y opcional role; separador , o ;)
+    y valida cada fila localmente. Devuelve (filas_validas, [(fila, usuario, error)]).
+    """
+    df = pd.read_csv(archivo, sep=None, engine="python", dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    if "username" not in df.columns or "password" not in df.columns:
+        raise ValueError("El CSV debe tener las columnas 'username' y 'password' (y opcional 'role').")
+
+    validas, errores, vistos = [], [], set()
+    for i, r in enumerate(df.to_dict("records"), start=2):  # fila 1 = encabezado
+        username = r["username"].strip().lower()
+        password = r["password"].strip()
+        role = (r.get("role") or "user").strip().lower() or "user"
+        error = validate_new_user(username, password, role)
+        if error is None and username in vistos:
+            error = "Repetido dentro del CSV."
+        if error:
+            errores.append((i, username, error))
+            continue
+        vistos.add(username)
+        validas.append({"username": username, "password": password, "role": role})
+    return validas, errores
+
+
+def roster_import(users_col, progress_col):
+    st.caption("CSV con columnas **username**, **password** y opcional **role** (user/admin).")
+    archivo = st.file_uploader("Archivo CSV", type=["csv"], key="admin_roster_csv")
+    if archivo is None:
+        return
+    try:
+        validas, errores = parse_roster(archivo)
+    except Exception as e:
+        st.error(f"No se pudo leer el CSV: {e}")
+        return
+
+    st.write(f"Filas válidas: **{len(validas)}** · con errores: **{len(errores)}**")
+    if not st.button("Importar cuentas", key="admin_roster_go", disabled=not validas):
+        if errores:
+            st.dataframe(pd.DataFrame(errores, columns=["fila", "usuario", "error"]), use_container_width=True)
+        return
+
+    t0 = time.perf_counter()
+    with st.spinner("Creando cuentas…"):
+        resultados = bulk_create_users(users_col, progress_col, validas)
+    seg = time.perf_counter() - t0
+    invalidate("users")
+
+    creados = sum(1 for _, ok, _ in resultados if ok)
+    st.success(f"{creados} cuentas creadas en {seg:.1f} s.")
+    fallos = [(u, msg) for u, ok, msg in resultados if not ok] + [(u, f"Fila {i}: {e}") for i, u, e in errores]
+    if fallos:
+        st.warning(f"{len(fallos)} filas no se importaron:")
+        st.dataframe(pd.DataFrame(fallos, columns=["usuario", "motivo"]), use_container_width=True)
+
+
+@tagged_cache("attempts", ttl=10)
+def attempts_kpis(_attempts_col):
+    if ADMIN_STATS_BACKEND == "facet":
+        # Una sola agregación $facet sobre attempts (índice cubriente)
+        return facet_kpis(_attempts_col)
+    # KPIs desde el rollup incremental (attempt_stats): un find, sin agregaciones
+    kpis, lvl_rate, lvl_score = read_rollup(_attempts_col.database)
+    last25 = list(_attempts_col.find({}, {"_id":0}).sort("created_at",-1).limit(25))
+    return kpis, lvl_rate, lvl_score, last25
+
+
+def admin_page():
+    st.title("⚙️ Administrador de Usuarios")
+
+    users_col = st.session_state.get("users_col")
+    progress_col = st.session_state.get("progress_col")
+    attempts_col = st.session_state.get("attempts_col")
+    if users_col is None:
+        st.error("No hay conexión con MongoDB.")
+        return
+
+    tab_users, tab_stats = st.tabs(["👥 Usuarios", "📊 Estadísticas"])
+
+    # ---------- TAB: USUARIOS ----------
+    with tab_users:
+        st.subheader("Usuarios actuales")
+        users_table(users_col)
+
+        st.markdown("---")
+
+        st.subheader("Crear nuevo usuario")
+        with st.form("admin_create_user"):
+            new_user = st.text_input("Nombre de usuario (min 3, sin espacios)").strip().lower()
+            new_pass = st.text_input("Contraseña (min 4)", type="password")
+            new_role = st.selectbox("Rol", ["user", "admin"])
+            submitted = st.form_submit_button("➕ Crear usuario")
+
+        if submitted:
+            error = validate_new_user(new_user, new_pass, new_role)
+            if error:
+                st.error(error)
+            elif users_col.find_one({"username": new_user}):
+                st.error("El usuario ya existe.")
+            else:
+                create_user(users_col, progress_col, new_user, new_pass, new_role)
+                st.success(f"Usuario '{new_user}' creado como {new_role}.")
+                invalidate("users")  # refresca solo los listados de usuarios
+
+        with st.expander("📥 Importar lista de estudiantes (CSV)"):
+            roster_import(users_col, progress_col)
+
+        st.markdown("---")
+
+        st.subheader("Editar usuario")
+        edit_user = user_picker(users_col, "editar", "admin_edit")
+        if edit_user:
+            curr = users_col.find_one({"username": edit_user}, {"role": 1, "_id": 0}) or {}
+            curr_role = curr.get("role", "user")
+            with st.form("admin_edit_user"):
+                new_pass_opt = st.text_input("Nueva contraseña (opcional: vacío = no cambiar)", type="password")
+                new_role_opt = st.selectbox("Nuevo rol", ["user", "admin"], index=0 if curr_role == "user" else 1)
+                submit_edit = st.form_submit_button("✏️ Guardar cambios")
+
+            if submit_edit:
+                # Evitar quitar el último admin
+                if curr_role == "admin" and new_role_opt == "user":
+                    other_admin = users_col.count_documents({"username": {"$ne": edit_user}, "role": "admin"}) > 0
+                    if not other_admin:
+                        st.error("No puedes quitar el último administrador del sistema.")
+                    else:
+                        update_user(users_col, edit_user, new_pass_opt or None, new_role_opt)
+                        st.success(f"Usuario '{edit_user}' actualizado.")
+                        invalidate("users")
+                else:
+                    update_user(users_col, edit_user, new_pass_opt or None, new_role_opt)
+                    st.success(f"Usuario '{edit_user}' actualizado.")
+                    invalidate("users")
+
+        st.markdown("---")
+
+        st.subheader("Eliminar usuario")
+        del_user = user_picker(users_col, "eliminar", "admin_del")
+        if del_user:
+            if st.button("🗑️ Eliminar usuario seleccionado"):
+                if del_user == st.session_state.username:
+                    st.error("No puedes eliminar tu propia cuenta en esta vista.")
+                elif del_user == "admin":
+                    st.error("Por seguridad no se permite eliminar la cuenta 'admin' por defecto.")
+                else:
+                    doc = users_col.find_one({"username": del_user}, {"role": 1, "_id": 0})
+                    if doc and doc.get("role") == "admin":
+                        other_admin = users_col.count_documents({"username": {"$ne": del_user}, "role": "admin"}) > 0
+                        if not other_admin:
+                            st.error("No puedes eliminar el último administrador del sistema.")
+                        else:
+                            delete_user(users_col, progress_col, del_user)
+                            st.success(f"Usuario '{del_user}' eliminado.")
+                            invalidate("users")
+                    else:
+                        delete_user(users_col, progress_col, del_user)
+                        st.success(f"Usuario '{del_user}' eliminado.")
+                        invalidate("users")
+
+    # ---------- TAB: ESTADÍSTICAS ----------
+    with tab_stats:
+        st.subheader("Resumen de desempeño")
+        if attempts_col is None:
+            st.error("Colección de intentos no disponible.")
+            return
+
+        kpis, by_level, by_level_score, ult = attempts_kpis(attempts_col)
+
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Intentos totales", f"{kpis['total_intentos']}")
+        c2.metric("Usuarios únicos", f"{kpis['total_usuarios']}")
+        c3.metric("Tasa aprobación global", f"{kpis['tasa_global']:.1f}%")
+        if ADMIN_STATS_BACKEND != "facet" and st.button("Recalcular estadísticas desde los intentos", key="admin_rebuild_stats"):
+            with st.spinner("Recalculando…"):
+                rebuild_rollup(attempts_col.database, pausa=get_attempt_writer().pausado())
+            invalidate("attempts")
+            st.rerun()
+
+        st.markdown("---")
+        st.subheader("Aprobación por nivel")
+        df_lvl = pd.DataFrame(by_level, columns=["level", "aprobacion_%"]).sort_values("level")
+        if not df_lvl.empty:
+            st.data_editor(df_lvl, disabled=True, use_container_width=True)
+            st.bar_chart(df_lvl.set_index("level"))
+        else:
+            st.info("Sin datos por nivel aún.")
+
+        st.markdown("---")
+        st.subheader("Promedio de puntaje por nivel")
+        df_lvl_score = pd.DataFrame(by_level_score, columns=["level", "prom_puntaje"]).sort_values("level")
+        if not df_lvl_score.empty:
+            st.data_editor(df_lvl_score, disabled=True, use_container_width=True)
+            st.bar_chart(df_lvl_score.set_index("level"))
+        else:
+            st.info("Sin puntajes aún.")
+
+        st.markdown("---")
+        st.subheader("Últimos 25 intentos")
+        df_last = pd.DataFrame(ult)
+        if not df_last.empty:
+            if "created_at" in df_last.columns:
+                df_last["created_at"] = pd.to_datetime(df_last["created_at"])
+            if "passed" in df_last.columns:
+                df_last["passed"] = df_last["passed"].map({True:"✅", False:"❌"})
+            keep_cols = [c for c in ["created_at","username","level","score","passed"] if c in df_last.columns]
+            st.data_editor(df_last.sort_values("created_at", ascending=False)[keep_cols], disabled=True, use_container_width=True)
+        else:
+            st.info("Aún no hay intentos registrados.")
+
+        st.markdown("---")
+        st.subheader("Caché de calificaciones IA")
+        cs = cache_stats()
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Tasa de aciertos", f"{cs['tasa_hit_%']:.1f}%")
+        k2.metric("Aciertos (memoria / Mongo)", f"{cs['hits_memoria']} / {cs['hits_mongo']}")
+        k3.metric("Llamadas a IA (misses)", f"{cs['misses']}")
+        k4.metric("Latencia ahorrada", f"{cs['ms_ahorrados'] / 1000.0:.1f} s")
+        st.caption(f"Entradas en memoria de este proceso: {cs['entradas_memoria']} · contadores desde el último reinicio.")
+
+        st.subheader("Caché del panel (por etiqueta)")
+        etiquetas = cache_tag_stats()
+        if etiquetas:
+            st.data_editor(pd.DataFrame(etiquetas), disabled=True, use_container_width=True)
+        else:
+            st.info("Aún no hay consultas cacheadas en este proceso.")
+
+        st.markdown("---")
+        st.subheader("Enrutador de modelos IA")
+        router = get_router()
+        estado = router.snapshot()
+        if estado:
+            st.data_editor(pd.DataFrame(estado), disabled=True, use_container_width=True)
+        else:
+            st.info("Aún no hay llamadas a la IA en este proceso.")
+        st.caption(f"Hedges disparados (respaldo en paralelo): {router.hedges}")
+
+        st.subheader("Limitador de tasa IA (requests/minuto por modelo)")
+        cupos = get_rate_limiter().snapshot()
+        if cupos:
+            st.data_editor(pd.DataFrame(cupos), disabled=True, use_container_width=True)
+        else:
+            st.info("Aún no hay requests a la IA en este proceso.")
+
+        st.markdown("---")
+        st.subheader("Escrituras de progreso (nivel actual)")
+        pw = get_progress_writer().snapshot()
+        w1, w2, w3, w4 = st.columns(4)
+        w1.metric("Solicitadas", f"{pw['solicitadas']}")
+        w2.metric("Evitadas (sin cambio)", f"{pw['evitadas']}")
+        w3.metric("Emitidas a Mongo", f"{pw['emitidas']}")
+        w4.metric("Combinadas en cola", f"{pw['coalescidas']}")
+        st.caption(f"Pendientes: {pw['pendientes']} · fallidas: {pw['fallidas']} · contadores desde el último reinicio.")
+
+        st.subheader("Arranque del proceso (Mongo)")
+        rep = dict(get_startup_report())
+        pasos = [("Conexión (ping)", "conexion_ms"), ("Bloqueante antes del login", "bloqueante_ms"),
+                 ("Admin por defecto", "admin_ms"), ("Índices", "indices_ms"), ("Rollup de estadísticas", "rollup_ms"),
+                 ("Total en segundo plano", "segundo_plano_ms")]
+        filas = [{"paso": nombre, "ms": round(rep[k], 1)} for nombre, k in pasos if k in rep]
+        if filas:
+            st.data_editor(pd.DataFrame(filas), disabled=True, use_container_width=True)
+        st.caption(f"Estado: {rep.get('estado', '—')} · TLS: {rep.get('modo_tls', '—')}"
+                   + (f" · errores: {rep['errores']}" if rep.get("errores") else ""))
+
+        st.subheader("Registro de intentos (escritura en lotes)")
+        aw = get_attempt_writer().snapshot()
+        a1, a2, a3, a4 = st.columns(4)
+        a1.metric("En cola", f"{aw['en_cola']}")
+        a2.metric("Escritos / encolados", f"{aw['escritos']} / {aw['encolados']}")
+        a3.metric("Flush p50 / p95", "—" if aw["flush_p50_ms"] is None else f"{aw['flush_p50_ms']:.0f} / {aw['flush_p95_ms']:.0f} ms")
+        a4.metric("En disco (sin Mongo)", f"{aw['derramados'] - aw['reprocesados']}")
+        st.caption(f"Flushes: {aw['flushes']} · fallidos: {aw['fallos']} · recuperados del disco: {aw['reprocesados']}"
+                   + (f" · último error: {aw['ultimo_error']}" if aw["ultimo_error"] else ""))
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Estadísticas de intentos mantenidas incrementalmente
+#   En vez de agregar toda la colección attempts en cada visita al panel:
+#   - attempt_stats: un documento "global" y uno por nivel ("level:N") con
+#     contadores que se actualizan con $inc al escribir cada lote de intentos.
+#   - attempt_users: un documento por usuario que alguna vez intentó; el
+#     upsert que lo crea es el que suma 1 a los usuarios únicos.
+#   El panel lee attempt_stats con un solo find por _id. rebuild_rollup()
+#   recalcula todo desde attempts (también: python attempt_stats.py --rebuild).
+#
+#   Alternativa (ADMIN_STATS_BACKEND=facet): calcular desde attempts crudos en
+#   UNA agregación con $facet sobre un índice que cubre los campos usados.
+# =========================================================
+
+import os
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from embedded_store import aplicar_pedidos
+
+# "rollup" (contadores incrementales) o "facet" (una agregación sobre attempts)
+ADMIN_STATS_BACKEND = os.getenv("ADMIN_STATS_BACKEND", "rollup").strip().lower()
+
+STATS_COLLECTION = "attempt_stats"
+STATS_USERS_COLLECTION = "attempt_users"
+LEVELS = (1, 2, 3, 4)
+
+_GLOBAL_ID = "global"
+
+# Índice que cubre la proyección del pipeline $facet (sin leer documentos)
+FACET_INDEX_KEYS = [("level", 1), ("passed", 1), ("score", 1), ("created_at", -1), ("username", 1)]
+FACET_INDEX_NAME = "stats_facet_cover"
+
+
+def _level_id(level) -> str:
+    return f"level:{level}"
+
+
+def registrar_lote(db, docs: list):
+    """Suma un lote de intentos (ya insertados en attempts) a los contadores."""
+    if not docs:
+        return
+    por_nivel = {}
+    total = aprobados = 0
+    for d in docs:
+        c = por_nivel.setdefault(d.get("level"), {"total": 0, "aprobados": 0, "score_sum": 0, "score_n": 0})
+        c["total"] += 1
+        total += 1
+        if d.get("passed"):
+            c["aprobados"] += 1
+            aprobados += 1
+        if d.get("score") is not None:
+            c["score_sum"] += d["score"]
+            c["score_n"] += 1
+
+    ahora = datetime.now(timezone.utc)
+    usuarios = {d.get("username") for d in docs if d.get("username")}
+    nuevos = 0
+    if usuarios:
+        res = aplicar_pedidos(
+            db[STATS_USERS_COLLECTION],
+            [("update_one", ({"_id": u}, {"$setOnInsert": {"first_at": ahora}}, True)) for u in usuarios],
+            ordered=False,
+        )
+        nuevos = res.upserted_count
+
+    pedidos = [
+        ("update_one", (
+            {"_id": _level_id(lvl)},
+            {"$inc": c, "$set": {"level": lvl, "updated_at": ahora}},
+            True,
+        ))
+        for lvl, c in por_nivel.items()
+    ]
+    pedidos.append(("update_one", (
+        {"_id": _GLOBAL_ID},
+        {"$inc": {"total": total, "aprobados": aprobados, "usuarios": nuevos}, "$set": {"updated_at": ahora}},
+        True,
+    )))
+    aplicar_pedidos(db[STATS_COLLECTION], pedidos, ordered=False)
+
+
+def read_rollup(db):
+    """
+    (kpis, aprobación por nivel, puntaje promedio por nivel) con la misma forma
+    que usaba el panel, leídos en un solo find.
+    """
+    ids = [_GLOBAL_ID] + [_level_id(l) for l in LEVELS]
+    docs = {d["_id"]: d for d in db[STATS_COLLECTION].find({"_id": {"$in": ids}})}
+
+    g = docs.get(_GLOBAL_ID) or {}
+    total = g.get("total", 0)
+    kpis = {
+        "total_intentos": total,
+        "total_usuarios": g.get("usuarios", 0),
+        "tasa_global": (g.get("aprobados", 0) / total * 100.0) if total else 0,
+    }
+
+    lvl_rate, lvl_score = [], []
+    for lvl in LEVELS:
+        d = docs.get(_level_id(lvl))
+        if not d or not d.get("total"):
+            continue
+        lvl_rate.append({"level": lvl, "aprobacion_%": d.get("aprobados", 0) / d["total"] * 100.0})
+        if d.get("score_n"):
+            lvl_score.append({"level": lvl, "prom_puntaje": d["score_sum"] / d["score_n"]})
+    return kpis, lvl_rate, lvl_score
+
+
+def facet_kpis(attempts_col, last_n: int = 25):
+    """
+    Mismo resultado que read_rollup + últimos intentos, en una sola agregación:
+    el $project inicial solo usa campos de FACET_INDEX_NAME, así el recorrido
+    es un IXSCAN cubierto y cada faceta trabaja sobre ese único pase.
+    """
+    pipeline = [
+        {"$project": {"_id": 0, "level": 1, "passed": 1, "score": 1, "created_at": 1, "username": 1}},
+        {"$facet": {
+            "global": [
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "aprobados": {"$sum": {"$cond": ["$passed", 1, 0]}},
+                }},
+            ],
+            "usuarios": [
+                {"$group": {"_id": "$username"}},
+                {"$count": "n"},
+            ],
+            "por_nivel": [
+                {"$group": {
+                    "_id": "$level",
+                    "aprobacion": {"$avg": {"$cond": ["$passed", 1, 0]}},
+                    "prom_puntaje": {"$avg": "$score"},   # $avg ignora nulos
+                }},
+                {"$sort": {"_id": 1}},
+            ],
+            "ultimos": [
+                {"$sort": {"created_at": -1}},
+                {"$limit": last_n},
+            ],
+        }},
+    ]
+    out = next(iter(attempts_col.aggregate(pipeline, hint=FACET_INDEX_NAME, allowDiskUse=True)), {})
+
+    g = (out.get("global") or [{}])[0]
+    total = g.get("total", 0)
+    kpis = {
+        "total_intentos": total,
+        "total_usuarios": (out.get("usuarios") or [{}])[0].get("n", 0),
+        "tasa_global": (g.get("aprobados", 0) / total * 100.0) if total else 0,
+    }
+    lvl_rate = [{"level": n["_id"], "aprobacion_%": n["aprobacion"] * 100.0} for n in out.get("por_nivel", [])]
+    lvl_score = [{"level": n["_id"], "prom_puntaje": n["prom_puntaje"]}
+                 for n in out.get("por_nivel", []) if n.get("prom_puntaje") is not None]
+    return kpis, lvl_rate, lvl_score, out.get("ultimos", [])
+
+
+def rebuild_rollup(db, attempts_name: str = "attempts", pausa=None) -> dict:
+    """
+    Recalcula attempt_stats y attempt_users desde cero con los intentos crudos.
+    Se arma en colecciones temporales que reemplazan a las vigentes con
+    rename(dropTarget=True): el panel nunca ve el rollup vacío o a medias.
+    `pausa` (p. ej. AttemptWriter.pausado()) detiene los flush de este proceso
+    mientras dura, para que ningún $inc de registrar_lote caiga entre la
+    lectura de attempts y el rename y se pierda.
+    """
+    with pausa or nullcontext():
+        return _rebuild(db, db[attempts_name])
+
+
+def _rebuild(db, attempts) -> dict:
+    ahora = datetime.now(timezone.utc)
+    tmp_users = f"{STATS_USERS_COLLECTION}_rebuild"
+    tmp_stats = f"{STATS_COLLECTION}_rebuild"
+    db.drop_collection(tmp_users)
+    db.drop_collection(tmp_stats)
+
+    niveles = list(attempts.aggregate([
+        {"$group": {
+            "_id": "$level",
+            "total": {"$sum": 1},
+            "aprobados": {"$sum": {"$cond": ["$passed", 1, 0]}},
+            "score_sum": {"$sum": {"$ifNull": ["$score", 0]}},
+            "score_n": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$score", None]}, None]}, 0, 1]}},
+        }},
+    ], allowDiskUse=True))
+
+    attempts.aggregate([
+        {"$group": {"_id": "$username"}},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$set": {"first_at": ahora}},
+        {"$merge": {"into": tmp_users, "whenMatched": "keepExisting"}},
+    ], allowDiskUse=True)
+    usuarios = db[tmp_users].count_documents({})
+
+    docs = [{
+        "_id": _GLOBAL_ID,
+        "total": sum(n["total"] for n in niveles),
+        "aprobados": sum(n["aprobados"] for n in niveles),
+        "usuarios": usuarios,
+        "updated_at": ahora,
+    }]
+    for n in niveles:
+        lvl = n.pop("_id")
+        docs.append({"_id": _level_id(lvl), "level": lvl, **n, "updated_at": ahora})
+
+    db[tmp_stats].insert_many(docs)
+    if usuarios:
+        db[tmp_users].rename(STATS_USERS_COLLECTION, dropTarget=True)
+    else:
+        # $merge sin documentos no crea la colección temporal
+        db[STATS_USERS_COLLECTION].delete_many({})
+    db[tmp_stats].rename(STATS_COLLECTION, dropTarget=True)
+    return docs[0]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from storage import _connect_mongo
+
+    ap = argparse.ArgumentParser(description="Estadísticas de intentos (rollup)")
+    ap.add_argument("--rebuild", action="store_true", help="Recalcula el rollup desde la colección attempts")
+    args = ap.parse_args()
+
+    uri = os.getenv("MONGODB_URI")
+    if not uri:
+        raise SystemExit("Define MONGODB_URI en el entorno.")
+    db = _connect_mongo(uri)["accounting_app"]
+    if args.rebuild:
+        g = rebuild_rollup(db)
+        print(f"Rollup recalculado: {g['total']} intentos, {g['usuarios']} usuarios únicos.")
+    kpis, _, _ = read_rollup(db)
+    print(kpis)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Registro durable de intentos (attempts) en lotes
+#   record_attempt solo encola; un hilo del proceso escribe con insert_many
+#   (w=1) cuando la cola llega a ATTEMPTS_BATCH_SIZE o pasan ATTEMPTS_FLUSH_S.
+#   - Si Mongo no responde, el lote se guarda en un archivo local (JSONL) y se
+#     reintenta en el siguiente flush exitoso.
+#   - El _id se asigna al encolar: si un insert falló después de escribir
+#     parte del lote en el servidor, el reintento choca con E11000 en esos
+#     documentos y se dan por escritos (sin duplicar intentos).
+#   - Al cerrar el proceso se vacía la cola (o se vuelca al archivo).
+#   - Cada lote escrito se suma a los contadores de attempt_stats.
+#   - Métricas de cola y latencia de flush para el panel admin.
+# =========================================================
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import streamlit as st
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from attempt_stats import registrar_lote
+
+ATTEMPTS_BATCH_SIZE = int(os.getenv("ATTEMPTS_BATCH_SIZE", "50"))
+ATTEMPTS_FLUSH_S = float(os.getenv("ATTEMPTS_FLUSH_S", "2"))
+ATTEMPTS_SPILL_PATH = os.getenv(
+    "ATTEMPTS_SPILL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "attempts_spill.jsonl"),
+)
+# Código de Mongo para clave duplicada
+_DUPLICADO = 11000
+
+
+def _a_json(doc: dict) -> str:
+    d = dict(doc)
+    if isinstance(d.get("_id"), ObjectId):
+        d["_id"] = str(d["_id"])
+    if isinstance(d.get("created_at"), datetime):
+        d["created_at"] = d["created_at"].isoformat()
+    return json.dumps(d, ensure_ascii=False)
+
+
+def _de_json(linea: str) -> dict:
+    d = json.loads(linea)
+    if isinstance(d.get("_id"), str) and ObjectId.is_valid(d["_id"]):
+        d["_id"] = ObjectId(d["_id"])
+    if isinstance(d.get("created_at"), str):
+        d["created_at"] = datetime.fromisoformat(d["created_at"])
+    return d
+
+
+class AttemptWriter:
+    def __init__(self, batch_size: int = ATTEMPTS_BATCH_SIZE, flush_s: float = ATTEMPTS_FLUSH_S,
+                 spill_path: str = ATTEMPTS_SPILL_PATH):
+        self._batch_size = max(1, batch_size)
+        self._flush_s = flush_s
+        self._spill_path = spill_path
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._cola = deque()
+        self._col = None
+        self.encolados = 0
+        self.escritos = 0
+        self.derramados = 0      # a archivo local por fallo de Mongo
+        self.reprocesados = 0    # recuperados del archivo
+        self.flushes = 0
+        self.fallos = 0
+        self._lat_ms = deque(maxlen=200)
+        self._ultimo_error = ""
+        self._hilo = threading.Thread(target=self._loop, name="attempt-writer", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, attempts_col, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        with self._cond:
+            self._col = attempts_col
+            self._cola.append(doc)
+            self.encolados += 1
+            if len(self._cola) >= self._batch_size:
+                self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                # Espera a que haya un lote completo o venza el plazo con algo en cola
+                self._cond.wait(timeout=self._flush_s)
+                hay = bool(self._cola)
+            if hay:
+                self.flush()
+
+    def pausado(self):
+        """
+        Context manager: mientras dure, ningún flush escribe (la cola sigue
+        aceptando intentos). Lo usa rebuild_rollup para no perder $inc.
+        """
+        return self._flush_lock
+
+    # ---------- flush ----------
+    def _derramar(self, docs: list):
+        try:
+            with open(self._spill_path, "a", encoding="utf-8") as f:
+                for d in docs:
+                    f.write(_a_json(d) + "\n")
+            self.derramados += len(docs)
+        except Exception as e:
+            # Sin Mongo ni disco: no hay dónde guardarlos
+            self._ultimo_error = f"spill: {e}"
+
+    def _pendientes_en_archivo(self) -> list:
+        if not os.path.exists(self._spill_path):
+            return []
+        try:
+            with open(self._spill_path, encoding="utf-8") as f:
+                return [_de_json(l) for l in f if l.strip()]
+        except Exception as e:
+            self._ultimo_error = f"replay: {e}"
+            return []
+
+    def flush(self):
+        """
+        Escribe la cola (y lo derramado antes) con insert_many; lo que falla va
+        al archivo. Los _id ya existentes (E11000) cuentan como escritos.
+        """
+        with self._flush_lock:
+            with self._cond:
+                lote = list(self._cola)
+                self._cola.clear()
+                col = self._col
+            if col is None:
+                return
+
+            # Lo que quedó en el archivo va primero (created_at conserva el orden)
+            previos = self._pendientes_en_archivo()
+            docs = previos + lote
+            if not docs:
+                return
+
+            t0 = time.perf_counter()
+            fallidos = set()
+            try:
+                # ordered=False: un duplicado no detiene el resto del lote
+                col.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                errores = (e.details or {}).get("writeErrors", [])
+                fallidos = {err["index"] for err in errores if err.get("code") != _DUPLICADO}
+                if fallidos:
+                    self._ultimo_error = str(e)[:200]
+            except Exception as e:
+                # No se sabe qué llegó al servidor: todo se reintenta (idempotente por _id)
+                fallidos = set(range(len(docs)))
+                self._ultimo_error = str(e)[:200]
+            ms = (time.perf_counter() - t0) * 1000.0
+
+            escritos = [d for i, d in enumerate(docs) if i not in fallidos]
+            with self._cond:
+                self.flushes += 1
+                self._lat_ms.append(ms)
+                self.escritos += len(escritos)
+                self.reprocesados += sum(1 for i in range(len(previos)) if i not in fallidos)
+
+            # Nada de lo derramado se sumó al rollup, ni siquiera lo que el
+            # servidor alcanzó a escribir: todo lo confirmado se suma ahora
+            if escritos:
+                try:
+                    registrar_lote(col.database, escritos)
+                except Exception as e:
+                    # El rollup queda corto; rebuild_rollup() lo recompone
+                    self._ultimo_error = f"rollup: {e}"[:200]
+
+            if previos:
+                try:
+                    os.remove(self._spill_path)
+                except OSError:
+                    pass
+            if fallidos:
+                with self._cond:
+                    self.fallos += 1
+                self._derramar([docs[i] for i in sorted(fallidos)])
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            lat = sorted(self._lat_ms)
+            return {
+                "en_cola": len(self._cola),
+                "encolados": self.encolados,
+                "escritos": self.escritos,
+                "derramados": self.derramados,
+                "reprocesados": self.reprocesados,
+                "flushes": self.flushes,
+                "fallos": self.fallos,
+                "flush_p50_ms": lat[len(lat) // 2] if lat else None,
+                "flush_p95_ms": lat[min(len(lat) - 1, int(len(lat) * 0.95))] if lat else None,
+                "ultimo_error": self._ultimo_error,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_attempt_writer() -> AttemptWriter:
+    writer = AttemptWriter()
+    atexit.register(writer.flush)
+    return writer
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Micro-benchmark del parseo de respuestas de la IA
+#   Compara el parser anterior (varias pasadas + hasta 3 json.loads) con
+#   ia_decode.decode_json (una pasada + un json.loads) sobre un corpus de
+#   respuestas reales/sintéticas, y verifica que ambos den el dict esperado.
+#   Uso:
+#     python bench_decode.py                      # usa decode_corpus.jsonl
+#     python bench_decode.py --repeticiones 5000
+#
+#   decode_corpus.jsonl: {"raw", "esperado"} donde esperado es el dict
+#   esperado o null (la respuesta no trae JSON utilizable).
+# =========================================================
+
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+
+from ia_decode import decode_json
+
+_FENCES = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE | re.MULTILINE)
+_SINGLE_QUOTE = re.compile(r"(?<!\\)'")
+_TRAILING_COMMA = re.compile(r",\s*}")
+
+
+def parse_anterior(s: str) -> dict:
+    """Copia del parser previo de ia.py (referencia para la comparación)."""
+    t = (s or "").strip()
+    lower = t.lower()
+    if ("no endpoints found" in lower or "unauthorized" in lower or
+        "rate limit" in lower or "timeout" in lower):
+        raise RuntimeError(t)
+
+    t = _FENCES.sub("", t).strip()
+    t = t.replace("<|begin_of_sentence|>", "").replace("<|end_of_sentence|>", "")
+    t = t.replace("“","\"").replace("”","\"").replace("’","'")
+    t = t.replace("\"aprobo\"", "\"aprobado\"").replace("'aprobo'", "'aprobado'")
+
+    start = t.find("{")
+    if start == -1:
+        raise RuntimeError("No se encontró '{' en la respuesta del modelo.")
+    brace = 0
+    in_str = False
+    esc = False
+    end = None
+    for i in range(start, len(t)):
+        ch = t[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == "\"":
+                in_str = False
+        else:
+            if ch == "\"":
+                in_str = True
+            elif ch == "{":
+                brace += 1
+            elif ch == "}":
+                brace -= 1
+                if brace == 0:
+                    end = i
+                    break
+    if end is None:
+        last = t.rfind("}")
+        if last == -1:
+            raise RuntimeError("No se encontró cierre '}' en la respuesta del modelo.")
+        end = last
+
+    candidate = t[start:end+1].strip()
+    try:
+        return json.loads(candidate)
+    except Exception:
+        pass
+    candidate2 = _SINGLE_QUOTE.sub('"', candidate)
+    try:
+        return json.loads(candidate2)
+    except Exception:
+        candidate3 = _TRAILING_COMMA.sub("}", candidate2)
+        return json.loads(candidate3)
+
+
+def _intentar(fn, raw):
+    try:
+        return fn(raw)
+    except Exception:
+        return None
+
+
+def _medir(fn, casos, repeticiones):
+    lat_us = []
+    for c in casos:
+        t0 = time.perf_counter()
+        for _ in range(repeticiones):
+            _intentar(fn, c["raw"])
+        lat_us.append((time.perf_counter() - t0) / repeticiones * 1e6)
+    return lat_us
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compara el parser anterior con ia_decode.decode_json")
+    ap.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "decode_corpus.jsonl"))
+    ap.add_argument("--repeticiones", type=int, default=2000, help="Repeticiones por caso para medir latencia")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        casos = [json.loads(l) for l in f if l.strip()]
+
+    print(f"{'parser':14} {'correctos':>10} {'mediana µs':>11} {'p95 µs':>8} {'total ms':>9}")
+    for nombre, fn in (("anterior", parse_anterior), ("decode_json", decode_json)):
+        correctos = 0
+        fallos = []
+        for c in casos:
+            out = _intentar(fn, c["raw"])
+            if out == c["esperado"]:
+                correctos += 1
+            else:
+                fallos.append((c, out))
+        lat = sorted(_medir(fn, casos, args.repeticiones))
+        print(f"{nombre:14} {correctos:>5}/{len(casos):<4} {statistics.median(lat):>11.1f} "
+              f"{lat[int(len(lat) * 0.95) - 1]:>8.1f} {sum(lat) / 1000.0:>9.3f}")
+        if args.verbose:
+            for c, out in fallos:
+                print(f"  - {c['raw'][:60]!r} → {out!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Benchmark y verificación del motor de devoluciones por lote
+#   Genera secuencias aleatorias de compras, ventas, devoluciones en compra
+#   (de un lote cualquiera) y devoluciones en venta (de una venta cualquiera),
+#   las corre sobre InventarioTrazable y las compara con una referencia
+#   ingenua que recorre la lista de lotes en cada operación (O(n)).
+#   Uso:
+#     python bench_devoluciones.py                       # 1k, 10k y 50k operaciones
+#     python bench_devoluciones.py --ops 1000 100000 --check 5000 --out bench_output.txt
+# =========================================================
+
+import argparse
+import random
+import time
+
+from inventory_engine import InventarioTrazable
+
+
+def secuencia(n: int, seed: int = 11) -> list:
+    rnd = random.Random(seed)
+    ops, compras, ventas = [], 0, 0
+    for _ in range(n):
+        r = rnd.random()
+        if r < 0.35 or not compras:
+            ops.append(("compra", rnd.randint(1, 50), round(rnd.uniform(5, 20), 2)))
+            compras += 1
+        elif r < 0.7:
+            ops.append(("venta", rnd.randint(1, 80)))
+            ventas += 1
+        elif r < 0.85:
+            ops.append(("dev_compra", rnd.randint(1, 30), rnd.randrange(compras)))
+        elif ventas:
+            ops.append(("dev_venta", rnd.randint(1, 30), rnd.randrange(ventas)))
+    return ops
+
+
+def correr_motor(metodo, ops):
+    inv = InventarioTrazable(metodo)
+    lotes, salida = [], []
+    for op in ops:
+        if op[0] == "compra":
+            lotes.append(inv.entrada(op[1], op[2]))
+        elif op[0] == "venta":
+            salida.append(sum(t.total for t in inv.venta(op[1])))
+        elif op[0] == "dev_compra":
+            salida.append(sum(t.total for t in inv.dev_compra(op[1], lotes[op[2]])))
+        else:
+            salida.append(sum(t.total for t in inv.dev_venta(op[1], op[2])))
+    return salida, inv.saldo()
+
+
+def correr_referencia(metodo, ops):
+    """Mismas reglas, recorriendo la lista de lotes en cada paso."""
+    fifo = metodo == "PEPS"
+    lotes, ventas, salida = [], [], []
+
+    def consumir(q, orden):
+        tramos = []
+        for i in orden:
+            if q <= 0:
+                break
+            use = min(q, lotes[i][0])
+            if use > 0:
+                lotes[i][0] -= use
+                tramos.append((i, use, lotes[i][1]))
+                q -= use
+        return tramos
+
+    for op in ops:
+        if op[0] == "compra":
+            lotes.append([float(op[1]), float(op[2])])
+        elif op[0] == "venta":
+            orden = range(len(lotes)) if fifo else range(len(lotes) - 1, -1, -1)
+            tramos = consumir(op[1], orden)
+            ventas.append(sorted([i, q, pu] for i, q, pu in tramos))
+            salida.append(sum(q * pu for _, q, pu in tramos))
+        elif op[0] == "dev_compra":
+            orden = [op[2]] + list(range(len(lotes) - 1, -1, -1))
+            salida.append(sum(q * pu for _, q, pu in consumir(op[1], orden)))
+        else:
+            q, tot = op[1], 0.0
+            for reg in ventas[op[2]]:
+                use = min(q, reg[1])
+                if use > 0:
+                    lotes[reg[0]][0] += use
+                    reg[1] -= use
+                    tot += use * reg[2]
+                    q -= use
+            salida.append(tot)
+    cant = sum(q for q, _ in lotes)
+    valor = sum(q * pu for q, pu in lotes)
+    return salida, (cant, (valor / cant) if cant > 0 else 0.0, valor)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Motor de devoluciones por lote vs recorrido lineal")
+    ap.add_argument("--ops", type=int, nargs="+", default=[1000, 10000, 50000])
+    ap.add_argument("--check", type=int, default=10000, help="Hasta cuántas operaciones se corre también la referencia")
+    ap.add_argument("--out", default=None, help="Archivo donde anexar el resultado")
+    args = ap.parse_args()
+
+    lineas, errores = [], 0
+    for n in args.ops:
+        ops = secuencia(n)
+        for metodo in ("PEPS", "UEPS"):
+            t0 = time.perf_counter()
+            res = correr_motor(metodo, ops)
+            t_motor = (time.perf_counter() - t0) * 1000.0
+            linea = f"{n:,} ops {metodo} · motor {t_motor:.1f} ms ({t_motor / n * 1000.0:.2f} µs/op)"
+            if n <= args.check:
+                t0 = time.perf_counter()
+                ref = correr_referencia(metodo, ops)
+                t_ref = (time.perf_counter() - t0) * 1000.0
+                dif = sum(1 for a, b in zip(res[0], ref[0]) if abs(a - b) > 1e-6)
+                dif += sum(1 for a, b in zip(res[1], ref[1]) if abs(a - b) > 1e-6)
+                errores += dif
+                linea += f" · lineal {t_ref:.1f} ms (x{t_ref / t_motor:.1f}) · diferencias={dif}"
+            lineas.append(linea)
+
+    for l in lineas:
+        print(l)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write("\n".join(lineas) + "\n")
+    if errores:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
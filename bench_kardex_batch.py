@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Benchmark y verificación del solver vectorizado de KARDEX
+#   Genera escenarios aleatorios (rangos de los niveles 2 y 4), los resuelve
+#   con resolver_lote_todos (NumPy) y con el bucle escalar sobre
+#   InventarioCapas, compara resultados y reporta tiempos.
+#   Uso:
+#     python bench_kardex_batch.py                      # 100k escenarios
+#     python bench_kardex_batch.py --n 1000000 --check 20000 --out bench_output.txt
+# =========================================================
+
+import argparse
+import time
+
+import numpy as np
+
+from kardex_batch import METODOS, resolver_escenario, resolver_lote_todos
+
+
+def escenarios(n: int, seed: int = 7) -> dict:
+    rnd = np.random.default_rng(seed)
+    enteros = lambda lo, hi: rnd.integers(lo, hi + 1, n).astype(np.float64)  # noqa: E731
+    return {
+        "inv0_u": enteros(0, 200), "inv0_pu": rnd.uniform(5, 20, n).round(2),
+        "comp1_u": enteros(0, 200), "comp1_pu": rnd.uniform(5, 20, n).round(2),
+        "venta_u": enteros(0, 400),
+        "comp2_u": enteros(0, 150), "comp2_pu": rnd.uniform(5, 20, n).round(2),
+        "dev_comp": enteros(0, 30), "dev_venta": enteros(0, 30),
+        "p_venta": rnd.uniform(15, 40, n).round(2), "tasa": rnd.choice([0.0, 0.25, 0.30, 0.35], n),
+        "gastos_op": rnd.uniform(0, 800, n).round(2),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Solver KARDEX vectorizado vs bucle escalar")
+    ap.add_argument("--n", type=int, default=100000, help="Escenarios del lote")
+    ap.add_argument("--check", type=int, default=5000, help="Escenarios que se comparan (y se cronometran) en escalar")
+    ap.add_argument("--out", default=None, help="Archivo donde anexar el resultado")
+    args = ap.parse_args()
+
+    p = escenarios(args.n)
+    resolver_lote_todos(**{k: v[:10] for k, v in p.items()})  # calentamiento
+    t0 = time.perf_counter()
+    lote = resolver_lote_todos(**p)
+    t_lote = (time.perf_counter() - t0) * 1000.0
+
+    m = min(args.check, args.n)
+    filas = [{k: float(v[i]) for k, v in p.items()} for i in range(m)]
+    t0 = time.perf_counter()
+    refs = [{metodo: resolver_escenario(metodo, **fila) for metodo in METODOS} for fila in filas]
+    t_escalar = (time.perf_counter() - t0) * 1000.0
+
+    errores = 0
+    for i, ref_i in enumerate(refs):
+        for metodo, ref in ref_i.items():
+            for campo, valor in ref.items():
+                if not np.isclose(lote[metodo][campo][i], valor, rtol=1e-9, atol=1e-6):
+                    errores += 1
+                    if errores <= 5:
+                        print(f"  difiere #{i} {metodo}.{campo}: lote={lote[metodo][campo][i]!r} escalar={valor!r}")
+    por_escenario_us = t_escalar / m * 1000.0 if m else 0.0
+
+    linea = (
+        f"{args.n:,} escenarios x 3 métodos · lote NumPy {t_lote:.1f} ms "
+        f"({t_lote / args.n * 1000.0:.2f} µs/escenario) · escalar {por_escenario_us:.1f} µs/escenario "
+        f"(estimado {por_escenario_us * args.n / 1000.0:.0f} ms para el lote) · "
+        f"comparados={m:,} · diferencias={errores}"
+    )
+    print(linea)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+    if errores:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Benchmark de la tabla KARDEX columnar vs lista de dicts
+#   Mide, por rerun de una grilla: construir la tabla esperada, pasarla a
+#   DataFrame, armar la plantilla en blanco del editor y validar lo
+#   diligenciado (antes: .iloc[i].to_dict() celda por celda).
+#   Uso:
+#     python bench_kardex_table.py                     # 7 y 60 filas
+#     python bench_kardex_table.py --filas 7 200 --out bench_output.txt
+# =========================================================
+
+import argparse
+import timeit
+
+import pandas as pd
+
+from kardex_table import COLS_NUM, KardexTabla
+
+
+def filas_dict(n: int) -> list:
+    return [
+        {"Fecha": f"Día {i + 1}", "Descripción": f"Movimiento {i + 1}",
+         **{c: (round(i * 10.5 + j, 2) if (i + j) % 3 else None) for j, c in enumerate(COLS_NUM)}}
+        for i in range(n)
+    ]
+
+
+def anterior(rows):
+    """Como estaba: DataFrame desde dicts, plantilla desde dicts y validación con iloc."""
+    pd.DataFrame(rows)
+    editado = pd.DataFrame([{"Fecha": r["Fecha"], "Descripción": r["Descripción"], **dict.fromkeys(COLS_NUM)} for r in rows])
+    flags = []
+    for i in range(len(rows)):
+        user = editado.iloc[i].to_dict()
+        exp = rows[i]
+        ok_cells = []
+        for k in COLS_NUM:
+            e, u = exp[k], user.get(k)
+            if e is None or e == "":
+                ok_cells.append(True)
+                continue
+            try:
+                u = None if u in (None, "") else float(u)
+            except Exception:
+                u = None
+            ok_cells.append(u is not None and abs(u - float(e)) <= 0.5)
+        flags.append(all(ok_cells))
+    return flags
+
+
+def columnar(rows):
+    t = KardexTabla()
+    for r in rows:
+        t.append(r)
+    t.to_frame()
+    return t.validar(t.en_blanco())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="KARDEX columnar vs lista de dicts")
+    ap.add_argument("--filas", type=int, nargs="+", default=[7, 60])
+    ap.add_argument("--reps", type=int, default=300)
+    ap.add_argument("--out", default=None, help="Archivo donde anexar el resultado")
+    args = ap.parse_args()
+
+    lineas = []
+    for n in args.filas:
+        rows = filas_dict(n)
+        assert list(anterior(rows)) == list(columnar(rows))
+        res = {}
+        for nombre, fn in (("anterior", anterior), ("columnar", columnar)):
+            res[nombre] = min(timeit.repeat(lambda: fn(rows), number=args.reps, repeat=5)) / args.reps * 1000.0
+        lineas.append(
+            f"{n} filas · anterior {res['anterior']:.2f} ms · columnar {res['columnar']:.2f} ms "
+            f"(x{res['anterior'] / res['columnar']:.1f})"
+        )
+
+    for l in lineas:
+        print(l)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write("\n".join(lineas) + "\n")
+
+
+if __name__ == "__main__":
+    main()
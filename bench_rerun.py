@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Medición del costo por rerun del script principal
+#   Uso:
+#     python bench_rerun.py                       # script actual
+#     python bench_rerun.py --script otro.py      # p. ej. una versión previa
+#     python bench_rerun.py --runs 30 --out bench_output.txt
+#
+#   Ejecuta la app con streamlit.testing (AppTest) sin Mongo ni red:
+#   la corrida termina en el aviso de conexión, así que el tiempo medido es
+#   justamente el "overhead" del script (imports, defs, singletons) por rerun.
+#   Para comparar antes/después:
+#     git show <commit>:Accounting_Learning.py > /tmp/antes.py
+#     python bench_rerun.py --script /tmp/antes.py
+# =========================================================
+
+import argparse
+import os
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+
+def medir(script: str, runs: int):
+    os.environ.pop("MONGODB_URI", None)
+    at = AppTest.from_file(script, default_timeout=120)
+    at.secrets["OPENROUTER_API_KEY"] = "bench-dummy-key"
+
+    tiempos = []
+    for _ in range(runs + 1):
+        t0 = time.perf_counter()
+        at.run()
+        tiempos.append((time.perf_counter() - t0) * 1000.0)
+
+    primera, resto = tiempos[0], tiempos[1:]
+    return {
+        "script": script,
+        "primera_ms": primera,
+        "mediana_ms": statistics.median(resto),
+        "p95_ms": sorted(resto)[max(0, int(len(resto) * 0.95) - 1)],
+        "min_ms": min(resto),
+        "runs": len(resto),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Overhead por rerun de la app")
+    ap.add_argument("--script", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "Accounting_Learning.py"))
+    ap.add_argument("--runs", type=int, default=20)
+    ap.add_argument("--out", default=None, help="Archivo donde anexar el resultado")
+    args = ap.parse_args()
+
+    r = medir(args.script, args.runs)
+    linea = (
+        f"{r['script']}: primera={r['primera_ms']:.1f} ms · "
+        f"rerun mediana={r['mediana_ms']:.1f} ms · p95={r['p95_ms']:.1f} ms · "
+        f"min={r['min_ms']:.1f} ms (n={r['runs']})"
+    )
+    print(linea)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+
+
+if __name__ == "__main__":
+    main()
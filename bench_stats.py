@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Benchmark de los backends de estadísticas del panel admin
+#   Siembra intentos sintéticos en un mongod LOCAL y mide la latencia de:
+#     - anterior: 3 agregaciones + find (como era attempts_kpis)
+#     - rollup:   read_rollup (un find) + últimos 25
+#     - facet:    facet_kpis (una agregación $facet con índice cubriente)
+#   Uso:
+#     python bench_stats.py                                  # 100k y 1M
+#     python bench_stats.py --sizes 100000 --runs 20
+#     python bench_stats.py --uri mongodb://localhost:27017 --out bench_output.txt
+#
+#   Usa la base "accounting_bench" (se borra al empezar cada tamaño).
+# =========================================================
+
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import MongoClient
+
+from attempt_stats import FACET_INDEX_KEYS, FACET_INDEX_NAME, facet_kpis, read_rollup, rebuild_rollup
+
+
+def sembrar(col, n: int, usuarios: int, lote: int = 10000):
+    base = datetime.now(timezone.utc) - timedelta(days=180)
+    rnd = random.Random(42)
+    hechos = 0
+    while hechos < n:
+        k = min(lote, n - hechos)
+        docs = []
+        for i in range(k):
+            level = rnd.randint(1, 4)
+            score = rnd.choice([None, 0, 1, 2, 3]) if level > 1 else rnd.randint(0, 3)
+            docs.append({
+                "username": f"alumno{rnd.randrange(usuarios):05d}",
+                "level": level,
+                "score": score,
+                "passed": score is not None and score >= 2,
+                "created_at": base + timedelta(seconds=(hechos + i) * 15),
+            })
+        col.insert_many(docs, ordered=False)
+        hechos += k
+
+
+def kpis_anterior(col):
+    """Copia de la versión previa de attempts_kpis (referencia)."""
+    list(col.aggregate([
+        {"$group": {"_id": None, "total_intentos": {"$sum": 1},
+                    "usuarios_unicos": {"$addToSet": "$username"},
+                    "aprobados": {"$sum": {"$cond": ["$passed", 1, 0]}}}},
+        {"$project": {"_id": 0, "total_intentos": 1, "total_usuarios": {"$size": "$usuarios_unicos"}}},
+    ], allowDiskUse=True))
+    list(col.aggregate([
+        {"$group": {"_id": "$level", "aprobacion": {"$avg": {"$cond": ["$passed", 1, 0]}}}},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True))
+    list(col.aggregate([
+        {"$match": {"score": {"$ne": None}}},
+        {"$group": {"_id": "$level", "prom_puntaje": {"$avg": "$score"}}},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True))
+    list(col.find({}, {"_id": 0}).sort("created_at", -1).limit(25))
+
+
+def kpis_rollup(col):
+    read_rollup(col.database)
+    list(col.find({}, {"_id": 0}).sort("created_at", -1).limit(25))
+
+
+def medir(fn, col, runs: int) -> dict:
+    fn(col)  # calentamiento (caché de WiredTiger / plan)
+    ms = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn(col)
+        ms.append((time.perf_counter() - t0) * 1000.0)
+    ms.sort()
+    return {"mediana": statistics.median(ms), "p95": ms[max(0, int(len(ms) * 0.95) - 1)], "min": ms[0]}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Latencia de los backends de estadísticas (mongod local)")
+    ap.add_argument("--uri", default=os.getenv("MONGODB_BENCH_URI", "mongodb://localhost:27017"))
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    ap.add_argument("--usuarios", type=int, default=5000, help="Usuarios distintos en los datos sintéticos")
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--out", default=None, help="Archivo donde anexar el resultado")
+    args = ap.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=3000)
+    client.admin.command("ping")
+    db = client["accounting_bench"]
+
+    lineas = []
+    for n in args.sizes:
+        for nombre in db.list_collection_names():
+            db.drop_collection(nombre)
+        col = db["attempts"]
+        t0 = time.perf_counter()
+        sembrar(col, n, args.usuarios)
+        col.create_index([("created_at", -1)])
+        col.create_index(FACET_INDEX_KEYS, name=FACET_INDEX_NAME)
+        t_seed = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rebuild_rollup(db)
+        t_rebuild = time.perf_counter() - t0
+        lineas.append(f"{n:,} intentos · siembra {t_seed:.1f} s · rebuild_rollup {t_rebuild * 1000.0:.0f} ms")
+
+        for nombre, fn in (("anterior", kpis_anterior), ("rollup", kpis_rollup), ("facet", facet_kpis)):
+            r = medir(fn, col, args.runs)
+            lineas.append(f"  {nombre:9} mediana={r['mediana']:.1f} ms · p95={r['p95']:.1f} ms · min={r['min']:.1f} ms")
+
+    for l in lineas:
+        print(l)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write("\n".join(lineas) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,631 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Backend embebido del repositorio (sin red)
+#   Implementa el subconjunto de la API de colecciones de pymongo que usan
+#   storage, admin, attempt_stats, los writers y la caché de IA:
+#   find/find_one (con sort/limit y proyección), insert_one/insert_many,
+#   update_one (upsert, $set/$unset/$inc/$setOnInsert), delete_*,
+#   count_documents, bulk_write (pedidos planos, ver aplicar_pedidos), create_index (unique), rename y un
+#   aggregate con las etapas que usa la app ($match, $project, $set, $group,
+#   $sort, $limit, $count, $facet, $merge).
+#   - memoria: datos del proceso (pruebas de carga, CI).
+#   - SQLite: lo mismo, persistido por documento (desarrollo local).
+#   Se elige con REPO_BACKEND (ver storage.repo_init).
+# =========================================================
+
+import copy
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+_FALTA = object()
+
+
+# ---------- rutas con punto: "levels.level1.passed" ----------
+def _get(doc, path: str):
+    cur = doc
+    for parte in path.split("."):
+        if not isinstance(cur, dict) or parte not in cur:
+            return _FALTA
+        cur = cur[parte]
+    return cur
+
+
+def _set(doc: dict, path: str, valor):
+    partes = path.split(".")
+    cur = doc
+    for parte in partes[:-1]:
+        if not isinstance(cur.get(parte), dict):
+            cur[parte] = {}
+        cur = cur[parte]
+    cur[partes[-1]] = valor
+
+
+def _unset(doc: dict, path: str):
+    partes = path.split(".")
+    cur = doc
+    for parte in partes[:-1]:
+        cur = cur.get(parte)
+        if not isinstance(cur, dict):
+            return
+    cur.pop(partes[-1], None)
+
+
+# ---------- filtros ----------
+def _cmp_ok(a, b, op) -> bool:
+    if a is _FALTA or a is None or b is None:
+        return False
+    try:
+        return op(a, b)
+    except TypeError:
+        return False
+
+
+def _cond_ok(valor, cond) -> bool:
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$in":
+                if (None if valor is _FALTA else valor) not in arg:
+                    return False
+            elif op == "$nin":
+                if (None if valor is _FALTA else valor) in arg:
+                    return False
+            elif op == "$ne":
+                if (None if valor is _FALTA else valor) == arg:
+                    return False
+            elif op == "$eq":
+                if not _cond_ok(valor, arg):
+                    return False
+            elif op == "$gt":
+                if not _cmp_ok(valor, arg, lambda a, b: a > b):
+                    return False
+            elif op == "$gte":
+                if not _cmp_ok(valor, arg, lambda a, b: a >= b):
+                    return False
+            elif op == "$lt":
+                if not _cmp_ok(valor, arg, lambda a, b: a < b):
+                    return False
+            elif op == "$lte":
+                if not _cmp_ok(valor, arg, lambda a, b: a <= b):
+                    return False
+            elif op == "$exists":
+                if (valor is not _FALTA) != bool(arg):
+                    return False
+            elif op == "$regex":
+                flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+                if not isinstance(valor, str) or not re.search(arg, valor, flags):
+                    return False
+            elif op == "$options":
+                continue
+            else:
+                raise NotImplementedError(f"Operador no soportado en el backend embebido: {op}")
+        return True
+    if valor is _FALTA:
+        return cond is None
+    return valor == cond
+
+
+def matches(doc: dict, filtro: dict | None) -> bool:
+    for campo, cond in (filtro or {}).items():
+        if campo == "$or":
+            if not any(matches(doc, f) for f in cond):
+                return False
+        elif campo == "$and":
+            if not all(matches(doc, f) for f in cond):
+                return False
+        elif not _cond_ok(_get(doc, campo), cond):
+            return False
+    return True
+
+
+def _proyectar(doc: dict, proyeccion: dict | None) -> dict:
+    if not proyeccion:
+        return copy.deepcopy(doc)
+    incluir = [k for k, v in proyeccion.items() if v and k != "_id"]
+    if incluir:
+        out = {}
+        if proyeccion.get("_id", 1):
+            out["_id"] = doc.get("_id")
+        for k in incluir:
+            v = _get(doc, k)
+            if v is not _FALTA:
+                _set(out, k, copy.deepcopy(v))
+        return out
+    out = copy.deepcopy(doc)
+    for k, v in proyeccion.items():
+        if not v:
+            _unset(out, k)
+    return out
+
+
+def _clave_orden(valor):
+    # Orden estilo Mongo simplificado: faltantes/None primero, luego números, textos, fechas
+    if valor is _FALTA or valor is None:
+        return (0, 0)
+    if isinstance(valor, bool):
+        return (4, valor)
+    if isinstance(valor, (int, float)):
+        return (1, valor)
+    if isinstance(valor, str):
+        return (2, valor)
+    if isinstance(valor, datetime):
+        return (3, valor.timestamp())
+    return (5, str(valor))
+
+
+def _ordenar(docs: list, orden: list) -> list:
+    for campo, direccion in reversed(orden):
+        docs.sort(key=lambda d: _clave_orden(_get(d, campo)), reverse=direccion < 0)
+    return docs
+
+
+def _spec_orden(key, direction=None) -> list:
+    if isinstance(key, str):
+        return [(key, 1 if direction is None else direction)]
+    return list(key)
+
+
+# ---------- expresiones de agregación ----------
+def _expr(e, doc):
+    if isinstance(e, str) and e.startswith("$"):
+        v = _get(doc, e[1:])
+        return None if v is _FALTA else v
+    if isinstance(e, dict) and len(e) == 1:
+        op, arg = next(iter(e.items()))
+        if op == "$cond":
+            if isinstance(arg, dict):
+                arg = [arg["if"], arg["then"], arg["else"]]
+            return _expr(arg[1], doc) if _expr(arg[0], doc) else _expr(arg[2], doc)
+        if op == "$ifNull":
+            v = _expr(arg[0], doc)
+            return _expr(arg[1], doc) if v is None else v
+        if op == "$eq":
+            return _expr(arg[0], doc) == _expr(arg[1], doc)
+        if op == "$ne":
+            return _expr(arg[0], doc) != _expr(arg[1], doc)
+        if op == "$multiply":
+            out = 1
+            for a in arg:
+                out *= _expr(a, doc) or 0
+            return out
+        if op == "$divide":
+            a, b = _expr(arg[0], doc), _expr(arg[1], doc)
+            return (a / b) if b else None
+        if op == "$size":
+            return len(_expr(arg, doc) or [])
+    if isinstance(e, dict):
+        return {k: _expr(v, doc) for k, v in e.items()}
+    return e
+
+
+def _group(docs: list, spec: dict) -> list:
+    grupos = {}
+    for d in docs:
+        clave = _expr(spec["_id"], d)
+        k = json.dumps(clave, default=str, sort_keys=True)
+        g = grupos.setdefault(k, {"_id": clave, "_acc": {}})
+        for campo, acc in spec.items():
+            if campo == "_id":
+                continue
+            op, arg = next(iter(acc.items()))
+            v = _expr(arg, d)
+            estado = g["_acc"].setdefault(campo, {"op": op, "suma": 0, "n": 0, "set": []})
+            if op == "$sum":
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    estado["suma"] += v
+            elif op == "$avg":
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    estado["suma"] += v
+                    estado["n"] += 1
+            elif op == "$addToSet":
+                if v not in estado["set"]:
+                    estado["set"].append(v)
+            else:
+                raise NotImplementedError(f"Acumulador no soportado en el backend embebido: {op}")
+    out = []
+    for g in grupos.values():
+        fila = {"_id": g["_id"]}
+        for campo, est in g["_acc"].items():
+            if est["op"] == "$sum":
+                fila[campo] = est["suma"]
+            elif est["op"] == "$avg":
+                fila[campo] = (est["suma"] / est["n"]) if est["n"] else None
+            else:
+                fila[campo] = est["set"]
+        out.append(fila)
+    return out
+
+
+class _Cursor:
+    def __init__(self, coleccion, filtro, proyeccion):
+        self._col = coleccion
+        self._filtro = filtro
+        self._proyeccion = proyeccion
+        self._orden = []
+        self._limite = 0
+
+    def sort(self, key, direction=None):
+        self._orden = _spec_orden(key, direction)
+        return self
+
+    def limit(self, n: int):
+        self._limite = int(n)
+        return self
+
+    def __iter__(self):
+        with self._col._db._lock:
+            docs = [d for d in self._col._candidatos(self._filtro) if matches(d, self._filtro)]
+            if self._orden:
+                _ordenar(docs, self._orden)
+            if self._limite:
+                docs = docs[:self._limite]
+            return iter([_proyectar(d, self._proyeccion) for d in docs])
+
+
+# ---------- escrituras por lote, independientes del backend ----------
+# Un pedido es (tipo, args): los args del método de colección del mismo nombre.
+#   ("insert_one", (doc,)) · ("update_one", (filtro, update, upsert))
+#   ("delete_one", (filtro,)) · ("delete_many", (filtro,))
+# Mongo los recibe como InsertOne/UpdateOne/... construidos con su API pública;
+# el backend embebido los aplica directo, sin leer objetos de pymongo.
+_OPERACIONES = {
+    "insert_one": InsertOne,
+    "update_one": UpdateOne,
+    "delete_one": DeleteOne,
+    "delete_many": DeleteMany,
+}
+
+
+def aplicar_pedidos(col, pedidos, ordered: bool = True):
+    """bulk_write de pedidos (tipo, args) sobre una colección de Mongo o embebida."""
+    pedidos = list(pedidos)
+    for tipo, _ in pedidos:
+        if tipo not in _OPERACIONES:
+            raise TypeError(f"Pedido de escritura no soportado: {tipo!r}")
+    if isinstance(col, EmbeddedCollection):
+        return col.bulk_write(pedidos, ordered=ordered)
+    return col.bulk_write([_OPERACIONES[tipo](*args) for tipo, args in pedidos], ordered=ordered)
+
+
+class EmbeddedCollection:
+    def __init__(self, db, nombre: str):
+        self._db = db
+        self.name = nombre
+        self._docs = {}        # _id -> doc
+        self._unicos = {}      # campo con índice único -> {valor: _id}
+
+    @property
+    def database(self):
+        return self._db
+
+    @property
+    def full_name(self) -> str:
+        return f"{self._db.name}.{self.name}"
+
+    def with_options(self, **kwargs):
+        return self
+
+    # ----- índices -----
+    def create_index(self, keys, unique: bool = False, **kwargs):
+        campos = [keys] if isinstance(keys, str) else [k for k, _ in keys]
+        if unique and len(campos) == 1 and campos[0] not in self._unicos:
+            with self._db._lock:
+                idx = {}
+                for d in self._docs.values():
+                    v = _get(d, campos[0])
+                    if v is not _FALTA:
+                        if v in idx:
+                            raise DuplicateKeyError(f"E11000 duplicate key {campos[0]}: {v}")
+                        idx[v] = d["_id"]
+                self._unicos[campos[0]] = idx
+        return kwargs.get("name") or "_".join(f"{c}_1" for c in campos)
+
+    def _choca(self, doc: dict, ignorar_id=None) -> str | None:
+        for campo, idx in self._unicos.items():
+            v = _get(doc, campo)
+            if v is not _FALTA and idx.get(v, ignorar_id) != ignorar_id:
+                return campo
+        return None
+
+    def _indexar(self, doc: dict, quitar: bool = False):
+        for campo, idx in self._unicos.items():
+            v = _get(doc, campo)
+            if v is _FALTA:
+                continue
+            if quitar:
+                idx.pop(v, None)
+            else:
+                idx[v] = doc["_id"]
+
+    def _candidatos(self, filtro: dict):
+        """Si el filtro fija un campo único (o _id) por igualdad, evita recorrer todo."""
+        for campo, v in (filtro or {}).items():
+            if isinstance(v, dict) or campo.startswith("$"):
+                continue
+            if campo == "_id":
+                d = self._docs.get(v)
+                return [d] if d is not None else []
+            idx = self._unicos.get(campo)
+            if idx is not None:
+                _id = idx.get(v)
+                return [self._docs[_id]] if _id is not None else []
+        return self._docs.values()
+
+    # ----- lectura -----
+    def find(self, filtro=None, proyeccion=None, **kwargs):
+        return _Cursor(self, filtro or {}, proyeccion)
+
+    def find_one(self, filtro=None, proyeccion=None, **kwargs):
+        for d in self.find(filtro, proyeccion).limit(1):
+            return d
+        return None
+
+    def count_documents(self, filtro=None, **kwargs) -> int:
+        with self._db._lock:
+            return sum(1 for d in self._candidatos(filtro) if matches(d, filtro or {}))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    # ----- escritura -----
+    def _insertar(self, doc: dict):
+        if "_id" not in doc:
+            doc["_id"] = ObjectId()
+        if doc["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key _id: {doc['_id']}")
+        campo = self._choca(doc)
+        if campo:
+            raise DuplicateKeyError(f"E11000 duplicate key {campo}: {_get(doc, campo)}")
+        self._docs[doc["_id"]] = copy.deepcopy(doc)
+        self._indexar(doc)
+        self._db._persistir(self, doc["_id"])
+
+    def insert_one(self, doc: dict, **kwargs):
+        with self._db._lock:
+            self._insertar(doc)
+        return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    def insert_many(self, docs, ordered: bool = True, **kwargs):
+        docs = list(docs)
+        errores = []
+        insertados = 0
+        with self._db._lock:
+            for i, doc in enumerate(docs):
+                try:
+                    self._insertar(doc)
+                    insertados += 1
+                except DuplicateKeyError as e:
+                    errores.append({"index": i, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if errores:
+            raise BulkWriteError({"writeErrors": errores, "nInserted": insertados})
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in docs], acknowledged=True)
+
+    def _aplicar(self, doc: dict, update: dict, insertando: bool):
+        for op, campos in update.items():
+            if op == "$set" or (op == "$setOnInsert" and insertando):
+                for k, v in campos.items():
+                    _set(doc, k, copy.deepcopy(v))
+            elif op == "$unset":
+                for k in campos:
+                    _unset(doc, k)
+            elif op == "$inc":
+                for k, v in campos.items():
+                    actual = _get(doc, k)
+                    _set(doc, k, (0 if actual is _FALTA or actual is None else actual) + v)
+            elif op != "$setOnInsert":
+                raise NotImplementedError(f"Operador de update no soportado en el backend embebido: {op}")
+
+    def update_one(self, filtro: dict, update: dict, upsert: bool = False, **kwargs):
+        with self._db._lock:
+            for d in list(self._candidatos(filtro)):
+                if matches(d, filtro):
+                    nuevo = copy.deepcopy(d)
+                    self._aplicar(nuevo, update, insertando=False)
+                    campo = self._choca(nuevo, ignorar_id=d["_id"])
+                    if campo:
+                        raise DuplicateKeyError(f"E11000 duplicate key {campo}: {_get(nuevo, campo)}")
+                    cambio = nuevo != d
+                    self._indexar(d, quitar=True)
+                    self._docs[d["_id"]] = nuevo
+                    self._indexar(nuevo)
+                    if cambio:
+                        self._db._persistir(self, d["_id"])
+                    return SimpleNamespace(matched_count=1, modified_count=int(cambio), upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            nuevo = {k: v for k, v in filtro.items()
+                     if not k.startswith("$") and not (isinstance(v, dict) and any(x.startswith("$") for x in v))}
+            base = {}
+            for k, v in nuevo.items():
+                _set(base, k, v)
+            self._aplicar(base, update, insertando=True)
+            self._insertar(base)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=base["_id"])
+
+    def bulk_write(self, pedidos, ordered: bool = True, **kwargs):
+        """Pedidos (tipo, args) de aplicar_pedidos; las operaciones de pymongo no se aceptan."""
+        res = {"inserted_count": 0, "matched_count": 0, "modified_count": 0,
+               "deleted_count": 0, "upserted_count": 0}
+        errores = []
+        for i, pedido in enumerate(pedidos):
+            if not (isinstance(pedido, tuple) and len(pedido) == 2 and pedido[0] in _OPERACIONES):
+                raise TypeError(f"{pedido!r} no es un pedido (tipo, args); usa embedded_store.aplicar_pedidos")
+            tipo, args = pedido
+            try:
+                r = getattr(self, tipo)(*args)
+            except DuplicateKeyError as e:
+                errores.append({"index": i, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            if tipo == "insert_one":
+                res["inserted_count"] += 1
+            elif tipo == "update_one":
+                res["matched_count"] += r.matched_count
+                res["modified_count"] += r.modified_count
+                res["upserted_count"] += int(r.upserted_id is not None)
+            else:
+                res["deleted_count"] += r.deleted_count
+        if errores:
+            raise BulkWriteError({"writeErrors": errores, "nInserted": res["inserted_count"],
+                                  "nUpserted": res["upserted_count"]})
+        return SimpleNamespace(**res, acknowledged=True)
+
+    def delete_one(self, filtro: dict, **kwargs):
+        with self._db._lock:
+            for d in list(self._candidatos(filtro)):
+                if matches(d, filtro):
+                    del self._docs[d["_id"]]
+                    self._indexar(d, quitar=True)
+                    self._db._borrar(self, d["_id"])
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, filtro: dict, **kwargs):
+        with self._db._lock:
+            ids = [d["_id"] for d in self._candidatos(filtro) if matches(d, filtro)]
+            for _id in ids:
+                self._indexar(self._docs.pop(_id), quitar=True)
+                self._db._borrar(self, _id)
+        return SimpleNamespace(deleted_count=len(ids))
+
+    def rename(self, nuevo: str, dropTarget: bool = False, **kwargs):
+        """Como Collection.rename: mueve documentos e índices únicos a `nuevo`."""
+        with self._db._lock:
+            destino = self._db[nuevo]
+            if destino._docs and not dropTarget:
+                raise OperationFailure(f"target namespace exists: {nuevo}")
+            destino.delete_many({})
+            for _id in self._docs:
+                self._db._borrar(self, _id)
+            destino._docs, destino._unicos = self._docs, self._unicos
+            self._docs, self._unicos = {}, {}
+            for _id in destino._docs:
+                self._db._persistir(destino, _id)
+
+    # ----- agregación -----
+    def aggregate(self, pipeline: list, **kwargs):
+        with self._db._lock:
+            docs = [copy.deepcopy(d) for d in self._docs.values()]
+        return iter(self._db._pipeline(docs, pipeline))
+
+
+class EmbeddedDB:
+    """Base de datos embebida; sqlite_path=None → solo memoria."""
+
+    def __init__(self, sqlite_path: str | None = None):
+        self.name = f"sqlite:{sqlite_path}" if sqlite_path else "memoria"
+        self._lock = threading.RLock()
+        self._cols = {}
+        self._sql = None
+        if sqlite_path:
+            self._sql = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self._sql.execute("PRAGMA journal_mode=WAL")
+            self._sql.execute("CREATE TABLE IF NOT EXISTS docs (col TEXT, id TEXT, body TEXT, PRIMARY KEY (col, id))")
+            for col, body in self._sql.execute("SELECT col, body FROM docs"):
+                doc = json.loads(body, object_hook=_desde_json)
+                self[col]._docs[doc["_id"]] = doc
+
+    def __getitem__(self, nombre: str) -> EmbeddedCollection:
+        with self._lock:
+            c = self._cols.get(nombre)
+            if c is None:
+                c = self._cols[nombre] = EmbeddedCollection(self, nombre)
+            return c
+
+    def get_collection(self, nombre: str, **kwargs) -> EmbeddedCollection:
+        return self[nombre]
+
+    def list_collection_names(self) -> list:
+        return [n for n, c in self._cols.items() if c._docs]
+
+    def drop_collection(self, nombre: str):
+        self[nombre].delete_many({})
+
+    def command(self, cmd, *args, **kwargs):
+        return {"ok": 1.0}
+
+    # ----- persistencia SQLite (escritura por documento) -----
+    def _persistir(self, col: EmbeddedCollection, _id):
+        if self._sql is not None:
+            body = json.dumps(col._docs[_id], default=_a_json, ensure_ascii=False)
+            self._sql.execute("INSERT OR REPLACE INTO docs (col, id, body) VALUES (?, ?, ?)",
+                              (col.name, _clave_id(_id), body))
+
+    def _borrar(self, col: EmbeddedCollection, _id):
+        if self._sql is not None:
+            self._sql.execute("DELETE FROM docs WHERE col = ? AND id = ?", (col.name, _clave_id(_id)))
+
+    # ----- pipeline -----
+    def _pipeline(self, docs: list, pipeline: list) -> list:
+        for etapa in pipeline:
+            op, arg = next(iter(etapa.items()))
+            if op == "$match":
+                docs = [d for d in docs if matches(d, arg)]
+            elif op == "$project":
+                if all(v in (0, 1, True, False) for v in arg.values()):
+                    docs = [_proyectar(d, arg) for d in docs]
+                else:
+                    docs = [{**({"_id": d.get("_id")} if arg.get("_id", 1) else {}),
+                             **{k: (_get(d, k) if v in (1, True) else _expr(v, d))
+                                for k, v in arg.items() if k != "_id"}} for d in docs]
+            elif op in ("$set", "$addFields"):
+                for d in docs:
+                    for k, v in arg.items():
+                        _set(d, k, _expr(v, d))
+            elif op == "$group":
+                docs = _group(docs, arg)
+            elif op == "$sort":
+                docs = _ordenar(docs, list(arg.items()))
+            elif op == "$limit":
+                docs = docs[:arg]
+            elif op == "$count":
+                docs = [{arg: len(docs)}] if docs else []
+            elif op == "$facet":
+                docs = [{k: self._pipeline([copy.deepcopy(d) for d in docs], sub) for k, sub in arg.items()}]
+            elif op == "$merge":
+                destino = self[arg["into"] if isinstance(arg, dict) else arg]
+                mantener = isinstance(arg, dict) and arg.get("whenMatched") == "keepExisting"
+                with self._lock:
+                    for d in docs:
+                        if d.get("_id") in destino._docs and mantener:
+                            continue
+                        if d.get("_id") in destino._docs:
+                            destino._indexar(destino._docs[d["_id"]], quitar=True)
+                        destino._docs[d["_id"]] = copy.deepcopy(d)
+                        destino._indexar(d)
+                        self._persistir(destino, d["_id"])
+                docs = []
+            else:
+                raise NotImplementedError(f"Etapa no soportada en el backend embebido: {op}")
+        return docs
+
+
+def _clave_id(_id) -> str:
+    return json.dumps(_id, default=_a_json, sort_keys=True)
+
+
+def _a_json(v):
+    if isinstance(v, datetime):
+        return {"$date": v.isoformat()}
+    if isinstance(v, ObjectId):
+        return {"$oid": str(v)}
+    raise TypeError(f"Tipo no serializable: {type(v).__name__}")
+
+
+def _desde_json(d: dict):
+    if len(d) == 1:
+        if "$date" in d:
+            return datetime.fromisoformat(d["$date"])
+        if "$oid" in d:
+            return ObjectId(d["$oid"])
+    return d
@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   IA (DeepSeek vía OpenRouter)
+#   Llamadas al modelo con fallback y evaluadores abiertos
+#   (el parseo de JSON vive en ia_decode).
+# =========================================================
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import streamlit as st
+from openai import APIConnectionError, BadRequestError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from ia_cache import cache_lookup, cache_store, grading_key
+from ia_decode import EVAL_SCHEMA, decode_json, response_format_for, supports_structured
+from ia_ratelimit import IARateLimited, get_rate_limiter
+from ia_router import get_router
+from ia_transport import with_retries
+from resources import get_grading_pool, get_hedge_pool, get_openai_client, get_openrouter_api_key
+from rubric_classifier import decision_local
+
+PRIMARY_MODEL  = "deepseek/deepseek-chat-v3.1:free"
+FALLBACK_MODEL = "openai/gpt-oss-20b:free"
+
+# Presupuesto (ms) antes de disparar el modelo de respaldo en paralelo (0 = sin hedging)
+IA_HEDGE_MS = float(os.getenv("IA_HEDGE_MS", "0"))
+
+# Tiempo máximo (s) que un examen espera por TODAS sus preguntas abiertas
+EXAM_AI_DEADLINE_S = float(os.getenv("EXAM_AI_DEADLINE_S", "25"))
+
+# Modelos que rechazaron response_format en este proceso (no se les vuelve a pedir)
+_SIN_STRUCTURED = set()
+
+def _chat_with_model(model_name: str, messages: list, temperature: float = 0.2, schema: dict | None = None):
+    client = get_openai_client(get_openrouter_api_key())
+    extra = {}
+    if schema and supports_structured(model_name) and model_name not in _SIN_STRUCTURED:
+        extra["response_format"] = response_format_for(schema)
+    try:
+        completion = with_retries(
+            lambda: client.chat.completions.create(
+                model=model_name,
+                messages=messages,
+                temperature=temperature,
+                extra_body={},
+                **extra
+            ),
+            (APIConnectionError,),
+            etiqueta=model_name,
+        )
+    except BadRequestError as e:
+        if not extra or not _es_error_structured(str(e)):
+            raise
+        # El endpoint no soporta salida estructurada: se recuerda y se repite sin esquema
+        _SIN_STRUCTURED.add(model_name)
+        return _chat_with_model(model_name, messages, temperature)
+    return (completion.choices[0].message.content or "").strip()
+
+def _es_error_structured(msg: str) -> bool:
+    low = msg.lower()
+    return "response_format" in low or "json_schema" in low or "structured" in low
+
+def _es_error_proveedor(msg: str) -> bool:
+    """Errores típicos del proveedor donde vale la pena probar otro modelo."""
+    return "Model is at capacity" in msg or "Provider returned error" in msg
+
+
+def _routed_call(router, model_name: str, messages: list, temperature: float, schema: dict | None = None) -> str:
+    """
+    Llama a un modelo respetando el limitador de tasa compartido y registra el
+    resultado en el enrutador (salud por modelo). Sin cupo → IARateLimited.
+    """
+    if not get_rate_limiter().acquire(model_name):
+        raise IARateLimited(f"IA_RATE_LIMITED: {model_name}")
+    t0 = time.perf_counter()
+    try:
+        out = _chat_with_model(model_name, messages, temperature, schema)
+    except BadRequestError as e:
+        msg = str(e)
+        if _es_error_proveedor(msg):
+            router.registrar(model_name, False, (time.perf_counter() - t0) * 1000.0,
+                             saturado="Model is at capacity" in msg, error=msg)
+        # Errores de prompt/malformed request no cuentan contra la salud del modelo
+        raise
+    except Exception as e:
+        router.registrar(model_name, False, (time.perf_counter() - t0) * 1000.0, error=str(e))
+        raise
+    router.registrar(model_name, True, (time.perf_counter() - t0) * 1000.0)
+    return out
+
+
+def _hedged_call(router, modelos: list, messages: list, temperature: float, schema: dict | None = None) -> str:
+    """
+    Lanza el modelo preferido; si no responde dentro de IA_HEDGE_MS, dispara
+    también el siguiente y se queda con la primera respuesta exitosa.
+    """
+    pool = get_hedge_pool()
+    ctx = get_script_run_ctx()
+    submit = lambda m: pool.submit(_with_script_ctx(lambda: _routed_call(router, m, messages, temperature, schema), ctx))
+
+    restantes = list(modelos[1:])
+    pendientes = {submit(modelos[0])}
+    wait(pendientes, timeout=IA_HEDGE_MS / 1000.0)
+    last_err = None
+    while pendientes:
+        if restantes and not any(f.done() for f in pendientes):
+            router.registrar_hedge()
+            pendientes.add(submit(restantes.pop(0)))
+        listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+        for f in listos:
+            try:
+                return f.result()
+            except BadRequestError as e:
+                if not _es_error_proveedor(str(e)):
+                    raise
+                last_err = e
+            except Exception as e:
+                last_err = e
+        # El que terminó falló: si quedan modelos sin lanzar, va el siguiente ya
+        if restantes and not pendientes:
+            pendientes.add(submit(restantes.pop(0)))
+    if isinstance(last_err, IARateLimited):
+        raise last_err
+    raise RuntimeError(f"IA_BOTH_FAILED: {last_err}")
+
+
+def ia_call(messages: list, temperature: float = 0.2, schema: dict | None = None) -> str:
+    """
+    Llama a los modelos en el orden que indica el enrutador (primario, luego fallback),
+    saltando los que tienen el circuito abierto por saturación o errores recientes.
+    Con IA_HEDGE_MS > 0, si el primero tarda más de ese presupuesto se lanza el siguiente en paralelo.
+    Con schema (ver ia_decode), los modelos que lo soportan responden JSON estructurado.
+    Si todos fallan (o no hay ninguno disponible), lanza RuntimeError para que los
+    niveles usen el fallback pedagógico local.
+    """
+    if not get_openrouter_api_key():
+        raise RuntimeError("IA_NO_API_KEY")
+
+    router = get_router()
+    modelos = router.orden([PRIMARY_MODEL, FALLBACK_MODEL])
+    if not modelos:
+        raise RuntimeError("IA_CIRCUIT_OPEN")
+
+    if IA_HEDGE_MS > 0 and len(modelos) > 1:
+        return _hedged_call(router, modelos, messages, temperature, schema)
+
+    last_err = None
+    for model_name in modelos:
+        try:
+            return _routed_call(router, model_name, messages, temperature, schema)
+        except BadRequestError as e:
+            if not _es_error_proveedor(str(e)):
+                # Errores de prompt/malformed request → relanzamos
+                raise
+            last_err = e
+        except Exception as e:
+            # Sin cupo, timeout, red, etc. → siguiente modelo
+            last_err = e
+
+    if isinstance(last_err, IARateLimited):
+        raise last_err
+    # Todos los modelos fallaron
+    raise RuntimeError(f"IA_BOTH_FAILED: {last_err}")
+
+
+def _feedback_messages(prompt_user: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Eres un tutor de contabilidad empático y claro. "
+                "Explica en máximo 6 líneas el acierto/error del estudiante, "
+                "resalta la fórmula clave o el concepto y ofrece 1 truco memotécnico."
+            )
+        },
+        {"role": "user", "content": prompt_user}
+    ]
+
+
+def ia_feedback(prompt_user: str) -> str:
+    """
+    Usa OpenRouter con fallback de modelos para dar feedback educativo breve.
+    Si no hay API key o fallan ambos modelos, devuelve mensaje local.
+    """
+    if not get_openrouter_api_key():
+        return "Feedback IA no disponible. Tus resultados se validaron localmente."
+
+    try:
+        return ia_call(_feedback_messages(prompt_user), temperature=0.3)
+    except Exception:
+        return "No pude generar feedback con IA ahora. Tus resultados se validaron localmente."
+
+
+def ia_feedback_or_default(prompt_user: str, default: str = "", flag_key: str | None = None) -> str:
+    """
+    Feedback de IA para calificación: nunca duerme ni reintenta en el hilo del script.
+    El limitador compartido decide si hay cupo; si no hay cupo, no hay API key o
+    fallan los modelos → devuelve `default` (activa los fallbacks locales).
+    Con `flag_key`, marca st.session_state[flag_key]=True cuando el motivo fue el límite de tasa.
+    """
+    if flag_key:
+        st.session_state.pop(flag_key, None)
+    if not get_openrouter_api_key():
+        return default
+    try:
+        resp = ia_call(_feedback_messages(prompt_user), temperature=0.3)
+    except IARateLimited:
+        if flag_key:
+            st.session_state[flag_key] = True
+        return default
+    except Exception:
+        return default
+    return resp or default
+
+
+# ===========================
+# Streaming (feedback que aparece token a token)
+# ===========================
+def _stream_with_model(model_name: str, messages: list, temperature: float = 0.2):
+    """Abre el stream (con reintentos de red) y devuelve un generador de fragmentos de texto."""
+    client = get_openai_client(get_openrouter_api_key())
+    stream = with_retries(
+        lambda: client.chat.completions.create(
+            model=model_name,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            extra_body={}
+        ),
+        (APIConnectionError,),
+        etiqueta=model_name,
+    )
+    for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+def ia_call_stream(messages: list, temperature: float = 0.2):
+    """
+    Versión en streaming de ia_call: genera el texto a medida que llega.
+    Mismo orden de modelos que el enrutador; si un modelo falla ANTES del
+    primer token se pasa al siguiente. Si todos fallan, lanza RuntimeError.
+    """
+    if not get_openrouter_api_key():
+        raise RuntimeError("IA_NO_API_KEY")
+
+    router = get_router()
+    modelos = router.orden([PRIMARY_MODEL, FALLBACK_MODEL])
+    if not modelos:
+        raise RuntimeError("IA_CIRCUIT_OPEN")
+
+    last_err = None
+    for model_name in modelos:
+        if not get_rate_limiter().acquire(model_name):
+            last_err = IARateLimited(f"IA_RATE_LIMITED: {model_name}")
+            continue
+        t0 = time.perf_counter()
+        try:
+            gen = _stream_with_model(model_name, messages, temperature)
+            primero = next(gen, "")
+        except BadRequestError as e:
+            msg = str(e)
+            if not _es_error_proveedor(msg):
+                raise
+            router.registrar(model_name, False, (time.perf_counter() - t0) * 1000.0,
+                             saturado="Model is at capacity" in msg, error=msg)
+            last_err = e
+            continue
+        except Exception as e:
+            router.registrar(model_name, False, (time.perf_counter() - t0) * 1000.0, error=str(e))
+            last_err = e
+            continue
+
+        if not primero:
+            router.registrar(model_name, False, (time.perf_counter() - t0) * 1000.0, error="respuesta vacía")
+            last_err = RuntimeError("respuesta vacía")
+            continue
+
+        # Ya hay texto en pantalla: desde aquí no se cambia de modelo
+        # (para el enrutador, la latencia de un stream es el tiempo al primer token)
+        router.registrar(model_name, True, (time.perf_counter() - t0) * 1000.0)
+        yield primero
+        try:
+            yield from gen
+        except Exception:
+            yield "\n\n_(La respuesta de la IA se interrumpió.)_"
+        return
+
+    raise RuntimeError(f"IA_BOTH_FAILED: {last_err}")
+
+
+def ia_feedback_stream(prompt_user: str):
+    """
+    Igual que ia_feedback pero en streaming (para st.write_stream).
+    Si no hay API key o fallan los modelos antes del primer token, genera el mensaje local.
+    """
+    if not get_openrouter_api_key():
+        yield "Feedback IA no disponible. Tus resultados se validaron localmente."
+        return
+
+    try:
+        yield from ia_call_stream(_feedback_messages(prompt_user), temperature=0.3)
+    except Exception:
+        yield "No pude generar feedback con IA ahora. Tus resultados se validaron localmente."
+
+
+def eval_ia_explicacion(pregunta: str, criterios: str, respuesta_estudiante: str) -> tuple[bool, str, str]:
+    """
+    Evalúa con IA una explicación abierta contra 'pregunta' y 'criterios'.
+    Devuelve: (aprobado_bool, comentario_corto, retroalimentacion).
+    """
+    texto = (respuesta_estudiante or "").strip()
+
+    # Respuestas casi idénticas a la misma pregunta → misma calificación (sin llamar a la IA)
+    cache_key = grading_key(texto, pregunta, criterios, f"{PRIMARY_MODEL}|{FALLBACK_MODEL}")
+    cached = cache_lookup(cache_key)
+    if cached is not None:
+        return cached
+
+    system_msg = {
+        "role": "system",
+        "content": (
+            "Eres un tutor de contabilidad empático, alentador y claro. "
+            "Siempre retroalimentas con tono amable, sin regaños ni juicios. "
+            "Estructura tu respuesta pedagógica así: "
+            "1) Refuerzo positivo breve; "
+            "2) Explicación clara y paso a paso; "
+            "3) Analogía simple (por ejemplo: 'mochila de costos', 'balanza', 'caja que se vacía'); "
+            "4) Un consejo práctico (‘siguiente paso’) para mejorar. "
+            "Usa terminología local de Colombia: CMV (Costo de la Mercancía Vendida), no COGS. "
+            "Evita tecnicismos innecesarios, sé conciso y motivador."
+        )
+    }
+
+    user_msg = {
+        "role": "user",
+        "content": (
+            f"Pregunta de evaluación:\n«{pregunta}»\n\n"
+            f"Criterios orientadores:\n{criterios}\n\n"
+            "Evalúa con máxima flexibilidad pedagógica.\n"
+            "La respuesta debe marcarse como APROBADA si expresa la idea central, "
+            "aunque use palabras distintas, sea breve, no sea técnica o no esté perfectamente redactada.\n"
+            "No exijas redacción textual, definiciones literales ni todos los criterios al mismo tiempo.\n"
+            "Solo marca como NO aprobada si:\n"
+            "1) contradice la idea contable principal,\n"
+            "2) afirma lo contrario,\n"
+            "3) no responde la pregunta,\n"
+            "4) es incoherente o totalmente ajena al tema.\n\n"
+            "Responde EXCLUSIVAMENTE con este JSON (una sola línea, sin texto extra):\n"
+            "{"
+            "\"aprobado\": true|false, "
+            "\"comentario_corto\": \"máximo 20 palabras, amable y flexible\", "
+            "\"retroalimentacion\": \"máximo 120 palabras, pedagógica, amable, reconociendo aciertos parciales\""
+            "}\n\n"
+            f"Respuesta del estudiante: \"{respuesta_estudiante.strip()}\""
+        )
+    }
+
+    try:
+        t0 = time.perf_counter()
+        raw = ia_call([system_msg, user_msg], temperature=0.25, schema=EVAL_SCHEMA)
+        st.session_state["eval_raw"] = raw  # opcional diagnóstico
+        data = decode_json(raw)
+
+        aprobado = bool(data.get("aprobado"))
+        comentario = (data.get("comentario_corto") or "").strip()
+        retro = (data.get("retroalimentacion") or "").strip()
+
+        if not comentario:
+            comentario = "IA: evaluación recibida."
+        else:
+            comentario = f"IA: {comentario}"
+        if not retro:
+            retro = ("Recuerda: al disminuir el inventario final se resta menos; por eso el CMV aumenta.")
+
+        cache_store(cache_key, (aprobado, comentario, retro), (time.perf_counter() - t0) * 1000.0)
+        return aprobado, comentario, retro
+
+    except Exception as e:
+        # Fallback mínimo
+        t = (texto or "").lower()
+        inv_down = any(w in t for w in ["disminuye","disminuir","baja","menor","reduce","decrece","muy pequeño"])
+        cost_up  = any(w in t for w in ["aumenta","sube","mayor","incrementa"])
+        resta_menos = ("resta menos" in t) or ("se resta menos" in t)
+
+        aprobado = inv_down and (cost_up or resta_menos)
+        comentario = "Fallback: la IA no estuvo disponible."
+        retro = ("Si el inventario final es muy pequeño, se descuenta menos en la fórmula y el CMV aumenta. "
+                 "Memotecnia: «menos inventario final → más CMV».")
+        return aprobado, comentario, retro
+
+def n1_eval_open_ai(respuesta_estudiante: str) -> tuple[bool, str, str]:
+    """
+    Evaluación flexible de la respuesta abierta del Nivel 1.
+    Acepta respuestas cortas siempre que la idea central sea correcta:
+    → Cuando el inventario final disminuye, el CMV AUMENTA.
+    """
+
+    pregunta = (
+        "Explica qué ocurre con el costo de la mercancía vendida (CMV) cuando "
+        "disminuye el inventario final, manteniendo constantes los demás elementos."
+    )
+
+    criterios = (
+        "Idea central esperada: cuando disminuye el inventario final, aumenta el CMV.\n"
+        "Aprueba cualquier respuesta que comunique esa relación, aunque sea breve, "
+        "informal, incompleta o con redacción no técnica.\n"
+        "También aprueba variantes como:\n"
+        "- 'Aumenta el CMV'\n"
+        "- 'El costo de venta sube'\n"
+        "- 'Si baja el inventario final, el CMV aumenta'\n"
+        "- 'Se resta menos al final, por eso sube el CMV'\n"
+        "No exijas explicación completa.\n"
+        "Solo reprueba si dice que disminuye, que no cambia, o si la respuesta no tiene relación."
+    )
+
+    # Primer filtro local: las respuestas claras se califican al instante, sin IA
+    local = decision_local("n1_cmv_inv_final", respuesta_estudiante)
+    if local is not None:
+        aprobado, retro = local
+        return aprobado, "Rúbrica: respuesta evaluada al instante.", retro
+
+    # Llamamos a la misma función que usas en todo el proyecto
+    return eval_ia_explicacion(
+        pregunta=pregunta,
+        criterios=criterios,
+        respuesta_estudiante=respuesta_estudiante
+    )
+
+
+# ===========================
+# Calificación concurrente de preguntas abiertas
+# ===========================
+def _with_script_ctx(fn, ctx):
+    """Ejecuta fn en un hilo del pool con el contexto de la sesión (para st.session_state)."""
+    def run():
+        th = threading.current_thread()
+        add_script_run_ctx(th, ctx)
+        try:
+            return fn()
+        finally:
+            add_script_run_ctx(th, None)
+    return run
+
+
+def grade_open_answers(jobs: dict, fallbacks: dict, deadline_s: float | None = None) -> dict:
+    """
+    Califica todas las preguntas abiertas de un envío a la vez.
+    - jobs: {clave: función sin argumentos que llama a la IA y devuelve el resultado}
+    - fallbacks: {clave: función sin argumentos con la heurística local (sin IA)}
+    Un único plazo global: lo que no haya terminado (o haya fallado) al vencer
+    se resuelve con su fallback. Devuelve {clave: resultado}.
+    """
+    if deadline_s is None:
+        deadline_s = EXAM_AI_DEADLINE_S
+
+    pool = get_grading_pool()
+    ctx = get_script_run_ctx()
+    t0 = time.perf_counter()
+    futures = {k: pool.submit(_with_script_ctx(fn, ctx)) for k, fn in jobs.items()}
+    wait(list(futures.values()), timeout=deadline_s)
+
+    results, pending = {}, []
+    for k, fut in futures.items():
+        if fut.done() and not fut.cancelled() and fut.exception() is None:
+            results[k] = fut.result()
+            continue
+        fut.cancel()  # si aún no arrancó, no se ejecuta; si ya corre, se ignora su resultado
+        pending.append(k)
+        results[k] = fallbacks[k]()
+
+    st.session_state["exam_grading_last"] = {
+        "preguntas": len(jobs),
+        "por_fallback": pending,
+        "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+    }
+    return results
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Caché de calificaciones de IA
+#   Muchas respuestas abiertas son casi idénticas ("el CMV aumenta").
+#   Se guardan por (respuesta normalizada + pregunta/criterios + modelo):
+#   - LRU en memoria del proceso (instantáneo).
+#   - Colección Mongo con índice TTL (compartida entre procesos/reinicios).
+# =========================================================
+
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import streamlit as st
+
+AI_CACHE_COLLECTION = "ai_grading_cache"
+AI_CACHE_TTL_DAYS = int(os.getenv("AI_CACHE_TTL_DAYS", "30"))
+AI_CACHE_LRU_SIZE = int(os.getenv("AI_CACHE_LRU_SIZE", "2048"))
+
+
+def normalize_answer(text: str) -> str:
+    """Minúsculas, sin tildes y con espacios colapsados."""
+    t = unicodedata.normalize("NFKD", (text or "").lower())
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return " ".join(t.split())
+
+
+def grading_key(respuesta: str, pregunta: str, criterios: str, modelo: str) -> str:
+    base = "\x1f".join([normalize_answer(respuesta), pregunta or "", criterios or "", modelo or ""])
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+class _GradingCache:
+    """LRU + contadores; thread-safe porque los exámenes califican en paralelo."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits_memoria": 0, "hits_mongo": 0, "misses": 0, "ms_ahorrados": 0.0}
+
+    def get_local(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+            return entry
+
+    def put_local(self, key, entry):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def count(self, campo: str, ms: float = 0.0):
+        with self._lock:
+            self.stats[campo] += 1
+            self.stats["ms_ahorrados"] += ms
+
+
+@st.cache_resource(show_spinner=False)
+def _get_cache() -> _GradingCache:
+    return _GradingCache(AI_CACHE_LRU_SIZE)
+
+
+def _cache_col():
+    return st.session_state.get("ai_cache_col")
+
+
+def cache_lookup(key: str):
+    """Devuelve (aprobado, comentario, retro) si está en caché; None si no."""
+    cache = _get_cache()
+    entry = cache.get_local(key)
+    if entry is not None:
+        cache.count("hits_memoria", entry["latency_ms"])
+        return tuple(entry["resultado"])
+
+    col = _cache_col()
+    if col is not None:
+        try:
+            doc = col.find_one({"_id": key}, {"resultado": 1, "latency_ms": 1})
+        except Exception:
+            doc = None
+        if doc:
+            entry = {"resultado": doc["resultado"], "latency_ms": float(doc.get("latency_ms") or 0.0)}
+            cache.put_local(key, entry)
+            cache.count("hits_mongo", entry["latency_ms"])
+            return tuple(entry["resultado"])
+
+    cache.count("misses")
+    return None
+
+
+def cache_store(key: str, resultado: tuple, latency_ms: float):
+    """Guarda una calificación exitosa de la IA (nunca los fallbacks locales)."""
+    entry = {"resultado": list(resultado), "latency_ms": round(latency_ms, 1)}
+    _get_cache().put_local(key, entry)
+
+    col = _cache_col()
+    if col is None:
+        return
+    try:
+        col.update_one(
+            {"_id": key},
+            {"$set": {**entry, "created_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    except Exception:
+        pass
+
+
+def cache_stats() -> dict:
+    """Contadores del proceso: aciertos, fallos, tasa y latencia ahorrada."""
+    cache = _get_cache()
+    with cache._lock:
+        s = dict(cache.stats)
+        s["entradas_memoria"] = len(cache._lru)
+    hits = s["hits_memoria"] + s["hits_mongo"]
+    total = hits + s["misses"]
+    s["tasa_hit_%"] = (hits / total * 100.0) if total else 0.0
+    return s
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Decodificación de respuestas de la IA
+#   - Esquemas JSON para pedir salida estructurada (response_format) a los
+#     modelos que la soportan.
+#   - decode_json: parser tolerante de UNA sola pasada para el resto:
+#     toma el primer objeto {...} balanceado y, mientras lo recorre,
+#     normaliza comillas simples/tipográficas y quita comas finales;
+#     luego un único json.loads.
+# =========================================================
+
+import json
+import os
+import re
+
+# Modelos (prefijos) a los que se les pide JSON con esquema; el resto usa el parser tolerante
+IA_STRUCTURED_PREFIXES = tuple(
+    p.strip() for p in os.getenv("IA_STRUCTURED_PREFIXES", "openai/").split(",") if p.strip()
+)
+
+# Textos de error del proveedor que a veces llegan como "respuesta"
+_ERRORES_PROVEEDOR = ("no endpoints found", "unauthorized", "rate limit", "timeout")
+
+_ABRE = {'"': '"', "'": "'", "“": "”", "”": "”"}
+_CIERRA = {'"': '"', "'": "'", "”": "”"}
+_ESPECIALES = frozenset('"\'“”’{}]\\\n')
+# Tramos sin caracteres especiales (se copian de una vez) o un carácter suelto
+_TOKENS = re.compile(r'[^"\'“”’{}\]\\\n]+|[\s\S]')
+
+EVAL_SCHEMA = {
+    "name": "evaluacion_explicacion",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "aprobado": {"type": "boolean"},
+            "comentario_corto": {"type": "string"},
+            "retroalimentacion": {"type": "string"},
+        },
+        "required": ["aprobado", "comentario_corto", "retroalimentacion"],
+        "additionalProperties": False,
+    },
+}
+
+
+def supports_structured(model_name: str) -> bool:
+    return model_name.startswith(IA_STRUCTURED_PREFIXES)
+
+
+def response_format_for(schema: dict | None) -> dict | None:
+    """response_format de OpenAI/OpenRouter para un esquema (o None)."""
+    if not schema:
+        return None
+    return {"type": "json_schema", "json_schema": schema}
+
+
+def _extraer_objeto(t: str) -> str | None:
+    """
+    Una pasada desde el primer '{': devuelve el objeto ya normalizado
+    (comillas → ", sin comas finales) o None si no hay '{'.
+    Los tramos de texto sin caracteres especiales se copian en bloque.
+    Si el objeto no cierra, cierra lo que quedó abierto.
+    """
+    start = t.find("{")
+    if start == -1:
+        return None
+
+    out = []
+    profundidad = 0
+    cierre = None   # comilla que cierra el string actual (None = fuera de string)
+    esc = False
+    for m in _TOKENS.finditer(t, start):
+        tok = m.group()
+        if len(tok) > 1 or tok not in _ESPECIALES:
+            if esc:
+                esc = False
+            out.append(tok)
+            continue
+
+        ch = tok
+        if cierre is not None:
+            if esc:
+                out.append(ch)
+                esc = False
+            elif ch == "\\":
+                out.append(ch)
+                esc = True
+            elif ch == cierre or (cierre == "”" and ch == "“"):
+                out.append('"')
+                cierre = None
+            elif ch == '"':          # comilla doble dentro de un string con comillas simples
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append("'" if ch == "’" else ch)
+            continue
+
+        if ch in _ABRE:
+            cierre = _CIERRA.get(ch, "”")
+            out.append('"')
+        elif ch == "}" or ch == "]":
+            # quitar coma final: {"a": 1,} / [1, 2,]
+            j = len(out) - 1
+            while j >= 0 and not out[j].strip():
+                j -= 1
+            if j >= 0:
+                previo = out[j].rstrip()
+                if previo.endswith(","):
+                    out[j] = previo[:-1]
+            out.append(ch)
+            if ch == "}":
+                profundidad -= 1
+                if profundidad == 0:
+                    return "".join(out)
+        else:
+            if ch == "{":
+                profundidad += 1
+            out.append(ch)
+
+    # No cerró: cerramos string y llaves pendientes
+    if cierre is not None:
+        out.append('"')
+    out.append("}" * max(0, profundidad))
+    return "".join(out)
+
+
+def decode_json(raw: str) -> dict:
+    """
+    Extrae y parsea el primer objeto JSON de la respuesta del modelo.
+    Tolera ```json fences, tokens raros, comillas simples o tipográficas,
+    comas finales, 'aprobo' y texto extra antes/después del JSON.
+    Lanza RuntimeError si no hay JSON utilizable.
+    """
+    t = raw or ""
+    candidato = _extraer_objeto(t)
+    if candidato is None:
+        low = t.lower()
+        if any(e in low for e in _ERRORES_PROVEEDOR):
+            raise RuntimeError(t.strip())
+        raise RuntimeError("No se encontró '{' en la respuesta del modelo.")
+
+    try:
+        data = json.loads(candidato)
+    except ValueError as e:
+        raise RuntimeError(f"JSON inválido en la respuesta del modelo: {e}")
+    if not isinstance(data, dict):
+        raise RuntimeError("La respuesta del modelo no es un objeto JSON.")
+    if "aprobo" in data and "aprobado" not in data:
+        data["aprobado"] = data.pop("aprobo")
+    return data
+
+
+def decode_json_or_empty(raw: str) -> dict:
+    """Igual que decode_json pero devuelve {} si no puede parsear."""
+    try:
+        return decode_json(raw)
+    except Exception:
+        return {}
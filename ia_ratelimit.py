@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Limitador de tasa compartido (token bucket por modelo)
+#   Un presupuesto de requests/minuto por modelo para TODO el proceso,
+#   en lugar de que cada sesión reintente con sleeps y multiplique los 429:
+#   - Hay cupo → se atiende de inmediato.
+#   - El cupo llega dentro de IA_RATE_MAX_WAIT_S → se encola (reserva) y espera.
+#   - Si no → se rechaza al instante para pasar al siguiente modelo / fallback local.
+# =========================================================
+
+import os
+import threading
+import time
+
+import streamlit as st
+
+IA_RPM = float(os.getenv("IA_RPM", "20"))
+IA_RATE_MAX_WAIT_S = float(os.getenv("IA_RATE_MAX_WAIT_S", "2"))
+
+
+class IARateLimited(RuntimeError):
+    """No hubo cupo en el limitador para el modelo dentro de la espera máxima."""
+
+
+def _rpm_por_modelo() -> dict:
+    """IA_RPM_POR_MODELO="modelo_a=20,modelo_b=40" sobreescribe IA_RPM por modelo."""
+    out = {}
+    for par in os.getenv("IA_RPM_POR_MODELO", "").split(","):
+        if "=" in par:
+            modelo, rpm = par.rsplit("=", 1)
+            try:
+                out[modelo.strip()] = float(rpm)
+            except ValueError:
+                pass
+    return out
+
+
+class _Bucket:
+    __slots__ = ("rpm", "tokens", "ts", "servidas", "encoladas", "rechazadas")
+
+    def __init__(self, rpm: float):
+        self.rpm = rpm
+        self.tokens = rpm  # arranca lleno: permite una ráfaga de hasta rpm requests
+        self.ts = time.monotonic()
+        self.servidas = 0
+        self.encoladas = 0
+        self.rechazadas = 0
+
+    def recargar(self, ahora: float):
+        self.tokens = min(self.rpm, self.tokens + (ahora - self.ts) * self.rpm / 60.0)
+        self.ts = ahora
+
+
+class RateLimiter:
+    def __init__(self, rpm_default: float, rpm_por_modelo: dict):
+        self._lock = threading.Lock()
+        self._rpm_default = rpm_default
+        self._rpm_por_modelo = rpm_por_modelo
+        self._buckets = {}
+
+    def _bucket(self, modelo) -> _Bucket:
+        b = self._buckets.get(modelo)
+        if b is None:
+            b = self._buckets[modelo] = _Bucket(self._rpm_por_modelo.get(modelo, self._rpm_default))
+        return b
+
+    def acquire(self, modelo: str, max_wait_s: float | None = None) -> bool:
+        """True si el request puede salir (quizá tras esperar); False si no hay cupo a tiempo."""
+        if max_wait_s is None:
+            max_wait_s = IA_RATE_MAX_WAIT_S
+        with self._lock:
+            b = self._bucket(modelo)
+            if b.rpm <= 0:  # sin límite
+                b.servidas += 1
+                return True
+            b.recargar(time.monotonic())
+            if b.tokens >= 1:
+                b.tokens -= 1
+                b.servidas += 1
+                return True
+            espera = (1 - b.tokens) * 60.0 / b.rpm
+            if espera > max_wait_s:
+                b.rechazadas += 1
+                return False
+            # Reserva el token (puede quedar negativo) para respetar el orden de llegada
+            b.tokens -= 1
+            b.encoladas += 1
+        time.sleep(espera)
+        with self._lock:
+            b.servidas += 1
+        return True
+
+    def snapshot(self) -> list:
+        with self._lock:
+            ahora = time.monotonic()
+            filas = []
+            for modelo, b in self._buckets.items():
+                b.recargar(ahora)
+                filas.append({
+                    "modelo": modelo,
+                    "rpm": b.rpm,
+                    "cupo_disponible": round(max(0.0, b.tokens), 1),
+                    "servidas": b.servidas,
+                    "encoladas": b.encoladas,
+                    "rechazadas": b.rechazadas,
+                })
+            return filas
+
+
+@st.cache_resource(show_spinner=False)
+def get_rate_limiter() -> RateLimiter:
+    return RateLimiter(IA_RPM, _rpm_por_modelo())
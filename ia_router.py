@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Enrutador de modelos IA con circuit breaker
+#   Estado compartido por todo el proceso (todas las sesiones):
+#   - Ventana móvil por modelo: tasa de error y p95 de latencia.
+#   - Circuito abierto durante un enfriamiento si el modelo se satura
+#     ("Model is at capacity") o su tasa de error supera el umbral.
+#   - Orden de preferencia: modelos sanos primero; el primario cede el
+#     turno si su p95 excede el presupuesto y el otro es más rápido.
+# =========================================================
+
+import os
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+
+ROUTER_WINDOW = int(os.getenv("IA_ROUTER_WINDOW", "50"))                 # últimas N llamadas
+ROUTER_MIN_CALLS = int(os.getenv("IA_ROUTER_MIN_CALLS", "5"))            # mínimo para juzgar tasa
+ROUTER_ERROR_RATE = float(os.getenv("IA_ROUTER_ERROR_RATE", "0.5"))      # umbral de apertura
+ROUTER_COOLDOWN_S = float(os.getenv("IA_ROUTER_COOLDOWN_S", "60"))       # circuito abierto
+ROUTER_P95_BUDGET_MS = float(os.getenv("IA_ROUTER_P95_BUDGET_MS", "15000"))
+
+
+class _EstadoModelo:
+    __slots__ = ("llamadas", "abierto_hasta", "aperturas", "ultimo_error")
+
+    def __init__(self):
+        self.llamadas = deque(maxlen=ROUTER_WINDOW)  # (ok, latency_ms)
+        self.abierto_hasta = 0.0
+        self.aperturas = 0
+        self.ultimo_error = ""
+
+    def tasa_error(self) -> float:
+        n = len(self.llamadas)
+        return (sum(1 for ok, _ in self.llamadas if not ok) / n) if n else 0.0
+
+    def p95_ms(self):
+        lat = sorted(ms for ok, ms in self.llamadas if ok)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+
+
+class ModelRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modelos = {}
+        self.hedges = 0
+
+    def _estado(self, modelo) -> _EstadoModelo:
+        est = self._modelos.get(modelo)
+        if est is None:
+            est = self._modelos[modelo] = _EstadoModelo()
+        return est
+
+    def disponible(self, modelo) -> bool:
+        with self._lock:
+            return time.monotonic() >= self._estado(modelo).abierto_hasta
+
+    def registrar(self, modelo, ok: bool, latency_ms: float, saturado: bool = False, error: str = ""):
+        with self._lock:
+            est = self._estado(modelo)
+            est.llamadas.append((ok, latency_ms))
+            if ok:
+                return
+            est.ultimo_error = error[:200]
+            if saturado or (len(est.llamadas) >= ROUTER_MIN_CALLS and est.tasa_error() >= ROUTER_ERROR_RATE):
+                est.abierto_hasta = time.monotonic() + ROUTER_COOLDOWN_S
+                est.aperturas += 1
+
+    def registrar_hedge(self):
+        with self._lock:
+            self.hedges += 1
+
+    def orden(self, modelos: list) -> list:
+        """Modelos utilizables, en orden de preferencia (vacío si todos tienen el circuito abierto)."""
+        with self._lock:
+            ahora = time.monotonic()
+            vivos = [m for m in modelos if ahora >= self._estado(m).abierto_hasta]
+            if len(vivos) >= 2:
+                p_pri, p_alt = self._estado(vivos[0]).p95_ms(), self._estado(vivos[1]).p95_ms()
+                if p_pri is not None and p_alt is not None and p_pri > ROUTER_P95_BUDGET_MS and p_alt < p_pri:
+                    vivos[0], vivos[1] = vivos[1], vivos[0]
+            return vivos
+
+    def snapshot(self) -> list:
+        """Estado por modelo para el panel de administración."""
+        with self._lock:
+            ahora = time.monotonic()
+            filas = []
+            for modelo, est in self._modelos.items():
+                p95 = est.p95_ms()
+                restante = max(0.0, est.abierto_hasta - ahora)
+                filas.append({
+                    "modelo": modelo,
+                    "circuito": "ABIERTO" if restante > 0 else "cerrado",
+                    "reabre_en_s": round(restante, 1),
+                    "llamadas_ventana": len(est.llamadas),
+                    "tasa_error_%": round(est.tasa_error() * 100.0, 1),
+                    "p95_ms": None if p95 is None else round(p95, 1),
+                    "aperturas": est.aperturas,
+                    "ultimo_error": est.ultimo_error,
+                })
+            return filas
+
+
+@st.cache_resource(show_spinner=False)
+def get_router() -> ModelRouter:
+    return ModelRouter()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Transporte HTTP para OpenRouter
+#   - Un solo httpx.Client por proceso: conexiones keep-alive reutilizadas
+#     por todas las sesiones, con el pool dimensionado por configuración.
+#   - Plazos explícitos de conexión/lectura: un proveedor colgado ya no
+#     congela el hilo del script.
+#   - Reintentos acotados con jitter, solo para fallos de red/timeout.
+#   - Log por request: conexión (DNS+TCP), TLS, TTFB y total, para saber
+#     si la lentitud es de la red o del modelo.
+# =========================================================
+
+import logging
+import os
+import random
+import time
+
+import httpx
+
+IA_CONNECT_TIMEOUT_S = float(os.getenv("IA_CONNECT_TIMEOUT_S", "5"))
+IA_READ_TIMEOUT_S = float(os.getenv("IA_READ_TIMEOUT_S", "45"))
+IA_POOL_MAX_CONNECTIONS = int(os.getenv("IA_POOL_MAX_CONNECTIONS", "32"))
+IA_POOL_MAX_KEEPALIVE = int(os.getenv("IA_POOL_MAX_KEEPALIVE", "16"))
+IA_POOL_KEEPALIVE_S = float(os.getenv("IA_POOL_KEEPALIVE_S", "60"))
+IA_MAX_RETRIES = int(os.getenv("IA_MAX_RETRIES", "1"))
+IA_RETRY_BASE_S = float(os.getenv("IA_RETRY_BASE_S", "0.5"))
+
+log = logging.getLogger("ia.transport")
+
+
+def build_timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=IA_CONNECT_TIMEOUT_S,
+        read=IA_READ_TIMEOUT_S,
+        write=IA_CONNECT_TIMEOUT_S,
+        pool=IA_CONNECT_TIMEOUT_S,
+    )
+
+
+# ---------- Tiempos por request (trace de httpcore) ----------
+def _tracer(marcas: dict):
+    t0 = time.perf_counter()
+
+    def trace(evento: str, info: dict):
+        marcas[evento] = (time.perf_counter() - t0) * 1000.0
+    return trace
+
+
+def _on_request(request: httpx.Request):
+    marcas = {}
+    request.extensions["trace"] = _tracer(marcas)
+    request.extensions["ia_marcas"] = marcas
+
+
+def _on_response(response: httpx.Response):
+    marcas = response.request.extensions.get("ia_marcas") or {}
+    conectar = marcas.get("connection.connect_tcp.complete")
+    tls = marcas.get("connection.start_tls.complete")
+    ttfb = marcas.get("http11.receive_response_headers.complete") or marcas.get("http2.receive_response_headers.complete")
+    log.info(
+        "openrouter %s %s → %s · conexión=%s tls=%s ttfb=%s ms",
+        response.request.method,
+        response.request.url.path,
+        response.status_code,
+        "reusada" if conectar is None else f"{conectar:.0f} ms",
+        "—" if tls is None else f"{tls:.0f} ms",
+        "—" if ttfb is None else f"{ttfb:.0f}",
+    )
+
+
+def build_http_client() -> httpx.Client:
+    """Cliente httpx compartido (keep-alive) para el SDK de OpenAI."""
+    return httpx.Client(
+        timeout=build_timeout(),
+        limits=httpx.Limits(
+            max_connections=IA_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=IA_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=IA_POOL_KEEPALIVE_S,
+        ),
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+
+
+# ---------- Reintentos acotados con jitter ----------
+def with_retries(fn, reintentables: tuple, etiqueta: str = ""):
+    """
+    Ejecuta fn(); ante errores de red/timeout reintenta hasta IA_MAX_RETRIES veces
+    con backoff exponencial y jitter completo. Registra la duración total.
+    """
+    t0 = time.perf_counter()
+    intento = 0
+    while True:
+        try:
+            out = fn()
+            log.info("openrouter %s total=%.0f ms (reintentos=%d)", etiqueta, (time.perf_counter() - t0) * 1000.0, intento)
+            return out
+        except reintentables as e:
+            if intento >= IA_MAX_RETRIES:
+                log.warning("openrouter %s falló tras %d reintentos en %.0f ms: %s",
+                            etiqueta, intento, (time.perf_counter() - t0) * 1000.0, e)
+                raise
+            espera = random.uniform(0, IA_RETRY_BASE_S * (2 ** intento))
+            intento += 1
+            time.sleep(espera)
@@ -0,0 +1,448 @@
+# ================================================================
+# Motor de valoración de inventarios por capas (PP · PEPS · UEPS)
+#
+# Único punto de verdad para los KARDEX de los niveles 2, 3 y 4:
+# - Mantiene agregados corrientes (cantidad y valor) → el saldo es O(1).
+# - Las capas viven en un deque: PEPS consume por la izquierda y
+#   UEPS por la derecha, ambos con pops O(1).
+# - En Promedio Ponderado el inventario es una sola capa al costo promedio.
+# InventarioTrazable (más abajo) agrega la trazabilidad por lote que
+# necesitan las devoluciones de los niveles 3 y 4.
+# ================================================================
+import heapq
+from collections import deque, namedtuple
+
+METODO_PP = "Promedio Ponderado"
+METODO_PEPS = "PEPS (FIFO)"
+METODO_UEPS = "UEPS (LIFO)"
+
+# Un tramo de salida:
+# - cantidad, costo_unitario, total: lo que sale del inventario.
+# - resto_capa: unidades que quedan en la capa consumida tras el tramo
+#   (es lo que muestran los KARDEX PEPS/UEPS "por tramo").
+# - saldo_cant, saldo_total: saldo global del inventario tras el tramo.
+# - lote: id del lote de origen (solo InventarioTrazable; None en el resto).
+Tramo = namedtuple(
+    "Tramo",
+    ["cantidad", "costo_unitario", "total", "resto_capa", "saldo_cant", "saldo_total", "lote"],
+    defaults=(None,),
+)
+
+
+def normalizar_metodo(metodo) -> str:
+    """Convierte cualquier etiqueta de método de la app en 'PP', 'PEPS' o 'UEPS'."""
+    m = str(metodo or "").upper()
+    if "PEPS" in m or "FIFO" in m:
+        return "PEPS"
+    if "UEPS" in m or "LIFO" in m:
+        return "UEPS"
+    return "PP"
+
+
+class InventarioCapas:
+    """
+    Inventario valorado por capas [[cantidad, costo_unitario], ...] en orden
+    cronológico (la capa más antigua a la izquierda).
+    """
+
+    __slots__ = ("metodo", "_capas", "_cant", "_valor")
+
+    def __init__(self, metodo=METODO_PEPS, capas=None):
+        self.metodo = normalizar_metodo(metodo)
+        self._capas = deque()
+        self._cant = 0
+        self._valor = 0
+        for q, pu in capas or ():
+            self.entrada(q, pu)
+
+    # ---------- Lectura ----------
+    @property
+    def cantidad(self):
+        return self._cant
+
+    @property
+    def valor(self):
+        return self._valor
+
+    @property
+    def costo_promedio(self) -> float:
+        return (self._valor / self._cant) if self._cant > 0 else 0.0
+
+    def saldo(self):
+        """(cantidad, costo_promedio, valor) — mismo contrato que el antiguo _sum_layers."""
+        return self._cant, self.costo_promedio, self._valor
+
+    def capas(self):
+        """Copia de las capas vigentes en orden cronológico."""
+        return [[q, pu] for q, pu in self._capas]
+
+    def copia(self):
+        nuevo = InventarioCapas(self.metodo)
+        nuevo._capas = deque([q, pu] for q, pu in self._capas)
+        nuevo._cant = self._cant
+        nuevo._valor = self._valor
+        return nuevo
+
+    def __len__(self):
+        return len(self._capas)
+
+    # ---------- Movimientos ----------
+    def entrada(self, cantidad, costo_unitario):
+        """
+        Registra una entrada (compra, saldo inicial o reingreso).
+        PP: recalcula el promedio y deja una sola capa.
+        PEPS/UEPS: agrega una capa nueva al final.
+        """
+        if cantidad <= 0:
+            return
+        cantidad = float(cantidad)
+        costo_unitario = float(costo_unitario)
+        self._cant += cantidad
+        self._valor += cantidad * costo_unitario
+        if self.metodo == "PP":
+            self._capas.clear()
+            self._capas.append([self._cant, self._valor / self._cant])
+        else:
+            self._capas.append([cantidad, costo_unitario])
+
+    def salida(self, cantidad, fifo=None):
+        """
+        Retira hasta `cantidad` unidades y devuelve la lista de tramos consumidos.
+        PP: un único tramo al costo promedio vigente.
+        PEPS/UEPS: un tramo por capa tocada; `fifo` permite forzar el extremo
+        (p. ej. devoluciones a proveedor que salen de la capa más reciente).
+        """
+        tramos = []
+        if cantidad <= 0 or self._cant <= 0:
+            return tramos
+
+        if self.metodo == "PP":
+            pu = self.costo_promedio
+            take = min(cantidad, self._cant)
+            tot = take * pu
+            self._cant -= take
+            self._valor -= tot
+            self._capas.clear()
+            if self._cant > 0:
+                self._capas.append([self._cant, self._valor / self._cant])
+            else:
+                self._cant, self._valor = 0, 0
+            tramos.append(Tramo(take, pu, tot, self._cant, self._cant, self._valor))
+            return tramos
+
+        if fifo is None:
+            fifo = self.metodo == "PEPS"
+        restante = cantidad
+        capas = self._capas
+        while restante > 0 and capas:
+            capa = capas[0] if fifo else capas[-1]
+            q, pu = capa
+            take = min(q, restante)
+            tot = take * pu
+            resto = q - take
+            restante -= take
+            self._cant -= take
+            self._valor -= tot
+            if resto > 0:
+                capa[0] = resto
+            elif fifo:
+                capas.popleft()
+            else:
+                capas.pop()
+            if not capas:
+                self._cant, self._valor = 0, 0
+            tramos.append(Tramo(take, pu, tot, resto, self._cant, self._valor))
+        return tramos
+
+
+# ================================================================
+# Inventario con trazabilidad de lotes (devoluciones en cualquier orden)
+#
+# Cada entrada crea un lote con id creciente (= orden cronológico) y cada
+# venta guarda de qué lote salió cada tramo. Así las devoluciones ya no son
+# casos especiales del Día 4 / Día 5:
+# - dev_compra(q, lote) retira del lote comprado y, si no alcanza, de los
+#   más recientes.
+# - dev_venta(q, venta) reingresa cada unidad a su lote de origen, aunque
+#   esa capa ya se hubiera agotado (el lote revive en su lugar cronológico).
+# Los extremos PEPS y UEPS son dos montículos (heapq) de ids con borrado
+# perezoso: vender, devolver o revivir un lote cuesta O(log n).
+# ================================================================
+# Con max_ventas, tamaño de la tabla de lotes a partir del cual se compacta
+_COMPACTAR_MIN = 64
+
+
+class InventarioTrazable:
+    """
+    Mismo contrato de lectura que InventarioCapas (cantidad, valor,
+    costo_promedio, saldo(), capas()) más compras, ventas y devoluciones por
+    lote. En Promedio Ponderado el inventario es un solo fondo; los lotes y
+    las ventas se registran igual para valorar las devoluciones:
+    - pp_costo_origen=False: ambas devoluciones al promedio vigente (Nivel 4).
+    - pp_costo_origen=True: devolución en compra al costo del lote comprado y
+      devolución en venta al costo con que salió la venta (Nivel 3).
+    max_ventas: si se indica, solo se recuerdan las últimas `max_ventas` ventas
+    para dev_venta() y los lotes agotados que ya nadie puede revivir se
+    descartan; la memoria queda acotada por los lotes abiertos (libros en
+    streaming). Los ids de lote se renumeran al compactar, así que en ese modo
+    solo valen dev_compra() sin lote y dev_venta() con índices negativos.
+    """
+
+    __slots__ = (
+        "metodo", "pp_costo_origen", "_lotes", "_antiguos", "_recientes",
+        "_cant", "_valor", "_ventas", "_ultima_entrada", "_abiertos", "_compactar_en",
+    )
+
+    def __init__(self, metodo=METODO_PEPS, pp_costo_origen=False, max_ventas=None):
+        self.metodo = normalizar_metodo(metodo)
+        self.pp_costo_origen = pp_costo_origen
+        self._lotes = []      # id → [cantidad vigente, costo_unitario]
+        self._antiguos = []   # montículo de ids (extremo PEPS)
+        self._recientes = []  # montículo de -ids (extremo UEPS)
+        self._cant = 0
+        self._valor = 0
+        # Por venta: deque de [lote, unidades sin devolver, costo_unitario],
+        # en el orden en que se reingresan (lotes más antiguos primero)
+        self._ventas = deque(maxlen=max_ventas) if max_ventas else []
+        self._ultima_entrada = None
+        self._abiertos = 0    # lotes con saldo (PEPS/UEPS)
+        self._compactar_en = _COMPACTAR_MIN if max_ventas else None
+
+    # ---------- Lectura ----------
+    @property
+    def cantidad(self):
+        return self._cant
+
+    @property
+    def valor(self):
+        return self._valor
+
+    @property
+    def costo_promedio(self) -> float:
+        return (self._valor / self._cant) if self._cant > 0 else 0.0
+
+    def saldo(self):
+        return self._cant, self.costo_promedio, self._valor
+
+    def capas(self):
+        """Lotes con saldo en orden cronológico (PP: una sola capa al promedio)."""
+        if self.metodo == "PP":
+            return [[self._cant, self.costo_promedio]] if self._cant > 0 else []
+        return [[q, pu] for q, pu in self._lotes if q > 0]
+
+    def lote(self, lote):
+        """(cantidad vigente, costo_unitario) de un lote."""
+        q, pu = self._lotes[lote]
+        return q, pu
+
+    @property
+    def ventas(self) -> int:
+        return len(self._ventas)
+
+    def __len__(self):
+        """Lotes con saldo (PP: una sola capa si hay saldo)."""
+        if self.metodo == "PP":
+            return 1 if self._cant > 0 else 0
+        return self._abiertos
+
+    # ---------- Internos ----------
+    def _activar(self, lote):
+        heapq.heappush(self._antiguos, lote)
+        heapq.heappush(self._recientes, -lote)
+
+    def _tope(self, fifo):
+        """Lote con saldo en el extremo pedido; descarta ids agotados o repetidos."""
+        heap = self._antiguos if fifo else self._recientes
+        while heap:
+            lote = heap[0] if fifo else -heap[0]
+            if self._lotes[lote][0] > 0:
+                return lote
+            heapq.heappop(heap)
+        return None
+
+    def _retirar(self, lote, cantidad):
+        capa = self._lotes[lote]
+        q, pu = capa
+        take = min(q, cantidad)
+        tot = take * pu
+        capa[0] = q - take
+        if capa[0] <= 0:
+            self._abiertos -= 1
+        self._cant -= take
+        self._valor -= tot
+        if self._cant <= 0:
+            self._cant, self._valor = 0, 0
+        return Tramo(take, pu, tot, capa[0], self._cant, self._valor, lote)
+
+    def _consumir(self, cantidad, fifo):
+        tramos = []
+        while cantidad > 0:
+            lote = self._tope(fifo)
+            if lote is None:
+                break
+            t = self._retirar(lote, cantidad)
+            cantidad -= t.cantidad
+            tramos.append(t)
+        return tramos
+
+    def _reponer(self, lote, cantidad):
+        capa = self._lotes[lote]
+        if capa[0] <= 0:
+            self._activar(lote)
+            self._abiertos += 1
+        capa[0] += cantidad
+        tot = cantidad * capa[1]
+        self._cant += cantidad
+        self._valor += tot
+        return Tramo(cantidad, capa[1], tot, capa[0], self._cant, self._valor, lote)
+
+    def _salida_pp(self, cantidad, pu, lote=None):
+        take = min(cantidad, self._cant)
+        tot = take * pu
+        self._cant -= take
+        self._valor = max(self._valor - tot, 0.0)
+        if self._cant <= 0:
+            self._cant, self._valor = 0, 0
+        return Tramo(take, pu, tot, self._cant, self._cant, self._valor, lote)
+
+    def _compactar(self):
+        """
+        Solo con max_ventas: conserva los lotes con saldo, los que aparecen en
+        las ventas recordadas (pueden revivir) y la última entrada, y los
+        renumera en orden cronológico. Se dispara al duplicarse la tabla, así
+        que su costo amortizado por entrada es O(1).
+        """
+        vivos = {self._ultima_entrada} if self._ultima_entrada is not None else set()
+        if self.metodo != "PP":
+            vivos.update(i for i, capa in enumerate(self._lotes) if capa[0] > 0)
+        for origen in self._ventas:
+            vivos.update(reg[0] for reg in origen if reg[0] is not None)
+        orden = sorted(vivos)
+        nuevo = {viejo: i for i, viejo in enumerate(orden)}
+        self._lotes = [self._lotes[i] for i in orden]
+        for origen in self._ventas:
+            for reg in origen:
+                if reg[0] is not None:
+                    reg[0] = nuevo[reg[0]]
+        if self._ultima_entrada is not None:
+            self._ultima_entrada = nuevo[self._ultima_entrada]
+        if self.metodo != "PP":
+            # Una lista ordenada ya es un montículo válido
+            abiertos = [i for i, capa in enumerate(self._lotes) if capa[0] > 0]
+            self._antiguos = abiertos
+            self._recientes = [-i for i in reversed(abiertos)]
+        self._compactar_en = 2 * len(self._lotes) + _COMPACTAR_MIN
+
+    # ---------- Movimientos ----------
+    def entrada(self, cantidad, costo_unitario):
+        """Saldo inicial o compra: crea un lote y devuelve su id (None si cantidad <= 0)."""
+        if cantidad <= 0:
+            return None
+        if self._compactar_en is not None and len(self._lotes) >= self._compactar_en:
+            self._compactar()
+        q, pu = float(cantidad), float(costo_unitario)
+        lote = len(self._lotes)
+        self._lotes.append([q, pu])
+        self._cant += q
+        self._valor += q * pu
+        if self.metodo != "PP":
+            self._activar(lote)
+            self._abiertos += 1
+        self._ultima_entrada = lote
+        return lote
+
+    def venta(self, cantidad):
+        """
+        Vende hasta `cantidad` unidades según el método y registra el lote de
+        cada tramo. La venta queda con índice `ventas - 1` para dev_venta().
+        """
+        if cantidad <= 0 or self._cant <= 0:
+            tramos = []
+        elif self.metodo == "PP":
+            tramos = [self._salida_pp(cantidad, self.costo_promedio)]
+        else:
+            tramos = self._consumir(cantidad, fifo=(self.metodo == "PEPS"))
+        # PEPS ya sale del lote más antiguo al más reciente; UEPS al revés
+        orden = reversed(tramos) if self.metodo == "UEPS" else tramos
+        self._ventas.append(deque([t.lote, t.cantidad, t.costo_unitario] for t in orden))
+        return tramos
+
+    def dev_compra(self, cantidad, lote=None):
+        """
+        Devolución a proveedor del lote `lote` (por defecto la última entrada).
+        Si ese lote ya no alcanza, el resto sale de los lotes más recientes.
+        """
+        if cantidad <= 0 or self._cant <= 0:
+            return []
+        if lote is None:
+            lote = self._ultima_entrada
+        if self.metodo == "PP":
+            pu = self._lotes[lote][1] if self.pp_costo_origen and lote is not None else self.costo_promedio
+            return [self._salida_pp(cantidad, pu, lote)]
+        tramos = []
+        if lote is not None and self._lotes[lote][0] > 0:
+            tramos.append(self._retirar(lote, cantidad))
+            cantidad -= tramos[0].cantidad
+        return tramos + self._consumir(cantidad, fifo=False)
+
+    def dev_venta(self, cantidad, venta=-1):
+        """
+        Devolución de un cliente sobre la venta `venta` (por defecto la última).
+        Cada unidad vuelve a su lote de origen, primero las de los lotes más
+        antiguos; solo reingresan las unidades vendidas y aún no devueltas.
+        Devuelve un tramo por lote repuesto (resto_capa = saldo del lote).
+        """
+        if cantidad <= 0 or not self._ventas:
+            return []
+        origen = self._ventas[venta]
+        if self.metodo == "PP":
+            q = tot = 0.0
+            promedio = self.costo_promedio
+            while cantidad > 0 and origen:
+                reg = origen[0]
+                use = min(cantidad, reg[1])
+                q += use
+                tot += use * (reg[2] if self.pp_costo_origen else promedio)
+                cantidad -= use
+                reg[1] -= use
+                if reg[1] <= 0:
+                    origen.popleft()
+            if q <= 0:
+                return []
+            self._cant += q
+            self._valor += tot
+            return [Tramo(q, tot / q, tot, self._cant, self._cant, self._valor, None)]
+
+        tramos = []
+        while cantidad > 0 and origen:
+            reg = origen[0]
+            use = min(cantidad, reg[1])
+            tramos.append(self._reponer(reg[0], use))
+            cantidad -= use
+            reg[1] -= use
+            if reg[1] <= 0:
+                origen.popleft()
+        return tramos
+
+
+# ================================================================
+# Atajos compatibles con los helpers históricos de la app
+# ================================================================
+def sum_layers(layers):
+    """layers: [[qty, pu], ...] → (qty_total, pu_prom, val_total)"""
+    q = sum(q for q, _ in layers)
+    v = sum(q * p for q, p in layers)
+    pu = (v / q) if q > 0 else 0.0
+    return q, pu, v
+
+
+def consume_layers_detail(layers, qty_out, fifo=True):
+    """
+    Consumo por capas sobre el motor.
+    Retorna (sale_details, layers_after):
+    - sale_details: [(q_take, pu_take, tot_take), ...]
+    - layers_after: capas remanentes en orden cronológico
+    """
+    inv = InventarioCapas(METODO_PEPS if fifo else METODO_UEPS, layers)
+    tramos = inv.salida(qty_out)
+    return [(t.cantidad, t.costo_unitario, t.total) for t in tramos], inv.capas()
@@ -0,0 +1,202 @@
+# ================================================================
+# Solver vectorizado de escenarios KARDEX (PP · PEPS · UEPS)
+#
+# Resuelve miles de escenarios en una llamada con arreglos NumPy. Cada
+# escenario sigue la secuencia de los niveles 2 y 4:
+#   D1 saldo inicial → D2 compra 1 → D3 venta → D4 compra 2
+#   → devolución en compra (sale de la capa más reciente)
+#   → devolución en venta (reingreso a costo de los tramos vendidos; solo
+#     reingresan unidades que efectivamente se vendieron).
+# Con comp2_u=0 es el escenario del Nivel 4; con dev_comp=dev_venta=0,
+# el del Nivel 2.
+#
+# Como hay a lo sumo tres capas de compra, PEPS/UEPS se reducen a mínimos
+# por capa (sin bucles por escenario). resolver_escenario() es la versión
+# escalar sobre InventarioTrazable (el motor de los KARDEX de los niveles
+# 3 y 4) y sirve de referencia. malla_pyg() arma las mallas de
+# sensibilidad del PyG del Nivel 4.
+# ================================================================
+import numpy as np
+
+from inventory_engine import InventarioTrazable, normalizar_metodo
+
+METODOS = ("PP", "PEPS", "UEPS")
+
+# Parámetros del escenario (todos aceptan escalares o arreglos que se transmiten)
+PARAMETROS = (
+    "inv0_u", "inv0_pu", "comp1_u", "comp1_pu", "venta_u",
+    "comp2_u", "comp2_pu", "dev_comp", "dev_venta", "p_venta", "tasa",
+)
+_DEFAULTS = {"comp2_u": 0.0, "comp2_pu": 0.0, "dev_comp": 0.0, "dev_venta": 0.0, "p_venta": 0.0, "tasa": 0.0}
+
+
+def _preparar(params: dict) -> dict:
+    faltan = [k for k in PARAMETROS if k not in params and k not in _DEFAULTS]
+    if faltan:
+        raise ValueError(f"Faltan parámetros del escenario: {', '.join(faltan)}")
+    extra = set(params) - set(PARAMETROS) - {"gastos_op", "otros_ingresos", "otros_egresos"}
+    if extra:
+        raise ValueError(f"Parámetros desconocidos: {', '.join(sorted(extra))}")
+    nombres = PARAMETROS + ("gastos_op", "otros_ingresos", "otros_egresos")
+    valores = [np.asarray(params.get(k, _DEFAULTS.get(k, 0.0)), dtype=np.float64) for k in nombres]
+    # Cantidades negativas no mueven inventario (igual que InventarioCapas)
+    arr = dict(zip(nombres, np.broadcast_arrays(*valores)))
+    for k in ("inv0_u", "comp1_u", "venta_u", "comp2_u", "dev_comp", "dev_venta"):
+        arr[k] = np.maximum(arr[k], 0.0)
+    return arr
+
+
+def _div(num, den):
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+
+def _pp(a: dict) -> dict:
+    q = a["inv0_u"] + a["comp1_u"]
+    v = a["inv0_u"] * a["inv0_pu"] + a["comp1_u"] * a["comp1_pu"]
+    pu = _div(v, q)
+
+    venta = np.minimum(a["venta_u"], q)
+    cmv = venta * pu
+    q = q - venta
+    v = np.where(q > 0, v - cmv, 0.0)
+
+    q = q + a["comp2_u"]
+    v = v + a["comp2_u"] * a["comp2_pu"]
+    pu = _div(v, q)
+
+    dev_q = np.minimum(a["dev_comp"], q)
+    dev_comp_valor = dev_q * pu
+    q = q - dev_q
+    v = np.where(q > 0, v - dev_comp_valor, 0.0)
+
+    # El reingreso entra al promedio vigente (0 si el inventario quedó vacío)
+    pu = _div(v, q)
+    dev_venta = np.minimum(a["dev_venta"], venta)
+    costo_dev_venta = dev_venta * pu
+    q = q + dev_venta
+    v = v + costo_dev_venta
+    return {"cmv_bruto": cmv, "dev_comp_valor": dev_comp_valor, "costo_dev_venta": costo_dev_venta,
+            "saldo_cant": q, "saldo_total": v}
+
+
+def _capas(a: dict, fifo: bool) -> dict:
+    q0, p0 = a["inv0_u"], a["inv0_pu"]
+    q1, p1 = a["comp1_u"], a["comp1_pu"]
+    q2, p2 = a["comp2_u"], a["comp2_pu"]
+
+    # D3 venta: PEPS consume capa 0 y luego 1; UEPS al revés
+    venta = a["venta_u"]
+    if fifo:
+        t0 = np.minimum(venta, q0)
+        t1 = np.minimum(venta - t0, q1)
+    else:
+        t1 = np.minimum(venta, q1)
+        t0 = np.minimum(venta - t1, q0)
+    cmv = t0 * p0 + t1 * p1
+    q0, q1 = q0 - t0, q1 - t1
+
+    # Devolución en compra: siempre desde la capa más reciente
+    resto = a["dev_comp"]
+    d2 = np.minimum(resto, q2)
+    resto = resto - d2
+    d1 = np.minimum(resto, q1)
+    resto = resto - d1
+    d0 = np.minimum(resto, q0)
+    dev_comp_valor = d2 * p2 + d1 * p1 + d0 * p0
+    q0, q1, q2 = q0 - d0, q1 - d1, q2 - d2
+
+    # Devolución en venta: PEPS recorre los tramos en orden y UEPS en orden
+    # inverso; en ambos casos el primero que se reingresa es el de la capa 0.
+    r0 = np.minimum(a["dev_venta"], t0)
+    r1 = np.minimum(a["dev_venta"] - r0, t1)
+    costo_dev_venta = r0 * p0 + r1 * p1
+
+    saldo_cant = q0 + q1 + q2 + r0 + r1
+    saldo_total = q0 * p0 + q1 * p1 + q2 * p2 + costo_dev_venta
+    return {"cmv_bruto": cmv, "dev_comp_valor": dev_comp_valor, "costo_dev_venta": costo_dev_venta,
+            "saldo_cant": saldo_cant, "saldo_total": saldo_total}
+
+
+def _pyg(a: dict, r: dict) -> dict:
+    ventas_netas = (a["venta_u"] - a["dev_venta"]) * a["p_venta"]
+    cmv_neto = r["cmv_bruto"] - r["costo_dev_venta"]
+    utilidad_bruta = ventas_netas - cmv_neto
+    utilidad_ai = utilidad_bruta - a["gastos_op"] + a["otros_ingresos"] - a["otros_egresos"]
+    impuesto = np.maximum(utilidad_ai, 0.0) * a["tasa"]
+    r.update({
+        "saldo_pu": _div(r["saldo_total"], r["saldo_cant"]),
+        "ventas_netas": ventas_netas,
+        "cmv_neto": cmv_neto,
+        "utilidad_bruta": utilidad_bruta,
+        "utilidad_ai": utilidad_ai,
+        "impuesto": impuesto,
+        "utilidad_neta": utilidad_ai - impuesto,
+    })
+    return r
+
+
+def resolver_lote(metodo, **params) -> dict:
+    """
+    Resuelve un lote de escenarios con un método. Devuelve un dict de arreglos
+    (misma forma que los parámetros transmitidos): cmv_bruto, dev_comp_valor,
+    costo_dev_venta, cmv_neto, saldo_cant, saldo_pu, saldo_total,
+    ventas_netas, utilidad_bruta, utilidad_ai, impuesto, utilidad_neta.
+    gastos_op, otros_ingresos y otros_egresos son opcionales (0 por defecto).
+    """
+    a = _preparar(params)
+    m = normalizar_metodo(metodo)
+    r = _pp(a) if m == "PP" else _capas(a, fifo=(m == "PEPS"))
+    return _pyg(a, r)
+
+
+def resolver_lote_todos(**params) -> dict:
+    """{'PP': {...}, 'PEPS': {...}, 'UEPS': {...}} para el mismo lote."""
+    a = _preparar(params)
+    return {
+        "PP": _pyg(a, _pp(a)),
+        "PEPS": _pyg(a, _capas(a, fifo=True)),
+        "UEPS": _pyg(a, _capas(a, fifo=False)),
+    }
+
+
+def malla_pyg(p_venta, tasa, dev_venta, campo="utilidad_neta", **escenario) -> dict:
+    """
+    Sensibilidad del PyG: evalúa `campo` sobre la malla p_venta × tasa ×
+    dev_venta (ejes 1D) para los tres métodos en una sola pasada transmitida.
+    `escenario` trae el resto de parámetros escalares (inv0_u, ..., gastos_op).
+    Devuelve {'PP': arreglo (P, T, D), 'PEPS': ..., 'UEPS': ...}.
+    """
+    p = np.asarray(p_venta, dtype=np.float64).reshape(-1, 1, 1)
+    t = np.asarray(tasa, dtype=np.float64).reshape(1, -1, 1)
+    d = np.asarray(dev_venta, dtype=np.float64).reshape(1, 1, -1)
+    forma = (p.size, t.size, d.size)
+    res = resolver_lote_todos(p_venta=p, tasa=t, dev_venta=d, **escenario)
+    return {m: np.broadcast_to(r[campo], forma) for m, r in res.items()}
+
+
+# ================================================================
+# Referencia escalar (un escenario, sobre el motor por capas)
+# ================================================================
+def resolver_escenario(metodo, inv0_u, inv0_pu, comp1_u, comp1_pu, venta_u,
+                       comp2_u=0.0, comp2_pu=0.0, dev_comp=0.0, dev_venta=0.0,
+                       p_venta=0.0, tasa=0.0, gastos_op=0.0, otros_ingresos=0.0, otros_egresos=0.0) -> dict:
+    inv = InventarioTrazable(metodo)
+    inv.entrada(inv0_u, inv0_pu)
+    inv.entrada(comp1_u, comp1_pu)
+    cmv = sum(t.total for t in inv.venta(venta_u))
+    inv.entrada(comp2_u, comp2_pu)
+    dev_comp_valor = sum(t.total for t in inv.dev_compra(dev_comp))
+    costo_dev_venta = sum(t.total for t in inv.dev_venta(dev_venta))
+
+    ventas_netas = (venta_u - dev_venta) * p_venta
+    cmv_neto = cmv - costo_dev_venta
+    utilidad_bruta = ventas_netas - cmv_neto
+    utilidad_ai = utilidad_bruta - gastos_op + otros_ingresos - otros_egresos
+    impuesto = max(utilidad_ai, 0) * tasa
+    q, pu, v = inv.saldo()
+    return {
+        "cmv_bruto": cmv, "dev_comp_valor": dev_comp_valor, "costo_dev_venta": costo_dev_venta,
+        "saldo_cant": q, "saldo_pu": pu, "saldo_total": v,
+        "ventas_netas": ventas_netas, "cmv_neto": cmv_neto, "utilidad_bruta": utilidad_bruta,
+        "utilidad_ai": utilidad_ai, "impuesto": impuesto, "utilidad_neta": utilidad_ai - impuesto,
+    }
@@ -0,0 +1,368 @@
+# ================================================================
+# KARDEX en streaming para libros de movimientos importados
+#
+# Consume un flujo arbitrario de movimientos (compra, venta, devolución en
+# compra y devolución en venta) de muchos SKU y emite filas de KARDEX una a
+# una bajo PP, PEPS o UEPS. Todo es generador: el libro nunca se materializa;
+# la memoria depende de los lotes abiertos por SKU, no del largo del libro.
+#
+# Reglas (las de InventarioTrazable, como en los niveles 3 y 4):
+# - La devolución en compra sale del último lote comprado y, si no alcanza,
+#   de los lotes de compra más recientes. Las unidades devueltas por clientes
+#   vuelven a su lote de origen, así que nunca salen como "compra" propia.
+# - La devolución en venta se aplica a la última venta del SKU: cada unidad
+#   reingresa a su lote de origen y a su costo; en PP, al costo promedio
+#   vigente. El costo_unitario de la fila no se usa: el costo lo da la venta.
+# - Una venta, devolución en compra o devolución en venta mayor que lo
+#   disponible (saldo o unidades de la última venta aún sin devolver) se
+#   aplica hasta agotar y reporta el faltante.
+# ================================================================
+import csv
+import io
+import json
+from collections import namedtuple
+from itertools import chain
+
+from inventory_engine import InventarioTrazable, normalizar_metodo
+
+COMPRA = "compra"
+VENTA = "venta"
+DEV_COMPRA = "dev_compra"
+DEV_VENTA = "dev_venta"
+
+# Etiquetas aceptadas en la columna "tipo" (español e inglés)
+_TIPOS = {
+    "compra": COMPRA, "purchase": COMPRA, "entrada": COMPRA,
+    "venta": VENTA, "sale": VENTA, "salida": VENTA,
+    "dev_compra": DEV_COMPRA, "devolucion_compra": DEV_COMPRA, "devolución_compra": DEV_COMPRA,
+    "purchase_return": DEV_COMPRA,
+    "dev_venta": DEV_VENTA, "devolucion_venta": DEV_VENTA, "devolución_venta": DEV_VENTA,
+    "sale_return": DEV_VENTA,
+}
+
+_DESCRIPCION = {
+    COMPRA: "Compra",
+    VENTA: "Venta",
+    DEV_COMPRA: "Devolución de compra",
+    DEV_VENTA: "Devolución de venta",
+}
+
+Movimiento = namedtuple("Movimiento", ["fecha", "sku", "tipo", "cantidad", "costo_unitario"])
+
+# Una fila de KARDEX. Las ventas y devoluciones en compra PEPS/UEPS emiten
+# una fila por tramo; entrada/salida vacías van en None.
+FilaKardex = namedtuple("FilaKardex", [
+    "fecha", "sku", "descripcion",
+    "ent_q", "ent_pu", "ent_tot",
+    "sal_q", "sal_pu", "sal_tot",
+    "sdo_q", "sdo_pu", "sdo_tot",
+    "faltante",
+])
+
+COLUMNAS_KARDEX = FilaKardex._fields
+
+
+# ================================================================
+# Lectura de libros (CSV o JSON lines) como generadores
+# ================================================================
+def _num(valor, campo: str, linea: int):
+    if valor is None or str(valor).strip() == "":
+        return None
+    s = str(valor).strip()
+    if "," in s and "." not in s:
+        s = s.replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        raise ValueError(f"Línea {linea}: '{campo}' no es numérico ({valor!r}).") from None
+
+
+def _movimiento(d: dict, linea: int) -> Movimiento:
+    tipo = _TIPOS.get(str(d.get("tipo") or "").strip().lower())
+    if tipo is None:
+        raise ValueError(f"Línea {linea}: tipo desconocido ({d.get('tipo')!r}).")
+    sku = str(d.get("sku") or "").strip()
+    if not sku:
+        raise ValueError(f"Línea {linea}: falta el SKU.")
+    cantidad = _num(d.get("cantidad"), "cantidad", linea)
+    if cantidad is None or cantidad < 0:
+        raise ValueError(f"Línea {linea}: la cantidad debe ser un número ≥ 0.")
+    costo = _num(d.get("costo_unitario"), "costo_unitario", linea)
+    if tipo == COMPRA and costo is None:
+        raise ValueError(f"Línea {linea}: la compra necesita costo_unitario.")
+    return Movimiento(str(d.get("fecha") or "").strip(), sku, tipo, cantidad, costo)
+
+
+def _texto(archivo):
+    """Acepta rutas, archivos de texto o binarios (p. ej. st.file_uploader)."""
+    if isinstance(archivo, str):
+        return open(archivo, "r", encoding="utf-8-sig", newline="")
+    if isinstance(archivo, io.TextIOBase):
+        return archivo
+    return io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+
+
+def leer_csv(archivo):
+    """
+    Movimientos de un CSV con columnas fecha, sku, tipo, cantidad y
+    costo_unitario (opcional salvo en compras). Separador , o ;.
+    """
+    f = _texto(archivo)
+    encabezado = f.readline()
+    if not encabezado:
+        return
+    sep = ";" if encabezado.count(";") > encabezado.count(",") else ","
+    lector = csv.reader(chain([encabezado], f), delimiter=sep)
+    columnas = [c.strip().lower() for c in next(lector)]
+    faltan = {"sku", "tipo", "cantidad"} - set(columnas)
+    if faltan:
+        raise ValueError(f"El CSV debe tener las columnas: {', '.join(sorted(faltan))}.")
+    for linea, valores in enumerate(lector, start=2):
+        if not any(v.strip() for v in valores):
+            continue
+        yield _movimiento(dict(zip(columnas, valores)), linea)
+
+
+def leer_jsonl(archivo):
+    """Movimientos de un archivo JSON lines (un objeto por línea, mismas claves que el CSV)."""
+    f = _texto(archivo)
+    for linea, txt in enumerate(f, start=1):
+        txt = txt.strip()
+        if not txt:
+            continue
+        try:
+            d = json.loads(txt)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Línea {linea}: JSON inválido ({e.msg}).") from None
+        yield _movimiento({str(k).lower(): v for k, v in d.items()}, linea)
+
+
+def leer_movimientos(archivo, nombre: str = ""):
+    """Elige el lector por extensión (.jsonl/.json → JSON lines; lo demás, CSV)."""
+    nombre = (nombre or getattr(archivo, "name", "") or (archivo if isinstance(archivo, str) else "")).lower()
+    if nombre.endswith((".jsonl", ".json", ".ndjson")):
+        return leer_jsonl(archivo)
+    return leer_csv(archivo)
+
+
+# ================================================================
+# Motor multi-SKU
+# ================================================================
+class _EstadoSKU:
+    __slots__ = ("inv", "totales")
+
+    def __init__(self, metodo):
+        # Solo la última venta admite devoluciones → memoria acotada por lotes abiertos
+        self.inv = InventarioTrazable(metodo, max_ventas=1)
+        self.totales = {"compras": 0.0, "dev_compras": 0.0, "cmv": 0.0, "costo_dev_ventas": 0.0,
+                        "unid_vendidas": 0.0, "faltantes": 0.0, "movimientos": 0}
+
+
+class KardexMultiSKU:
+    """
+    Estado por SKU (lotes + tramos de la última venta) y totales corrientes.
+    procesar(mov) devuelve las filas de KARDEX que genera ese movimiento.
+    """
+
+    def __init__(self, metodo):
+        self.metodo = normalizar_metodo(metodo)
+        self._skus = {}
+        self.movimientos = 0
+        self.filas = 0
+        self.max_capas = 0
+
+    def _estado(self, sku) -> _EstadoSKU:
+        e = self._skus.get(sku)
+        if e is None:
+            e = self._skus[sku] = _EstadoSKU(self.metodo)
+        return e
+
+    def _fila(self, mov, e, desc, ent=None, sal=None, faltante=0.0) -> FilaKardex:
+        q, pu, v = e.inv.saldo()
+        ent_q, ent_pu, ent_tot = ent or (None, None, None)
+        sal_q, sal_pu, sal_tot = sal or (None, None, None)
+        return FilaKardex(mov.fecha, mov.sku, desc, ent_q, ent_pu, ent_tot,
+                          sal_q, sal_pu, sal_tot, q, pu, v, faltante)
+
+    def _salidas(self, mov, e, desc, tramos, faltante) -> list:
+        if not tramos:
+            return [self._fila(mov, e, desc, faltante=faltante)]
+        filas = []
+        for i, t in enumerate(tramos, start=1):
+            etiqueta = f"{desc} tramo {i}" if len(tramos) > 1 else desc
+            fila = self._fila(mov, e, etiqueta, sal=(t.cantidad, t.costo_unitario, t.total),
+                              faltante=faltante if i == len(tramos) else 0.0)
+            # El saldo del tramo es el global tras ese tramo (no el final del movimiento)
+            fila = fila._replace(sdo_q=t.saldo_cant, sdo_tot=t.saldo_total,
+                                 sdo_pu=(t.saldo_total / t.saldo_cant) if t.saldo_cant > 0 else 0.0)
+            filas.append(fila)
+        return filas
+
+    def procesar(self, mov: Movimiento) -> list:
+        e = self._estado(mov.sku)
+        tot = e.totales
+        tot["movimientos"] += 1
+        self.movimientos += 1
+        desc = _DESCRIPCION[mov.tipo]
+
+        if mov.tipo == COMPRA:
+            e.inv.entrada(mov.cantidad, mov.costo_unitario)
+            tot["compras"] += mov.cantidad * mov.costo_unitario
+            filas = [self._fila(mov, e, desc, ent=(mov.cantidad, mov.costo_unitario, mov.cantidad * mov.costo_unitario))]
+
+        elif mov.tipo == VENTA:
+            tramos = e.inv.venta(mov.cantidad)
+            vendido = sum(t.cantidad for t in tramos)
+            faltante = mov.cantidad - vendido
+            tot["cmv"] += sum(t.total for t in tramos)
+            tot["unid_vendidas"] += vendido
+            tot["faltantes"] += faltante
+            filas = self._salidas(mov, e, desc, tramos, faltante)
+
+        elif mov.tipo == DEV_COMPRA:
+            tramos = e.inv.dev_compra(mov.cantidad)
+            devuelto = sum(t.cantidad for t in tramos)
+            tot["dev_compras"] += sum(t.total for t in tramos)
+            tot["faltantes"] += mov.cantidad - devuelto
+            filas = self._salidas(mov, e, desc, tramos, mov.cantidad - devuelto)
+
+        else:  # DEV_VENTA
+            tramos = e.inv.dev_venta(mov.cantidad)
+            repuesto = sum(t.cantidad for t in tramos)
+            valor = sum(t.total for t in tramos)
+            faltante = mov.cantidad - repuesto
+            tot["costo_dev_ventas"] += valor
+            tot["faltantes"] += faltante
+            ent = (repuesto, valor / repuesto, valor) if repuesto > 0 else None
+            filas = [self._fila(mov, e, desc, ent=ent, faltante=faltante)]
+
+        self.filas += len(filas)
+        self.max_capas = max(self.max_capas, len(e.inv))
+        return filas
+
+    def capas_abiertas(self) -> int:
+        return sum(len(e.inv) for e in self._skus.values())
+
+    def resumen(self) -> list:
+        """Una fila por SKU con totales del periodo y saldo final."""
+        filas = []
+        for sku in sorted(self._skus):
+            e = self._skus[sku]
+            q, pu, v = e.inv.saldo()
+            t = e.totales
+            filas.append({
+                "sku": sku, "movimientos": t["movimientos"],
+                "compras": t["compras"], "dev_compras": t["dev_compras"],
+                "unid_vendidas": t["unid_vendidas"], "cmv": t["cmv"],
+                "costo_dev_ventas": t["costo_dev_ventas"], "cmv_neto": t["cmv"] - t["costo_dev_ventas"],
+                "faltantes": t["faltantes"],
+                "saldo_cant": q, "saldo_pu": pu, "saldo_total": v,
+            })
+        return filas
+
+
+def kardex_stream(movimientos, metodo, motor: KardexMultiSKU | None = None):
+    """
+    Generador de FilaKardex para un flujo de Movimiento. Pasa `motor` para
+    leer después el resumen por SKU y los contadores.
+    """
+    motor = motor or KardexMultiSKU(metodo)
+    for mov in movimientos:
+        yield from motor.procesar(mov)
+
+
+def escribir_csv(filas, destino):
+    """Escribe filas de KARDEX a un archivo de texto a medida que se generan."""
+    w = csv.writer(destino)
+    w.writerow(COLUMNAS_KARDEX)
+    n = 0
+    for f in filas:
+        w.writerow(["" if x is None else (round(x, 4) if isinstance(x, float) else x) for x in f])
+        n += 1
+    return n
+
+
+# ================================================================
+# Libro sintético (ejemplos y pruebas de carga)
+# ================================================================
+def generar_libro(n: int, skus: int = 50, seed: int = 1):
+    """Genera n movimientos plausibles repartidos entre `skus` productos."""
+    import random
+
+    rnd = random.Random(seed)
+    base = {f"SKU-{i:04d}": rnd.uniform(5, 80) for i in range(skus)}
+    nombres = list(base)
+    stock = dict.fromkeys(base, 0.0)
+    pendiente = dict.fromkeys(base, 0)    # unidades de la última venta aún sin devolver
+    for i in range(n):
+        sku = rnd.choice(nombres)
+        dia = (i * 336) // max(n, 1)          # 12 meses de 28 días, en orden
+        fecha = f"2024-{1 + dia // 28:02d}-{1 + dia % 28:02d}"
+        r = rnd.random()
+        if stock[sku] <= 0 or r < 0.40:
+            q = rnd.randint(5, 60)
+            stock[sku] += q
+            yield Movimiento(fecha, sku, COMPRA, float(q), round(base[sku] * rnd.uniform(0.9, 1.15), 2))
+        elif r < 0.85:
+            q = rnd.randint(1, max(1, int(stock[sku])))
+            stock[sku] -= q
+            pendiente[sku] = q
+            yield Movimiento(fecha, sku, VENTA, float(q), None)
+        elif r < 0.93 and pendiente[sku] > 0:
+            q = min(rnd.randint(1, 5), pendiente[sku])
+            stock[sku] += q
+            pendiente[sku] -= q
+            yield Movimiento(fecha, sku, DEV_VENTA, float(q), None)
+        else:
+            q = min(rnd.randint(1, 5), int(stock[sku]))
+            stock[sku] -= q
+            yield Movimiento(fecha, sku, DEV_COMPRA, float(q), None)
+
+
+def escribir_libro_csv(movimientos, destino):
+    w = csv.writer(destino)
+    w.writerow(Movimiento._fields)
+    for m in movimientos:
+        w.writerow(["" if x is None else x for x in m])
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    import time
+    import tracemalloc
+
+    ap = argparse.ArgumentParser(description="KARDEX en streaming para libros de movimientos")
+    ap.add_argument("--generar", type=int, metavar="N", help="Escribe un libro sintético de N movimientos en --libro")
+    ap.add_argument("--skus", type=int, default=200)
+    ap.add_argument("--libro", default="libro_movimientos.csv")
+    ap.add_argument("--metodo", default="PEPS", help="PP, PEPS o UEPS")
+    ap.add_argument("--salida", default=None, help="CSV donde escribir el KARDEX completo (por defecto solo se cuenta)")
+    ap.add_argument("--memoria", action="store_true", help="Mide el pico de memoria con tracemalloc (más lento)")
+    args = ap.parse_args()
+
+    if args.generar:
+        with open(args.libro, "w", encoding="utf-8", newline="") as f:
+            escribir_libro_csv(generar_libro(args.generar, args.skus), f)
+        print(f"Libro con {args.generar:,} movimientos en {args.libro}")
+        sys.exit(0)
+
+    motor = KardexMultiSKU(args.metodo)
+    if args.memoria:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    filas = kardex_stream(leer_movimientos(args.libro), args.metodo, motor)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8", newline="") as f:
+            escribir_csv(filas, f)
+    else:
+        for _ in filas:
+            pass
+    seg = time.perf_counter() - t0
+    linea = (
+        f"{motor.movimientos:,} movimientos → {motor.filas:,} filas ({motor.metodo}) en {seg:.2f} s · "
+        f"SKUs={len(motor.resumen())} · capas abiertas={motor.capas_abiertas()}"
+    )
+    if args.memoria:
+        linea += f" · pico memoria={tracemalloc.get_traced_memory()[1] / 1e6:.1f} MB"
+    print(linea)
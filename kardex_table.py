@@ -0,0 +1,208 @@
+# ================================================================
+# Tabla KARDEX columnar para las grillas de los niveles 2–4
+#
+# Los builders agregan filas con agregar(...) (o append(dict) con la misma
+# forma de siempre) y la tabla guarda:
+# - Fecha y Descripción en listas.
+# - Las 9 columnas numéricas en un único arreglo float64 (n × 9, orden de
+#   columnas), NaN donde la celda no aplica.
+# - Una máscara booleana `requerido` (n × 9): True solo donde el validador
+#   debe exigir la celda. Reemplaza los centinelas "" / None.
+# to_frame() entrega a pandas columnas que son vistas de solo lectura de ese
+# arreglo (sin copiar fila por fila; escribir en ellas lanzaría ValueError en
+# vez de corromper las respuestas esperadas) y validar() compara el editor
+# completo de una vez.
+# ================================================================
+import math
+
+import numpy as np
+import pandas as pd
+
+COLS_TEXTO = ("Fecha", "Descripción")
+COLS_NUM = (
+    "Entrada_cant", "Entrada_pu", "Entrada_total",
+    "Salida_cant", "Salida_pu", "Salida_total",
+    "Saldo_cant", "Saldo_pu", "Saldo_total",
+)
+COLUMNAS = COLS_TEXTO + COLS_NUM
+
+_IDX = {c: j for j, c in enumerate(COLS_NUM)}
+
+
+def _vacia(v) -> bool:
+    return v is None or (isinstance(v, str) and v.strip() == "") or (isinstance(v, float) and math.isnan(v))
+
+
+def _a_float(v) -> float:
+    """
+    Celda del editor → float; vacía o inválida → NaN. Acepta "$" y espacios y
+    ambos separadores: con punto y coma, el último es el decimal ("$1.234,5" y
+    "1,234.5" → 1234.5); un separador repetido es de miles ("1.234.567"); uno
+    solo es decimal ("12,5" → 12.5).
+    """
+    if v is None:
+        return np.nan
+    if isinstance(v, (int, float, np.number)):
+        return float(v)
+    t = str(v).strip().replace("$", "").replace(" ", "")
+    if "," in t and "." in t:
+        miles = "." if t.rfind(",") > t.rfind(".") else ","
+        t = t.replace(miles, "")
+    for sep in (",", "."):
+        if t.count(sep) > 1:
+            t = t.replace(sep, "")
+    try:
+        return float(t.replace(",", "."))
+    except ValueError:
+        return np.nan
+
+
+def _solo_lectura(a: np.ndarray) -> np.ndarray:
+    """Vista no modificable: la tabla es la respuesta esperada de la grilla."""
+    v = a.view()
+    v.flags.writeable = False
+    return v
+
+
+class KardexTabla:
+    __slots__ = ("_fecha", "_desc", "_val", "_req", "_n")
+
+    def __init__(self, capacidad: int = 8):
+        self._fecha = []
+        self._desc = []
+        # Orden Fortran: cada columna queda contigua en memoria
+        self._val = np.full((capacidad, len(COLS_NUM)), np.nan, order="F")
+        self._req = np.zeros((capacidad, len(COLS_NUM)), dtype=bool, order="F")
+        self._n = 0
+
+    # ---------- Construcción ----------
+    def _crecer(self):
+        cap = max(8, 2 * len(self._val))
+        val = np.full((cap, len(COLS_NUM)), np.nan, order="F")
+        req = np.zeros((cap, len(COLS_NUM)), dtype=bool, order="F")
+        val[: self._n] = self._val[: self._n]
+        req[: self._n] = self._req[: self._n]
+        self._val, self._req = val, req
+
+    def agregar(self, fecha, descripcion, **celdas):
+        """Agrega una fila; las celdas omitidas o vacías (None, "", NaN) no se exigen."""
+        if self._n == len(self._val):
+            self._crecer()
+        i = self._n
+        for col, v in celdas.items():
+            j = _IDX[col]
+            if not _vacia(v):
+                self._val[i, j] = float(v)
+                self._req[i, j] = True
+        self._fecha.append(fecha)
+        self._desc.append(descripcion)
+        self._n += 1
+
+    def append(self, fila: dict):
+        """Compatibilidad con los builders que arman la fila como dict."""
+        self.agregar(fila["Fecha"], fila["Descripción"], **{c: fila.get(c) for c in COLS_NUM})
+
+    # ---------- Lectura ----------
+    def __len__(self):
+        return self._n
+
+    @property
+    def valores(self) -> np.ndarray:
+        """Vista (n × 9, solo lectura) de las celdas numéricas; NaN donde no aplica."""
+        return _solo_lectura(self._val[: self._n])
+
+    @property
+    def requerido(self) -> np.ndarray:
+        return _solo_lectura(self._req[: self._n])
+
+    def columna(self, nombre):
+        if nombre == "Fecha":
+            return list(self._fecha)
+        if nombre == "Descripción":
+            return list(self._desc)
+        return _solo_lectura(self._val[: self._n, _IDX[nombre]])
+
+    def fila(self, i: int) -> dict:
+        """La fila i como dict (None en las celdas no exigidas)."""
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        d = {"Fecha": self._fecha[i], "Descripción": self._desc[i]}
+        for j, c in enumerate(COLS_NUM):
+            d[c] = float(self._val[i, j]) if self._req[i, j] else None
+        return d
+
+    __getitem__ = fila
+
+    def __iter__(self):
+        return (self.fila(i) for i in range(self._n))
+
+    def etiquetas(self) -> list:
+        return [f"{f} · {d}" for f, d in zip(self._fecha, self._desc)]
+
+    # ---------- pandas ----------
+    def to_frame(self) -> pd.DataFrame:
+        """
+        DataFrame con las columnas de siempre; cada columna numérica es una vista
+        de solo lectura del arreglo. Para editarlo, usar .copy() o en_blanco().
+        """
+        n = self._n
+        cols = {"Fecha": self._fecha, "Descripción": self._desc}
+        cols.update((c, _solo_lectura(self._val[:n, j])) for j, c in enumerate(COLS_NUM))
+        return pd.DataFrame(cols, copy=False)
+
+    def en_blanco(self) -> pd.DataFrame:
+        """Plantilla para st.data_editor: mismas Fecha/Descripción y celdas numéricas vacías."""
+        vacio = np.full(self._n, np.nan)
+        cols = {"Fecha": list(self._fecha), "Descripción": list(self._desc)}
+        cols.update((c, vacio.copy()) for c in COLS_NUM)
+        return pd.DataFrame(cols, copy=False)
+
+    def _usuario(self, df: pd.DataFrame) -> np.ndarray:
+        """Celdas numéricas del editor como float (n × 9); texto no numérico → NaN."""
+        n = self._n
+        out = np.full((n, len(COLS_NUM)), np.nan)
+        for j, c in enumerate(COLS_NUM):
+            col = df[c].to_numpy()[:n]
+            if col.dtype.kind in "fiub":
+                out[: len(col), j] = col
+            else:
+                out[: len(col), j] = [_a_float(v) for v in col]
+        return out
+
+    def _aciertos(self, df: pd.DataFrame, tol: float) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            return ~self.requerido | (np.abs(self._usuario(df) - self.valores) <= tol)
+
+    def validar(self, df: pd.DataFrame, tol: float = 0.5) -> np.ndarray:
+        """
+        Compara lo diligenciado en el editor contra la tabla esperada.
+        Devuelve un arreglo bool por fila: todas las celdas exigidas a ±tol.
+        """
+        return self._aciertos(df, tol).all(axis=1)
+
+    def diferencias(self, df: pd.DataFrame, tol: float = 0.5) -> list:
+        """[(fila, Fecha, Descripción, columna, ingresado, esperado), ...] de las celdas exigidas que fallan."""
+        filas, cols = np.nonzero(~self._aciertos(df, tol))
+        return [
+            (int(i), self._fecha[i], self._desc[i], COLS_NUM[j],
+             df[COLS_NUM[j]].iloc[i] if i < len(df) else None, float(self._val[i, j]))
+            for i, j in zip(filas, cols)
+        ]
+
+
+def describir_filas(df: pd.DataFrame) -> str:
+    """Texto compacto del KARDEX diligenciado (para los prompts de retroalimentación)."""
+    num = df[list(COLS_NUM)].apply(pd.to_numeric, errors="coerce")
+
+    def g(v):
+        return "—" if pd.isna(v) else f"{v:.2f}"
+
+    lineas = []
+    for fecha, desc, fila in zip(df["Fecha"], df["Descripción"], num.itertuples(index=False, name=None)):
+        e, s, k = fila[0:3], fila[3:6], fila[6:9]
+        lineas.append(
+            f"{fecha} {desc}: E({','.join(map(g, e))}) | S({','.join(map(g, s))}) | Saldo({','.join(map(g, k))})"
+        )
+    return "\n".join(lineas)
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Nivel 1: Fundamentos del CMV
+# =========================================================
+
+import random
+
+import streamlit as st
+
+from ia import eval_ia_explicacion, n1_eval_open_ai
+from storage import record_attempt, set_level_passed
+from ui_common import peso, speak_block, start_celebration
+
+# ===========================
+# Helpers de escenarios aleatorios estables
+# ===========================
+def n1_new_case():
+    inv0 = random.randint(500, 4000)
+    compras = random.randint(800, 5000)
+    devol = random.randint(0, int(compras*0.3))
+    invf = random.randint(0, inv0 + compras - devol)
+    st.session_state.n1p_inv0 = float(inv0)
+    st.session_state.n1p_compras = float(compras)
+    st.session_state.n1p_devol = float(devol)
+    st.session_state.n1p_invf = float(invf)
+
+# ===========================
+# NIVEL 1
+# ===========================
+def page_level1(username):
+    st.title("Nivel 1 · Introducción a la valoración de inventarios")
+
+    tabs = st.tabs(["🎧 Teoría", "🛠 Ejemplo guiado", "🎮 Práctica interactiva (IA)", "🏁 Evaluación para aprobar"])
+
+    # Teoría
+    with tabs[0]:
+        st.subheader("¿Qué es valorar inventarios y por qué impacta tu utilidad?")
+        teoria = (
+            "Valorar inventarios significa asignar un **costo monetario** a las unidades que una empresa mantiene "
+            "para vender. Este valor aparece como **activo** en el balance y, al mismo tiempo, determina el "
+            "**costo de la mercancía vendida** en el estado de resultados, por lo que impacta directamente la utilidad.\n\n"
+            "En un **sistema periódico**, los movimientos del inventario no se registran con detalle en cada venta; "
+            "durante el período se acumulan las compras y los ajustes, y al cierre se calcula el costo de la mercancía vendida "
+            "con la fórmula base:\n\n"
+            "  **Costo de la mercancía vendida = Inventario inicial + Compras − Devoluciones en compras − Inventario final**\n\n"
+            "• **Inventario inicial**: el costo de las unidades disponibles al comenzar el período.\n"
+            "• **Compras**: el costo de las unidades adquiridas durante el período (incluye desembolsos necesarios para dejarlas disponibles para la venta).\n"
+            "• **Devoluciones en compras**: restan las compras cuando se regresan unidades al proveedor.\n"
+            "• **Inventario final**: el costo de las unidades que permanecen al cierre; su valoración depende del método (promedio ponderado, primeras en entrar primeras en salir, últimas en entrar primeras en salir) que estudiarás en el siguiente nivel.\n\n"
+            "💡 **Analogía de la mochila de costos**: imagina que cargas una mochila donde ingresan el inventario inicial y las compras. "
+            "Si devuelves mercancía al proveedor, sacas parte de esa mochila. Al finalizar, miras lo que queda adentro (inventario final). "
+            "Lo que salió para atender las ventas del período es, precisamente, el **costo de la mercancía vendida**."
+        )
+        st.write(teoria)
+        with st.expander("🔊 Escuchar explicación"):
+            speak_block(teoria, key_prefix="teo-n1", lang_hint="es")
+
+        with st.expander("📌 Nota contable/NIIF"):
+            st.markdown(
+                "Bajo NIIF, debes usar un método de costo razonable y **consistente**. "
+                "UEPS no es aceptado por NIIF plenas (se usa aquí con fines educativos/comparativos)."
+            )
+
+    # Ejemplo guiado
+    with tabs[1]:
+        st.subheader("Ejemplo guiado · paso a paso")
+        colL, colR = st.columns([1,2], gap="large")
+        with colL:
+            st.caption("Ingresa/ajusta datos")
+            inv0 = st.number_input("Inventario Inicial (InvI)", min_value=0.0, value=1500.0, step=100.0, key="n1_ex_inv0")
+            compras = st.number_input("Compras del período", min_value=0.0, value=2700.0, step=100.0, key="n1_ex_compras")
+            devol = st.number_input("Devoluciones (a proveedor)", min_value=0.0, value=200.0, step=50.0, key="n1_ex_devol")
+            invf = st.number_input("Inventario Final (InvF)", min_value=0.0, value=1300.0, step=100.0, key="n1_ex_invf")
+
+        with colR:
+            st.caption("Desglose y explicación")
+
+            # ===== LÓGICA DE AJUSTE DEL INVENTARIO FINAL =====
+            # Cálculo del máximo inventario final coherente:
+            # InvF_max = InvI + Compras − Devoluciones en compras
+            invf_max = inv0 + compras - devol
+            invf_calc = invf          # lo que usaremos en el cálculo interno
+            ajustado = False
+
+            # Si el InvF digitado hace que el CMV sea negativo, ajustamos InvF
+            # para que el CMV sea exactamente 0 (equivalente a que no hubo ventas).
+            cogs_bruto = inv0 + compras - devol - invf
+            if cogs_bruto < 0:
+                invf_calc = invf_max
+                ajustado = True
+
+            # Ahora calculamos el CMV usando el inventario final "efectivo"
+            cogs = inv0 + compras - devol - invf_calc
+
+            st.markdown(
+                f"""
+                <div style='line-height:1.8; font-size:1.05rem;'>
+                    <b>1)</b> Inventario inicial + Compras → {peso(inv0)} + {peso(compras)} = <b>{peso(inv0+compras)}</b><br>
+                    <b>2)</b> Menos devoluciones en compras → {peso(inv0+compras)} − {peso(devol)} = <b>{peso(inv0+compras-devol)}</b><br>
+                    <b>3)</b> Menos inventario final → {peso(inv0+compras-devol)} − {peso(invf_calc)} = <b>{peso(cogs)}</b>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+
+            st.success(f"**Costo de la mercancía vendida** = {peso(cogs)}")
+
+            # Mensaje explicando el ajuste (solo si hubo que corregir)
+            if ajustado:
+                st.warning(
+                    "⚠️ El inventario final que ingresaste era tan alto que el costo de la mercancía vendida "
+                    "habría resultado **negativo**, lo cual no es coherente en un sistema periódico.\n\n"
+                    f"- Inventario final digitado: {peso(invf)}\n"
+                    f"- Máximo inventario final posible según la fórmula "
+                    f"(InvI + Compras − Devoluciones): {peso(invf_max)}\n\n"
+                    "Para efectos del cálculo, ajustamos internamente el inventario final a ese valor máximo, "
+                    "lo que equivale a suponer que **no hubo ventas** y por eso el costo de la mercancía vendida es 0."
+                )
+
+            st.caption(
+                "Interpretación: en la ‘mochila de costos’ entran el inventario inicial y las compras. "
+                "Las devoluciones en compras restan costo disponible. Al final, el inventario que queda en la mochila "
+                "(inventario final) **no** corresponde a ventas. La diferencia es el **costo de la mercancía vendida**. "
+                "Si el inventario final fuera tan alto que el costo resultara negativo, en la práctica significa que "
+                "no tuvo sentido ese dato y debe ajustarse al máximo posible (sin ventas)."
+            )
+
+        st.write("**Mini reto**: explica qué ocurriría con el costo de la mercancía vendida si **no hubiera devoluciones en compras** y el **inventario final fuera muy pequeño**.")
+        razonamiento = st.text_area("Tu razonamiento (opcional, la inteligencia artificial te comenta):", key="n1_ex_raz")
+
+        # IA opcional (evalúa específicamente el mini reto con criterios contables)
+        ask_ai = st.checkbox("💬 Pedir feedback de IA (opcional)", key="n1_ex_ai", value=False)
+
+        # Define la pregunta del mini reto para que quede claro en el validador (opcional, para diagnóstico/consistencia)
+        mini_reto = (
+            "¿Qué ocurriría con el **Costo de la Mercancía Vendida (CMV)** si no hubiera devoluciones en compras "
+            "y el inventario final fuera muy pequeño?"
+        )
+        criterios_mini = (
+            "1) Si no hay devoluciones en compras → las compras no se reducen (se mantienen altas).\n"
+            "2) Inventario final muy pequeño → se RESTA MUY POCO al cierre, por tanto el **CMV AUMENTA**."
+        )
+
+        if st.button("💬 Comentar", key="n1_ex_fb"):
+            if ask_ai:
+                with st.spinner("Evaluando con IA…"):
+                    ok, comentario, retro = eval_ia_explicacion(mini_reto, criterios_mini, razonamiento)
+
+                with st.expander("💬 Resultado de la IA (mini reto)"):
+                    st.markdown(f"**Pregunta:** {mini_reto}")
+                    st.markdown(f"**Resultado:** {'✅ Aprobado' if ok else '❌ No aprobado'}")
+                    st.markdown(f"**Comentario:** {comentario}")
+                    st.markdown("---")
+                    st.info(f"**Retroalimentación formativa:** {retro}")
+
+    # Práctica interactiva (IA) — escenarios estables
+    with tabs[2]:
+        st.subheader("Práctica interactiva")
+        st.caption("Completa el cálculo. Puedes generar otro escenario y validar (IA opcional).")
+
+        if "n1p_inv0" not in st.session_state:
+            n1_new_case()
+
+        cols = st.columns(4)
+        with cols[0]:
+            st.metric("Inventario Inicial", peso(st.session_state.n1p_inv0))
+        with cols[1]:
+            st.metric("Compras", peso(st.session_state.n1p_compras))
+        with cols[2]:
+            st.metric("Devoluciones", peso(st.session_state.n1p_devol))
+        with cols[3]:
+            st.metric("Inventario Final", peso(st.session_state.n1p_invf))
+
+        st.button("🔄 Nuevo escenario", on_click=n1_new_case, key="n1_practice_new")
+
+        with st.form("n1_practice_form"):
+            user_cogs = st.number_input("El costo de mercancía vendida es:", min_value=0.0, value=0.0, step=10.0, key="n1_practice_user_cogs")
+            user_comment = st.text_area("Justifica brevemente (opcional):", key="n1_practice_comment")
+            ask_ai = st.checkbox("💬 Pedir feedback de IA (opcional)", key="n1_practice_ai", value=False)
+            submitted = st.form_submit_button("✅ Validar práctica")
+
+        if submitted:
+            st.toast("✅ Respuesta recibida, validando...", icon="✅")
+            inv0 = st.session_state.n1p_inv0
+            compras = st.session_state.n1p_compras
+            devol = st.session_state.n1p_devol
+            invf = st.session_state.n1p_invf
+            correct = inv0 + compras - devol - invf
+            if abs(user_cogs - correct) <= 0.5:
+                st.success(f"¡Correcto! El **costo de la mercancía vendida** es {peso(correct)}")
+            else:
+                st.error(f"No coincide. El **costo de la mercancía vendida** esperado era {peso(correct)}")
+
+            if ask_ai:
+                with st.spinner("Evaluando con IA..."):
+                    # Definimos la pregunta y los criterios de evaluación pedagógicos
+                    pregunta = (
+                        "En este escenario, el estudiante debe calcular correctamente el "
+                        "Costo de la Mercancía Vendida (CMV) aplicando la fórmula: "
+                        "CMV = Inventario inicial + Compras − Devoluciones en compras − Inventario final. "
+                        "Además, debe interpretar su resultado de forma contable y conceptual."
+                    )
+
+                    criterios = (
+                        "1️⃣ El valor numérico del CMV debe coincidir (dentro de la tolerancia) con el cálculo correcto.\n"
+                        "2️⃣ La explicación debe reflejar comprensión de la relación entre inventario final y CMV "
+                        "(menor inventario final → se resta menos → CMV más alto).\n"
+                        "3️⃣ Si no hay devoluciones en compras, el estudiante debe reconocer que las compras no se reducen.\n"
+                        "4️⃣ La retroalimentación debe ser amable, clara y con una analogía práctica (mochila de costos, balanza, etc.)."
+                    )
+
+                    # Llamada a la IA (usa la función ya existente)
+                    ok_ia, comentario_ia, retro_ia = eval_ia_explicacion(
+                        pregunta=pregunta,
+                        criterios=criterios,
+                        respuesta_estudiante=(
+                            f"CMV calculado por el estudiante: {user_cogs:.2f}. "
+                            f"Datos: Inventario inicial={inv0:.2f}, Compras={compras:.2f}, "
+                            f"Devoluciones en compras={devol:.2f}, Inventario final={invf:.2f}. "
+                            f"CMV correcto={correct:.2f}. "
+                            f"Explicación escrita: {user_comment.strip()}"
+                        )
+                    )
+
+                # Mostrar el resultado de la IA en la interfaz
+                with st.expander("💬 Feedback de la IA (práctica CMV)"):
+                    st.markdown(f"**Resultado:** {'✅ Aprobado' if ok_ia else '❌ No aprobado'}")
+                    st.markdown(f"**Comentario:** {comentario_ia}")
+                    st.markdown("---")
+                    st.info(f"**Retroalimentación pedagógica:** {retro_ia}")
+
+    # Evaluación final — 5 preguntas (2 selección múltiple, 2 cálculo, 1 abierta IA)
+    with tabs[3]:
+        st.subheader("Evaluación final del Nivel 1")
+        st.caption("Son 5 preguntas. Apruebas con **5 de 5**.")
+
+        # ---------- Claves correctas / datos de cálculo ----------
+        # P1: Fórmula correcta
+        P1_CORRECTA = "Inventario inicial + Compras − Devoluciones en compras − Inventario final"
+        # P2: Afirmación verdadera
+        P2_CORRECTA = "Un inventario final más alto, manteniendo todo lo demás igual, reduce el costo de la mercancía vendida."
+
+        # P3: Cálculo directo
+        P3_invI, P3_comp, P3_dev, P3_invF = 1800.0, 4500.0, 300.0, 1200.0
+        P3_CORRECTO = P3_invI + P3_comp - P3_dev - P3_invF  # 4800.0
+
+        # P4: Cálculo inverso (despejar Inventario final)
+        P4_invI, P4_comp, P4_dev, P4_cmv = 2400.0, 3600.0, 200.0, 4000.0
+        P4_CORRECTO = P4_invI + P4_comp - P4_dev - P4_cmv    # 1800.0
+
+        TOL = 0.5  # tolerancia para respuestas numéricas
+        TOTAL_ITEMS = 5
+        PASS_MIN = 5
+
+        with st.form("n1_eval_form_v2", clear_on_submit=False):
+            # ---------- Pregunta 1 (Selección múltiple) ----------
+            st.markdown("**1) En un sistema periódico, ¿cuál es la fórmula correcta para calcular el costo de la mercancía vendida?**")
+            p1_opts = [
+                "Inventario inicial + Compras + Devoluciones en compras − Inventario final",
+                P1_CORRECTA,
+                "Inventario final + Compras − Devoluciones en compras − Ventas",
+                "Inventario inicial + Ventas − Devoluciones en compras − Inventario final",
+            ]
+            q1 = st.radio("Selecciona una opción:", p1_opts, index=None, key="n1v2_q1")
+
+            st.markdown("---")
+
+            # ---------- Pregunta 2 (Selección múltiple) ----------
+            st.markdown("**2) En un sistema periódico, selecciona la afirmación verdadera:**")
+            p2_opts = [
+                "El costo de la mercancía vendida se conoce con certeza en cada venta.",
+                "Las devoluciones en compras aumentan el costo de la mercancía vendida.",
+                P2_CORRECTA,
+                "El costo de la mercancía vendida no se ve afectado por las devoluciones en compras.",
+            ]
+            q2 = st.radio("Selecciona una opción:", p2_opts, index=None, key="n1v2_q2")
+
+            st.markdown("---")
+
+            # ---------- Pregunta 3 (Cálculo directo) ----------
+            st.markdown("**3) Con base en esta información. Calcule el costo de la mercancía vendida**")
+            st.markdown(
+                f"""
+                <div style='line-height:1.8; font-size:1.05rem;'>
+                <b>Datos:</b><br>
+                • Inventario inicial = <b>{peso(P3_invI)}</b><br>
+                • Compras = <b>{peso(P3_comp)}</b><br>
+                • Devoluciones en compras = <b>{peso(P3_dev)}</b><br>
+                • Inventario final = <b>{peso(P3_invF)}</b>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+            q3 = st.number_input("Escribe tu resultado ($):", min_value=0.0, value=0.0, step=10.0, key="n1v2_q3")
+
+            st.markdown("---")
+
+            # ---------- Pregunta 4 (Cálculo inverso) ----------
+            st.markdown("**4) Con base en esta información. Calcule el valor del inventario final**")
+            st.markdown(
+                f"""
+                <div style='line-height:1.8; font-size:1.05rem;'>
+                <b>Datos:</b><br>
+                • Inventario inicial = <b>{peso(P4_invI)}</b><br>
+                • Compras = <b>{peso(P4_comp)}</b><br>
+                • Devoluciones en compras = <b>{peso(P4_dev)}</b><br>
+                • Costo de la mercancía vendida = <b>{peso(P4_cmv)}</b>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+            q4 = st.number_input("Inventario final ($):", min_value=0.0, value=0.0, step=10.0, key="n1v2_q4")
+
+            st.markdown("---")
+
+            # ---------- Pregunta 5 (Abierta, validación con IA) ----------
+            st.markdown("**5) Respuesta abierta (validada con IA)**")
+            st.write(
+                "Explica **qué ocurre con el costo de la mercancía vendida** cuando **disminuye el inventario final**, "
+                "manteniendo constantes el inventario inicial, las compras y las devoluciones en compras."
+            )
+            q5_text = st.text_area("Tu explicación en 2–4 líneas:", key="n1v2_q5")
+
+            ask_ai = st.checkbox("Mostrar el resultado detallado de la validación por IA", value=True, key="n1v2_ai_show")
+
+            submitted = st.form_submit_button("🧪 Validar evaluación")
+
+        if submitted:
+            st.toast("✅ Respuestas recibidas, validando...", icon="✅")
+
+            score = 0
+            details = []
+
+            # P1
+            ok1 = (q1 == P1_CORRECTA)
+            if ok1: score += 1
+            details.append(("1) Fórmula correcta", ok1))
+
+            # P2
+            ok2 = (q2 == P2_CORRECTA)
+            if ok2: score += 1
+            details.append(("2) Afirmación verdadera", ok2))
+
+            # P3
+            ok3 = (abs((q3 or 0.0) - P3_CORRECTO) <= TOL)
+            if ok3: score += 1
+            details.append(("3) Cálculo directo", ok3))
+
+            # P4
+            ok4 = (abs((q4 or 0.0) - P4_CORRECTO) <= TOL)
+            if ok4: score += 1
+            details.append(("4) Cálculo inverso", ok4))
+
+            # P5 — validación con IA
+            ok5, fb5_short, fb5_retro = n1_eval_open_ai(q5_text)
+            if ok5: score += 1
+            details.append(("5) Respuesta abierta (IA)", ok5))
+
+            st.markdown(
+                """
+                <style>
+                .val { font-family: monospace; font-size: 15px; color: #1a73e8; font-weight: 600; }
+                .calc { line-height: 1.9; font-size: 1.02rem; }
+                </style>
+                """,
+                unsafe_allow_html=True
+            )
+
+            def fmt_plain(v, dec=0):
+                try:
+                    return f"{v:,.{dec}f}".replace(",", ".")
+                except Exception:
+                    return str(v)
+
+            def money(v, dec=0):
+                return f"${fmt_plain(v, dec)}"
+
+            # --------- Retroalimentación formativa por pregunta (1–4) ---------
+            feedback_por_pregunta = []
+
+            def fmt_valor_html(v):
+                """Devuelve el valor monetario formateado y estilizado en HTML uniforme."""
+                return f"<span style='font-family:monospace;font-size:15px;color:#1a73e8;font-weight:600;'> {peso(v)} </span>"
+
+            if not ok1:
+                feedback_por_pregunta.append(
+                    ("1) Fórmula correcta",
+                    "Recuerda la estructura en sistema periódico: "
+                    "Costo de la mercancía vendida = Inventario inicial + Compras − Devoluciones en compras − Inventario final. "
+                    "Las devoluciones en compras RESTAN del costo disponible y el inventario final se descuenta al cierre.")
+                )
+            else:
+                feedback_por_pregunta.append(("1) Fórmula correcta", "¡Bien! Identificaste la fórmula sin confundir los signos."))
+
+            if not ok2:
+                feedback_por_pregunta.append(
+                    ("2) Afirmación verdadera",
+                    "Si el inventario final aumenta (manteniendo todo lo demás igual), se descuenta una cifra mayor al cierre, "
+                    "por lo que el costo de la mercancía vendida DISMINUYE. Por eso la afirmación correcta es la que indica esa relación inversa.")
+                )
+            else:
+                feedback_por_pregunta.append(("2) Afirmación verdadera", "Correcto: inventario final más alto ⇒ menor costo de la mercancía vendida."))
+
+            # --- Textos HTML formateados para P3 y P4 ---
+            texto_p3 = f"""
+            <div class='calc'>
+            Vuelve a aplicar la fórmula con los datos:<br>
+            <span class='val'>{money(P3_invI)}</span> &plus;
+            <span class='val'>{money(P3_comp)}</span> &minus;
+            <span class='val'>{money(P3_dev)}</span> &minus;
+            <span class='val'>{money(P3_invF)}</span>
+            = <strong><span class='val'>{money(P3_CORRECTO)}</span></strong>.<br>
+            <em>Error típico:</em> olvidar restar las devoluciones en compras.
+            </div>
+            """
+
+            texto_p4 = f"""
+            <div class='calc'>
+            Despeja el Inventario final desde la fórmula:<br>
+            Inventario final = Inventario inicial &plus; Compras &minus; Devoluciones en compras &minus; Costo de la mercancía vendida.<br>
+            Con los datos:<br>
+            <span class='val'>{money(P4_invI)}</span> &plus;
+            <span class='val'>{money(P4_comp)}</span> &minus;
+            <span class='val'>{money(P4_dev)}</span> &minus;
+            <span class='val'>{money(P4_cmv)}</span>
+            = <strong><span class='val'>{money(P4_CORRECTO)}</span></strong>.<br>
+            <em>Error típico:</em> cambiar signos al despejar.
+            </div>
+            """
+
+            if not ok3:
+                feedback_por_pregunta.append(("3) Cálculo directo", texto_p3))
+            else:
+                feedback_por_pregunta.append(("3) Cálculo directo", "Cálculo correcto y bien aplicado el orden de operaciones."))
+
+            if not ok4:
+                feedback_por_pregunta.append(("4) Cálculo inverso", texto_p4))
+            else:
+                feedback_por_pregunta.append(("4) Cálculo inverso", "¡Bien! Despejaste correctamente el inventario final."))
+
+
+            # --------- Mostrar panel de retroalimentación ---------
+            with st.expander("🧠 Retroalimentación formativa por pregunta"):
+                for titulo, nota in feedback_por_pregunta:
+                    st.markdown(f"**{titulo}**", unsafe_allow_html=True)
+                    st.markdown(nota, unsafe_allow_html=True)
+                    st.markdown("---")
+
+
+            # Resultado
+            passed = (score >= PASS_MIN)
+            record_attempt(username, level=1, score=score, passed=passed)  # Mongo: sin cambios
+
+            # Feedback al estudiante
+            cols = st.columns([1,1,1])
+            cols[0].metric("Aciertos", f"{score}/{TOTAL_ITEMS}")
+            cols[1].metric("Regla de aprobación", f"{PASS_MIN} de {TOTAL_ITEMS}")
+            cols[2].metric("Estado", "✅ Aprobado" if passed else "❌ No aprobado")
+
+            with st.expander("Detalle por pregunta"):
+                for label, ok in details:
+                    st.write(f"{'✅' if ok else '❌'} {label}")
+
+            if ask_ai:
+                with st.expander("💬 Resultado de la IA (pregunta 5)"):
+                    st.markdown(f"**Resultado:** {'✅ Aprobado' if ok5 else '❌ No aprobado'}")
+                    st.write(fb5_short)
+                    st.markdown("---")
+                    st.info(f"**Retroalimentación formativa:** {fb5_retro}")
+
+            if passed:
+                set_level_passed(st.session_state["progress_col"], username, "level1", score)
+                st.session_state["sidebar_next_select"] = "Nivel 2: Métodos (PP/PEPS/UEPS)"
+
+                st.session_state["celebrate_score_text"] = f"{score}/{TOTAL_ITEMS}"
+                st.session_state["celebrate_answers_title"] = "✅ Respuestas correctas del Nivel 1"
+                st.session_state["celebrate_answers"] = [
+                    f"1) Fórmula correcta: {P1_CORRECTA}",
+                    f"2) Afirmación verdadera: {P2_CORRECTA}",
+                    f"3) Cálculo directo: {money(P3_CORRECTO)}",
+                    f"4) Cálculo inverso (Inventario final): {money(P4_CORRECTO)}",
+                    "5) Respuesta abierta esperada: si el inventario final disminuye, el CMV aumenta."
+                ]
+
+                start_celebration(
+                    message_md=(
+                        "<b>¡Nivel 1 superado!</b> 🏆<br><br>"
+                        f"<b>Aciertos:</b> {score}/{TOTAL_ITEMS}<br><br>"
+                        "Dominaste la fórmula del <b>costo de la mercancía vendida</b> y el sistema periódico. "
+                        "Ahora sí: pasemos a los <b>métodos de valoración</b>."
+                    ),
+                    next_label="Nivel 2",
+                    next_key_value="Nivel 2: Métodos (PP/PEPS/UEPS)"
+                )
+            else:
+                st.error(f"No aprobado. Aciertos {score}/{TOTAL_ITEMS}. Repasa la teoría y vuelve a intentar.")
@@ -0,0 +1,2099 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Nivel 2: Métodos PP/PEPS/UEPS
+# =========================================================
+
+import io
+import random
+import json
+import json as _json
+import time
+
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+
+from inventory_engine import InventarioCapas
+from kardex_stream import KardexMultiSKU, escribir_libro_csv, generar_libro, kardex_stream, leer_movimientos
+from kardex_table import KardexTabla, describir_filas
+from ia import grade_open_answers, ia_feedback, ia_feedback_or_default, ia_feedback_stream
+from ia_decode import decode_json_or_empty
+from resources import rx
+from rubric_classifier import decision_local
+from storage import record_attempt, set_current_level, set_level_passed
+from ui_common import peso, speak_block, start_celebration
+
+# ===========================
+# Helpers de escenarios aleatorios estables
+# ===========================
+def n2_new_case():
+    st.session_state.n2_inv0_u  = random.randint(50, 150)
+    st.session_state.n2_inv0_pu = random.choice([10.0, 11.0, 12.0])
+    st.session_state.n2_comp_u  = random.randint(50, 200)
+    st.session_state.n2_comp_pu = random.choice([12.0, 13.0, 14.0])
+    st.session_state.n2_venta_u = random.randint(60, st.session_state.n2_inv0_u + st.session_state.n2_comp_u)
+
+# ===========================
+# Práctica con libros de movimientos (KARDEX en streaming)
+# ===========================
+N2_LIBRO_PREVIEW = 300   # filas del KARDEX que se muestran; el resto solo se procesa
+
+_COLS_LIBRO = {
+    "fecha": "Fecha", "sku": "SKU", "descripcion": "Descripción",
+    "ent_q": "Entrada_cant", "ent_pu": "Entrada_pu", "ent_tot": "Entrada_total",
+    "sal_q": "Salida_cant", "sal_pu": "Salida_pu", "sal_tot": "Salida_total",
+    "sdo_q": "Saldo_cant", "sdo_pu": "Saldo_pu", "sdo_tot": "Saldo_total",
+    "faltante": "Faltante",
+}
+
+
+@st.cache_data(show_spinner=False)
+def n2_libro_ejemplo(n: int = 2000, skus: int = 12) -> str:
+    buf = io.StringIO()
+    escribir_libro_csv(generar_libro(n, skus), buf)
+    return buf.getvalue()
+
+
+def n2_libro_movimientos():
+    st.subheader("Práctica · KARDEX desde un libro de movimientos")
+    st.caption(
+        "Sube un libro con columnas **fecha, sku, tipo, cantidad, costo_unitario** "
+        "(tipo: compra, venta, dev_compra, dev_venta). Se procesa movimiento a movimiento, "
+        f"así que sirve para libros grandes; se muestran las primeras {N2_LIBRO_PREVIEW} filas del KARDEX."
+    )
+    st.download_button(
+        "⬇️ Libro de ejemplo (CSV)", n2_libro_ejemplo(), file_name="libro_movimientos_ejemplo.csv",
+        mime="text/csv", key="n2_libro_ejemplo",
+    )
+
+    c1, c2 = st.columns([2, 1])
+    archivo = c1.file_uploader("Libro de movimientos (CSV o JSON lines)", type=["csv", "jsonl", "json"], key="n2_libro_file")
+    metodo = c2.selectbox("Método", ["Promedio Ponderado", "PEPS (FIFO)", "UEPS (LIFO)"], key="n2_libro_metodo")
+    sku = c2.text_input("Ver solo el SKU (opcional)", key="n2_libro_sku").strip()
+    if archivo is None:
+        return
+
+    if st.button("Procesar libro", key="n2_libro_go"):
+        motor = KardexMultiSKU(metodo)
+        vista = []
+        t0 = time.perf_counter()
+        try:
+            archivo.seek(0)
+            for fila in kardex_stream(leer_movimientos(archivo, archivo.name), metodo, motor):
+                if len(vista) < N2_LIBRO_PREVIEW and (not sku or fila.sku == sku):
+                    vista.append(fila)
+        except ValueError as e:
+            st.error(f"No se pudo procesar el libro: {e}")
+            return
+        st.session_state["n2_libro_resultado"] = {
+            "archivo": archivo.name, "metodo": metodo, "sku": sku,
+            "vista": vista, "resumen": motor.resumen(),
+            "movimientos": motor.movimientos, "filas": motor.filas,
+            "capas": motor.capas_abiertas(), "seg": time.perf_counter() - t0,
+        }
+
+    res = st.session_state.get("n2_libro_resultado")
+    if not res or res["archivo"] != archivo.name:
+        return
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Movimientos", f"{res['movimientos']:,}")
+    m2.metric("Filas de KARDEX", f"{res['filas']:,}")
+    m3.metric("SKU", len(res["resumen"]))
+    m4.metric("Tiempo", f"{res['seg']:.2f} s")
+    st.caption(f"Método: **{res['metodo']}** · capas abiertas al cierre: {res['capas']}")
+
+    st.markdown("#### Resumen por SKU")
+    st.dataframe(pd.DataFrame(res["resumen"]).round(2), use_container_width=True, hide_index=True)
+
+    st.markdown("#### KARDEX" + (f" · {res['sku']}" if res["sku"] else ""))
+    if not res["vista"]:
+        st.info("No hay filas para mostrar con ese filtro.")
+        return
+    df = pd.DataFrame(res["vista"]).rename(columns=_COLS_LIBRO).round(2)
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    faltantes = int((df["Faltante"] > 0).sum())
+    if faltantes:
+        st.warning(f"{faltantes} fila(s) de la vista pidieron más unidades que el saldo disponible (columna Faltante).")
+
+# ===========================
+# Helpers del Nivel 2 (KARDEX, escenarios y calificación)
+# ===========================
+def _fmt_money(v):
+    try:
+        return peso(float(v))
+    except Exception:
+        return str(v)
+
+
+def _kardex_two_ops(method_name, inv0_u, inv0_pu, comp_u, comp_pu, venta_u):
+    cols = pd.MultiIndex.from_tuples([
+        ("", "Fecha"), ("", "Descripción"),
+        ("Entrada", "Cantidad"), ("Entrada", "Precio"), ("Entrada", "Total"),
+        ("Salida", "Cantidad"), ("Salida", "Precio"), ("Salida", "Total"),
+        ("Saldo", "Cantidad"), ("Saldo", "Precio"), ("Saldo", "Total"),
+    ])
+
+    rows = []
+
+    # --- Fila 1: Saldo inicial ---
+    inv = InventarioCapas(method_name)
+    inv.entrada(inv0_u, inv0_pu)
+    saldo_qty, saldo_pu, saldo_val = inv.saldo()
+    entrada_inicial_total = inv0_u * inv0_pu
+
+    # AHORA EL SALDO INICIAL SE MUESTRA COMO ENTRADA Y COMO SALDO
+    rows.append([
+        "Día 1", "Saldo inicial",
+        int(inv0_u) if inv0_u > 0 else "", round(inv0_pu, 2) if inv0_u > 0 else "", round(entrada_inicial_total, 2) if inv0_u > 0 else "",
+        "", "", "",
+        int(saldo_qty), round(saldo_pu, 2), round(saldo_val, 2)
+    ])
+
+    explain_lines = [f"- **Saldo inicial**: registramos {int(inv0_u)} u @ {_fmt_money(inv0_pu)} como una entrada inicial al Kardex; "
+                     f"el saldo muestra esas mismas {int(saldo_qty)} u, por {_fmt_money(saldo_val)}."]
+
+    # --- Fila 2: Compra ---
+    entrada_total = comp_u * comp_pu
+    inv.entrada(comp_u, comp_pu)
+    saldo_qty, saldo_pu, saldo_val = inv.saldo()
+    if method_name == "Promedio Ponderado":
+        rows.append([
+            "Día 2", "Compra",
+            int(comp_u), round(comp_pu, 2), round(entrada_total, 2),
+            "", "", "",
+            int(saldo_qty), round(saldo_pu, 2), round(saldo_val, 2)
+        ])
+        explain_lines.append(
+            f"- **Compra**: +{int(comp_u)} u @ {_fmt_money(comp_pu)}. A partir del saldo inicial ya registrado, "
+            f"recalculamos el costo promedio: ahora el saldo es de {int(saldo_qty)} u a {_fmt_money(saldo_pu)}."
+        )
+    else:
+        # PEPS / UEPS: solo fila de Compra (sin “Saldo (día 1)”)
+        rows.append([
+            "Día 2", "Compra",
+            int(comp_u), round(comp_pu, 2), round(entrada_total, 2),
+            "", "", "",
+            int(comp_u), round(comp_pu, 2), round(entrada_total, 2)
+        ])
+        capas_txt = " · ".join([f"{int(q)}u@{_fmt_money(p)}" for q, p in inv.capas()])
+        explain_lines.append(
+            f"- **Compra**: +{int(comp_u)} u @ {_fmt_money(comp_pu)}. "
+            f"La fila del Día 2 muestra la nueva capa; el inventario total se observa combinando el saldo inicial del Día 1 y esta fila. "
+            f"Capas: {capas_txt}."
+        )
+
+    # --- Fila 3: Venta ---
+    venta_total = 0.0
+    salida_pu_mostrar = 0.0
+
+    if venta_u > 0 and saldo_qty > 0:
+        tramos = inv.salida(venta_u)
+        venta_total = sum(t.total for t in tramos)
+        saldo_qty, saldo_pu, saldo_val = inv.saldo()
+        if method_name == "Promedio Ponderado":
+            salida_pu_mostrar = tramos[0].costo_unitario
+            explain_lines.append(
+                f"- **Venta**: {int(venta_u)} u al costo promedio {_fmt_money(salida_pu_mostrar)} → **CMV**: {_fmt_money(venta_total)}. "
+                f"Saldo: {int(saldo_qty)} u, {_fmt_money(saldo_val)}."
+            )
+        else:
+            salida_pu_mostrar = (venta_total / venta_u) if venta_u > 0 else 0.0
+
+            if tramos:
+                det_txt = " + ".join([f"{int(t.cantidad)}u@{_fmt_money(t.costo_unitario)}={_fmt_money(t.total)}" for t in tramos])
+                capas_txt = (" · ".join([f"{int(q)}u@{_fmt_money(p)}" for q, p in inv.capas()]) if len(inv) else "0 u")
+                explain_lines.append(
+                    f"- **Venta**: {int(venta_u)} u → {det_txt} ⇒ **CMV**: {_fmt_money(venta_total)}. Saldo: {capas_txt}."
+                )
+            else:
+                explain_lines.append("- **Venta**: no hay consumo (sin saldo).")
+
+    rows.append([
+        "Día 3", "Venta",
+        "", "", "",
+        int(venta_u) if venta_u > 0 else "", round(salida_pu_mostrar, 2) if venta_u > 0 else "", round(venta_total, 2) if venta_u > 0 else "",
+        int(saldo_qty), round(saldo_pu, 2), round(saldo_val, 2)
+    ])
+
+    df = pd.DataFrame(rows, columns=cols)
+    explain_md = "\n".join(explain_lines)
+    return df, explain_md
+
+
+def compute_rows_and_script(method_name, inv0_u, inv0_pu, comp_u, comp_pu, venta_u):
+    """
+    Construye las filas del KARDEX y un 'script' con guiones pedagógicos
+    adaptados a los valores que el estudiante definió.
+    - Siempre registra el saldo inicial como una ENTRADA (Día 1).
+    - Día 2: solo la compra (sin fila extra de saldo).
+    - Día 3: venta según el método (PP una fila, PEPS/UEPS por tramos).
+    En PEPS/UEPS NO se promedia el saldo: se trabaja por capas.
+    """
+    inv = InventarioCapas(method_name)
+
+    rows = []   # cada fila: dict con keys: fecha, desc, ent_q, ent_pu, ent_tot, sal_q, sal_pu, sal_tot, sdo_q, sdo_pu, sdo_tot
+    script = [] # guiones para la narración
+
+    # ----------------------------------------------------
+    # DÍA 1 · SALDO INICIAL (SIEMPRE COMO ENTRADA + SALDO)
+    # ----------------------------------------------------
+    if inv0_u > 0:
+        ent_q_1 = int(inv0_u)
+        ent_pu_1 = float(inv0_pu)
+        ent_tot_1 = ent_q_1 * ent_pu_1
+        inv.entrada(ent_q_1, ent_pu_1)
+    else:
+        ent_q_1 = None
+        ent_pu_1 = None
+        ent_tot_1 = None
+    s_q, s_pu, s_v = inv.saldo()
+
+    rows.append({
+        "fecha": "Día 1", "desc": "Saldo inicial",
+        "ent_q": ent_q_1, "ent_pu": ent_pu_1, "ent_tot": ent_tot_1,
+        "sal_q": None, "sal_pu": None, "sal_tot": None,
+        "sdo_q": int(s_q), "sdo_pu": round(s_pu, 2), "sdo_tot": round(s_v, 2),
+    })
+
+    if inv0_u > 0:
+        script.append({
+            "title": "Paso 1 · Saldo inicial como entrada",
+            "text": (
+                f"Empezamos registrando el saldo inicial como una ENTRADA: "
+                f"{ent_q_1} unidades a un costo unitario de {_fmt_money(ent_pu_1)} pesos. "
+                f"En la columna Total calculamos {ent_q_1} por {_fmt_money(ent_pu_1)} pesos, "
+                f"lo que da {_fmt_money(ent_tot_1)} pesos. Ese mismo valor pasa a la columna Saldo, "
+                f"porque al inicio solo existe esta capa de inventario."
+            ),
+            "actions": [
+                {"row": 0, "cell": "ent_q", "money": False, "val": ent_q_1},
+                {"row": 0, "cell": "ent_pu", "money": True,  "val": round(ent_pu_1, 2)},
+                {"row": 0, "cell": "ent_tot", "money": True, "val": round(ent_tot_1, 2)},
+                {"row": 0, "cell": "sdo_q", "money": False, "val": int(s_q)},
+                {"row": 0, "cell": "sdo_pu", "money": True, "val": round(s_pu, 2)},
+                {"row": 0, "cell": "sdo_tot", "money": True, "val": round(s_v, 2)},
+            ]
+        })
+
+    else:
+        script.append({
+            "title": "Paso 1 · Sin saldo inicial",
+            "text": (
+                "En este escenario no hay saldo inicial de inventarios. Dejamos vacías las columnas "
+                "de Entrada en el Día 1 y el Saldo comienza en cero."
+            ),
+            "actions": [
+                {"row": 0, "cell": "sdo_q", "money": False, "val": 0},
+                {"row": 0, "cell": "sdo_pu", "money": True, "val": 0.0},
+                {"row": 0, "cell": "sdo_tot", "money": True, "val": 0.0},
+            ]
+        })
+
+    # ---------------------------------
+    # DÍA 2 · COMPRA (SOLO UNA FILA)
+    # ---------------------------------
+    ent_q_2 = int(comp_u) if comp_u > 0 else None
+    ent_pu_2 = float(comp_pu) if comp_u > 0 else None
+    ent_tot_2 = ent_q_2 * ent_pu_2 if comp_u > 0 else None
+
+    if method_name == "Promedio Ponderado":
+        # Guardar saldo previo para explicación
+        prev_q, prev_pu, prev_v = s_q, s_pu, s_v
+
+        inv.entrada(comp_u, comp_pu)
+        s_q, s_pu, s_v = inv.saldo()
+
+        rows.append({
+            "fecha": "Día 2", "desc": "Compra",
+            "ent_q": ent_q_2, "ent_pu": ent_pu_2, "ent_tot": ent_tot_2,
+            "sal_q": None, "sal_pu": None, "sal_tot": None,
+            "sdo_q": int(s_q), "sdo_pu": round(s_pu, 2), "sdo_tot": round(s_v, 2),
+        })
+
+        script.append({
+            "title": "Paso 2 · Compra y nuevo costo promedio",
+            "text": (
+                f"Registramos la compra del Día 2 como ENTRADA: {ent_q_2} unidades a "
+                f"{_fmt_money(ent_pu_2)} pesos, con un total de {_fmt_money(ent_tot_2)} pesos.\n\n"
+                f"Para actualizar el saldo aplicamos el Promedio Ponderado:\n"
+                f"Valor anterior del saldo: {_fmt_money(prev_v)} pesos con {int(prev_q)} unidades.\n"
+                f"Valor de la compra: {_fmt_money(ent_tot_2)} pesos con {ent_q_2} unidades.\n"
+                f"Nuevo costo promedio = (valor anterior + valor de la compra) / "
+                f"(unidades anteriores + unidades compradas).\n"
+                f"Es decir: {_fmt_money(prev_v)} pesos más {_fmt_money(ent_tot_2)} pesos, dividido entre "
+                f"{int(prev_q)} más {ent_q_2} unidades, nos da un costo promedio de {_fmt_money(s_pu)} pesos por unidad.\n"
+                f"Con ese costo promedio mostramos el nuevo SALDO de {int(s_q)} unidades "
+                f"por {_fmt_money(s_pu)} pesos, para un total de {_fmt_money(s_v)} pesos."
+            ),
+            "actions": [
+                {"row": 1, "cell": "ent_q", "money": False, "val": ent_q_2},
+                {"row": 1, "cell": "ent_pu", "money": True,  "val": round(ent_pu_2, 2)},
+                {"row": 1, "cell": "ent_tot", "money": True, "val": round(ent_tot_2, 2)},
+                {"row": 1, "cell": "sdo_q", "money": False, "val": int(s_q)},
+                {"row": 1, "cell": "sdo_pu", "money": True, "val": round(s_pu, 2)},
+                {"row": 1, "cell": "sdo_tot", "money": True, "val": round(s_v, 2)},
+            ]
+        })
+        start_sale_row_index = 2
+
+    else:
+        # PEPS / UEPS → se manejan capas, pero en esta fila mostramos solo la capa de la compra
+        inv.entrada(comp_u, comp_pu)
+        s_q, _, _ = inv.saldo()
+
+        rows.append({
+            "fecha": "Día 2", "desc": "Compra",
+            "ent_q": ent_q_2, "ent_pu": ent_pu_2, "ent_tot": ent_tot_2,
+            "sal_q": None, "sal_pu": None, "sal_tot": None,
+            "sdo_q": ent_q_2 or 0,
+            "sdo_pu": round(ent_pu_2 or 0.0, 2),
+            "sdo_tot": round(ent_tot_2 or 0.0, 2),
+        })
+
+        metodo_tag = "PEPS" if method_name == "PEPS (FIFO)" else "UEPS (LIFO)"
+        script.append({
+            "title": f"Paso 2 · Compra como nueva capa ({metodo_tag})",
+            "text": (
+                f"En {metodo_tag} NO promediamos el costo. La compra del Día 2 se registra como una nueva capa: "
+                f"{ent_q_2} unidades a {_fmt_money(ent_pu_2)} pesos, total {_fmt_money(ent_tot_2)} pesos.\n\n"
+                f"En la columna SALDO de esta fila mostramos solo esa capa comprada... "
+                f"más adelante la venta consumirá primero una u otra capa según el método, "
+                f"en lugar de combinar todo en un único costo promedio."
+            ),
+            "actions": [
+                {"row": 1, "cell": "ent_q", "money": False, "val": ent_q_2},
+                {"row": 1, "cell": "ent_pu", "money": True,  "val": round(ent_pu_2, 2)},
+                {"row": 1, "cell": "ent_tot", "money": True, "val": round(ent_tot_2, 2)},
+                {"row": 1, "cell": "sdo_q", "money": False, "val": ent_q_2 or 0},
+                {"row": 1, "cell": "sdo_pu", "money": True, "val": round(ent_pu_2 or 0.0, 2)},
+                {"row": 1, "cell": "sdo_tot", "money": True, "val": round(ent_tot_2 or 0.0, 2)},
+            ]
+        })
+        start_sale_row_index = 2
+
+    # ---------------------------------
+    # DÍA 3 · VENTA (PP vs PEPS/UEPS)
+    # ---------------------------------
+    if venta_u > 0 and s_q > 0:
+        # ======== PROMEDIO PONDERADO ========
+        if method_name == "Promedio Ponderado":
+            prev_q, prev_pu, prev_v = s_q, s_pu, s_v
+            tramo = inv.salida(min(venta_u, int(s_q)))[0]
+            sal_q, sal_pu, sal_tot = tramo.cantidad, tramo.costo_unitario, tramo.total
+            s_q, s_pu, s_v = inv.saldo()
+
+            rows.append({
+                "fecha": "Día 3", "desc": "Venta",
+                "ent_q": None, "ent_pu": None, "ent_tot": None,
+                "sal_q": int(sal_q), "sal_pu": round(sal_pu, 2), "sal_tot": round(sal_tot, 2),
+                "sdo_q": int(s_q), "sdo_pu": round(s_pu, 2), "sdo_tot": round(s_v, 2),
+            })
+
+            script.append({
+                "title": "Paso 3 · Venta con Promedio Ponderado",
+                "text": (
+                    f"En el Día 3 registramos la VENTA como una SALIDA de {sal_q} unidades. "
+                    f"Como estamos en Promedio Ponderado, usamos el costo promedio vigente: "
+                    f"{_fmt_money(sal_pu)} pesos por unidad.\n\n"
+                    f"El CMV de esta fila es {sal_q} por {_fmt_money(sal_pu)} pesos, "
+                    f"lo que da {_fmt_money(sal_tot)} pesos.\n"
+                    f"Para actualizar el SALDO restamos esas unidades y ese valor al saldo anterior "
+                    f"({int(prev_q)} unidades por {_fmt_money(prev_pu)} pesos, total {_fmt_money(prev_v)} pesos), "
+                    f"y volvemos a calcular el nuevo costo promedio del inventario que queda."
+                ),
+                "actions": [
+                    {"row": start_sale_row_index, "cell": "sal_q", "money": False, "val": int(sal_q)},
+                    {"row": start_sale_row_index, "cell": "sal_pu", "money": True,  "val": round(sal_pu, 2)},
+                    {"row": start_sale_row_index, "cell": "sal_tot", "money": True, "val": round(sal_tot, 2)},
+                    {"row": start_sale_row_index, "cell": "sdo_q", "money": False, "val": int(s_q)},
+                    {"row": start_sale_row_index, "cell": "sdo_pu", "money": True, "val": round(s_pu, 2)},
+                    {"row": start_sale_row_index, "cell": "sdo_tot", "money": True, "val": round(s_v, 2)},
+                ]
+            })
+
+        # ======== PEPS / UEPS (TRAMOS, SIN PROMEDIO) ========
+        else:
+            fifo = (method_name == "PEPS (FIFO)")
+            metodo_tag = "PEPS" if fifo else "UEPS"
+
+            # El motor consume capa a capa (PEPS por la izquierda, UEPS por la derecha)
+            acc_row = start_sale_row_index
+
+            for tramo_index, tramo in enumerate(inv.salida(float(venta_u)), start=1):
+                q_take, layer_pu, tot_take, q_rem = tramo[:4]
+
+                # 🔴 CORRECCIÓN: SALDO POR TRAMO EN PEPS/UEPS
+                # Si se agota la capa en este tramo → saldo 0 a ese mismo costo.
+                if q_rem > 0:
+                    # Quedan unidades en la MISMA capa que acabamos de consumir
+                    sdo_q = q_rem
+                    sdo_pu = layer_pu
+                else:
+                    # Capa agotada: en esta fila mostramos saldo 0 a ese costo
+                    sdo_q = 0.0
+                    sdo_pu = layer_pu
+
+                sdo_tot = sdo_q * sdo_pu
+
+                rows.append({
+                    "fecha": "Día 3",
+                    "desc": f"Venta tramo {tramo_index} ({metodo_tag})",
+                    "ent_q": None, "ent_pu": None, "ent_tot": None,
+                    "sal_q": int(q_take), "sal_pu": round(layer_pu, 2), "sal_tot": round(tot_take, 2),
+                    "sdo_q": int(sdo_q), "sdo_pu": round(sdo_pu, 2), "sdo_tot": round(sdo_tot, 2),
+                })
+
+                if fifo:
+                    frase_capa = (
+                        "En PEPS, primero salen las unidades más antiguas. "
+                        "Por eso este tramo consume unidades de la capa que entró primero."
+                    )
+                else:
+                    frase_capa = (
+                        "En UEPS, primero salen las unidades más recientes. "
+                        "Por eso este tramo consume unidades de la capa que entró de último."
+                    )
+
+                script.append({
+                    "title": f"Paso 3 · Venta (tramo {tramo_index}) — {metodo_tag}",
+                    "text": (
+                        f"En este tramo sacamos {int(q_take)} unidades de una capa valorada a "
+                        f"{_fmt_money(layer_pu)} pesos. El costo del tramo es {int(q_take)} por "
+                        f"{_fmt_money(layer_pu)} pesos, es decir {_fmt_money(tot_take)} pesos.\n\n"
+                        f"{frase_capa}\n"
+                        f"En la columna SALDO de esta fila mostramos **la misma capa** después del tramo. "
+                        f"Si se agotó, verás 0 unidades a ese mismo costo; si quedaron unidades, "
+                        f"verás cuántas siguen en esa capa, siempre sin promediar."
+                    ),
+                    "actions": [
+                        {"row": acc_row, "cell": "sal_q", "money": False, "val": int(q_take)},
+                        {"row": acc_row, "cell": "sal_pu", "money": True,  "val": round(layer_pu, 2)},
+                        {"row": acc_row, "cell": "sal_tot", "money": True, "val": round(tot_take, 2)},
+                        {"row": acc_row, "cell": "sdo_q", "money": False, "val": int(sdo_q)},
+                        {"row": acc_row, "cell": "sdo_pu", "money": True, "val": round(sdo_pu, 2)},
+                        {"row": acc_row, "cell": "sdo_tot", "money": True, "val": round(sdo_tot, 2)},
+                    ]
+                })
+
+                acc_row += 1
+
+    else:
+        # No hay venta o no hay saldo
+        rows.append({
+            "fecha": "Día 3", "desc": "Venta",
+            "ent_q": None, "ent_pu": None, "ent_tot": None,
+            "sal_q": None, "sal_pu": None, "sal_tot": None,
+            "sdo_q": int(s_q), "sdo_pu": round(s_pu, 2), "sdo_tot": round(s_v, 2),
+        })
+        script.append({
+            "title": "Paso 3 · Sin venta o sin saldo",
+            "text": (
+                "En este escenario no registramos una venta efectiva (o no hay inventario para vender). "
+                "Por eso las columnas de SALIDA quedan vacías y el SALDO permanece igual que en el Día 2."
+            ),
+            "actions": [
+                {"row": start_sale_row_index, "cell": "sdo_q", "money": False, "val": int(s_q)},
+                {"row": start_sale_row_index, "cell": "sdo_pu", "money": True, "val": round(s_pu, 2)},
+                {"row": start_sale_row_index, "cell": "sdo_tot", "money": True, "val": round(s_v, 2)},
+            ]
+        })
+
+    return rows, script
+
+# =========================
+# Utilidades de estado
+# =========================
+def _ensure_default_state():
+    ss = st.session_state
+    ss.setdefault("n2_ex_metodo", "Promedio Ponderado")
+    ss.setdefault("n2_ex_inv0_u", 80)
+    ss.setdefault("n2_ex_inv0_pu", 10.0)
+    ss.setdefault("n2_ex_comp1_u", 40)
+    ss.setdefault("n2_ex_comp1_pu", 11.0)
+    ss.setdefault("n2_ex_venta_u", 90)
+    ss.setdefault("n2_ex_comp2_u", 50)
+    ss.setdefault("n2_ex_comp2_pu", 13.0)
+
+
+def _randomize_scenario_values():
+    # Genera un escenario razonable
+    inv0_u  = random.choice([60, 80, 100, 120, 150])
+    inv0_pu = random.choice([8.0, 9.0, 10.0, 11.0, 12.0])
+    comp1_u = random.choice([30, 40, 50, 60, 70])
+    comp1_pu= random.choice([inv0_pu - 1, inv0_pu, inv0_pu + 1, inv0_pu + 2])
+    venta_u = random.choice([40, 60, 90, 110, 130])
+    comp2_u = random.choice([30, 40, 50, 60, 80])
+    comp2_pu= random.choice([comp1_pu - 1, comp1_pu, comp1_pu + 1, comp1_pu + 2])
+
+    ss = st.session_state
+    ss["n2_ex_inv0_u"]  = inv0_u
+    ss["n2_ex_inv0_pu"] = float(max(1.0, round(inv0_pu, 2)))
+    ss["n2_ex_comp1_u"] = comp1_u
+    ss["n2_ex_comp1_pu"]= float(max(1.0, round(comp1_pu, 2)))
+    ss["n2_ex_venta_u"] = venta_u
+    ss["n2_ex_comp2_u"] = comp2_u
+    ss["n2_ex_comp2_pu"]= float(max(1.0, round(comp2_pu, 2)))
+
+
+def _request_randomize():
+    st.session_state["n2_ex_rand_request"] = True
+
+# =========================
+# Construcción PARAMÉTRICA de filas esperadas
+# =========================
+def build_expected_rows(method_name, inv0_u_ex, inv0_pu_ex, comp1_u, comp1_pu, venta_ex_u, comp2_u, comp2_pu):
+    """
+    Devuelve una KardexTabla con columnas:
+    Fecha, Descripción,
+    Entrada_cant, Entrada_pu, Entrada_total,
+    Salida_cant,  Salida_pu,  Salida_total,
+    Saldo_cant,   Saldo_pu,   Saldo_total
+
+    Lógica alineada con el EJEMPLO GUIADO:
+    - Día 1: saldo inicial como ENTRADA y como SALDO.
+    - Día 2: SOLO una fila de Compra 1 (sin “Saldo (día 1)”).
+    * Promedio Ponderado: saldo con promedio.
+    * PEPS/UEPS: saldo solo de la capa comprada.
+    - Día 3: ventas por método.
+    * PP: una fila.
+    * PEPS/UEPS: tramos sin promedios; el saldo del tramo muestra la capa del tramo (0 si se agota).
+    - Día 4: Compra 2 (saldo solo de la capa comprada en PEPS/UEPS).
+    """
+    rows = KardexTabla()
+    inv = InventarioCapas(method_name)
+
+    # ------------------------------
+    # Día 1: Saldo inicial
+    # ------------------------------
+    if inv0_u_ex > 0:
+        ent_q1 = int(inv0_u_ex)
+        ent_pu1 = float(inv0_pu_ex)
+        ent_tot1 = ent_q1 * ent_pu1
+        inv.entrada(ent_q1, ent_pu1)
+    else:
+        ent_q1 = ent_pu1 = ent_tot1 = None
+
+    s_q, s_p, s_v = inv.saldo()
+
+    rows.append({
+        "Fecha": "Día 1", "Descripción": "Saldo inicial",
+        "Entrada_cant": ent_q1,
+        "Entrada_pu": round(ent_pu1, 2) if ent_pu1 else None,
+        "Entrada_total": round(ent_tot1, 2) if ent_tot1 else None,
+        "Salida_cant": None, "Salida_pu": None, "Salida_total": None,
+        "Saldo_cant": s_q,
+        "Saldo_pu": round(s_p, 2),
+        "Saldo_total": round(s_v, 2)
+    })
+
+    # ------------------------------
+    # Día 2: Compra 1
+    # ------------------------------
+    ent_tot = comp1_u * comp1_pu
+    inv.entrada(comp1_u, comp1_pu)
+
+    if method_name == "Promedio Ponderado":
+        s_q, s_p, s_v = inv.saldo()
+
+        rows.append({
+            "Fecha": "Día 2", "Descripción": "Compra 1",
+            "Entrada_cant": comp1_u,
+            "Entrada_pu": round(comp1_pu, 2),
+            "Entrada_total": round(ent_tot, 2),
+            "Salida_cant": None, "Salida_pu": None, "Salida_total": None,
+            "Saldo_cant": s_q,
+            "Saldo_pu": round(s_p, 2),
+            "Saldo_total": round(s_v, 2)
+        })
+
+    else:
+        # PEPS/UEPS → una sola fila "Compra 1"
+        rows.append({
+            "Fecha": "Día 2", "Descripción": "Compra 1",
+            "Entrada_cant": comp1_u,
+            "Entrada_pu": round(comp1_pu, 2),
+            "Entrada_total": round(ent_tot, 2),
+            "Salida_cant": None, "Salida_pu": None, "Salida_total": None,
+            "Saldo_cant": comp1_u,
+            "Saldo_pu": round(comp1_pu, 2),
+            "Saldo_total": round(ent_tot, 2)
+        })
+
+    # ------------------------------
+    # Día 3: Venta
+    # ------------------------------
+    if method_name == "Promedio Ponderado":
+        if s_q > 0 and venta_ex_u > 0:
+            sale_q, sale_pu, sale_tot = inv.salida(venta_ex_u)[0][:3]
+            s_q, s_p, s_v = inv.saldo()
+
+            rows.append({
+                "Fecha": "Día 3", "Descripción": "Venta",
+                "Entrada_cant": None, "Entrada_pu": None, "Entrada_total": None,
+                "Salida_cant": sale_q,
+                "Salida_pu": round(sale_pu, 2),
+                "Salida_total": round(sale_tot, 2),
+                "Saldo_cant": s_q,
+                "Saldo_pu": round(s_p, 2),
+                "Saldo_total": round(s_v, 2)
+            })
+        else:
+            rows.append({
+                "Fecha": "Día 3", "Descripción": "Venta",
+                "Entrada_cant": None, "Entrada_pu": None, "Entrada_total": None,
+                "Salida_cant": None, "Salida_pu": None, "Salida_total": None,
+                "Saldo_cant": s_q,
+                "Saldo_pu": round(s_p, 2),
+                "Saldo_total": round(s_v, 2)
+            })
+
+    else:
+        # PEPS / UEPS (venta por tramos, SALDO solo de la capa del tramo)
+        fifo = (method_name == "PEPS (FIFO)")
+        metodo_tag = "PEPS" if fifo else "UEPS"
+
+        for tramo_index, tramo in enumerate(inv.salida(float(venta_ex_u)), start=1):
+            q_take, layer_pu, tot_take, q_rem = tramo[:4]
+
+            # 🔴 NUEVA LÓGICA: SALDO muestra SOLO la capa de ese tramo
+            # Si se agota, queda 0 unidades al mismo costo unitario.
+            if q_rem > 0:
+                sdo_q = q_rem
+                sdo_pu = layer_pu
+            else:
+                sdo_q = 0.0
+                sdo_pu = layer_pu
+
+            sdo_tot = sdo_q * sdo_pu
+
+            rows.append({
+                "Fecha": "Día 3",
+                "Descripción": f"Venta tramo {tramo_index} ({metodo_tag})",
+                "Entrada_cant": None, "Entrada_pu": None, "Entrada_total": None,
+                "Salida_cant": int(q_take),
+                "Salida_pu": round(layer_pu, 2),
+                "Salida_total": round(tot_take, 2),
+                "Saldo_cant": int(sdo_q),
+                "Saldo_pu": round(sdo_pu, 2),
+                "Saldo_total": round(sdo_tot, 2)
+            })
+
+        s_q, s_p, s_v = inv.saldo()
+
+    # ------------------------------
+    # Día 4: Compra 2
+    # ------------------------------
+    ent2_tot = comp2_u * comp2_pu
+    inv.entrada(comp2_u, comp2_pu)
+
+    if method_name == "Promedio Ponderado":
+        s_q, s_p, s_v = inv.saldo()
+
+        rows.append({
+            "Fecha": "Día 4", "Descripción": "Compra 2",
+            "Entrada_cant": comp2_u,
+            "Entrada_pu": round(comp2_pu, 2),
+            "Entrada_total": round(ent2_tot, 2),
+            "Salida_cant": None, "Salida_pu": None, "Salida_total": None,
+            "Saldo_cant": s_q,
+            "Saldo_pu": round(s_p, 2),
+            "Saldo_total": round(s_v, 2)
+        })
+
+    else:
+        # PEPS / UEPS: saldo solo de la nueva capa
+        rows.append({
+            "Fecha": "Día 4", "Descripción": "Compra 2",
+            "Entrada_cant": comp2_u,
+            "Entrada_pu": round(comp2_pu, 2),
+            "Entrada_total": round(ent2_tot, 2),
+            "Salida_cant": None, "Salida_pu": None, "Salida_total": None,
+            "Saldo_cant": comp2_u,
+            "Saldo_pu": round(comp2_pu, 2),
+            "Saldo_total": round(ent2_tot, 2)
+        })
+
+    return rows
+
+# ====== Helpers de performance y parseo ======
+@st.cache_data(show_spinner=False)
+def cached_solve_pp(inv0_u, inv0_pu, comp1_u, comp1_pu, venta_u, comp2_u, comp2_pu):
+    # Mismo cuerpo que tu `solve_pp()` actual
+    q0 = inv0_u
+    v0 = inv0_u * inv0_pu
+    # Día 2
+    v1 = v0 + comp1_u * comp1_pu
+    q1 = inv0_u + comp1_u
+    pu1 = (v1 / q1) if q1 > 0 else 0.0
+    saldo_after_c1 = (q1, pu1, v1)
+    # Día 3
+    sale_q = min(venta_u, q1)
+    cmv = sale_q * pu1
+    q2 = q1 - sale_q
+    v2 = v1 - cmv
+    pu2 = (v2 / q2) if q2 > 0 else 0.0
+    saldo_after_sale = (q2, pu2, v2)
+    # Día 4
+    q3 = q2 + comp2_u
+    v3 = v2 + comp2_u * comp2_pu
+    pu3 = (v3 / q3) if q3 > 0 else 0.0
+    saldo_final = (q3, pu3, v3)
+    return saldo_after_c1, saldo_after_sale, saldo_final
+
+
+@st.cache_data(show_spinner=False)
+def cached_solve_peps_rows(peps_inv0_u, peps_inv0_pu, peps_comp1_u, peps_comp1_pu, peps_venta_u, peps_comp2_u, peps_comp2_pu):
+    inv = InventarioCapas("PEPS (FIFO)", [[peps_inv0_u, peps_inv0_pu]])
+    s_q, s_pu, s_v = inv.saldo()
+    rows = [{
+        "fecha":"Día 1","desc":"Saldo inicial",
+        "ent_q":None,"ent_pu":None,"ent_tot":None,
+        "sal_q":None,"sal_pu":None,"sal_tot":None,
+        "sdo_q":int(s_q),"sdo_pu":round(s_pu,2),"sdo_tot":round(s_v,2)
+    }]
+    # Día 2 — saldo día 1 + compra a su costo
+    rows.append({
+        "fecha":"Día 2","desc":"Saldo (día 1)",
+        "ent_q":None,"ent_pu":None,"ent_tot":None,
+        "sal_q":None,"sal_pu":None,"sal_tot":None,
+        "sdo_q":int(s_q),"sdo_pu":round(s_pu,2),"sdo_tot":round(s_v,2)
+    })
+    ent_tot = peps_comp1_u * peps_comp1_pu
+    inv.entrada(peps_comp1_u, peps_comp1_pu)
+    rows.append({
+        "fecha":"Día 2","desc":"Compra 1",
+        "ent_q":int(peps_comp1_u),"ent_pu":round(peps_comp1_pu,2),"ent_tot":round(ent_tot,2),
+        "sal_q":None,"sal_pu":None,"sal_tot":None,
+        "sdo_q":int(peps_comp1_u),"sdo_pu":round(peps_comp1_pu,2),"sdo_tot":round(ent_tot,2)
+    })
+    # Día 3 — venta en tramos (el tramo ya trae el saldo global resultante)
+    for i, tramo in enumerate(inv.salida(peps_venta_u), start=1):
+        q_take, pu_take, tot_take, _, rq, rv = tramo
+        rpu = (rv / rq) if rq > 0 else 0.0
+        rows.append({
+            "fecha":"Día 3","desc": f"Venta tramo {i} (PEPS)",
+            "ent_q":None,"ent_pu":None,"ent_tot":None,
+            "sal_q":int(q_take),"sal_pu":round(pu_take,2),"sal_tot":round(tot_take,2),
+            "sdo_q":int(rq),"sdo_pu":round(rpu,2),"sdo_tot":round(rv,2)
+        })
+    # Día 4 — compra 2
+    ent2_tot = peps_comp2_u * peps_comp2_pu
+    inv.entrada(peps_comp2_u, peps_comp2_pu)
+    rows.append({
+        "fecha":"Día 4","desc":"Compra 2",
+        "ent_q":int(peps_comp2_u),"ent_pu":round(peps_comp2_pu,2),"ent_tot":round(ent2_tot,2),
+        "sal_q":None,"sal_pu":None,"sal_tot":None,
+        "sdo_q":int(peps_comp2_u),"sdo_pu":round(peps_comp2_pu,2),"sdo_tot":round(ent2_tot,2)
+    })
+    qF, puF, vF = inv.saldo()
+    return rows, (qF, puF, vF)
+
+
+def grade_open_with_ai_batched(ans2: str, ans3: str):
+    """
+    1 request para las dos preguntas abiertas.
+    Devuelve (score2, fb2, score3, fb3)
+    """
+    prompt = f"""
+Eres un evaluador. Devuelve SOLO un JSON con este formato EXACTO:
+{{
+"q2": {{"score": 0|1, "feedback": "texto breve"}},
+"q3": {{"score": 0|1, "feedback": "texto breve"}}
+}}
+
+Criterios:
+- q2 (importancia de elegir método): puntúa 1 si menciona al menos dos de:
+CMV/utilidad, estados financieros/comparabilidad, impuestos/decisiones.
+- q3 (cuando conviene Promedio Ponderado): puntúa 1 si propone un caso plausible
+(compras frecuentes/costos variables/menor volatilidad/simplificación operativa) y lo justifica.
+
+"Evalúa de forma muy flexible. Si la respuesta tiene una idea contable coherente, considérala correcta. "
+"No exijas redacción exacta ni tecnicismos. Prioriza comprensión general y da feedback amable."
+
+Respuestas del estudiante:
+[Q2]
+{ans2}
+
+[Q3]
+{ans3}
+"""
+    # Limitador compartido: sin cupo o sin IA → "" y se usa la heurística local
+    raw = ia_feedback_or_default(prompt, default="")
+    data = decode_json_or_empty(raw) if raw else {}
+    try:
+        if not data:
+            raise ValueError("sin respuesta de IA")
+        s2 = int(data.get("q2", {}).get("score", 0))
+        f2 = str(data.get("q2", {}).get("feedback", "")).strip()
+        s3 = int(data.get("q3", {}).get("score", 0))
+        f3 = str(data.get("q3", {}).get("feedback", "")).strip()
+        return s2, f2, s3, f3
+    except Exception:
+        def quick(a, kws, minhits):
+            hit = sum(1 for k in kws if k.lower() in (a or "").lower())
+            return (1 if hit >= minhits else 0, "Respuesta breve; refuerza con ejemplos y efectos en CMV/estados.")
+        s2, f2 = quick(ans2, ["CMV","utilidad","estados","financieros","impuestos","decisiones","comparabilidad"], 2)
+        s3, f3 = quick(ans3, ["promedio","compras frecuentes","costos variables","volatilidad","simplificar"], 2)
+        return s2, f2, s3, f3
+
+
+def _heuristic_fail(answer: str, min_words=3, banned=None):
+    if banned is None:
+        banned = []
+
+    a = (answer or "").strip().lower()
+
+    # Solo falla si está prácticamente vacía
+    if len(a.split()) < min_words:
+        return True, "La respuesta es demasiado corta. Escribe al menos una idea completa."
+
+    # Solo falla si está totalmente fuera de tema por palabras muy problemáticas
+    for bad in banned:
+        if bad in a and len(a.split()) <= 6:
+            return True, f"La respuesta parece fuera de tema por la mención de “{bad}” sin desarrollo."
+
+    return False, ""
+
+
+def n2_eval_open_ai_q2(answer: str, ask=ia_feedback):
+    a = (answer or "").strip()
+    al = a.lower()
+
+    bad, why = _heuristic_fail(
+        a,
+        min_words=3,
+        banned=["gastos financieros", "pasivos", "endeudamiento", "apalancamiento"]
+    )
+    if bad:
+        return False, "❌ Respuesta muy corta.", why
+
+    # Primer filtro local (rúbrica): si decide con confianza, no se llama a la IA
+    local = decision_local("n2_q2_importancia_metodo", a)
+    if local is not None:
+        ok, fb_formativo = local
+        return ok, ("✅ Cumple criterios" if ok else "❌ No cumple criterios"), fb_formativo
+
+    # Heurística MUY LAXA: con una sola idea pertinente, aprueba
+    keywords = [
+        "cmv", "costo", "utilidad", "ganancia",
+        "estado", "financiero", "comparabilidad",
+        "impuesto", "decisión", "precio", "compra", "margen"
+    ]
+    hits = sum(1 for k in keywords if k in al)
+    heuristic_ok = (hits >= 1)
+
+    prompt = (
+        "Evalúa esta respuesta de forma MUY FLEXIBLE.\n"
+        "Aprueba si la respuesta tiene al menos una idea coherente relacionada con "
+        "método de valoración, CMV, utilidad, estados financieros, comparabilidad, "
+        "impuestos o decisiones.\n"
+        "Primera línea EXACTA: 'SCORE: 1' o 'SCORE: 0'.\n"
+        "Después escribe 2–3 líneas de feedback amable, pedagógico y breve.\n\n"
+        f"RESPUESTA DEL ESTUDIANTE:\n{a}"
+    )
+
+    fb = ask(prompt) or ""
+    first = fb.strip().splitlines()[0] if fb.strip() else ""
+    m = rx("score_line").fullmatch(first.strip())
+
+    ai_failed = (not fb.strip())
+    ai_ok = bool(m and m.group(1) == "1")
+
+    # Regla final: si la heurística dice sí, aprueba.
+    # Si la IA falla, también aprueba en examen; aquí además la dejamos laxa en general.
+    ok = heuristic_ok or ai_ok or ai_failed
+
+    fb_short = "✅ Cumple criterios" if ok else "❌ No cumple criterios"
+    fb_formativo = "\n".join(fb.strip().splitlines()[1:]).strip() if fb.strip() else ""
+
+    if not fb_formativo:
+        fb_formativo = (
+            "Tu respuesta va en la dirección correcta. "
+            "Recuerda relacionar el método con el CMV, la utilidad o el efecto en los estados financieros."
+        )
+
+    return ok, fb_short, fb_formativo
+
+
+def n2_eval_open_ai_q3(answer: str, ask=ia_feedback):
+    a = (answer or "").strip()
+    al = a.lower()
+
+    bad, why = _heuristic_fail(a, min_words=3, banned=[])
+    if bad:
+        return False, "❌ Respuesta muy corta.", why
+
+    local = decision_local("n2_q3_cuando_pp", a)
+    if local is not None:
+        ok, fb_formativo = local
+        return ok, ("✅ Cumple criterios" if ok else "❌ No cumple criterios"), fb_formativo
+
+    keywords = [
+        "promedio", "ponderado", "compras frecuentes", "costos variables",
+        "volatilidad", "simplifica", "estable", "suaviza", "cmv"
+    ]
+    hits = sum(1 for k in keywords if k in al)
+    heuristic_ok = (hits >= 1)
+
+    prompt = (
+        "Evalúa esta respuesta de forma MUY FLEXIBLE.\n"
+        "Aprueba si menciona al menos una idea coherente sobre cuándo conviene usar "
+        "Promedio Ponderado.\n"
+        "Primera línea EXACTA: 'SCORE: 1' o 'SCORE: 0'.\n"
+        "Después escribe 2–3 líneas de feedback amable.\n\n"
+        f"RESPUESTA DEL ESTUDIANTE:\n{a}"
+    )
+
+    fb = ask(prompt) or ""
+    first = fb.strip().splitlines()[0] if fb.strip() else ""
+    m = rx("score_line").fullmatch(first.strip())
+
+    ai_failed = (not fb.strip())
+    ai_ok = bool(m and m.group(1) == "1")
+
+    ok = heuristic_ok or ai_ok or ai_failed
+
+    fb_short = "✅ Cumple criterios" if ok else "❌ No cumple criterios"
+    fb_formativo = "\n".join(fb.strip().splitlines()[1:]).strip() if fb.strip() else ""
+
+    if not fb_formativo:
+        fb_formativo = (
+            "La idea es aceptable. Puedes reforzarla mencionando compras frecuentes, "
+            "costos variables o que el promedio ayuda a suavizar el costo."
+        )
+
+    return ok, fb_short, fb_formativo
+
+# ---------- Solución PEPS (filas esperadas, SIN “Saldo (día 1)”) ----------
+def build_peps_exam_rows(peps_inv0_u, peps_inv0_pu, peps_comp1_u, peps_comp1_pu,
+                         peps_venta_u, peps_comp2_u, peps_comp2_pu):
+    """
+    Construye las filas esperadas del Kardex PEPS para el examen, con esta lógica:
+    - Día 1: saldo inicial como ENTRADA + SALDO.
+    - Día 2: solo la fila de Compra 1 (sin 'Saldo (día 1)').
+    - Día 3: una fila por tramo de venta, mostrando el saldo como la capa activa
+            (no se promedia el costo). Si una capa se agota en el tramo,
+            el SALDO de esa fila muestra 0 unidades al costo de esa capa.
+    - Día 4: Compra 2, el saldo muestra solo la nueva capa comprada.
+    """
+    rows = []
+    inv = InventarioCapas("PEPS (FIFO)")
+
+    # ----------------- Día 1: Saldo inicial como entrada + saldo -----------------
+    if peps_inv0_u > 0:
+        ent_q = peps_inv0_u
+        ent_pu = peps_inv0_pu
+        ent_tot = ent_q * ent_pu
+        sdo_q = peps_inv0_u
+        sdo_pu = peps_inv0_pu
+        sdo_tot = ent_tot
+        inv.entrada(peps_inv0_u, peps_inv0_pu)
+    else:
+        ent_q = ent_pu = ent_tot = ""
+        sdo_q = sdo_pu = sdo_tot = 0.0
+
+    rows.append({
+        "fecha": "Día 1", "desc": "Saldo inicial",
+        "ent_q": ent_q if ent_q != "" else "",
+        "ent_pu": ent_pu if ent_q != "" else "",
+        "ent_tot": ent_tot if ent_q != "" else "",
+        "sal_q": "", "sal_pu": "", "sal_tot": "",
+        "sdo_q": sdo_q, "sdo_pu": sdo_pu, "sdo_tot": sdo_tot,
+    })
+
+    # ----------------- Día 2: Compra 1 (nueva capa) -----------------
+    if peps_comp1_u > 0:
+        ent_q2 = peps_comp1_u
+        ent_pu2 = peps_comp1_pu
+        ent_tot2 = ent_q2 * ent_pu2
+        rows.append({
+            "fecha": "Día 2", "desc": "Compra 1",
+            "ent_q": ent_q2, "ent_pu": ent_pu2, "ent_tot": ent_tot2,
+            "sal_q": "", "sal_pu": "", "sal_tot": "",
+            # En SALDO se muestra solo la capa comprada
+            "sdo_q": ent_q2, "sdo_pu": ent_pu2, "sdo_tot": ent_tot2,
+        })
+        inv.entrada(peps_comp1_u, peps_comp1_pu)
+    else:
+        rows.append({
+            "fecha": "Día 2", "desc": "Compra 1",
+            "ent_q": "", "ent_pu": "", "ent_tot": "",
+            "sal_q": "", "sal_pu": "", "sal_tot": "",
+            "sdo_q": 0, "sdo_pu": 0.0, "sdo_tot": 0.0,
+        })
+
+    # ----------------- Día 3: Venta en tramos (PEPS, sin promediar) -----------------
+    if peps_venta_u > 0 and inv.cantidad > 0:
+        # En PEPS el motor toma siempre la capa más antigua con unidades disponibles
+        for tramo_index, tramo in enumerate(inv.salida(float(peps_venta_u)), start=1):
+            q_take, layer_pu, tot_take, q_rem = tramo[:4]
+
+            # 💡 NUEVA LÓGICA: SALDO de la fila muestra SIEMPRE la capa del tramo
+            if q_rem > 0:
+                # Quedan unidades en la misma capa que se está consumiendo
+                sdo_q = q_rem
+                sdo_pu = layer_pu
+            else:
+                # La capa se agotó en este tramo: saldo 0 unidades al mismo costo
+                sdo_q = 0.0
+                sdo_pu = layer_pu
+            sdo_tot = sdo_q * sdo_pu
+
+            rows.append({
+                "fecha": "Día 3",
+                "desc": f"Venta tramo {tramo_index} (PEPS)",
+                "ent_q": "", "ent_pu": "", "ent_tot": "",
+                "sal_q": q_take, "sal_pu": layer_pu, "sal_tot": tot_take,
+                "sdo_q": sdo_q, "sdo_pu": sdo_pu, "sdo_tot": sdo_tot,
+            })
+    else:
+        # Escenario sin venta efectiva
+        q_tot, pu_tot, v_tot = inv.saldo()
+        rows.append({
+            "fecha": "Día 3",
+            "desc": "Venta",
+            "ent_q": "", "ent_pu": "", "ent_tot": "",
+            "sal_q": "", "sal_pu": "", "sal_tot": "",
+            "sdo_q": q_tot, "sdo_pu": pu_tot, "sdo_tot": v_tot,
+        })
+
+    # ----------------- Día 4: Compra 2 (nueva capa) -----------------
+    if peps_comp2_u > 0:
+        ent_q4 = peps_comp2_u
+        ent_pu4 = peps_comp2_pu
+        ent_tot4 = ent_q4 * ent_pu4
+        rows.append({
+            "fecha": "Día 4", "desc": "Compra 2",
+            "ent_q": ent_q4, "ent_pu": ent_pu4, "ent_tot": ent_tot4,
+            "sal_q": "", "sal_pu": "", "sal_tot": "",
+            # Igual que en el ejemplo guiado: el saldo de esta fila muestra solo la nueva capa
+            "sdo_q": ent_q4, "sdo_pu": ent_pu4, "sdo_tot": ent_tot4,
+        })
+        inv.entrada(peps_comp2_u, peps_comp2_pu)
+    else:
+        rows.append({
+            "fecha": "Día 4", "desc": "Compra 2",
+            "ent_q": "", "ent_pu": "", "ent_tot": "",
+            "sal_q": "", "sal_pu": "", "sal_tot": "",
+            "sdo_q": 0, "sdo_pu": 0.0, "sdo_tot": 0.0,
+        })
+
+    return rows
+
+# ====== Lectura tolerante de celdas del examen ======
+def _get_num_safe(row, key):
+    v = row.get(key, "")
+    try:
+        if v is None:
+            return None
+        v = str(v).strip()
+        if v == "":
+            return None
+        v = v.replace("$", "").replace(" ", "").replace(",", ".")
+        return float(v)
+    except:
+        return None
+
+
+def _near(a, b, tol=0.5):
+    return (a is not None) and (abs(a-b) <= tol)
+
+# ===========================
+# NIVEL 2 (Métodos PP/PEPS/UEPS)
+# ===========================
+def page_level2(username):
+    st.title("Nivel 2 · Métodos de valoración: Promedio Ponderado, PEPS (FIFO) y UEPS")
+
+    progress_col = st.session_state.get("progress_col")
+    set_current_level(progress_col, username, "level2")
+
+    tabs = st.tabs(["🎧 Teoría", "🛠 Ejemplos guiados", "🎮 Práctica (IA)", "🏁 Evaluación para aprobar", "📂 Libro de movimientos"])
+
+    with tabs[0]:
+        st.subheader("Teoría · Métodos de valoración de inventarios (PEPS, UEPS y Promedio)")
+
+        intro = """
+    En contabilidad, los inventarios representan bienes disponibles para la venta y, al mismo tiempo, **costos acumulados** que impactan la utilidad del período. Valorar correctamente el inventario permite determinar con precisión el **Costo de la Mercancía Vendida (CMV)** y analizar la rentabilidad del negocio.
+    """
+        st.markdown(intro)
+
+        st.markdown("### ⚖️ ¿Por qué existen distintos métodos?")
+        st.markdown(
+            "Los precios de compra cambian con el tiempo (inflación, descuentos, logística). "
+            "Por eso, cada método responde a la pregunta: **¿qué costo asigno a lo vendido y qué costo queda en el inventario final?**  \n"
+            "En Colombia, el **Estándar para Pymes (Sección 13)** permite tres enfoques:"
+        )
+
+        st.markdown("---")
+        st.markdown("### 1) PEPS (Primero en Entrar, Primero en Salir)")
+        st.markdown(
+            "- **Idea básica:** salen primero las unidades que entraron primero; el inventario final queda con costos **más recientes**.  \n"
+            "- **Efecto típico con precios al alza:** **CMV menor** y **mayor utilidad bruta** (porque se usan costos antiguos en las salidas).  \n"
+            "- **Analogía:** una estantería donde se entregan primero los productos más viejos; los nuevos quedan en la repisa y valoran el inventario final."
+        )
+
+        st.markdown("---")
+        st.markdown("### 2) UEPS (Último en Entrar, Primero en Salir)")
+        st.markdown(
+            "- **Idea básica:** salen primero las unidades que entraron de último; el inventario final queda con costos **más antiguos**.  \n"
+            "- **Efecto típico con precios al alza:** **CMV mayor** y **menor utilidad bruta** (porque se usan costos recientes en las salidas).  \n"
+            "- **Importante en Colombia:** el UEPS **no está permitido fiscalmente**; se usa para análisis internos o ejercicios académicos.  \n"
+            "- **Analogía:** una pila de sacos donde tomas el de arriba (el más nuevo) y los de abajo (antiguos) permanecen en el inventario."
+        )
+
+        st.markdown("---")
+        st.markdown("### 3) Promedio Ponderado")
+        st.markdown(
+            "- **Idea básica:** mezcla los costos de los lotes disponibles y calcula un **costo promedio por unidad**, que se usa para las salidas y el inventario final."
+        )
+        st.markdown("**Fórmula:**")
+        st.latex(r"\text{Costo promedio ponderado}=\frac{\text{Costo total disponible}}{\text{Unidades totales disponibles}}")
+        st.markdown(
+            "- **Efecto contable:** **suaviza** la volatilidad de precios y es muy utilizado por su equilibrio entre **simplicidad** y **razonabilidad**.  \n"
+            "- **Analogía:** una “olla de costos”: al vender, cada unidad se sirve con “una cucharada” de ese promedio."
+        )
+
+        st.markdown("---")
+        st.markdown("### 💡 Para decidir")
+        st.markdown(
+            "Cada método ofrece una mirada distinta del costo y la utilidad. La decisión debe ser **coherente con la operación del negocio** y **consistente en el tiempo**. "
+            "Recuerda: el método elegido afecta el **CMV, la utilidad** y la **carga tributaria**; por eso, comprender su efecto es clave para la toma de decisiones."
+        )
+
+        with st.expander("🔊 Escuchar explicación"):
+            full_text = "\n\n".join([intro,
+                "¿Por qué existen distintos métodos? Los precios de compra cambian con el tiempo...",
+                "PEPS: idea básica, efecto con precios al alza y analogía de estantería.",
+                "UEPS: idea básica, efecto con precios al alza, nota fiscal en Colombia y analogía de pila de sacos.",
+                "Promedio Ponderado: idea básica, fórmula y analogía de olla de costos.",
+                "Para decidir: coherencia del método, consistencia y efectos sobre CMV y utilidad."
+            ])
+            speak_block(full_text, key_prefix="teo-n2", lang_hint="es")
+
+    # =========================================
+    # TAB 1 · EJEMPLO GUIADO (KARDEX DINÁMICO)
+    # =========================================
+    with tabs[1]:
+        st.subheader("KARDEX dinámico por método (PP · PEPS · UEPS)")
+
+        # ===== Controles del ejemplo (INSUMOS) — Layout narrativo por días =====
+        st.markdown("#### Parámetros del escenario")
+
+        # — Método en una sola fila —
+        with st.container():
+            st.markdown("**Método de valoración**")
+            metodo = st.selectbox(
+                "Método",
+                ["Promedio Ponderado", "PEPS (FIFO)", "UEPS (LIFO)"],
+                key="n2_kardex_met",
+                label_visibility="collapsed"
+            )
+
+        # — Día 1: Saldo inicial —
+        st.markdown("📦 **Día 1.** La empresa reporta un **saldo inicial del inventario** de:")
+        c1a, c1b = st.columns([1,1], gap="small")
+        with c1a:
+            inv0_u = st.number_input(
+                "Cantidades iniciales",
+                min_value=0, value=100, step=10,
+                key="n2_kx_inv_u"
+            )
+        with c1b:
+            inv0_pu = st.number_input(
+                "Costo unitario",
+                min_value=0.0, value=10.0, step=0.5,
+                key="n2_kx_inv_pu"
+            )
+
+        # — Día 2: Compra —
+        st.markdown("🛒 **Día 2.** La empresa realizó una **compra** de:")
+        c2a, c2b = st.columns([1,1], gap="small")
+        with c2a:
+            comp_u = st.number_input(
+                "Compra (unidades)",
+                min_value=0, value=60, step=10,
+                key="n2_kx_comp_u"
+            )
+        with c2b:
+            comp_pu = st.number_input(
+                "Costo de la compra",
+                min_value=0.0, value=12.0, step=0.5,
+                key="n2_kx_comp_pu"
+            )
+
+        # — Día 3: Venta —
+        st.markdown("💰 **Día 3.** La empresa realizó una **venta** de:")
+        c3a, _ = st.columns([1,1], gap="small")
+        with c3a:
+            venta_u = st.number_input(
+                "Venta (unidades)",
+                min_value=0, value=120, step=10,
+                key="n2_kx_venta_u"
+            )
+
+        # =========================
+        # 🎬 DEMOSTRACIÓN NARRADA (PEPS/UEPS con filas por capas)
+        # =========================
+        st.markdown("---")
+        st.markdown("### 🎬 Demostración narrada: llenado del KARDEX por método y capas")
+
+        c_demo_a, c_demo_b = st.columns([1,1])
+        with c_demo_a:
+            narr_speed = st.slider("Velocidad de narración", 0.75, 1.50, 1.00, 0.05)
+        with c_demo_b:
+            narr_muted = st.toggle("Silenciar voz", value=False)
+
+        demo_rows, demo_script = compute_rows_and_script(metodo, inv0_u, inv0_pu, comp_u, comp_pu, venta_u)
+
+        html_demo_template = r"""
+        <style>
+        .kx {border-collapse:collapse;width:100%;font-size:14px;margin-bottom:6px}
+        .kx th,.kx td {border:1px solid #eaeaea;padding:6px 8px;text-align:center}
+        .kx thead th {background:#f8fafc;font-weight:600}
+        .kx .hi {background:#fff7e6;box-shadow:inset 0 0 0 9999px rgba(255,165,0,0.08)}
+        .fill {transition: background 0.3s, color 0.3s}
+        .controls {display:flex;gap:8px;align-items:center;margin:6px 0}
+        .badge {display:inline-block;background:#eef;border:1px solid #dde;padding:2px 8px;border-radius:12px;font-size:12px}
+        .btn {padding:6px 10px; border:1px solid #ddd; background:#fafafa; cursor:pointer; border-radius:6px;}
+        .btn:hover {background:#f0f0f0}
+        .muted {color:#999}
+        #narr {margin-top:6px;font-size:15px}
+        </style>
+
+        <div class="controls">
+        <button id="playDemo" class="btn">▶️ Reproducir demo</button>
+        <button id="pauseDemo" class="btn">⏸️ Pausa</button>
+        <button id="resetDemo" class="btn">↺ Reiniciar</button>
+        <span class="badge">%%METODO%%</span>
+        </div>
+
+        <table class="kx" id="kxtable">
+        <thead>
+            <tr>
+            <th></th><th></th>
+            <th colspan="3">Entrada</th>
+            <th colspan="3">Salida</th>
+            <th colspan="3">Saldo</th>
+            </tr>
+            <tr>
+            <th>Fecha</th><th>Descripción</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            </tr>
+        </thead>
+        <tbody id="kbody"></tbody>
+        </table>
+        <div id="narr"></div>
+
+        <script>
+        (function(){
+        const rows = %%ROWS%%;
+        const script = %%SCRIPT%%;
+        const metodo = "%%METODO%%";
+        const narrMuted = %%MUTED%%;
+        const rate = %%RATE%%;
+
+        const tbody = document.getElementById("kbody");
+        const narrDiv = document.getElementById("narr");
+        const btnPlay = document.getElementById("playDemo");
+        const btnPause = document.getElementById("pauseDemo");
+        const btnReset = document.getElementById("resetDemo");
+
+        const pesos = (v)=> {
+            try {
+                return new Intl.NumberFormat('es-CO', {
+                    style: 'currency',
+                    currency: 'COP',
+                    maximumFractionDigits: 2
+                }).format(v);
+            } catch(e){
+                return "$" + (Math.round(v*100)/100).toLocaleString('es-CO');
+            }
+        };
+
+        const fmt = (x)=> (
+            x===null || x===undefined || x===""
+                ? ""
+                : (typeof x==="number"
+                    ? (Number.isInteger(x)
+                        ? x.toString()
+                        : (Math.round(x*100)/100).toString().replace(".",",")
+                    )
+                    : x
+                )
+        );
+
+        // 🔹 NUEVO: limpiar el texto para la voz
+        function cleanForSpeak(text) {
+            if (!text) return "";
+
+            let t = text;
+
+            // 1) Casos tipo: US$100, US$ 100, $100, $ 100, COP 100 → "100 pesos"
+            t = t.replace(/\bUS?\$\s*(\d+(?:[\\.,]\d+)*)\s*(pesos)?/gi, "$1 pesos");
+            t = t.replace(/\$\s*(\d+(?:[\\.,]\d+)*)\s*(pesos)?/g, "$1 pesos");
+            t = t.replace(/\bCOP\s*(\d+(?:[\\.,]\d+)*)\s*(pesos)?/gi, "$1 pesos");
+            // 100 $, 100 US$, 100 COP → "100 pesos"
+            t = t.replace(/(\d+(?:[\\.,]\d+)*)\s*(US?\$|COP|\$)\b/gi, "$1 pesos");
+
+            // 2) Si quedó "pesos 100" → "100 pesos"
+            t = t.replace(/pesos\s+(\d+(?:[\\.,]\d+)*)/gi, "$1 pesos");
+
+            // 3) Si quedó "100 pesos pesos" → "100 pesos"
+            t = t.replace(/(\d+(?:[\\.,]\d+)*)\s+pesos\s+pesos/gi, "$1 pesos");
+
+            // 4) Si quedó "pesos 100 pesos" → "100 pesos"
+            t = t.replace(/pesos\s+(\d+(?:[\\.,]\d+)*)\s+pesos/gi, "$1 pesos");
+
+            // 5) Limpiar espacios dobles
+            t = t.replace(/\s{2,}/g, " ");
+
+            return t;
+        }
+
+        let isRunning = false;
+        let isPaused = false;
+        let shouldStop = false;
+
+        function speak(text){
+            return new Promise((resolve)=>{
+                if (narrMuted) return resolve();
+                try{
+                    // NO cancelamos aquí para permitir pausa/reanudar
+                    const u = new SpeechSynthesisUtterance(cleanForSpeak(text));
+                    const voices = window.speechSynthesis.getVoices();
+                    const pick = voices.find(v=>/es|spanish|mex|col/i.test((v.name+" "+v.lang))) || voices[0];
+                    if (pick) u.voice = pick;
+                    u.rate = rate;
+                    u.pitch = 1.0;
+                    u.onend = ()=> resolve();
+                    window.speechSynthesis.speak(u);
+                } catch(e){
+                    resolve();
+                }
+            });
+        }
+
+        const sleep = (ms)=> new Promise(r=>setTimeout(r, ms));
+
+        async function waitWhilePaused(){
+            while(isPaused){
+                await sleep(150);
+            }
+        }
+
+        function buildTable(){
+            tbody.innerHTML = "";
+            rows.forEach((r, i)=>{
+                const tr = document.createElement("tr");
+                tr.id = "row"+i;
+                tr.innerHTML = `
+                    <td>${r.fecha}</td><td>${r.desc}</td>
+                    <td id="r${i}_ent_q"  class="fill muted"></td>
+                    <td id="r${i}_ent_pu" class="fill muted"></td>
+                    <td id="r${i}_ent_tot"class="fill muted"></td>
+                    <td id="r${i}_sal_q"  class="fill muted"></td>
+                    <td id="r${i}_sal_pu" class="fill muted"></td>
+                    <td id="r${i}_sal_tot"class="fill muted"></td>
+                    <td id="r${i}_sdo_q"  class="fill muted"></td>
+                    <td id="r${i}_sdo_pu" class="fill muted"></td>
+                    <td id="r${i}_sdo_tot"class="fill muted"></td>
+                `;
+                tbody.appendChild(tr);
+            });
+        }
+        function clearTable(){
+            [...tbody.querySelectorAll("td")].forEach(td=>{
+                if (td.id) { td.textContent = ""; td.classList.add("muted"); }
+            });
+            [...tbody.querySelectorAll("tr")].forEach(tr=> tr.classList.remove("hi"));
+            narrDiv.textContent = "";
+        }
+        function highlightRow(i){
+            [...tbody.querySelectorAll("tr")].forEach((tr, idx)=>{
+                tr.classList.toggle("hi", idx === i);
+            });
+        }
+        function fillCell(rowIdx, key, val, money=false){
+            const el = document.getElementById(`r${rowIdx}_${key}`);
+            if (!el) return;
+            el.classList.remove("muted");
+            el.style.background = "#fffbe6";
+            el.style.color = "#333";
+            el.textContent = money ? pesos(val) : fmt(val);
+            setTimeout(()=>{ el.style.background=""; }, 300);
+        }
+
+        async function runScript(){
+            // Si ya está corriendo y está en pausa, al hacer clic en Reproducir reanudamos
+            if (isRunning && isPaused){
+                isPaused = false;
+                if (window.speechSynthesis && window.speechSynthesis.resume){
+                    window.speechSynthesis.resume();
+                }
+                btnPause.textContent = "⏸️ Pausa";
+                return;
+            }
+            // Si ya está corriendo y no está en pausa, ignoramos
+            if (isRunning) return;
+
+            isRunning = true;
+            shouldStop = false;
+            isPaused = false;
+            btnPause.textContent = "⏸️ Pausa";
+
+            clearTable();
+            buildTable();
+
+            // Pintar título de cada paso, resaltar fila y llenar celdas en orden
+            for (let sIdx = 0; sIdx < script.length; sIdx++){
+                if (shouldStop) break;
+                const step = script[sIdx];
+
+                await waitWhilePaused();
+                if (shouldStop) break;
+
+                narrDiv.textContent = step.title;
+                // resaltar filas involucradas: la primera acción indica la fila
+                if (step.actions && step.actions.length>0){
+                    highlightRow(step.actions[0].row);
+                }
+
+                // duración base proporcional al texto
+                const dur = Math.max(2200, Math.min(7000, step.text.length * 55 / rate));
+                const chunks = Math.max(3, step.actions.length);
+                const waits = Array.from({length:chunks-1}, (_,k)=> Math.floor(dur*(k+1)/chunks));
+
+                const pVoice = speak(step.text);
+
+                for (let i=0;i<step.actions.length;i++){
+                    if (shouldStop) break;
+                    await waitWhilePaused();
+                    if (shouldStop) break;
+
+                    const a = step.actions[i];
+                    if (i>0){
+                        await sleep(waits[i-1]);
+                        await waitWhilePaused();
+                        if (shouldStop) break;
+                    }
+                    fillCell(a.row, a.cell, a.val, !!a.money);
+                }
+
+                await pVoice;
+                if (shouldStop) break;
+                await waitWhilePaused();
+                if (shouldStop) break;
+                await sleep(200);
+            }
+            highlightRow(-1);
+            isRunning = false;
+        }
+
+        // --- Botones ---
+        // Reproducir / continuar
+        btnPlay.onclick  = runScript;
+
+        // Pausar / reanudar
+        btnPause.onclick = ()=>{
+            if (!isRunning) return;
+            if (!isPaused){
+                isPaused = true;
+                btnPause.textContent = "▶️ Reanudar";
+                if (window.speechSynthesis && window.speechSynthesis.pause){
+                    window.speechSynthesis.pause();
+                }
+            } else {
+                isPaused = false;
+                btnPause.textContent = "⏸️ Pausa";
+                if (window.speechSynthesis && window.speechSynthesis.resume){
+                    window.speechSynthesis.resume();
+                }
+            }
+        };
+
+        // Reiniciar todo
+        btnReset.onclick = ()=>{
+            shouldStop = true;
+            isPaused = false;
+            isRunning = false;
+            btnPause.textContent = "⏸️ Pausa";
+            if (window.speechSynthesis && window.speechSynthesis.cancel){
+                window.speechSynthesis.cancel();
+            }
+            clearTable();
+            buildTable();
+            highlightRow(-1);
+            narrDiv.textContent = "";
+        };
+
+        buildTable();
+        if (window.speechSynthesis) {
+            window.speechSynthesis.onvoiceschanged = ()=>{};
+        }
+        })();
+        </script>
+        """
+
+        html_demo = (
+            html_demo_template
+            .replace("%%ROWS%%", _json.dumps(demo_rows))
+            .replace("%%SCRIPT%%", _json.dumps(demo_script))
+            .replace("%%METODO%%", metodo)
+            .replace("%%MUTED%%", "true" if narr_muted else "false")
+            .replace("%%RATE%%", str(narr_speed))
+        )
+
+        components.html(html_demo, height=250, scrolling=True)
+
+    with tabs[2]:
+        st.subheader("Práctica IA: diligencia tu propio KARDEX")
+        st.caption("Selecciona un método y, si quieres, genera un escenario aleatorio. También puedes editar los valores manualmente.")
+
+        _ensure_default_state()
+
+        # Atender aleatorización ANTES de instanciar widgets
+        if st.session_state.get("n2_ex_rand_request", False):
+            _randomize_scenario_values()
+            st.session_state.pop("n2_ex_rand_request", None)
+            st.rerun()
+
+        # =========================
+        # Método independiente del ejercicio
+        # =========================
+        c0a, c0b = st.columns([1, 3])
+        with c0a:
+            ex_metodo = st.selectbox(
+                "Método (ejercicio)",
+                ["Promedio Ponderado", "PEPS (FIFO)", "UEPS (LIFO)"],
+                key="n2_ex_metodo"
+            )
+
+        # =========================
+        # Escenario editable (Día 1-4)
+        # =========================
+        st.markdown("#### 🎯 Escenario del ejercicio")
+
+        # Día 1
+        st.markdown("**Día 1.** La empresa reporta un saldo inicial de inventario de:")
+        c1a, c1b = st.columns([1, 1])
+        with c1a:
+            inv0_u_ex  = st.number_input("Cantidad (u) — Día 1", min_value=0, step=1, key="n2_ex_inv0_u")
+        with c1b:
+            inv0_pu_ex = st.number_input("Costo unitario — Día 1", min_value=0.0, step=0.1, key="n2_ex_inv0_pu")
+
+        # Día 2
+        st.markdown("**Día 2.** La empresa realizó una **compra** de:")
+        c2a, c2b = st.columns([1, 1])
+        with c2a:
+            comp1_u  = st.number_input("Cantidad (u) — Día 2", min_value=0, step=1, key="n2_ex_comp1_u")
+        with c2b:
+            comp1_pu = st.number_input("Costo unitario — Día 2", min_value=0.0, step=0.1, key="n2_ex_comp1_pu")
+
+        # Día 3
+        st.markdown("**Día 3.** La empresa realizó una **venta** de:")
+        venta_ex_u = st.number_input("Cantidad vendida (u) — Día 3", min_value=0, step=1, key="n2_ex_venta_u")
+
+        # Día 4
+        st.markdown("**Día 4.** La empresa realizó otra **compra** de:")
+        c4a, c4b = st.columns([1, 1])
+        with c4a:
+            comp2_u  = st.number_input("Cantidad (u) — Día 4", min_value=0, step=1, key="n2_ex_comp2_u")
+        with c4b:
+            comp2_pu = st.number_input("Costo unitario — Día 4", min_value=0.0, step=0.1, key="n2_ex_comp2_pu")
+
+        # Botón aleatorio al final (no modifica widgets directamente)
+        st.button(
+            "🎲 Generar escenario aleatorio",
+            key="n2_ex_rand_btn",
+            on_click=_request_randomize
+        )
+
+        expected_rows = build_expected_rows(
+            ex_metodo, inv0_u_ex, inv0_pu_ex, comp1_u, comp1_pu, venta_ex_u, comp2_u, comp2_pu
+        )
+
+        # =========================
+        # Plantilla dinámica para edición
+        # =========================
+
+        # Crear la tabla solo si no existe o si cambió el número de filas esperado
+        if (
+            "n2_kardex_student_table_df" not in st.session_state
+            or len(st.session_state["n2_kardex_student_table_df"]) != len(expected_rows)
+        ):
+            st.session_state["n2_kardex_student_table_df"] = expected_rows.en_blanco()
+
+        # Mantener actualizadas solo las columnas fijas
+        st.session_state["n2_kardex_student_table_df"]["Fecha"] = expected_rows.columna("Fecha")
+        st.session_state["n2_kardex_student_table_df"]["Descripción"] = expected_rows.columna("Descripción")
+
+        edited = st.data_editor(
+            st.session_state["n2_kardex_student_table_df"],
+            use_container_width=True,
+            num_rows="fixed",
+            hide_index=True,
+            disabled=["Fecha", "Descripción"],
+            key="n2_kardex_student_table_var",
+            column_config={
+                "Entrada_cant": st.column_config.NumberColumn("Entrada_cant", step=1),
+                "Entrada_pu": st.column_config.NumberColumn("Entrada_pu", step=0.01),
+                "Entrada_total": st.column_config.NumberColumn("Entrada_total", step=0.01),
+                "Salida_cant": st.column_config.NumberColumn("Salida_cant", step=1),
+                "Salida_pu": st.column_config.NumberColumn("Salida_pu", step=0.01),
+                "Salida_total": st.column_config.NumberColumn("Salida_total", step=0.01),
+                "Saldo_cant": st.column_config.NumberColumn("Saldo_cant", step=1),
+                "Saldo_pu": st.column_config.NumberColumn("Saldo_pu", step=0.01),
+                "Saldo_total": st.column_config.NumberColumn("Saldo_total", step=0.01),
+            }
+        )
+
+        st.session_state["n2_kardex_student_table_df"] = edited.copy()
+
+        # =========================
+        # Validación y feedback
+        # =========================
+        with st.form("n2_kardex_check_var"):
+            ask_ai = st.checkbox("💬 Pedir retroalimentación de IA (procedimiento)", value=False, key="n2_kardex_ai_feedback_var")
+            submitted_ex = st.form_submit_button("✅ Validar mi KARDEX")
+
+        if submitted_ex:
+            tol = 0.5
+
+            # Celdas exigidas (máscara de la tabla esperada) a ±tol, todas las filas a la vez
+            flags = list(zip(expected_rows.etiquetas(), expected_rows.validar(edited, tol)))
+
+            aciertos = sum(1 for _, ok in flags if ok)
+            st.metric("Aciertos por fila", f"{aciertos}/{len(flags)}")
+            for label, ok in flags:
+                st.write(("✅ " if ok else "❌ ") + label)
+
+            if aciertos == len(flags):
+                st.success("¡Excelente! Tu procedimiento y saldos son coherentes con el método elegido.")
+            else:
+                st.warning("Hay diferencias en una o más filas. Revisa cantidades, costos unitarios y el método aplicado en cada día/tramo.")
+
+            # Feedback IA opcional
+            if ask_ai:
+                intento = describir_filas(edited.iloc[:len(expected_rows)])
+
+                final_exp = expected_rows[-1]
+                exp_qtyF = final_exp["Saldo_cant"]
+                exp_valF = final_exp["Saldo_total"]
+                exp_puF  = final_exp["Saldo_pu"]
+
+                sol_desc = (
+                    f"Método: {ex_metodo}. "
+                    f"Saldo final esperado: cant={exp_qtyF}, val={exp_valF}, pu={exp_puF}. "
+                    f"Cantidad de filas esperadas: {len(expected_rows)}."
+                )
+
+                # Streaming: el texto aparece desde el primer token
+                with st.expander("💬 Retroalimentación de la IA", expanded=True):
+                    st.write_stream(ia_feedback_stream(
+                        "Evalúa el procedimiento de un KARDEX paso a paso. " + sol_desc +
+                        "\nEl estudiante diligenció:\n" + intento +
+                        "\nIndica: (1) si respeta el método (promedio/PEPS/UEPS) en cada día/tramo, "
+                        "(2) posibles errores (promediar en PEPS/UEPS, usar costo equivocado en venta, no actualizar saldo), "
+                        "(3) un tip memotécnico breve y aplicable."
+                    ))
+
+
+    with tabs[3]:
+        st.subheader("Evaluación final del Nivel 2")
+        st.caption("Debes acertar **5 de 5** para aprobar y avanzar al siguiente nivel.")
+
+        # ========= Escenarios diferenciados =========
+        # --- Promedio Ponderado (Bolsos)
+        inv0_u, inv0_pu = 80, 10.0
+        comp1_u, comp1_pu = 40, 11.0
+        venta_u = 90
+        comp2_u, comp2_pu = 50, 13.0
+
+        # --- PEPS (Camisas)
+        peps_inv0_u, peps_inv0_pu = 100, 9.0
+        peps_comp1_u, peps_comp1_pu = 60, 10.5
+        peps_venta_u = 120
+        peps_comp2_u, peps_comp2_pu = 70, 12.0
+
+        # ---------- Solución PP ----------    
+        pp_after_c1, pp_after_sale, pp_final = cached_solve_pp(
+            inv0_u, inv0_pu, comp1_u, comp1_pu, venta_u, comp2_u, comp2_pu
+        )
+
+        peps_rows_expected = build_peps_exam_rows(
+            peps_inv0_u, peps_inv0_pu, peps_comp1_u, peps_comp1_pu,
+            peps_venta_u, peps_comp2_u, peps_comp2_pu
+        )
+
+        # ========= UI: una sola FORM para todo =========
+        with st.form("n2_eval_all"):
+            # 1) Selección múltiple
+            st.markdown("### 1) Selección múltiple (1 punto)")
+            st.markdown(
+                "¿Cuál de los siguientes métodos de valoración de inventarios genera normalmente una **mayor utilidad bruta** cuando los precios de compra están en aumento?"
+            )
+            q1 = st.radio(
+                "Elige una opción:",
+                [
+                    "A) UEPS (Último en Entrar, Primero en Salir)",
+                    "B) PEPS (Primero en Entrar, Primero en Salir)",
+                    "C) Promedio Ponderado",
+                    "D) Ninguno, todos generan la misma utilidad",
+                ],
+                index=None,
+                key="n2_eval_q1_new",
+            )
+
+            st.markdown("---")
+
+            # 2) Preguntas abiertas
+            st.markdown("### 2) Preguntas abiertas (2 puntos)")
+            a1 = st.text_area(
+                "2) Explica, con tus propias palabras, por qué es importante elegir correctamente el método de valoración de inventarios en una empresa.",
+                key="n2_eval_a1", height=130
+            )
+            a2 = st.text_area(
+                "3) Describe una situación práctica en la que el método del **Promedio Ponderado** podría ser más conveniente que PEPS o UEPS, y justifica tu respuesta.",
+                key="n2_eval_a2", height=130
+            )
+            ask_ai_open = st.checkbox("💬 Pedir calificación y feedback de IA para las preguntas abiertas", value=True)
+
+            st.markdown("---")
+
+            # 3) Ejercicio PP (tabla fija 4 filas)
+            st.markdown("### 3) Ejercicio (1 punto): Promedio Ponderado")
+            st.markdown(
+                f"""
+                **Contexto:**  
+                La empresa **ABC S.A.S.**, dedicada a la venta de bolsos, desea calcular el costo de su inventario bajo el método **Promedio Ponderado**.  
+                A continuación se describe el movimiento de mercancías durante la semana:
+
+                - **Día 1:** Inventario inicial de **{inv0_u} bolsos** a un costo unitario de **${inv0_pu:,.2f}**.  
+                - **Día 2:** Compra de **{comp1_u} bolsos adicionales** a **${comp1_pu:,.2f}** cada uno.  
+                - **Día 3:** Venta de **{venta_u} bolsos**.  
+                - **Día 4:** Nueva compra de **{comp2_u} bolsos** a **${comp2_pu:,.2f}** por unidad.  
+
+                Completa el siguiente **Kardex**, aplicando correctamente el método de **Promedio Ponderado**.
+                """
+            )
+
+            pp_template = pd.DataFrame([
+                {"Fecha":"Día 1","Descripción":"Saldo inicial",
+                "Entrada_cant":None,"Entrada_pu":None,"Entrada_total":None,
+                "Salida_cant":None,"Salida_pu":None,"Salida_total":None,
+                "Saldo_cant":None,"Saldo_pu":None,"Saldo_total":None},
+                {"Fecha":"Día 2","Descripción":"Compra 1",
+                "Entrada_cant":None,"Entrada_pu":None,"Entrada_total":None,
+                "Salida_cant":None,"Salida_pu":None,"Salida_total":None,
+                "Saldo_cant":None,"Saldo_pu":None,"Saldo_total":None},
+                {"Fecha":"Día 3","Descripción":"Venta",
+                "Entrada_cant":None,"Entrada_pu":None,"Entrada_total":None,
+                "Salida_cant":None,"Salida_pu":None,"Salida_total":None,
+                "Saldo_cant":None,"Saldo_pu":None,"Saldo_total":None},
+                {"Fecha":"Día 4","Descripción":"Compra 2",
+                "Entrada_cant":None,"Entrada_pu":None,"Entrada_total":None,
+                "Salida_cant":None,"Salida_pu":None,"Salida_total":None,
+                "Saldo_cant":None,"Saldo_pu":None,"Saldo_total":None},
+            ])
+            if "n2_eval_pp_df" not in st.session_state:
+                st.session_state["n2_eval_pp_df"] = pp_template.copy()
+
+            pp_edit = st.data_editor(
+                st.session_state["n2_eval_pp_df"],
+                use_container_width=True,
+                num_rows="fixed",
+                hide_index=True,
+                disabled=["Fecha", "Descripción"],
+                key="n2_eval_pp_tbl",
+                column_config={
+                    "Entrada_cant": st.column_config.NumberColumn("Entrada_cant", step=1),
+                    "Entrada_pu": st.column_config.NumberColumn("Entrada_pu", step=0.01),
+                    "Entrada_total": st.column_config.NumberColumn("Entrada_total", step=0.01),
+                    "Salida_cant": st.column_config.NumberColumn("Salida_cant", step=1),
+                    "Salida_pu": st.column_config.NumberColumn("Salida_pu", step=0.01),
+                    "Salida_total": st.column_config.NumberColumn("Salida_total", step=0.01),
+                    "Saldo_cant": st.column_config.NumberColumn("Saldo_cant", step=1),
+                    "Saldo_pu": st.column_config.NumberColumn("Saldo_pu", step=0.01),
+                    "Saldo_total": st.column_config.NumberColumn("Saldo_total", step=0.01),
+                }
+            )
+
+            st.session_state["n2_eval_pp_df"] = pp_edit.copy()
+
+            st.markdown("---")
+
+            # 4) Ejercicio PEPS (tabla dinámica por filas esperadas)
+            st.markdown("### 4) Ejercicio (1 punto): PEPS (FIFO)")
+            st.markdown(
+                f"""
+                **Contexto:**  
+                La empresa **MODA JOVEN S.A.S.**, dedicada a la comercialización de camisas, aplica el método **PEPS (Primero en Entrar, Primero en Salir)** para valorar su inventario.  
+                Durante la semana ocurrieron los siguientes movimientos:
+
+                - **Día 1:** Inventario inicial de **{peps_inv0_u} camisas** a un costo unitario de **${peps_inv0_pu:,.2f}**.  
+                - **Día 2:** Compra de **{peps_comp1_u} camisas** a **${peps_comp1_pu:,.2f}** cada una.  
+                - **Día 3:** Venta de **{peps_venta_u} camisas**.  
+                - **Día 4:** Nueva compra de **{peps_comp2_u} camisas** a **${peps_comp2_pu:,.2f}** por unidad.  
+
+                Diligencia el siguiente **Kardex PEPS**, asegurando que las salidas respeten el orden cronológico de entrada.
+                """
+            )
+
+            # Construimos plantilla con la MISMA cantidad de filas esperadas
+            peps_cols = ["Fecha","Descripción",
+                        "Entrada_cant","Entrada_pu","Entrada_total",
+                        "Salida_cant","Salida_pu","Salida_total",
+                        "Saldo_cant","Saldo_pu","Saldo_total"]
+            peps_template = pd.DataFrame([{k: "" for k in peps_cols} for _ in range(len(peps_rows_expected))])
+            for i, r in enumerate(peps_rows_expected):
+                peps_template.loc[i, "Fecha"] = r["fecha"]
+                peps_template.loc[i, "Descripción"] = r["desc"]
+
+            if "n2_eval_peps_df" not in st.session_state or len(st.session_state["n2_eval_peps_df"]) != len(peps_rows_expected):
+                st.session_state["n2_eval_peps_df"] = peps_template.copy()
+
+            pp_fixed_cols = ["Fecha", "Descripción"]
+            for i, r in enumerate(peps_rows_expected):
+                st.session_state["n2_eval_peps_df"].loc[i, "Fecha"] = r["fecha"]
+                st.session_state["n2_eval_peps_df"].loc[i, "Descripción"] = r["desc"]
+
+            peps_edit = st.data_editor(
+                st.session_state["n2_eval_peps_df"],
+                use_container_width=True,
+                num_rows="fixed",
+                hide_index=True,
+                disabled=["Fecha", "Descripción"],
+                key="n2_eval_peps_tbl",
+                column_config={
+                    "Entrada_cant": st.column_config.NumberColumn("Entrada_cant", step=1),
+                    "Entrada_pu": st.column_config.NumberColumn("Entrada_pu", step=0.01),
+                    "Entrada_total": st.column_config.NumberColumn("Entrada_total", step=0.01),
+                    "Salida_cant": st.column_config.NumberColumn("Salida_cant", step=1),
+                    "Salida_pu": st.column_config.NumberColumn("Salida_pu", step=0.01),
+                    "Salida_total": st.column_config.NumberColumn("Salida_total", step=0.01),
+                    "Saldo_cant": st.column_config.NumberColumn("Saldo_cant", step=1),
+                    "Saldo_pu": st.column_config.NumberColumn("Saldo_pu", step=0.01),
+                    "Saldo_total": st.column_config.NumberColumn("Saldo_total", step=0.01),
+                }
+            )
+
+            st.session_state["n2_eval_peps_df"] = peps_edit.copy()
+
+            # ===== Submit único
+            submitted_all = st.form_submit_button("🧪 Validar evaluación N2")
+
+        # ========= Evaluación / Puntuación =========
+        if submitted_all:
+            total_score = 0
+            details_msgs = []
+
+            # --- MCQ
+            correct_label = "B) PEPS (Primero en Entrar, Primero en Salir)"
+            mcq_ok = (q1 == correct_label)
+            total_score += 1 if mcq_ok else 0
+            details_msgs.append(f"Selección múltiple: {'✅' if mcq_ok else '❌'}")
+
+            # --- Abiertas (en paralelo, con heurística previa y parser estricto)
+            # Sin respuesta de IA a tiempo → misma ruta que "IA falló" (heurística local)
+            sin_ia = lambda prompt: ""
+            abiertas = grade_open_answers(
+                jobs={
+                    "q2": lambda: n2_eval_open_ai_q2(a1 or ""),
+                    "q3": lambda: n2_eval_open_ai_q3(a2 or ""),
+                },
+                fallbacks={
+                    "q2": lambda: n2_eval_open_ai_q2(a1 or "", ask=sin_ia),
+                    "q3": lambda: n2_eval_open_ai_q3(a2 or "", ask=sin_ia),
+                },
+            )
+            ok_a1, fb1_short, fb1_formativo = abiertas["q2"]
+            ok_a2, fb2_short, fb2_formativo = abiertas["q3"]
+            total_score += (1 if ok_a1 else 0) + (1 if ok_a2 else 0)
+            details_msgs.append(f"Pregunta abierta 2: {'✅' if ok_a1 else '❌'}")
+            details_msgs.append(f"Pregunta abierta 3: {'✅' if ok_a2 else '❌'}")
+
+            # --- Ejercicio PP (validación clave de saldos por día)
+            # Esperados PP
+            pp_r1_q = inv0_u
+            pp_r1_tot = inv0_u * inv0_pu
+            pp_r2_q, pp_r2_pu, pp_r2_tot = pp_after_c1[0], pp_after_c1[1], pp_after_c1[2]
+            pp_r3_q, pp_r3_pu, pp_r3_tot = pp_after_sale[0], pp_after_sale[1], pp_after_sale[2]
+            pp_r4_q, pp_r4_pu, pp_r4_tot = pp_final[0], pp_final[1], pp_final[2]
+
+            try:
+                r1 = pp_edit.iloc[0].to_dict()
+                r2 = pp_edit.iloc[1].to_dict()
+                r3 = pp_edit.iloc[2].to_dict()
+                r4 = pp_edit.iloc[3].to_dict()
+
+                ok_pp = (
+                    _near(_get_num_safe(r1,"Saldo_cant"), pp_r1_q) and
+                    _near(_get_num_safe(r1,"Saldo_total"), pp_r1_tot) and
+                    _near(_get_num_safe(r2,"Saldo_cant"), pp_r2_q) and
+                    ( (_get_num_safe(r2,"Saldo_pu") is None) or _near(_get_num_safe(r2,"Saldo_pu"), pp_r2_pu) ) and
+                    _near(_get_num_safe(r2,"Saldo_total"), pp_r2_tot) and
+                    _near(_get_num_safe(r3,"Saldo_cant"), pp_r3_q) and
+                    ( (_get_num_safe(r3,"Saldo_pu") is None) or _near(_get_num_safe(r3,"Saldo_pu"), pp_r3_pu) ) and
+                    _near(_get_num_safe(r3,"Saldo_total"), pp_r3_tot) and
+                    _near(_get_num_safe(r4,"Saldo_cant"), pp_r4_q) and
+                    ( (_get_num_safe(r4,"Saldo_pu") is None) or _near(_get_num_safe(r4,"Saldo_pu"), pp_r4_pu) ) and
+                    _near(_get_num_safe(r4,"Saldo_total"), pp_r4_tot)
+                )
+            except Exception:
+                ok_pp = False
+
+            total_score += 1 if ok_pp else 0
+            details_msgs.append(f"Ejercicio PP: {'✅' if ok_pp else '❌'}")
+
+            # --- Ejercicio PEPS (validación por fila esperada, con tolerancia)
+            ok_peps = True
+            peps_errors = []
+
+            try:
+                for i, exp in enumerate(peps_rows_expected):
+                    row = peps_edit.iloc[i].to_dict()
+
+                    def check_num(col_ui, expected, label):
+                        nonlocal ok_peps
+                        val = _get_num_safe(row, col_ui)
+                        if not _near(val, expected):
+                            ok_peps = False
+                            peps_errors.append(
+                                f"Fila {i+1} ({row.get('Fecha', '')} - {row.get('Descripción', '')}) | "
+                                f"{label}: ingresado={row.get(col_ui)} | esperado={expected}"
+                            )
+
+                    # Entrada
+                    if exp["ent_q"] != "":
+                        check_num("Entrada_cant", exp["ent_q"], "Entrada cantidad")
+                        check_num("Entrada_pu", exp["ent_pu"], "Entrada costo unitario")
+                        check_num("Entrada_total", exp["ent_tot"], "Entrada total")
+
+                    # Salida
+                    if exp["sal_q"] != "":
+                        check_num("Salida_cant", exp["sal_q"], "Salida cantidad")
+                        check_num("Salida_pu", exp["sal_pu"], "Salida costo unitario")
+                        check_num("Salida_total", exp["sal_tot"], "Salida total")
+
+                    # Saldo
+                    saldo_cant = _get_num_safe(row, "Saldo_cant")
+                    saldo_pu   = _get_num_safe(row, "Saldo_pu")
+                    saldo_tot  = _get_num_safe(row, "Saldo_total")
+
+                    if saldo_cant is not None and not _near(saldo_cant, exp["sdo_q"]):
+                        ok_peps = False
+                        peps_errors.append(
+                            f"Fila {i+1} | Saldo cantidad: ingresado={row.get('Saldo_cant')} | esperado={exp['sdo_q']}"
+                        )
+
+                    if saldo_pu is not None and not _near(saldo_pu, exp["sdo_pu"]):
+                        ok_peps = False
+                        peps_errors.append(
+                            f"Fila {i+1} | Saldo costo unitario: ingresado={row.get('Saldo_pu')} | esperado={exp['sdo_pu']}"
+                        )
+
+                    if saldo_tot is not None and not _near(saldo_tot, exp["sdo_tot"]):
+                        ok_peps = False
+                        peps_errors.append(
+                            f"Fila {i+1} | Saldo total: ingresado={row.get('Saldo_total')} | esperado={exp['sdo_tot']}"
+                        )
+
+            except Exception as e:
+                ok_peps = False
+                peps_errors.append(f"Error interno en validación PEPS: {e}")
+
+            total_score += 1 if ok_peps else 0
+            details_msgs.append(f"Ejercicio PEPS: {'✅' if ok_peps else '❌'}")
+
+            if not ok_peps:
+                st.warning("Detalle de errores encontrados en PEPS:")
+                for err in peps_errors:
+                    st.write("- " + err)
+
+
+            # ===== Resultado final =====
+            st.markdown("---")
+            st.metric("Puntaje total", f"{total_score}/5")
+            st.write(" | ".join(details_msgs))
+
+            passed = (total_score >= 5)
+            record_attempt(username, level=2, score=total_score, passed=passed)
+
+            if passed:
+                set_level_passed(st.session_state["progress_col"], username, "level2", total_score)
+                st.session_state["sidebar_next_select"] = "Nivel 3: Devoluciones"
+
+                st.session_state["celebrate_score_text"] = f"{total_score}/5"
+                st.session_state["celebrate_answers_title"] = "✅ Respuestas correctas del Nivel 2"
+                st.session_state["celebrate_answers"] = [
+                    "1) Selección múltiple: B) PEPS (Primero en Entrar, Primero en Salir).",
+                    "2) Pregunta abierta 1: era válida una respuesta que explicara que elegir bien el método afecta el CMV y la utilidad, influye en los estados financieros/comparabilidad y también puede impactar impuestos o decisiones de gestión.",
+                    "3) Pregunta abierta 2: era válida una respuesta que planteara un caso con compras frecuentes o costos variables, explicando que el Promedio Ponderado suaviza la volatilidad del CMV y simplifica el registro.",
+                    "4) Ejercicio PP: diligenciaste correctamente la tabla de Promedio Ponderado.",
+                    "5) Ejercicio PEPS: diligenciaste correctamente la tabla PEPS."
+                ]
+
+                df_pp_correct = pd.DataFrame([
+                    {
+                        "Fecha": "Día 1",
+                        "Descripción": "Saldo inicial",
+                        "Saldo_cant": pp_r1_q,
+                        "Saldo_pu": inv0_pu,
+                        "Saldo_total": pp_r1_tot
+                    },
+                    {
+                        "Fecha": "Día 2",
+                        "Descripción": "Compra 1",
+                        "Saldo_cant": pp_r2_q,
+                        "Saldo_pu": round(pp_r2_pu, 2),
+                        "Saldo_total": round(pp_r2_tot, 2)
+                    },
+                    {
+                        "Fecha": "Día 3",
+                        "Descripción": "Venta",
+                        "Saldo_cant": pp_r3_q,
+                        "Saldo_pu": round(pp_r3_pu, 2),
+                        "Saldo_total": round(pp_r3_tot, 2)
+                    },
+                    {
+                        "Fecha": "Día 4",
+                        "Descripción": "Compra 2",
+                        "Saldo_cant": pp_r4_q,
+                        "Saldo_pu": round(pp_r4_pu, 2),
+                        "Saldo_total": round(pp_r4_tot, 2)
+                    },
+                ])
+
+                df_peps_correct = pd.DataFrame(peps_rows_expected)
+
+                st.session_state["celebrate_tables"] = {
+                    "Promedio Ponderado": df_pp_correct,
+                    "PEPS": df_peps_correct
+                }
+
+                start_celebration(
+                    message_md=(
+                        "<b>¡Nivel 2 aprobado!</b> 🎉<br><br>"
+                        f"<b>Aciertos:</b> {total_score}/5<br><br>"
+                        "Dominaste <b>PP / PEPS / UEPS</b> en teoría y práctica. "
+                        "Sigamos con el <b>Nivel 3</b>: <i>Devoluciones</i>."
+                    ),
+                    next_label="Ir al Nivel 3",
+                    next_key_value="Nivel 3: Devoluciones"
+                )
+            else:
+                st.error("No aprobado. Necesitas 5/5. Revisa tus respuestas y vuelve a intentarlo.")
+                if ask_ai_open:
+                    with st.expander("💬 Feedback de la IA (preguntas abiertas)"):
+                        st.markdown("**Pregunta 2**")
+                        st.write(fb1_short)
+                        st.info(fb1_formativo)
+                        st.markdown("---")
+                        st.markdown("**Pregunta 3**")
+                        st.write(fb2_short)
+                        st.info(fb2_formativo)
+
+    with tabs[4]:
+        n2_libro_movimientos()
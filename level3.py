@@ -0,0 +1,1603 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Nivel 3: Devoluciones
+# =========================================================
+
+import random
+import json as _json
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from inventory_engine import InventarioTrazable
+from kardex_table import KardexTabla, describir_filas
+from ia import grade_open_answers, ia_feedback_or_default, ia_feedback_stream
+from rubric_classifier import decision_local
+from storage import record_attempt, set_current_level, set_level_passed
+from ui_common import peso, speak_block, start_celebration
+
+# ===========================
+# Helpers de escenarios aleatorios estables
+# ===========================
+def n3_new_case():
+    st.session_state.n3_inv0    = random.randint(500, 1500)
+    st.session_state.n3_prom0   = random.choice([15.0, 16.0, 17.0])
+    st.session_state.n3_comp    = random.randint(500, 2000)
+    st.session_state.n3_comp_pu = random.choice([17.0, 18.0, 19.0])
+    st.session_state.n3_dev_comp= random.randint(0, int(st.session_state.n3_comp*0.2))
+    st.session_state.n3_venta_u = random.randint(200, st.session_state.n3_inv0 + st.session_state.n3_comp)
+    st.session_state.n3_dev_v_u = random.randint(0, int(st.session_state.n3_venta_u*0.2))
+
+# ===========================
+# Helpers del Nivel 3 (KARDEX con devoluciones y calificación)
+# ===========================
+def _fmt_money(v):
+    try:
+        return peso(float(v))
+    except Exception:
+        return str(v)
+
+# ========= Generación de filas y guion =========
+def compute_rows_and_script_with_returns(
+    method_name,
+    inv0_u,
+    inv0_pu,
+    comp_u,
+    comp_pu,
+    venta_u,
+    dev_comp_u,
+    dev_venta_u,
+):
+    """
+    Construye todas las filas (Día 1–5).
+    Días 1–3: prellenados según el método.
+    Días 4–5: se narran (acciones en script).
+    En PEPS/UEPS NUNCA se promedia: se trabaja siempre por capas.
+    """
+    rows = []
+    script = []
+
+    # Motor con trazabilidad de lotes: las devoluciones saben de qué
+    # capa salió (o entró) cada unidad. En PP se valoran al costo de
+    # origen (compra / venta original), como explica la lección.
+    inv = InventarioTrazable(method_name, pp_costo_origen=True)
+    metodo_tag = "PEPS" if inv.metodo == "PEPS" else "UEPS"
+
+    # =====================
+    # DÍA 1 · SALDO INICIAL
+    # =====================
+    inv.entrada(inv0_u, inv0_pu)
+    s_q, s_pu, s_v = inv.saldo()
+    if inv0_u > 0:
+        ent_q_1 = int(inv0_u)
+        ent_pu_1 = float(inv0_pu)
+        ent_tot_1 = ent_q_1 * ent_pu_1
+    else:
+        ent_q_1 = None
+        ent_pu_1 = None
+        ent_tot_1 = None
+
+    rows.append(
+        {
+            "fecha": "Día 1",
+            "desc": "Saldo inicial",
+            "ent_q": ent_q_1,
+            "ent_pu": ent_pu_1,
+            "ent_tot": ent_tot_1,
+            "sal_q": None,
+            "sal_pu": None,
+            "sal_tot": None,
+            "sdo_q": int(s_q) if s_q > 0 else 0,
+            "sdo_pu": round(s_pu, 2),
+            "sdo_tot": round(s_v, 2),
+        }
+    )
+
+    # =====================
+    # DÍA 2 · COMPRA
+    # =====================
+    ent_tot = comp_u * comp_pu
+    lote_compra = inv.entrada(comp_u, comp_pu)
+    s_q, s_pu, s_v = inv.saldo()
+    if inv.metodo == "PP":
+        sdo_2 = (int(s_q), round(s_pu, 2), round(s_v, 2))
+    else:
+        # PEPS / UEPS: el saldo de esa fila muestra solo la capa comprada
+        sdo_2 = (
+            int(comp_u) if comp_u > 0 else 0,
+            round(comp_pu, 2) if comp_u > 0 else 0.0,
+            round(ent_tot, 2) if comp_u > 0 else 0.0,
+        )
+
+    rows.append(
+        {
+            "fecha": "Día 2",
+            "desc": "Compra",
+            "ent_q": int(comp_u) if comp_u > 0 else None,
+            "ent_pu": round(comp_pu, 2) if comp_u > 0 else None,
+            "ent_tot": round(ent_tot, 2) if comp_u > 0 else None,
+            "sal_q": None,
+            "sal_pu": None,
+            "sal_tot": None,
+            "sdo_q": sdo_2[0],
+            "sdo_pu": sdo_2[1],
+            "sdo_tot": sdo_2[2],
+        }
+    )
+
+    # =====================
+    # DÍA 3 · VENTA (PRELLENADA)
+    # =====================
+    tramos = inv.venta(venta_u)
+    if inv.metodo == "PP" and tramos:
+        t = tramos[0]
+        s_q, s_pu, s_v = inv.saldo()
+        rows.append(
+            {
+                "fecha": "Día 3",
+                "desc": "Venta",
+                "ent_q": None,
+                "ent_pu": None,
+                "ent_tot": None,
+                "sal_q": int(t.cantidad),
+                "sal_pu": round(t.costo_unitario, 2),
+                "sal_tot": round(t.total, 2),
+                "sdo_q": int(s_q),
+                "sdo_pu": round(s_pu, 2),
+                "sdo_tot": round(s_v, 2),
+            }
+        )
+    elif tramos:
+        # PEPS / UEPS (sin promediar): un tramo por capa; el saldo
+        # mostrado es SOLO el de la capa afectada en ese tramo
+        for i, t in enumerate(tramos, start=1):
+            rows.append(
+                {
+                    "fecha": "Día 3",
+                    "desc": f"Venta tramo {i} ({metodo_tag})",
+                    "ent_q": None,
+                    "ent_pu": None,
+                    "ent_tot": None,
+                    "sal_q": int(t.cantidad),
+                    "sal_pu": round(t.costo_unitario, 2),
+                    "sal_tot": round(t.total, 2),
+                    "sdo_q": int(t.resto_capa),
+                    "sdo_pu": round(t.costo_unitario, 2),
+                    "sdo_tot": round(t.resto_capa * t.costo_unitario, 2),
+                }
+            )
+        s_q, s_pu, s_v = inv.saldo()
+    else:
+        rows.append(
+            {
+                "fecha": "Día 3",
+                "desc": "Venta",
+                "ent_q": None,
+                "ent_pu": None,
+                "ent_tot": None,
+                "sal_q": None,
+                "sal_pu": None,
+                "sal_tot": None,
+                "sdo_q": int(s_q),
+                "sdo_pu": round(s_pu, 2),
+                "sdo_tot": round(s_v, 2),
+            }
+        )
+
+    # A partir de aquí se narran solo las devoluciones
+    narr_start_idx = len(rows)
+
+    # =====================
+    # DÍA 4 · DEVOLUCIÓN DE COMPRA
+    # =====================
+    tramos = inv.dev_compra(dev_comp_u, lote_compra)
+    if tramos:
+        if inv.metodo == "PP":
+            # Sale del promedio pero valorada al precio original de compra
+            take_q, take_pu, take_val = tramos[0][:3]
+            s_q, s_pu, s_v = inv.saldo()
+
+            rows.append(
+                {
+                    "fecha": "Día 4",
+                    "desc": "Devolución de compra",
+                    "ent_q": None,
+                    "ent_pu": None,
+                    "ent_tot": None,
+                    "sal_q": int(take_q),
+                    "sal_pu": round(take_pu, 2),
+                    "sal_tot": round(take_val, 2),
+                    "sdo_q": int(s_q),
+                    "sdo_pu": round(s_pu, 2),
+                    "sdo_tot": round(s_v, 2),
+                }
+            )
+
+            script.append(
+                {
+                    "title": "Día 4 · Devolución de compra (PP)",
+                    "text": (
+                        f"En el Día 4 registramos una **devolución de compra**: devolvemos "
+                        f"{int(take_q)} unidades al proveedor al mismo costo de compra "
+                        f"({_fmt_money(take_pu)} por unidad). Esto reduce el inventario y se "
+                        f"recalcula el costo promedio del saldo."
+                    ),
+                    "actions": [
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sal_q",
+                            "money": False,
+                            "val": int(take_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sal_pu",
+                            "money": True,
+                            "val": round(take_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sal_tot",
+                            "money": True,
+                            "val": round(take_val, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_q",
+                            "money": False,
+                            "val": int(s_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_pu",
+                            "money": True,
+                            "val": round(s_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_tot",
+                            "money": True,
+                            "val": round(s_v, 2),
+                        },
+                    ],
+                }
+            )
+        else:
+            # PEPS / UEPS: la devolución sale del lote de esa compra (si no
+            # alcanza, de los más recientes); el método solo cambia la narrativa.
+            s_q, s_pu, s_v = inv.saldo()
+            take_q = sum(t.cantidad for t in tramos)
+            take_val = sum(t.total for t in tramos)
+            take_pu = (take_val / take_q) if take_q > 0 else 0.0
+
+            # SALDO en la fila: lo que queda en el lote de la compra devuelta
+            saldo_q = tramos[0].resto_capa
+            saldo_tot = saldo_q * take_pu
+
+            rows.append(
+                {
+                    "fecha": "Día 4",
+                    "desc": "Devolución de compra",
+                    "ent_q": None,
+                    "ent_pu": None,
+                    "ent_tot": None,
+                    "sal_q": int(take_q),
+                    "sal_pu": round(take_pu, 2),
+                    "sal_tot": round(take_val, 2),
+                    "sdo_q": int(saldo_q),
+                    "sdo_pu": round(take_pu, 2),
+                    "sdo_tot": round(saldo_tot, 2),
+                }
+            )
+
+            script.append(
+                {
+                    "title": f"Día 4 · Devolución de compra ({metodo_tag})",
+                    "text": (
+                        f"Registramos una **devolución de compra**: retiramos "
+                        f"{int(take_q)} unidades de la capa de la compra que estamos devolviendo, "
+                        f"al costo en que fueron compradas ({_fmt_money(take_pu)} por unidad).\n\n"
+                        f"En el SALDO del Día 4 ves cuántas unidades quedan en esa misma capa y con el mismo costo; "
+                        f"no promediamos, respetamos siempre el valor de la capa."
+                    ),
+                    "actions": [
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sal_q",
+                            "money": False,
+                            "val": int(take_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sal_pu",
+                            "money": True,
+                            "val": round(take_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sal_tot",
+                            "money": True,
+                            "val": round(take_val, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_q",
+                            "money": False,
+                            "val": int(saldo_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_pu",
+                            "money": True,
+                            "val": round(take_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_tot",
+                            "money": True,
+                            "val": round(saldo_tot, 2),
+                        },
+                    ],
+                }
+            )
+
+    # =====================
+    # DÍA 5 · DEVOLUCIÓN DE VENTA (REINGRESO)
+    # =====================
+    tramos = inv.dev_venta(dev_venta_u)
+    if tramos:
+        # ------- PROMEDIO PONDERADO -------
+        if inv.metodo == "PP":
+            # Reingreso al costo con que salió la venta original
+            in_q, in_pu, in_val = tramos[0][:3]
+            s_q, s_pu, s_v = inv.saldo()
+
+            rows.append(
+                {
+                    "fecha": "Día 5",
+                    "desc": "Devolución de venta (reingreso)",
+                    "ent_q": int(in_q),
+                    "ent_pu": round(in_pu, 2),
+                    "ent_tot": round(in_val, 2),
+                    "sal_q": None,
+                    "sal_pu": None,
+                    "sal_tot": None,
+                    "sdo_q": int(s_q),
+                    "sdo_pu": round(s_pu, 2),
+                    "sdo_tot": round(s_v, 2),
+                }
+            )
+
+            script.append(
+                {
+                    "title": "Día 5 · Devolución de venta (PP)",
+                    "text": (
+                        f"El cliente devuelve {int(in_q)} unidades. En Promedio Ponderado, "
+                        f"reingresan al mismo costo con el que se reconoció la venta "
+                        f"({_fmt_money(in_pu)} por unidad), revirtiendo parte del CMV neto "
+                        f"y recalculando el costo promedio del inventario."
+                    ),
+                    "actions": [
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "ent_q",
+                            "money": False,
+                            "val": int(in_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "ent_pu",
+                            "money": True,
+                            "val": round(in_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "ent_tot",
+                            "money": True,
+                            "val": round(in_val, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_q",
+                            "money": False,
+                            "val": int(s_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_pu",
+                            "money": True,
+                            "val": round(s_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_tot",
+                            "money": True,
+                            "val": round(s_v, 2),
+                        },
+                    ],
+                }
+            )
+
+        # ------- PEPS / UEPS (SIN PROMEDIAR) -------
+        else:
+            # Cada unidad vuelve a la capa de la que salió (aunque se
+            # hubiera agotado); el costo por unidad NO cambia
+            in_q = sum(t.cantidad for t in tramos)
+            in_val = sum(t.total for t in tramos)
+            in_pu = in_val / in_q
+            capa_q, capa_pu = tramos[0].resto_capa, tramos[0].costo_unitario
+            capa_tot = capa_q * capa_pu
+            s_q, s_pu, s_v = inv.saldo()
+            if len(tramos) == 1:
+                costo_txt = f"{_fmt_money(in_pu)} por unidad"
+            else:
+                costo_txt = "cada una en la capa de la que salió (" + ", ".join(
+                    f"{int(t.cantidad)} u a {_fmt_money(t.costo_unitario)}" for t in tramos
+                ) + ")"
+
+            rows.append(
+                {
+                    "fecha": "Día 5",
+                    "desc": "Devolución de venta (reingreso)",
+                    "ent_q": int(in_q),
+                    "ent_pu": round(in_pu, 2),
+                    "ent_tot": round(in_val, 2),
+                    "sal_q": None,
+                    "sal_pu": None,
+                    "sal_tot": None,
+                    # Saldo mostrado: SOLO la capa asociada a la devolución
+                    "sdo_q": int(capa_q),
+                    "sdo_pu": round(capa_pu, 2),
+                    "sdo_tot": round(capa_tot, 2),
+                }
+            )
+
+            script.append(
+                {
+                    "title": f"Día 5 · Devolución de venta ({metodo_tag})",
+                    "text": (
+                        f"El cliente devuelve {int(in_q)} unidades. En {metodo_tag}, las reingresamos "
+                        f"al mismo costo con el que salieron en la venta original, {costo_txt}.\n\n"
+                        f"Si todavía existía inventario en esa misma capa, simplemente le sumamos las unidades devueltas; "
+                        f"el costo por unidad NO cambia. En la fila del Día 5 el SALDO muestra la capa asociada a esa devolución."
+                    ),
+                    "actions": [
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "ent_q",
+                            "money": False,
+                            "val": int(in_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "ent_pu",
+                            "money": True,
+                            "val": round(in_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "ent_tot",
+                            "money": True,
+                            "val": round(in_val, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_q",
+                            "money": False,
+                            "val": int(capa_q),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_pu",
+                            "money": True,
+                            "val": round(capa_pu, 2),
+                        },
+                        {
+                            "row": len(rows) - 1,
+                            "cell": "sdo_tot",
+                            "money": True,
+                            "val": round(capa_tot, 2),
+                        },
+                    ],
+                }
+            )
+
+    return rows, script, narr_start_idx
+
+# =========================
+# Estado y escenario
+# =========================
+def _ensure_default_state():
+    ss = st.session_state
+    ss.setdefault("n2_ex_metodo", "Promedio Ponderado")
+    # Día 1
+    ss.setdefault("n2_ex_inv0_u", 80)
+    ss.setdefault("n2_ex_inv0_pu", 10.0)
+    # Día 2
+    ss.setdefault("n2_ex_comp1_u", 40)
+    ss.setdefault("n2_ex_comp1_pu", 11.0)
+    # Día 3
+    ss.setdefault("n2_ex_venta_u", 90)
+    # Día 4 (devolución de compra a proveedor)
+    ss.setdefault("n2_ex_dev_comp_u", 8)
+    # Día 5 (devolución de venta del cliente)
+    ss.setdefault("n2_ex_dev_venta_u", 6)
+
+
+def _randomize_scenario_values():
+    import random
+    inv0_u = random.choice([60, 80, 100, 120, 150])
+    inv0_pu = random.choice([8.0, 9.0, 10.0, 11.0, 12.0])
+    comp1_u = random.choice([30, 40, 50, 60, 70])
+    comp1_pu = random.choice([inv0_pu - 1, inv0_pu, inv0_pu + 1, inv0_pu + 2])
+    venta_u = random.choice([40, 60, 90, 110, 130])
+    dev_comp_u = max(0, min(comp1_u, random.choice([5, 8, 10, 12, 15])))
+    dev_venta_u = max(0, min(venta_u, random.choice([4, 6, 8, 10, 12])))
+
+    ss = st.session_state
+    ss["n2_ex_inv0_u"] = inv0_u
+    ss["n2_ex_inv0_pu"] = float(max(1.0, round(inv0_pu, 2)))
+    ss["n2_ex_comp1_u"] = comp1_u
+    ss["n2_ex_comp1_pu"] = float(max(1.0, round(comp1_pu, 2)))
+    ss["n2_ex_venta_u"] = venta_u
+    ss["n2_ex_dev_comp_u"] = dev_comp_u
+    ss["n2_ex_dev_venta_u"] = dev_venta_u
+
+
+def _request_randomize():
+    st.session_state["n2_ex_rand_request"] = True
+
+# =========================
+# Filas ESPERADAS (D1–D5)
+# =========================
+def build_expected_rows(method_name, inv0_u_ex, inv0_pu_ex, comp1_u, comp1_pu, venta_ex_u, dev_comp_u, dev_venta_u):
+    """
+    Devuelve filas con columnas:
+    Fecha, Descripción,
+    Entrada_cant, Entrada_pu, Entrada_total,
+    Salida_cant,  Salida_pu,  Salida_total,
+    Saldo_cant,   Saldo_pu,   Saldo_total
+
+    Secuencia:
+    D1: Saldo inicial (como ENTRADA + SALDO).
+    D2: Compra 1
+        - PP: saldo con promedio.
+        - PEPS/UEPS: saldo muestra SOLO la capa comprada (sin promediar).
+    D3: Venta
+        - PP: una fila.
+        - PEPS/UEPS: tramos por capa; si se agota una capa, el saldo de esa fila muestra 0 a ese costo.
+    D4: Devolución de compra
+        - PP: al costo de la compra original (comp1_pu).
+        - PEPS/UEPS: sale de la capa de la Compra 1 (si no alcanza, de las más recientes).
+    D5: Devolución de venta
+        - PP: reingreso al costo de la venta original.
+        - PEPS/UEPS: cada unidad vuelve a la capa de la que salió (primero las más antiguas),
+          mostrando SOLO esa capa en el saldo.
+    """
+    rows = KardexTabla()
+    inv = InventarioTrazable(method_name, pp_costo_origen=True)
+    metodo_tag = "PEPS" if inv.metodo == "PEPS" else "UEPS"
+
+    def fila(fecha, desc, ent=(None, None, None), sal=(None, None, None), sdo=None):
+        if sdo is None:
+            s_q, s_p, s_v = inv.saldo()
+            sdo = (s_q, round(s_p, 2), round(s_v, 2))
+        rows.agregar(
+            fecha, desc,
+            Entrada_cant=ent[0], Entrada_pu=ent[1], Entrada_total=ent[2],
+            Salida_cant=sal[0], Salida_pu=sal[1], Salida_total=sal[2],
+            Saldo_cant=sdo[0], Saldo_pu=sdo[1], Saldo_total=sdo[2],
+        )
+
+    # --------------------------
+    # Día 1 · Saldo inicial (ENTRADA + SALDO)
+    # --------------------------
+    inv.entrada(inv0_u_ex, inv0_pu_ex)
+    if inv0_u_ex > 0:
+        fila("Día 1", "Saldo inicial",
+             ent=(int(inv0_u_ex), round(inv0_pu_ex, 2), round(int(inv0_u_ex) * inv0_pu_ex, 2)))
+    else:
+        fila("Día 1", "Saldo inicial")
+
+    # --------------------------
+    # Día 2 · Compra 1 (SIN "Saldo día 1")
+    # --------------------------
+    ent_tot2 = comp1_u * comp1_pu
+    lote_compra = inv.entrada(comp1_u, comp1_pu)
+    ent2 = (comp1_u, round(comp1_pu, 2), round(ent_tot2, 2))
+    if inv.metodo == "PP":
+        # PP: se promedia con el saldo anterior
+        fila("Día 2", "Compra 1", ent=ent2)
+    else:
+        # PEPS / UEPS: la fila muestra SOLO la capa de la compra
+        fila("Día 2", "Compra 1", ent=ent2, sdo=ent2)
+
+    # --------------------------
+    # Día 3 · Venta
+    # --------------------------
+    tramos = inv.venta(venta_ex_u)
+    if not tramos:
+        fila("Día 3", "Venta")
+    elif inv.metodo == "PP":
+        t = tramos[0]
+        fila("Día 3", "Venta", sal=(t.cantidad, round(t.costo_unitario, 2), round(t.total, 2)))
+    else:
+        # PEPS / UEPS: venta por tramos, sin promediar; el SALDO que se
+        # muestra es SOLO el de la capa del tramo (0 si se agotó)
+        for i, t in enumerate(tramos, start=1):
+            fila(
+                "Día 3", f"Venta tramo {i} ({metodo_tag})",
+                sal=(int(t.cantidad), round(t.costo_unitario, 2), round(t.total, 2)),
+                sdo=(int(t.resto_capa), round(t.costo_unitario, 2), round(t.resto_capa * t.costo_unitario, 2)),
+            )
+
+    # --------------------------
+    # Día 4 · Devolución de compra
+    # --------------------------
+    tramos = inv.dev_compra(dev_comp_u, lote_compra)
+    if tramos:
+        take_q = sum(t.cantidad for t in tramos)
+        take_val = sum(t.total for t in tramos)
+        fila("Día 4", "Devolución de compra",
+             sal=(take_q, round(take_val / take_q, 2), round(take_val, 2)))
+    else:
+        fila("Día 4", "Devolución de compra")
+
+    # --------------------------
+    # Día 5 · Devolución de venta (reingreso)
+    # --------------------------
+    tramos = inv.dev_venta(dev_venta_u)
+    if not tramos:
+        fila("Día 5", "Devolución de venta (reingreso)")
+    else:
+        in_q = sum(t.cantidad for t in tramos)
+        in_val = sum(t.total for t in tramos)
+        ent5 = (in_q, round(in_val / in_q, 2), round(in_val, 2))
+        if inv.metodo == "PP":
+            fila("Día 5", "Devolución de venta (reingreso)", ent=ent5)
+        else:
+            # Capa asociada a la devolución (saldo que se muestra SOLO con esa capa)
+            capa = tramos[0]
+            fila("Día 5", "Devolución de venta (reingreso)", ent=ent5,
+                 sdo=(int(capa.resto_capa), round(capa.costo_unitario, 2),
+                      round(capa.resto_capa * capa.costo_unitario, 2)))
+
+    return rows
+
+# =========================
+# Utilidades y helpers
+# =========================
+def _on_topic_fallback_q4() -> str:
+    """Feedback on-topic si el proveedor no responde o se desvía."""
+    return (
+        "Para que las devoluciones no distorsionen los estados, deben registrarse con el "
+        "costo correcto según el método:\n"
+        "- En **Promedio Ponderado (PP)**: usa el **promedio vigente** al momento de la operación; "
+        "ajusta el **CMV** (si es devolución de venta) o las **compras netas** (si es devolución de compra) y "
+        "recalcula el **saldo y su costo unitario**.\n"
+        "- En **PEPS/UEPS**: respeta la **capa** que corresponde (más antigua o más reciente). "
+        "Promediar en estos métodos genera errores en CMV y en el valor del inventario.\n"
+        "Consecuencia típica de hacerlo mal: **CMV**, **saldo** y **comparabilidad** quedan afectados, "
+        "lo que sesga la utilidad y las decisiones de gestión."
+    )
+
+
+def _sanitize_on_topic_q4(text: str) -> str:
+    """Filtra contenido fuera de tema (debe/haber, IVA, asientos, etc.) y devuelve fallback si aparece."""
+    if not text:
+        return _on_topic_fallback_q4()
+    banned = [
+        "debe", "haber", "asiento", "apertura", "cierre", "diario",
+        "iva repercutido", "iva soportado", "iva", "cuentas t",
+        "resultado del ejercicio", "balance de comprobación"
+    ]
+    low = text.lower()
+    if any(b in low for b in banned):
+        return _on_topic_fallback_q4()
+    return text
+
+
+def safe_ia_feedback(prompt: str, default: str = "") -> str:
+    """
+    ia_feedback sobre el limitador de tasa compartido (sin sleeps en el hilo del script).
+    - Sin cupo → marca st.session_state['n3_ai_rate_limited']=True y devuelve default.
+    - Siempre retorna str; si no hay respuesta útil → default.
+    """
+    return ia_feedback_or_default(prompt, default=default, flag_key="n3_ai_rate_limited")
+
+# ===== ESCENARIO Q5 AJUSTADO (SIN DECIMALES RAROS) =====
+def q5_scenario():
+    # Escenario EXACTO:
+    # Día 1: 80 u @ 12
+    # Día 2: compra 40 u @ 15
+    # Día 3: venta 100 u
+    # Día 4: devolución en compra 10 u
+    # Día 5: devolución en venta 10 u
+    return {
+        "inv0_u":   80,    # Día 1: unidades iniciales
+        "inv0_pu":  12.0,  # Día 1: precio unitario inicial
+        "comp1_u":  40,    # Día 2: compra unidades
+        "comp1_pu": 15.0,  # Día 2: compra precio unitario
+        "venta_u":  100,   # Día 3: venta unidades
+        "dev_comp": 10,    # Día 4: devolución en compras (unidades que salen)
+        "dev_venta":10,    # Día 5: devolución en ventas (unidades que reingresan)
+    }
+
+
+def _scenario_signature(sc: dict) -> str:
+    return f'{sc["inv0_u"]}-{sc["inv0_pu"]}-{sc["comp1_u"]}-{sc["comp1_pu"]}-{sc["venta_u"]}-{sc["dev_comp"]}-{sc["dev_venta"]}'
+
+
+@st.cache_data(show_spinner=False)
+def build_expected_rows_q5_pp(sc: dict, sig: str):
+    """
+    Construye la solución esperada del KARDEX PP para Q5 siguiendo:
+    - Día 1: saldo inicial solo como SALDO (entradas vacías).
+    - Día 2: compra 1, saldo promediado.
+    - Día 3: venta al costo promedio vigente.
+    - Día 4: devolución de compra a **costo de compra** (el del lote de la compra 1).
+    - Día 5: devolución de venta a **costo de la venta original** (el promedio con que salió).
+    Las celdas no aplicables van con "" y quedan fuera de la máscara de celdas exigidas.
+    """
+    rows = KardexTabla()
+    inv = InventarioTrazable("Promedio Ponderado", pp_costo_origen=True)
+
+    def fila(fecha, desc, tramos=(), lado="Salida"):
+        s_q, s_p, s_v = inv.saldo()
+        celdas = {"Saldo_cant": s_q, "Saldo_pu": round(s_p, 2), "Saldo_total": round(s_v, 2)}
+        for q, pu, tot in (t[:3] for t in tramos):
+            celdas.update({f"{lado}_cant": q, f"{lado}_pu": pu, f"{lado}_total": tot})
+        rows.agregar(fecha, desc, **celdas)
+
+    # ===== Día 1: Saldo inicial (solo SALDO) =====
+    inv.entrada(sc["inv0_u"], sc["inv0_pu"])
+    fila("Día 1", "Saldo inicial")
+
+    # ===== Día 2: Compra 1 (promediada) =====
+    comp1_u, comp1_pu = sc["comp1_u"], sc["comp1_pu"]
+    lote_compra = inv.entrada(comp1_u, comp1_pu)
+    fila("Día 2", "Compra 1", [(comp1_u, comp1_pu, comp1_u * comp1_pu)], lado="Entrada")
+
+    # ===== Día 3: Venta (al costo promedio vigente) =====
+    fila("Día 3", "Venta", inv.venta(sc["venta_u"]))
+
+    # ===== Día 4: Devolución de compra (sale del promedio, valorada al costo del lote comprado) =====
+    fila("Día 4", "Devolución de compra", inv.dev_compra(sc["dev_comp"], lote_compra))
+
+    # ===== Día 5: Devolución de venta (reingreso al costo de la venta original) =====
+    fila("Día 5", "Devolución de venta (reingreso)", inv.dev_venta(sc["dev_venta"]), lado="Entrada")
+
+    return rows
+
+# ---- Q4 abierta con IA ----
+def grade_open_q4(text: str, ask=safe_ia_feedback):
+    t = (text or "").strip()
+    tl = t.lower()
+
+    # Si está vacía de verdad, sí va mal
+    if len(t.split()) < 3:
+        return 0, "Escribe al menos una idea completa sobre devoluciones."
+
+    # Primer filtro local (rúbrica): si decide con confianza, no se llama a la IA
+    local = decision_local("n3_q4_devoluciones", t)
+    if local is not None:
+        ok, fb = local
+        return (1 if ok else 0), fb
+
+    prompt = (
+        "Evalúa de forma muy flexible. Si la respuesta tiene una idea contable coherente, considérala correcta. "
+        "No exijas redacción exacta ni tecnicismos. Prioriza comprensión general y da feedback amable."
+        "Evalúa SOLO sobre devoluciones y coherencia con el método (PP/PEPS/UEPS).\n"
+        "Sé MUY FLEXIBLE: aprueba si la respuesta tiene al menos una idea contable coherente "
+        "sobre devoluciones, CMV, saldo, costo unitario o efecto en compras/ventas.\n"
+        "Primera línea EXACTA: 'SCORE: 1' o 'SCORE: 0'. Luego 2–4 líneas de feedback docente.\n\n"
+        f"RESPUESTA:\n{t}"
+    )
+
+    st.session_state.pop("n3_ai_rate_limited", None)
+    raw = ask(prompt, default="")
+    sraw = str(raw or "")
+    first = sraw.strip().splitlines()[0].strip() if sraw.strip() else ""
+    ai_score = 1 if first.upper().endswith("1") else 0
+    fb = "\n".join(sraw.strip().splitlines()[1:]).strip()
+
+    # Heurística MUY LAXA
+    kws = ["devol", "cmv", "compra", "venta", "inventario", "saldo", "costo", "unitario"]
+    heuristic_ok = any(k in tl for k in kws)
+
+    rate_limited = bool(st.session_state.get("n3_ai_rate_limited", False))
+    ai_failed = (not sraw.strip()) or rate_limited
+
+    # En examen, si IA falla -> punto bueno
+    score1 = 1 if (heuristic_ok or ai_score == 1 or ai_failed) else 0
+
+    if not fb:
+        fb = (
+            "Tu respuesta se acepta. Procura relacionar la devolución con el CMV, "
+            "el inventario o el costo unitario según el método."
+        )
+
+    banned_student = ["activo = pasivo + patrimonio", "ecuación contable"]
+    if any(b in tl for b in banned_student) and not heuristic_ok:
+        score1 = 0
+        fb = _on_topic_fallback_q4()
+
+    return score1, fb
+
+# ===========================
+# NIVEL 3 (Devoluciones)
+# ===========================
+def page_level3(username):
+    st.title("Nivel 3 · Casos con Devoluciones (compras y ventas)")
+
+    progress_col = st.session_state.get("progress_col")
+    set_current_level(progress_col, username, "level3")
+
+    tabs = st.tabs(["🎧 Teoría", "🛠 Ejemplos guiados", "🎮 Práctica (IA)", "🏁 Evaluación para aprobar"])
+
+    # =========================================
+    # TAB 0 · TEORÍA
+    # =========================================
+    with tabs[0]:
+        st.subheader("Teoría · Devoluciones en compras y ventas (PP, PEPS y UEPS)")
+
+        intro = """
+    En inventarios, las **devoluciones** ajustan movimientos ya registrados y afectan directamente el **Costo de la Mercancía Vendida (CMV)** y la utilidad del periodo. 
+    Hay dos tipos: **devoluciones en compras** (a proveedor) y **devoluciones en ventas** (del cliente a la empresa). 
+    Comprender su tratamiento —siempre consistente con el método de valoración (Promedio, PEPS, UEPS)— evita distorsiones en los estados financieros.
+    """
+        st.markdown(intro)
+
+        st.markdown("### 🛒 Devoluciones en compras")
+        st.markdown(
+            "- **Qué son:** mercancía que la empresa **devuelve al proveedor** (defecto, exceso, inconformidad).  \n"
+            "- **Efecto contable:** **disminuyen** el total de compras; por ende, reducen el **pool** de costo disponible para vender.  \n"
+            "- **Compras netas:** se calculan restando las devoluciones de las compras brutas."
+        )
+        st.markdown("**Fórmula:**")
+        st.latex(r"\text{Compras netas} \;=\; \text{Compras brutas} \;-\; \text{Devoluciones en compras}")
+
+        st.markdown("---")
+        st.markdown("### 🧾 Devoluciones en ventas")
+        st.markdown(
+            "- **Qué son:** el **cliente devuelve** unidades previamente vendidas; estas **reingresan al inventario**.  \n"
+            "- **Efecto en el CMV:** el reingreso **reduce el CMV neto** del periodo (parte del costo reconocido como vendido regresa al inventario).  \n"
+            "- **¿Cómo se valora el reingreso?** Siempre debe hacerse al **mismo costo con el que salieron** esas unidades, de forma coherente con el método aplicado."
+        )
+        st.markdown(
+            "  - **Promedio Ponderado (PP):** las devoluciones revierten el **costo promedio** que se usó en la operación original "
+            "(no el promedio vigente en una fecha distinta). Ese costo se suma de nuevo al inventario y se recalcula un **nuevo promedio**.\n"
+            "  - **PEPS (FIFO):** se respeta la cronología: las primeras capas son las que salen primero; las devoluciones se reconocen con "
+            "los **costos de esas mismas capas** desde las que se originó la venta.\n"
+            "  - **UEPS (LIFO):** salen primero las capas más recientes; las devoluciones se reconocen con los **costos de las capas recientes** "
+            "que dieron origen a la salida."
+        )
+
+        st.markdown("**Relación simple con el CMV neto:**")
+        st.latex(r"\text{COGS neto} \;\approx\; \text{COGS bruto} \;-\; \text{Costo de unidades devueltas (reingresadas)}")
+
+        st.markdown("---")
+        st.markdown("### 🔎 Coherencia con el método (PP, PEPS, UEPS)")
+        st.markdown(
+            "- **PP:** todo se valora a un **costo promedio**; las devoluciones en ventas **revierten el mismo promedio** que se usó para el CMV "
+            "de la venta original y, al reingresar, se recalcula un **nuevo promedio** del saldo.\n"
+            "- **PEPS:** se respeta la **cronología**: las primeras capas (más antiguas) son las que salen primero; las devoluciones en ventas "
+            "se reconocen con los **costos de esas mismas capas** de donde salieron.\n"
+            "- **UEPS:** salen primero las capas más recientes; las devoluciones en ventas se reconocen con los **costos de las capas recientes** "
+            "que originaron la salida.\n"
+            "- **Nota en Colombia:** el **UEPS no es aceptado fiscalmente**, pero se usa en análisis internos o ejercicios académicos."
+        )
+
+        st.markdown("---")
+        st.markdown("### 💡 Idea clave")
+        st.markdown(
+            "Registra siempre las devoluciones de forma **consistente con el método de inventario** y al **costo con el que salieron**. "
+            "Así mantienes el **CMV**, el **saldo de inventario** y la **utilidad** correctamente medidos, "
+            "facilitando decisiones y la comparabilidad entre periodos."
+        )
+
+        with st.expander("🔊 Escuchar explicación"):
+            full_text = "\n\n".join([
+                intro.strip(),
+                "Devoluciones en compras: disminuyen las compras y el pool de costo disponible.",
+                "Devoluciones en ventas: reingresan unidades al costo con el que salieron y reducen el COGS neto.",
+                "Coherencia con PP/PEPS/UEPS y nota sobre UEPS en Colombia.",
+                "Idea clave: consistencia en el costo aplicado a la salida y a la devolución."
+            ])
+            speak_block(full_text, key_prefix="teo-n3", lang_hint="es")
+
+    # =========================================
+    # TAB 1 · EJEMPLO GUIADO (KARDEX DINÁMICO)
+    # =========================================
+    with tabs[1]:
+        st.subheader("KARDEX dinámico con devoluciones (PP · PEPS · UEPS)")
+        st.caption(
+            "Días 1–3 prellenados según el método. "
+            "La demostración narrada se centra en el Día 4 (devolución de compra) y Día 5 (devolución de venta)."
+        )
+
+        # ========= Parámetros del escenario =========
+        st.markdown("#### Parámetros del escenario")
+
+        st.markdown("**Método de valoración**")
+        metodo = st.selectbox(
+            "Método",
+            ["Promedio Ponderado", "PEPS (FIFO)", "UEPS (LIFO)"],
+            key="n3_kx_met",
+            label_visibility="collapsed",
+        )
+
+        # Días 1–3
+        st.markdown("📦 **Día 1.** Saldo inicial:")
+        c1a, c1b = st.columns([1, 1], gap="small")
+        with c1a:
+            inv0_u = st.number_input(
+                "Cantidad (u)", min_value=0, value=100, step=10, key="n3_kx_inv_u"
+            )
+        with c1b:
+            inv0_pu = st.number_input(
+                "Costo unitario ($/u)",
+                min_value=0.0,
+                value=10.0,
+                step=0.5,
+                key="n3_kx_inv_pu",
+            )
+
+        st.markdown("🛒 **Día 2.** Compra:")
+        c2a, c2b = st.columns([1, 1], gap="small")
+        with c2a:
+            comp_u = st.number_input(
+                "Compra (u)", min_value=0, value=60, step=10, key="n3_kx_comp_u"
+            )
+        with c2b:
+            comp_pu = st.number_input(
+                "Costo compra ($/u)",
+                min_value=0.0,
+                value=12.0,
+                step=0.5,
+                key="n3_kx_comp_pu",
+            )
+
+        st.markdown("💰 **Día 3.** Venta:")
+        venta_u = st.number_input(
+            "Venta (u)", min_value=0, value=120, step=10, key="n3_kx_venta_u"
+        )
+
+        st.markdown("---")
+        st.markdown("↩️ **Día 4.** Devolución de compra (a proveedor):")
+        dev_comp_u = st.number_input(
+            "Unidades devueltas al proveedor",
+            min_value=0,
+            value=10,
+            step=5,
+            key="n3_kx_dev_comp_u",
+        )
+        st.caption(
+            "La devolución se valora al **mismo costo unitario de la compra original**. "
+            "En PP ajusta el promedio; en PEPS/UEPS se retiran unidades de la capa de esa compra."
+        )
+
+        st.markdown("↪️ **Día 5.** Devolución de venta (del cliente):")
+        dev_venta_u = st.number_input(
+            "Unidades devueltas por el cliente",
+            min_value=0,
+            value=8,
+            step=2,
+            key="n3_kx_dev_venta_u",
+        )
+        st.caption(
+            "La devolución se valora al **mismo costo unitario con el que salieron en la venta original**. "
+            "En PEPS/UEPS se reingresan a esa misma capa, sin promediar."
+        )
+
+        st.markdown("---")
+        st.markdown("### 🎬 Demostración narrada (arranca en Día 4 y 5)")
+
+        c_demo_a, c_demo_b = st.columns([1, 1])
+        with c_demo_a:
+            narr_speed = st.slider(
+                "Velocidad de narración", 0.75, 1.50, 1.00, 0.05, key="n3_kx_rate"
+            )
+        with c_demo_b:
+            narr_muted = st.toggle(
+                "Silenciar voz", value=False, key="n3_kx_mute"
+            )
+
+        # Llamada
+        demo_rows, demo_script, narr_start_idx = compute_rows_and_script_with_returns(
+            metodo,
+            inv0_u,
+            inv0_pu,
+            comp_u,
+            comp_pu,
+            venta_u,
+            dev_comp_u,
+            dev_venta_u,
+        )
+
+        # ========= HTML + JS de la demo narrada =========
+        html_demo_template = """
+        <style>
+        .kx {border-collapse:collapse;width:100%;font-size:14px;margin-bottom:6px}
+        .kx th,.kx td {border:1px solid #eaeaea;padding:6px 8px;text-align:center}
+        .kx thead th {background:#f8fafc;font-weight:600}
+        .kx .hi {background:#fff7e6;box-shadow:inset 0 0 0 9999px rgba(255,165,0,0.08)}
+        .fill {transition: background 0.3s, color 0.3s}
+        .controls {display:flex;gap:8px;align-items:center;margin:6px 0}
+        .badge {display:inline-block;background:#eef;border:1px solid #dde;padding:2px 8px;border-radius:12px;font-size:12px}
+        .btn {padding:6px 10px; border:1px solid #ddd; background:#fafafa; cursor:pointer; border-radius:6px;}
+        .btn:hover {background:#f0f0f0}
+        .muted {color:#999}
+        #narr {margin-top:6px;font-size:15px}
+        </style>
+
+        <div class="controls">
+        <button id="playDemo" class="btn">▶️ Reproducir demo</button>
+        <button id="pauseDemo" class="btn">⏸️ Pausar</button>
+        <button id="resetDemo" class="btn">↺ Reiniciar</button>
+        <span class="badge">%%METODO%%</span>
+        </div>
+
+        <table class="kx" id="kxtable">
+        <thead>
+            <tr>
+            <th></th><th></th>
+            <th colspan="3">Entrada</th>
+            <th colspan="3">Salida</th>
+            <th colspan="3">Saldo</th>
+            </tr>
+            <tr>
+            <th>Fecha</th><th>Descripción</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            </tr>
+        </thead>
+        <tbody id="kbody"></tbody>
+        </table>
+        <div id="narr"></div>
+
+        <script>
+        (function(){
+        const rows     = %%ROWS%%;
+        const script   = %%SCRIPT%%;
+        const metodo   = "%%METODO%%";
+        const narrStart = %%NARRSTART%%;
+        const narrMuted = %%MUTED%%;
+        const rate     = %%RATE%%;
+
+        const tbody    = document.getElementById("kbody");
+        const narrDiv  = document.getElementById("narr");
+        const btnPlay  = document.getElementById("playDemo");
+        const btnPause = document.getElementById("pauseDemo");
+        const btnReset = document.getElementById("resetDemo");
+
+        let isPaused   = false;
+        let isRunning  = false;
+
+        const pesos = (v)=> {
+            try { return new Intl.NumberFormat('es-CO',{style:'currency', currency:'COP', maximumFractionDigits:2}).format(v); }
+            catch(e){ return "$"+(Math.round(v*100)/100).toLocaleString('es-CO'); }
+        };
+
+        const fmt = (x)=> (x===null || x===undefined || x==="")
+            ? ""
+            : (typeof x==="number"
+                ? (Number.isInteger(x)? x.toString() : (Math.round(x*100)/100).toString().replace(".",","))
+                : x);
+
+        function buildTable(){
+            tbody.innerHTML = "";
+            rows.forEach((r, i)=>{
+                const tr = document.createElement("tr");
+                tr.id = "row"+i;
+
+                const isNarr = (i >= narrStart);
+
+                const ent_q   = isNarr ? "" : fmt(r.ent_q);
+                const ent_pu  = isNarr ? "" : (r.ent_pu!==null && r.ent_pu!==undefined ? pesos(r.ent_pu): "");
+                const ent_tot = isNarr ? "" : (r.ent_tot!==null && r.ent_tot!==undefined ? pesos(r.ent_tot): "");
+
+                const sal_q   = isNarr ? "" : fmt(r.sal_q);
+                const sal_pu  = isNarr ? "" : (r.sal_pu!==null && r.sal_pu!==undefined ? pesos(r.sal_pu): "");
+                const sal_tot = isNarr ? "" : (r.sal_tot!==null && r.sal_tot!==undefined ? pesos(r.sal_tot): "");
+
+                const sdo_q   = isNarr ? "" : fmt(r.sdo_q);
+                const sdo_pu  = isNarr ? "" : (r.sdo_pu!==null && r.sdo_pu!==undefined ? pesos(r.sdo_pu): "");
+                const sdo_tot = isNarr ? "" : (r.sdo_tot!==null && r.sdo_tot!==undefined ? pesos(r.sdo_tot): "");
+
+                tr.innerHTML = `
+                    <td>${r.fecha}</td><td>${r.desc}</td>
+                    <td id="r${i}_ent_q"  class="fill">${ent_q}</td>
+                    <td id="r${i}_ent_pu" class="fill">${ent_pu}</td>
+                    <td id="r${i}_ent_tot"class="fill">${ent_tot}</td>
+                    <td id="r${i}_sal_q"  class="fill">${sal_q}</td>
+                    <td id="r${i}_sal_pu" class="fill">${sal_pu}</td>
+                    <td id="r${i}_sal_tot"class="fill">${sal_tot}</td>
+                    <td id="r${i}_sdo_q"  class="fill">${sdo_q}</td>
+                    <td id="r${i}_sdo_pu" class="fill">${sdo_pu}</td>
+                    <td id="r${i}_sdo_tot"class="fill">${sdo_tot}</td>
+                `;
+                tbody.appendChild(tr);
+            });
+        }
+
+        function clearHi(){
+            [...tbody.querySelectorAll("tr")].forEach(tr=> tr.classList.remove("hi"));
+        }
+        function highlightRow(i){
+            clearHi();
+            const tr = document.getElementById("row"+i);
+            if (tr) tr.classList.add("hi");
+        }
+        function fillCell(rowIdx, key, val, money=false){
+            const el = document.getElementById(`r${rowIdx}_${key}`);
+            if (!el) return;
+            el.textContent = money ? pesos(val) : fmt(val);
+            el.style.background = "#fffbe6";
+            setTimeout(()=>{ el.style.background=""; }, 300);
+        }
+
+        const sleep = (ms)=> new Promise(r => setTimeout(r, ms));
+
+        async function waitIfPaused(){
+            while(isPaused){
+                await sleep(150);
+            }
+        }
+
+        function speak(text){
+            return new Promise((resolve)=>{
+                if (narrMuted) return resolve();
+                try{
+                    if (window.speechSynthesis.speaking) window.speechSynthesis.cancel();
+                    const u = new SpeechSynthesisUtterance(text);
+                    const voices = window.speechSynthesis.getVoices();
+                    const pick = voices.find(v => /es|spanish|mex|col/i.test((v.name+" "+v.lang))) || voices[0];
+                    if (pick) u.voice = pick;
+                    u.rate = rate;
+                    u.pitch = 1.0;
+                    u.onend = ()=> resolve();
+                    window.speechSynthesis.speak(u);
+                } catch(e){
+                    resolve();
+                }
+            });
+        }
+
+        async function runScript(){
+            if (isRunning) return;
+
+            isRunning = true;
+            isPaused = false;
+            btnPause.textContent = "⏸️ Pausar";
+
+            buildTable();
+            clearHi();
+            narrDiv.textContent = "";
+
+            for (let sIdx = 0; sIdx < script.length; sIdx++){
+                const step = script[sIdx];
+                await waitIfPaused();
+
+                narrDiv.textContent = step.title;
+
+                if (step.actions && step.actions.length>0){
+                    highlightRow(step.actions[0].row);
+                }
+
+                const dur = Math.max(2200, Math.min(7000, step.text.length * 55 / rate));
+                const chunks = Math.max(3, step.actions.length);
+                const waits = Array.from({length:chunks-1}, (_,k)=> Math.floor(dur*(k+1)/chunks));
+
+                const pVoice = speak(step.text);
+
+                for (let i=0;i<step.actions.length;i++){
+                    await waitIfPaused();
+                    const a = step.actions[i];
+                    if (i>0){ await sleep(waits[i-1]); }
+                    fillCell(a.row, a.cell, a.val, !!a.money);
+                }
+
+                await pVoice;
+                await waitIfPaused();
+                await sleep(200);
+            }
+
+            clearHi();
+            isRunning = false;
+        }
+
+        btnPlay.onclick = runScript;
+
+        btnPause.onclick = ()=>{
+            if (!isRunning) return;
+            if (!isPaused){
+                isPaused = true;
+                if (window.speechSynthesis && window.speechSynthesis.speaking){
+                    window.speechSynthesis.pause();
+                }
+                btnPause.textContent = "▶️ Reanudar";
+            } else {
+                isPaused = false;
+                if (window.speechSynthesis && window.speechSynthesis.paused){
+                    window.speechSynthesis.resume();
+                }
+                btnPause.textContent = "⏸️ Pausar";
+            }
+        };
+
+        btnReset.onclick = ()=>{
+            try{ if (window.speechSynthesis) window.speechSynthesis.cancel(); }catch(e){}
+            isPaused = false;
+            isRunning = false;
+            btnPause.textContent = "⏸️ Pausar";
+            buildTable();
+            clearHi();
+            narrDiv.textContent = "";
+        };
+
+        buildTable();
+        })();
+        </script>
+        """
+
+        html_demo = (
+            html_demo_template.replace("%%ROWS%%", _json.dumps(demo_rows))
+            .replace("%%SCRIPT%%", _json.dumps(demo_script))
+            .replace("%%METODO%%", metodo)
+            .replace("%%NARRSTART%%", str(narr_start_idx))
+            .replace("%%MUTED%%", "true" if narr_muted else "false")
+            .replace("%%RATE%%", str(narr_speed))
+        )
+
+        components.html(html_demo, height=360, scrolling=True)
+
+    # =========================================
+    # TAB 2 · PRÁCTICA IA (KARDEX DÍAS 1–5)
+    # =========================================
+    with tabs[2]:
+        st.subheader("Práctica IA: diligencia tu propio KARDEX (Nivel 3)")
+        st.caption("Completa TODAS las filas. Deja en BLANCO las celdas que no aplican en cada fila. Secuencia: Día 1 a Día 5.")
+
+        _ensure_default_state()
+
+        if st.session_state.get("n2_ex_rand_request", False):
+            _randomize_scenario_values()
+            st.session_state.pop("n2_ex_rand_request", None)
+            st.rerun()
+
+        # =========================
+        # Método
+        # =========================
+        c0a, c0b = st.columns([1, 3])
+        with c0a:
+            ex_metodo = st.selectbox(
+                "Método (ejercicio)",
+                ["Promedio Ponderado", "PEPS (FIFO)", "UEPS (LIFO)"],
+                key="n2_ex_metodo"
+            )
+
+        # =========================
+        # Escenario (textos solicitados)
+        # =========================
+        st.markdown("#### 🎯 Escenario del ejercicio")
+
+        st.markdown("**Día 1. La empresa reporta un saldo inicial de inventario de:**")
+        c1a, c1b = st.columns([1, 1])
+        with c1a:
+            inv0_u_ex = st.number_input("Cantidad (u) — Día 1", min_value=0, step=1, key="n2_ex_inv0_u")
+        with c1b:
+            inv0_pu_ex = st.number_input("Costo unitario — Día 1", min_value=0.0, step=0.1, key="n2_ex_inv0_pu")
+
+        st.markdown("**Día 2. La empresa realizó una compra de:**")
+        c2a, c2b = st.columns([1, 1])
+        with c2a:
+            comp1_u = st.number_input("Cantidad (u) — Día 2", min_value=0, step=1, key="n2_ex_comp1_u")
+        with c2b:
+            comp1_pu = st.number_input("Costo unitario — Día 2", min_value=0.0, step=0.1, key="n2_ex_comp1_pu")
+
+        st.markdown("**Día 3. La empresa realizó una venta de:**")
+        venta_ex_u = st.number_input("Cantidad vendida (u) — Día 3", min_value=0, step=1, key="n2_ex_venta_u")
+
+        st.markdown("**Día 4. La empresa realizó una devolución de compra (al proveedor) por:**")
+        dev_comp_u = st.number_input("Unidades devueltas al proveedor (u) — Día 4", min_value=0, step=1, key="n2_ex_dev_comp_u")
+
+        st.markdown("**Día 5. La empresa recibió una devolución de venta (del cliente) por:**")
+        dev_venta_u = st.number_input("Unidades devueltas por el cliente (u) — Día 5", min_value=0, step=1, key="n2_ex_dev_venta_u")
+
+        st.button("🎲 Generar escenario aleatorio", key="n2_ex_rand_btn", on_click=_request_randomize)
+
+        expected_rows = build_expected_rows(
+            ex_metodo, inv0_u_ex, inv0_pu_ex, comp1_u, comp1_pu, venta_ex_u, dev_comp_u, dev_venta_u
+        )
+
+        # =========================
+        # Editor: tabla COMPLETAMENTE EN BLANCO
+        # =========================
+        df_for_editor = expected_rows.en_blanco()
+
+        col_config = {
+            "Fecha": st.column_config.TextColumn(disabled=True),
+            "Descripción": st.column_config.TextColumn(disabled=True),
+            "Entrada_cant": st.column_config.NumberColumn(step=1, help="Unidades que ingresan"),
+            "Entrada_pu": st.column_config.NumberColumn(step=0.01, help="Costo unitario de la entrada"),
+            "Entrada_total": st.column_config.NumberColumn(step=0.01, help="Valor total de la entrada"),
+            "Salida_cant": st.column_config.NumberColumn(step=1, help="Unidades que salen"),
+            "Salida_pu": st.column_config.NumberColumn(step=0.01, help="Costo unitario de la salida"),
+            "Salida_total": st.column_config.NumberColumn(step=0.01, help="Valor total de la salida"),
+            "Saldo_cant": st.column_config.NumberColumn(step=1, help="Unidades en saldo"),
+            "Saldo_pu": st.column_config.NumberColumn(step=0.01, help="Costo unitario del saldo"),
+            "Saldo_total": st.column_config.NumberColumn(step=0.01, help="Valor total del saldo"),
+        }
+
+        st.markdown("#### ✍️ Completa TODAS las filas (Días 1–5)")
+        st.caption("Deja en BLANCO las celdas que no aplican (por ejemplo, Entradas en una fila de Venta).")
+        edited = st.data_editor(
+            df_for_editor,
+            use_container_width=True,
+            num_rows="fixed",
+            disabled=False,
+            column_config=col_config,
+            hide_index=True,
+            key="n2_kardex_student_table_lvl2"
+        )
+
+        # =========================
+        # Validación
+        # =========================
+        with st.form("n2_kardex_check_lvl2"):
+            ask_ai = st.checkbox("💬 Retroalimentación de IA (opcional)", value=False, key="n2_kardex_ai_lvl2")
+            submitted_ex = st.form_submit_button("✅ Validar mi KARDEX")
+
+        if submitted_ex:
+            tol = 0.5
+
+            # Celdas exigidas (máscara de la tabla esperada) a ±tol, todas las filas a la vez
+            flags = list(zip(expected_rows.etiquetas(), expected_rows.validar(edited, tol)))
+
+            aciertos = sum(1 for _, ok in flags if ok)
+            st.metric("Aciertos por fila", f"{aciertos}/{len(flags)}")
+            for label, ok in flags:
+                st.write(("✅ " if ok else "❌ ") + label)
+
+            if aciertos == len(flags):
+                st.success("¡Excelente! Tu KARDEX coincide con el método y el tratamiento correcto de las devoluciones.")
+            else:
+                st.warning("Hay diferencias. Revisa cantidades, costos unitarios, devoluciones y el método aplicado en cada día.")
+
+            if ask_ai:
+                intento = describir_filas(edited.iloc[:len(expected_rows)])
+
+                final_exp = expected_rows[-1]
+                exp_qtyF = final_exp["Saldo_cant"]
+                exp_valF = final_exp["Saldo_total"]
+                exp_puF = final_exp["Saldo_pu"]
+
+                sol_desc = (
+                    f"Método: {ex_metodo}. "
+                    f"Saldo final esperado: cant={exp_qtyF}, val={exp_valF}, pu={exp_puF}. "
+                    f"Filas esperadas: {len(expected_rows)}."
+                )
+
+                # Streaming: el texto aparece desde el primer token
+                with st.expander("💬 Retroalimentación de la IA", expanded=True):
+                    st.write_stream(ia_feedback_stream(
+                        "Evalúa el KARDEX diligenciado por el estudiante (Días 1–5). " + sol_desc +
+                        "\nEntradas del estudiante:\n" + intento +
+                        "\nIndica: (1) si respeta el método (PP/PEPS/UEPS) en compra, venta y devoluciones, "
+                        "(2) errores típicos (costo de devolución, promedio mal aplicado), "
+                        "(3) un tip memotécnico breve sobre devoluciones al costo de salida original."
+                    ))
+
+    with tabs[3]:
+        st.subheader("Evaluación final del Nivel 3")
+        st.caption("Debes acertar **5 de 5** para aprobar y avanzar.")
+
+        # =========================
+        # Q1–Q3: Selección múltiple + Q4 abierta + Q5 ejercicio
+        # =========================
+        with st.form("n3_eval_form_mcq"):
+            st.markdown("### Preguntas de selección múltiple")
+
+            q1 = st.radio(
+                "1) ¿Cuál de las siguientes afirmaciones describe correctamente una devolución en compras?",
+                [
+                    "a) Aumenta las compras brutas y el valor total del inventario.",
+                    "b) Disminuye las compras brutas y el costo total disponible para la venta.",
+                    "c) Aumenta el Costo de la Mercancía Vendida (CMV) del periodo.",
+                    "d) No afecta el inventario ni las compras netas.",
+                ],
+                index=None,
+                key="n3_q1"
+            )
+
+            q2 = st.radio(
+                "2) Bajo el método PEPS (FIFO), ¿cómo deben valorarse las unidades que regresan al inventario por una devolución en ventas?",
+                [
+                    "a) Al costo promedio vigente del inventario.",
+                    "b) Con el costo más reciente de compra.",
+                    "c) Con los costos de las primeras unidades que salieron (más antiguas).",
+                    "d) Con un costo determinado libremente por la empresa.",
+                ],
+                index=None,
+                key="n3_q2"
+            )
+
+            q3 = st.radio(
+                "3) ¿Cuál es el efecto de una devolución en ventas sobre el Costo de la Mercancía Vendida (CMV)?",
+                [
+                    "a) Incrementa el CMV neto del periodo.",
+                    "b) No tiene ningún efecto sobre el CMV.",
+                    "c) Disminuye el CMV neto del periodo porque parte del costo vendido regresa al inventario.",
+                    "d) Aumenta el CMV bruto y reduce la utilidad.",
+                ],
+                index=None,
+                key="n3_q3"
+            )
+
+            st.markdown("### Pregunta abierta")
+            q4_text = st.text_area(
+                "4) Explica por qué es importante registrar las devoluciones de forma coherente con el método (PP, PEPS o UEPS), y qué consecuencias tendría hacerlo mal en los estados financieros.",
+                height=140,
+                key="n3_q4"
+            )
+
+            ask_ai_q4 = st.checkbox("💬 Pedir feedback SOLO para la pregunta 4 (opcional)", key="n3_eval_ai_q4", value=False)
+
+            st.markdown("### Ejercicio tipo práctica (Promedio Ponderado)")
+            st.caption("**Q5**: Completa el KARDEX D1–D5. Tabla completamente en blanco. **Método: Promedio Ponderado**.")
+
+            # ===== Escenario Q5 (mostrado al estudiante) =====
+            _sc = q5_scenario()
+            _sig = _scenario_signature(_sc)
+
+            st.markdown(
+                f"""
+    **Escenario — Empresa “Comercial ABC S.A.S.”**
+
+    La empresa comercializa bolsos y registró las siguientes transacciones durante la semana:
+
+    - **Día 1:** La empresa reporta un saldo inicial de **{_sc['inv0_u']} unidades** de bolsos a **${_sc['inv0_pu']:.2f}** cada una.  
+    - **Día 2:** Realizó una **compra** de **{_sc['comp1_u']} unidades** a **${_sc['comp1_pu']:.2f}** cada una.  
+    - **Día 3:** Efectuó una **venta** de **{_sc['venta_u']} unidades**.  
+    - **Día 4:** Se efectuó una **devolución en compra** de **{_sc['dev_comp']} unidades**, por defectos de fábrica.  
+    - **Día 5:** Un cliente realizó una **devolución en venta** de **{_sc['dev_venta']} unidades**, que regresan al inventario.
+
+    Completa el **KARDEX** registrando todas las operaciones en orden cronológico, aplicando el **método Promedio Ponderado**.
+    """
+            )
+
+            # Filas esperadas (para validar luego)
+            expected_rows_q5 = build_expected_rows_q5_pp(_sc, _sig)
+
+            # DF vacío para el editor
+            df_q5_blank = expected_rows_q5.en_blanco()
+
+            tail_col_config = {
+                "Fecha":        st.column_config.TextColumn(disabled=True),
+                "Descripción":  st.column_config.TextColumn(disabled=True),
+                "Entrada_cant": st.column_config.NumberColumn(step=1, help="Unidades que ingresan"),
+                "Entrada_pu":   st.column_config.NumberColumn(step=0.01, help="Costo unitario de la entrada"),
+                "Entrada_total":st.column_config.NumberColumn(step=0.01, help="Valor total de la entrada"),
+                "Salida_cant":  st.column_config.NumberColumn(step=1, help="Unidades que salen"),
+                "Salida_pu":    st.column_config.NumberColumn(step=0.01, help="Costo unitario de la salida"),
+                "Salida_total": st.column_config.NumberColumn(step=0.01, help="Valor total de la salida"),
+                "Saldo_cant":   st.column_config.NumberColumn(step=1, help="Unidades en saldo"),
+                "Saldo_pu":     st.column_config.NumberColumn(step=0.01, help="Costo unitario del saldo"),
+                "Saldo_total":  st.column_config.NumberColumn(step=0.01, help="Valor total del saldo"),
+            }
+
+            edited_q5 = st.data_editor(
+                df_q5_blank,
+                use_container_width=True,
+                num_rows="fixed",
+                column_config=tail_col_config,
+                hide_index=True,
+                key="n3_q5_editor_v3"
+            )
+
+            submitted = st.form_submit_button("🧪 Enviar evaluación")
+
+        # =========================
+        # Corrección y resultado
+        # =========================
+        if submitted:
+            correct = {
+                "n3_q1": "b) Disminuye las compras brutas y el costo total disponible para la venta.",
+                "n3_q2": "c) Con los costos de las primeras unidades que salieron (más antiguas).",
+                "n3_q3": "c) Disminuye el CMV neto del periodo porque parte del costo vendido regresa al inventario.",
+            }
+            answers = {"n3_q1": q1, "n3_q2": q2, "n3_q3": q3}
+            q1_ok = (answers["n3_q1"] == correct["n3_q1"])
+            q2_ok = (answers["n3_q2"] == correct["n3_q2"])
+            q3_ok = (answers["n3_q3"] == correct["n3_q3"])
+
+            # Plazo único: si la IA no responde a tiempo se califica con la heurística local
+            q4_score1, q4_fb = grade_open_answers(
+                jobs={"q4": lambda: grade_open_q4(q4_text or "")},
+                fallbacks={"q4": lambda: grade_open_q4(q4_text or "", ask=lambda prompt, default="": default)},
+            )["q4"]
+
+            if ask_ai_q4:
+                q4_fb = _sanitize_on_topic_q4(q4_fb)
+            else:
+                q4_fb = ""
+
+            # ---- Q5 validación con detalle de errores ----
+            TOL = 0.5
+            q5_errors = [
+                f"Fila {i+1} ({fecha} - {desc}) | {k}: ingresado={usr_val} | esperado={exp_val}"
+                for i, fecha, desc, k, usr_val, exp_val in expected_rows_q5.diferencias(edited_q5, TOL)
+            ]
+            q5_ok = not q5_errors
+
+            total_hits = int(q1_ok) + int(q2_ok) + int(q3_ok) + int(q4_score1) + int(q5_ok)
+            passed = (total_hits == 5)
+
+            try:
+                record_attempt(username, level=3, score=total_hits, passed=passed)
+            except Exception:
+                pass
+
+            st.markdown("### Resultado")
+            cA, cB = st.columns(2)
+            with cA: st.metric("Aciertos", f"{total_hits}/5")
+            with cB: st.metric("Estado", "APROBADO ✅" if passed else "NO APROBADO ❌")
+
+            with st.expander("Detalle de corrección"):
+                st.write(f"**Q1:** {'✅' if q1_ok else '❌'}")
+                st.write(f"**Q2:** {'✅' if q2_ok else '❌'}")
+                st.write(f"**Q3:** {'✅' if q3_ok else '❌'}")
+                st.write(f"**Q4 (abierta):** {'✅' if q4_score1==1 else '❌'}")
+                if ask_ai_q4 and q4_fb:
+                    st.write("**Feedback Q4 (IA):**")
+                    st.write(q4_fb)
+                st.write(f"**Q5 (KARDEX PP):** {'✅' if q5_ok else '❌'}")
+
+                if not q5_ok:
+                    st.warning("Errores encontrados en la tabla del KARDEX:")
+                    for err in q5_errors:
+                        st.write("- " + err)
+
+                    st.caption(
+                        "Revisa especialmente el costo correcto de la devolución, "
+                        "el saldo después de cada operación y el valor total esperado en cada fila."
+                    )
+
+            if passed:
+                try:
+                    set_level_passed(st.session_state.get('progress_col'), username, "level3", total_hits)
+                except Exception:
+                    pass
+
+                st.success("🎉 ¡Aprobaste la Evaluación del Nivel 3! Avanzas al siguiente módulo.")
+
+                try:
+                    st.session_state["sidebar_next_select"] = "Nivel 4: Estado de Resultados"
+
+                    # NUEVO: puntaje y respuestas correctas para la pantalla de celebración
+                    st.session_state["celebrate_score_text"] = f"{total_hits}/5"
+                    st.session_state["celebrate_answers_title"] = "✅ Respuestas correctas del Nivel 3"
+                    st.session_state["celebrate_answers"] = [
+                        "1) Selección múltiple: la respuesta correcta explicaba que una devolución en compras reduce el valor de las compras y el costo de la mercancía disponible para la venta.",
+                        "2) Selección múltiple: la opción correcta indicaba que una devolución en ventas disminuye los ingresos por ventas del periodo.",
+                        "3) Selección múltiple: la opción correcta identificaba que las devoluciones afectan tanto el inventario como el resultado del periodo dependiendo de si son compras o ventas.",
+                        "4) Pregunta abierta: era válida una respuesta que explicara correctamente el efecto contable de las devoluciones en compras o en ventas sobre el inventario, el CMV o la utilidad.",
+                        "5) Ejercicio KARDEX (Promedio Ponderado): diligenciaste correctamente la tabla considerando la compra, la venta y las devoluciones en compras y ventas."
+                    ]
+
+                    start_celebration(
+                        message_md=(
+                            "<b>¡Nivel 3 aprobado!</b> 🎉<br><br>"
+                            f"<b>Aciertos:</b> {total_hits}/5<br><br>"
+                            "Ya comprendes el efecto de las <b>devoluciones</b>. "
+                            "Ahora vamos al <b>Estado de Resultados</b>."
+                        ),
+                        next_label="Ir al Nivel 4",
+                        next_key_value="Nivel 4: Estado de Resultados"
+                    )
+                except Exception:
+                    pass
+            else:
+                st.error("No aprobado. Debes acertar 5/5. Repasa la lógica de devoluciones y vuelve a intentar.")
@@ -0,0 +1,2157 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Nivel 4: Estado de Resultados
+# =========================================================
+
+import json as _json
+import math
+import os
+import random
+
+import numpy as np
+import pandas as pd
+import pandas as _pd
+import streamlit as st
+import streamlit.components.v1 as components
+
+from inventory_engine import InventarioTrazable, normalizar_metodo
+from kardex_batch import METODOS, malla_pyg
+from kardex_table import KardexTabla
+from ia import grade_open_answers, ia_feedback_or_default, ia_feedback_stream
+from resources import rx
+from rubric_classifier import decision_local
+from storage import record_attempt, set_current_level, set_level_passed
+from ui_common import speak_block, start_celebration
+
+# ===========================
+# Helpers de escenarios aleatorios estables
+# ===========================
+def n4_new_case():
+    st.session_state.n4_ventas   = random.randint(8000, 20000)
+    st.session_state.n4_dev_vtas = random.randint(0, 1200)
+    st.session_state.n4_cogs     = random.randint(4000, 12000)
+    st.session_state.n4_gastos   = random.randint(1000, 5000)
+
+# ===========================
+# Sensibilidad del Estado de Resultados (malla vectorizada)
+# ===========================
+N4_SENS_PRECIOS = 50       # puntos del eje precio de venta
+N4_SENS_TASAS = 51         # tasa de impuesto 0 %–50 % (mismo rango que el slider)
+N4_SENS_DEVOLUCIONES = 10  # niveles de devolución en ventas (0 … unidades vendidas)
+# Cada malla ocupa ~0,6 MB (3 métodos × P × T × D float64) y la firma cambia con
+# cada escenario aleatorio: se acota el caché en entradas y en tiempo de vida
+N4_SENS_CACHE_MAX = int(os.getenv("N4_SENS_CACHE_MAX", "32"))
+N4_SENS_CACHE_TTL_S = int(os.getenv("N4_SENS_CACHE_TTL_S", "3600"))
+
+
+def _n4_paso_precio(tope: float) -> float:
+    """Paso "redondo" (1, 2, 5 × 10^k) para que el eje de precios caiga en valores legibles."""
+    bruto = max(tope, 1.0) / N4_SENS_PRECIOS
+    base = 10 ** math.floor(math.log10(bruto))
+    return next(m * base for m in (1, 2, 5, 10) if m * base >= bruto)
+
+
+@st.cache_data(show_spinner=False, max_entries=N4_SENS_CACHE_MAX, ttl=N4_SENS_CACHE_TTL_S)
+def n4_malla_sensibilidad(inv0_u, inv0_pu, comp1_u, comp1_pu, venta_u, dev_comp,
+                          paso_precio, gastos_op, otros_ingresos, otros_egresos):
+    """
+    Utilidad neta sobre precio × tasa × devolución en ventas × método en una
+    sola pasada vectorizada. Los argumentos son la firma del escenario: mover
+    la tasa, el precio dentro del eje o la devolución elegida no recalcula.
+    Devuelve (precios, tasas, devoluciones, {'PP': (P, T, D), 'PEPS': ..., 'UEPS': ...}).
+    """
+    precios = paso_precio * np.arange(1, N4_SENS_PRECIOS + 1)
+    tasas = np.arange(N4_SENS_TASAS) / 100.0
+    devoluciones = np.unique(np.linspace(0, venta_u, N4_SENS_DEVOLUCIONES).round())
+    malla = malla_pyg(
+        precios, tasas, devoluciones,
+        inv0_u=inv0_u, inv0_pu=inv0_pu, comp1_u=comp1_u, comp1_pu=comp1_pu, venta_u=venta_u,
+        dev_comp=dev_comp, gastos_op=gastos_op, otros_ingresos=otros_ingresos, otros_egresos=otros_egresos,
+    )
+    return precios, tasas, devoluciones, {m: np.ascontiguousarray(z) for m, z in malla.items()}
+
+
+def n4_sensibilidad(esc: dict, metodo: str):
+    """Mapas de calor de la utilidad neta para el escenario del ejemplo guiado."""
+    import altair as alt
+
+    st.markdown("### 🌡️ Sensibilidad: ¿cómo responde la utilidad neta?")
+    st.caption(
+        "Cada mapa evalúa el Estado de Resultados completo para muchos precios de venta y tasas de impuesto "
+        "(con la devolución en ventas elegida). Verde = utilidad, rojo = pérdida; el punto negro es tu escenario."
+    )
+
+    q_disp = esc["inv0_u"] + esc["comp1_u"]
+    costo = (esc["inv0_u"] * esc["inv0_pu"] + esc["comp1_u"] * esc["comp1_pu"]) / q_disp if q_disp > 0 else 0.0
+    paso = _n4_paso_precio(max(3.0 * costo, 1.25 * esc["p_venta"]))
+    gastos = lambda clave: float(sum(v for _, v in esc[clave]))  # noqa: E731
+    precios, tasas, devs, malla = n4_malla_sensibilidad(
+        esc["inv0_u"], esc["inv0_pu"], esc["comp1_u"], esc["comp1_pu"], esc["venta_u"], esc["dev_comp"],
+        paso, gastos("gastos_operativos"), gastos("otros_ingresos"), gastos("otros_egresos"),
+    )
+
+    opciones = [int(d) for d in devs]
+    dev_sel = st.select_slider(
+        "Devolución en ventas (u) para los mapas",
+        options=opciones,
+        value=opciones[int(np.abs(devs - esc["dev_vent"]).argmin())],
+        key="n4_sens_dev",
+    )
+    k = opciones.index(dev_sel)
+    i_p = int(np.abs(precios - esc["p_venta"]).argmin())
+    i_t = int(np.abs(tasas - esc["tasa_impuesto"]).argmin())
+
+    # Una escala de color común (centrada en 0) para comparar los métodos
+    tope = max(float(np.abs(z[:, :, k]).max()) for z in malla.values()) or 1.0
+    escala = alt.Scale(scheme="redyellowgreen", domain=[-tope, tope], domainMid=0)
+    P, T = len(precios), len(tasas)
+    base = {
+        "p0": np.repeat(precios - paso / 2, T), "p1": np.repeat(precios + paso / 2, T),
+        "t0": np.tile(tasas * 100 - 0.5, P), "t1": np.tile(tasas * 100 + 0.5, P),
+        "Precio": np.repeat(precios, T), "Tasa %": np.tile(tasas * 100, P),
+    }
+    punto = pd.DataFrame({"Precio": [esc["p_venta"]], "Tasa %": [esc["tasa_impuesto"] * 100]})
+
+    cols = st.columns(len(METODOS))
+    for col, m in zip(cols, METODOS):
+        df = pd.DataFrame({**base, "Utilidad neta": malla[m][:, :, k].ravel()})
+        mapa = alt.Chart(df).mark_rect().encode(
+            x=alt.X("p0:Q", title="Precio de venta ($/u)"), x2="p1",
+            y=alt.Y("t0:Q", title="Tasa de impuesto (%)"), y2="t1",
+            color=alt.Color("Utilidad neta:Q", scale=escala, legend=None),
+            tooltip=[alt.Tooltip("Precio:Q", format=",.2f"), "Tasa %:Q",
+                     alt.Tooltip("Utilidad neta:Q", format=",.2f")],
+        )
+        marca = alt.Chart(punto).mark_point(color="black", size=60, filled=True).encode(x="Precio:Q", y="Tasa %:Q")
+        titulo = m + (" · ejemplo" if m == normalizar_metodo(metodo) else "")
+        with col:
+            st.markdown(f"**{titulo}**")
+            st.altair_chart((mapa + marca).properties(height=260), use_container_width=True)
+
+    # Devolución en ventas × método, al precio y tasa vigentes (punto más cercano de la malla)
+    df_dev = pd.DataFrame({
+        "Método": np.repeat(METODOS, len(devs)),
+        "Devolución (u)": np.tile(devs.astype(int), len(METODOS)),
+        "Utilidad neta": np.concatenate([malla[m][i_p, i_t, :] for m in METODOS]),
+    })
+    st.markdown(f"**Devolución en ventas × método** (precio ≈ {precios[i_p]:,.2f}, tasa {tasas[i_t]:.0%})")
+    st.altair_chart(
+        alt.Chart(df_dev).mark_rect().encode(
+            x=alt.X("Devolución (u):O"), y=alt.Y("Método:N", sort=list(METODOS)),
+            color=alt.Color("Utilidad neta:Q", scale=alt.Scale(scheme="redyellowgreen", domainMid=0)),
+            tooltip=["Método", "Devolución (u)", alt.Tooltip("Utilidad neta:Q", format=",.2f")],
+        ).properties(height=140),
+        use_container_width=True,
+    )
+    st.caption(
+        f"Malla de {P} precios × {T} tasas × {len(devs)} devoluciones × {len(METODOS)} métodos "
+        f"= {P * T * len(devs) * len(METODOS):,} estados de resultados, calculados de una vez."
+    )
+
+# ===========================
+# Helpers del Nivel 4 (KARDEX, Estado de Resultados y calificación)
+# ===========================
+N4_FINAL_KP = "n4_final_"   # prefijo de claves de la evaluación final
+
+# =========================
+# Builder KARDEX + métricas PyG dependientes del método
+# =========================
+def build_kardex_and_metrics(esc: dict, metodo: str):
+    inv0_u, inv0_pu = esc["inv0_u"], esc["inv0_pu"]
+    c1_u, c1_pu     = esc["comp1_u"], esc["comp1_pu"]
+    v_u, p_venta    = esc["venta_u"], esc["p_venta"]
+    dcomp_u         = esc["dev_comp"]
+    dvent_u         = esc["dev_vent"]
+
+    fifo = True if "PEPS" in metodo else False if "UEPS" in metodo else None
+
+    # --- Día 1: saldo inicial
+    rows = KardexTabla()
+    inv = InventarioTrazable(metodo)
+    inv.entrada(inv0_u, inv0_pu)
+    s_q, s_pu, s_v = inv.saldo()
+    rows.append({
+        "Fecha":"Día 1", "Descripción":"Saldo inicial",
+        "Entrada_cant":None, "Entrada_pu":None, "Entrada_total":None,
+        "Salida_cant":None,  "Salida_pu":None,  "Salida_total":None,
+        "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+    })
+
+    # --- Día 2: compra (PP promedia; PEPS/UEPS agregan una nueva capa)
+    ent_tot = c1_u * c1_pu
+    lote_compra = inv.entrada(c1_u, c1_pu)
+    s_q, s_pu, s_v = inv.saldo()
+    rows.append({
+        "Fecha":"Día 2", "Descripción":"Compra",
+        "Entrada_cant": c1_u, "Entrada_pu": round(c1_pu,2), "Entrada_total": round(ent_tot,2),
+        "Salida_cant":None, "Salida_pu":None, "Salida_total":None,
+        "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+    })
+
+    # --- Día 3: venta
+    if v_u > 0 and s_q > 0:
+        if metodo == "Promedio Ponderado":
+            sale_q, sale_pu, sale_tot = inv.venta(v_u)[0][:3]
+            s_q, s_pu, s_v = inv.saldo()
+            rows.append({
+                "Fecha":"Día 3", "Descripción":"Venta",
+                "Entrada_cant":None, "Entrada_pu":None, "Entrada_total":None,
+                "Salida_cant": sale_q, "Salida_pu": round(sale_pu,2), "Salida_total": round(sale_tot,2),
+                "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+            })
+            cmv_bruto = sale_tot
+        else:
+            tramos = inv.venta(v_u)
+            cmv_bruto = sum(t.total for t in tramos)
+            for i, t in enumerate(tramos, start=1):
+                rpu = (t.saldo_total / t.saldo_cant) if t.saldo_cant > 0 else 0.0
+                rows.append({
+                    "Fecha":"Día 3", "Descripción": f"Venta tramo {i} ({'PEPS' if fifo else 'UEPS'})",
+                    "Entrada_cant":None, "Entrada_pu":None, "Entrada_total":None,
+                    "Salida_cant": int(t.cantidad), "Salida_pu": round(t.costo_unitario,2), "Salida_total": round(t.total,2),
+                    "Saldo_cant": int(t.saldo_cant), "Saldo_pu": round(rpu,2), "Saldo_total": round(t.saldo_total,2)
+                })
+            s_q, s_pu, s_v = inv.saldo()
+    else:
+        cmv_bruto = 0.0
+        rows.append({
+            "Fecha":"Día 3", "Descripción":"Venta",
+            "Entrada_cant":None, "Entrada_pu":None, "Entrada_total":None,
+            "Salida_cant":None, "Salida_pu":None, "Salida_total":None,
+            "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+        })
+
+    # --- Día 4: devolución en compra (salida a proveedor)
+    if metodo == "Promedio Ponderado":
+        tramos_dev = inv.dev_compra(esc["dev_comp"], lote_compra)
+        take_q, take_pu, take_val = tramos_dev[0][:3] if tramos_dev else (0, s_pu, 0.0)
+        s_q, s_pu, s_v = inv.saldo()
+        rows.append({
+            "Fecha":"Día 4", "Descripción":"Devolución de compra (a proveedor)",
+            "Entrada_cant":None, "Entrada_pu":None, "Entrada_total":None,
+            "Salida_cant": int(take_q), "Salida_pu": round(take_pu,2), "Salida_total": round(take_val,2),
+            "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+        })
+        dev_comp_valor = take_val
+    else:
+        # Sale del lote de la compra (y, si no alcanza, de los más recientes), sea PEPS o UEPS
+        tramos_dev = inv.dev_compra(esc["dev_comp"], lote_compra)
+        dev_comp_valor = sum(t.total for t in tramos_dev)
+        take_q_total = sum(t.cantidad for t in tramos_dev)
+        s_q, s_pu, s_v = inv.saldo()
+        avg_dev_comp_pu = (dev_comp_valor / take_q_total) if take_q_total > 0 else None
+        rows.append({
+            "Fecha":"Día 4", "Descripción":"Devolución de compra (a proveedor)",
+            "Entrada_cant":None, "Entrada_pu":None, "Entrada_total":None,
+            "Salida_cant": int(take_q_total),
+            "Salida_pu": round(avg_dev_comp_pu,2) if avg_dev_comp_pu is not None else None,
+            "Salida_total": round(dev_comp_valor,2),
+            "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+        })
+
+    # --- Día 5: devolución en venta (reingreso)
+    # PP reingresa al promedio vigente; PEPS/UEPS, cada unidad a la capa de la
+    # que salió (primero las más antiguas)
+    tramos_dv = inv.dev_venta(esc["dev_vent"])
+    costo_dev_venta = sum(t.total for t in tramos_dv)
+    s_q, s_pu, s_v = inv.saldo()
+    if tramos_dv:
+        in_q = sum(t.cantidad for t in tramos_dv)
+        rows.append({
+            "Fecha":"Día 5", "Descripción":"Devolución de venta (reingreso)",
+            "Entrada_cant": in_q, "Entrada_pu": round(costo_dev_venta / in_q,2), "Entrada_total": round(costo_dev_venta,2),
+            "Salida_cant":None, "Salida_pu":None, "Salida_total":None,
+            "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+        })
+    else:
+        rows.append({
+            "Fecha":"Día 5", "Descripción":"Devolución de venta (reingreso)",
+            "Entrada_cant":None, "Entrada_pu":None, "Entrada_total":None,
+            "Salida_cant":None, "Salida_pu":None, "Salida_total":None,
+            "Saldo_cant": int(s_q), "Saldo_pu": round(s_pu,2), "Saldo_total": round(s_v,2)
+        })
+
+    # =========================
+    # Métricas PyG del periodo
+    # =========================
+    ventas_brutas       = esc["venta_u"] * esc["p_venta"]
+    dev_ventas_brutas   = esc["dev_vent"] * esc["p_venta"]
+    ventas_netas        = ventas_brutas - dev_ventas_brutas
+
+    compras_brutas      = esc["comp1_u"] * esc["comp1_pu"]
+    if metodo == "Promedio Ponderado":
+        dev_compras_valor = 0.0
+        for r in rows:
+            if r["Fecha"]=="Día 4" and "Devolución de compra" in r["Descripción"]:
+                dev_compras_valor = r["Salida_total"] or 0.0
+                break
+    else:
+        # Para PEPS/UEPS usamos el valor calculado en D4
+        dev_compras_valor = dev_comp_valor
+
+    compras_netas       = compras_brutas - dev_compras_valor
+
+    # CMV neto: se descuenta explícitamente el costo de la devolución en ventas
+    cmv_neto            = cmv_bruto - costo_dev_venta
+    utilidad_bruta      = ventas_netas - cmv_neto
+
+    gastos_op           = sum(v for _, v in esc["gastos_operativos"])
+    resultado_operativo = utilidad_bruta - gastos_op
+
+    otros_ingresos      = sum(v for _, v in esc["otros_ingresos"])
+    otros_egresos       = sum(v for _, v in esc["otros_egresos"])
+    utilidad_ai         = resultado_operativo + otros_ingresos - otros_egresos
+    impuesto            = max(utilidad_ai, 0) * esc["tasa_impuesto"]
+    utilidad_neta       = utilidad_ai - impuesto
+
+    resumen = {
+        "ventas_brutas": ventas_brutas,
+        "dev_ventas_brutas": dev_ventas_brutas,
+        "ventas_netas": ventas_netas,
+        "compras_brutas": compras_brutas,
+        "dev_compras_valor": dev_compras_valor,
+        "compras_netas": compras_netas,
+        "cmv_bruto": cmv_bruto,
+        "costo_dev_venta": costo_dev_venta,
+        "cmv_neto": cmv_neto,
+        "utilidad_bruta": utilidad_bruta,
+        "gastos_op": gastos_op,
+        "resultado_operativo": resultado_operativo,
+        "otros_ingresos": otros_ingresos,
+        "otros_egresos": otros_egresos,
+        "utilidad_ai": utilidad_ai,
+        "impuesto": impuesto,
+        "utilidad_neta": utilidad_neta,
+    }
+    return rows, resumen
+
+# Adaptar filas del KARDEX a la estructura HTML
+def _as_row(r):
+    return {
+        "Fecha": r["Fecha"],
+        "Descripción": r["Descripción"],
+        "Entrada_cant": r.get("Entrada_cant",""),
+        "Entrada_pu": r.get("Entrada_pu",""),
+        "Entrada_total": r.get("Entrada_total",""),
+        "Salida_cant": r.get("Salida_cant",""),
+        "Salida_pu": r.get("Salida_pu",""),
+        "Salida_total": r.get("Salida_total",""),
+        "Saldo_cant": r.get("Saldo_cant",""),
+        "Saldo_pu": r.get("Saldo_pu",""),
+        "Saldo_total": r.get("Saldo_total",""),
+    }
+
+# =========================
+# Estado y escenario (defaults)
+# =========================
+def _n4_ensure_default_state(K):
+    ss = st.session_state
+    ss.setdefault(K("metodo"), "Promedio Ponderado")
+    ss.setdefault(K("inv0_u"), 80)
+    ss.setdefault(K("inv0_pu"), 10.0)
+    ss.setdefault(K("comp1_u"), 40)
+    ss.setdefault(K("comp1_pu"), 11.0)
+    ss.setdefault(K("venta_u"), 90)
+    ss.setdefault(K("p_venta"), 20.0)
+    ss.setdefault(K("dev_comp_u"), 8)
+    ss.setdefault(K("dev_vent_u"), 6)
+    ss.setdefault(K("go_1_name"), "Publicidad y promociones")
+    ss.setdefault(K("go_1_val"), 120.0)
+    ss.setdefault(K("go_2_name"), "Servicios (luz/agua/internet)")
+    ss.setdefault(K("go_2_val"), 80.0)
+    ss.setdefault(K("go_3_name"), "Gastos administrativos")
+    ss.setdefault(K("go_3_val"), 150.0)
+    ss.setdefault(K("otros_ing"), 40.0)
+    ss.setdefault(K("otros_egr"), 20.0)
+    ss.setdefault(K("tasa"), 0.30)
+
+# =========================
+# Escenario de la práctica (claves con prefijo K)
+# =========================
+def _n4_escenario_practica(K):
+    ss = st.session_state
+    return {
+        "inv0_u": ss[K("inv0_u")],
+        "inv0_pu": ss[K("inv0_pu")],
+        "comp1_u": ss[K("comp1_u")],
+        "comp1_pu": ss[K("comp1_pu")],
+        "venta_u": ss[K("venta_u")],
+        "p_venta": ss[K("p_venta")],
+        "dev_comp": ss[K("dev_comp_u")],
+        "dev_vent": ss[K("dev_vent_u")],
+        "gastos_operativos": [
+            (
+                ss[K("go_1_name")].strip() or "Gasto 1",
+                float(ss[K("go_1_val")]),
+            ),
+            (
+                ss[K("go_2_name")].strip() or "Gasto 2",
+                float(ss[K("go_2_val")]),
+            ),
+            (
+                ss[K("go_3_name")].strip() or "Gasto 3",
+                float(ss[K("go_3_val")]),
+            ),
+        ],
+        "otros_ingresos": [
+            ("Otros ingresos", float(ss[K("otros_ing")]))
+        ],
+        "otros_egresos": [
+            ("Otros egresos", float(ss[K("otros_egr")]))
+        ],
+        "tasa_impuesto": float(ss[K("tasa")]),
+    }
+
+# =========================
+# Builder KARDEX + métricas PyG (misma lógica que TAB 2)
+# =========================
+def _n4_build_kardex_and_metrics(esc_loc: dict, method_name: str):
+    inv0_u, inv0_pu = esc_loc["inv0_u"], esc_loc["inv0_pu"]
+    c1_u, c1_pu = esc_loc["comp1_u"], esc_loc["comp1_pu"]
+    v_u, p_venta = esc_loc["venta_u"], esc_loc["p_venta"]
+    dcomp_u = esc_loc["dev_comp"]
+    dvent_u = esc_loc["dev_vent"]
+
+    metodo = method_name
+    fifo = True if "PEPS" in metodo else False if "UEPS" in metodo else None
+
+    # --- Día 1: saldo inicial (entrada + saldo)
+    rows = KardexTabla()
+    inv = InventarioTrazable(metodo)
+    inv.entrada(inv0_u, inv0_pu)
+    s_q, s_pu, s_v = inv.saldo()
+
+    if inv0_u > 0:
+        ent_q = inv0_u
+        ent_pu = inv0_pu
+        ent_tot = inv0_u * inv0_pu
+    else:
+        ent_q = ent_pu = ent_tot = None
+
+    rows.append(
+        {
+            "Fecha": "Día 1",
+            "Descripción": "Saldo inicial",
+            "Entrada_cant": ent_q,
+            "Entrada_pu": None if ent_pu is None else round(ent_pu, 2),
+            "Entrada_total": None if ent_tot is None else round(ent_tot, 2),
+            "Salida_cant": None,
+            "Salida_pu": None,
+            "Salida_total": None,
+            "Saldo_cant": int(s_q),
+            "Saldo_pu": round(s_pu, 2),
+            "Saldo_total": round(s_v, 2),
+        }
+    )
+
+    # --- Día 2: compra (PP promedia; PEPS/UEPS agregan una nueva capa)
+    ent_tot = c1_u * c1_pu
+    lote_compra = inv.entrada(c1_u, c1_pu)
+    s_q, s_pu, s_v = inv.saldo()
+    rows.append(
+        {
+            "Fecha": "Día 2",
+            "Descripción": "Compra",
+            "Entrada_cant": c1_u,
+            "Entrada_pu": round(c1_pu, 2),
+            "Entrada_total": round(ent_tot, 2),
+            "Salida_cant": None,
+            "Salida_pu": None,
+            "Salida_total": None,
+            "Saldo_cant": int(s_q),
+            "Saldo_pu": round(s_pu, 2),
+            "Saldo_total": round(s_v, 2),
+        }
+    )
+
+    # --- Día 3: venta
+    if v_u > 0 and s_q > 0:
+        if metodo == "Promedio Ponderado":
+            sale_q, sale_pu, sale_tot = inv.venta(v_u)[0][:3]
+            s_q, s_pu, s_v = inv.saldo()
+            rows.append(
+                {
+                    "Fecha": "Día 3",
+                    "Descripción": "Venta",
+                    "Entrada_cant": None,
+                    "Entrada_pu": None,
+                    "Entrada_total": None,
+                    "Salida_cant": sale_q,
+                    "Salida_pu": round(sale_pu, 2),
+                    "Salida_total": round(sale_tot, 2),
+                    "Saldo_cant": int(s_q),
+                    "Saldo_pu": round(s_pu, 2),
+                    "Saldo_total": round(s_v, 2),
+                }
+            )
+            cmv_bruto = sale_tot
+        else:
+            tramos = inv.venta(v_u)
+            cmv_bruto = sum(t.total for t in tramos)
+            for i, t in enumerate(tramos, start=1):
+                rpu = (t.saldo_total / t.saldo_cant) if t.saldo_cant > 0 else 0.0
+                rows.append(
+                    {
+                        "Fecha": "Día 3",
+                        "Descripción": f"Venta tramo {i} ({'PEPS' if fifo else 'UEPS'})",
+                        "Entrada_cant": None,
+                        "Entrada_pu": None,
+                        "Entrada_total": None,
+                        "Salida_cant": int(t.cantidad),
+                        "Salida_pu": round(t.costo_unitario, 2),
+                        "Salida_total": round(t.total, 2),
+                        "Saldo_cant": int(t.saldo_cant),
+                        "Saldo_pu": round(rpu, 2),
+                        "Saldo_total": round(t.saldo_total, 2),
+                    }
+                )
+            s_q, s_pu, s_v = inv.saldo()
+    else:
+        cmv_bruto = 0.0
+        rows.append(
+            {
+                "Fecha": "Día 3",
+                "Descripción": "Venta",
+                "Entrada_cant": None,
+                "Entrada_pu": None,
+                "Entrada_total": None,
+                "Salida_cant": None,
+                "Salida_pu": None,
+                "Salida_total": None,
+                "Saldo_cant": int(s_q),
+                "Saldo_pu": round(s_pu, 2),
+                "Saldo_total": round(s_v, 2),
+            }
+        )
+
+    # --- Día 4: devolución en compra (salida a proveedor)
+    if metodo == "Promedio Ponderado":
+        tramos_dev = inv.dev_compra(dcomp_u, lote_compra)
+        take_q, take_pu, take_val = tramos_dev[0][:3] if tramos_dev else (0, s_pu, 0.0)
+        s_q, s_pu, s_v = inv.saldo()
+        rows.append(
+            {
+                "Fecha": "Día 4",
+                "Descripción": "Devolución de compra (a proveedor)",
+                "Entrada_cant": None,
+                "Entrada_pu": None,
+                "Entrada_total": None,
+                "Salida_cant": int(take_q),
+                "Salida_pu": round(take_pu, 2),
+                "Salida_total": round(take_val, 2),
+                "Saldo_cant": int(s_q),
+                "Saldo_pu": round(s_pu, 2),
+                "Saldo_total": round(s_v, 2),
+            }
+        )
+        dev_comp_valor = take_val
+    else:
+        # Sale del lote de la compra (y, si no alcanza, de los más recientes), sea PEPS o UEPS
+        tramos_dev = inv.dev_compra(dcomp_u, lote_compra)
+        dev_comp_valor = sum(t.total for t in tramos_dev)
+        total_dev_units = sum(t.cantidad for t in tramos_dev)
+        s_q, s_pu, s_v = inv.saldo()
+        salida_cant = int(total_dev_units)
+        salida_pu = (
+            round(dev_comp_valor / total_dev_units, 2)
+            if total_dev_units > 0
+            else None
+        )
+        rows.append(
+            {
+                "Fecha": "Día 4",
+                "Descripción": "Devolución de compra (a proveedor)",
+                "Entrada_cant": None,
+                "Entrada_pu": None,
+                "Entrada_total": None,
+                "Salida_cant": salida_cant,
+                "Salida_pu": salida_pu,
+                "Salida_total": round(dev_comp_valor, 2),
+                "Saldo_cant": int(s_q),
+                "Saldo_pu": round(s_pu, 2),
+                "Saldo_total": round(s_v, 2),
+            }
+        )
+
+    # --- Día 5: devolución en venta (reingreso)
+    # PP reingresa al promedio vigente; PEPS/UEPS, cada unidad a la capa de la
+    # que salió (primero las más antiguas)
+    tramos_dv = inv.dev_venta(dvent_u)
+    costo_dev_venta = sum(t.total for t in tramos_dv)
+    s_q, s_pu, s_v = inv.saldo()
+    if tramos_dv:
+        in_q = sum(t.cantidad for t in tramos_dv)
+        ent_dv = (in_q, round(costo_dev_venta / in_q, 2), round(costo_dev_venta, 2))
+    else:
+        ent_dv = (None, None, None)
+    rows.append(
+        {
+            "Fecha": "Día 5",
+            "Descripción": "Devolución de venta (reingreso)",
+            "Entrada_cant": ent_dv[0],
+            "Entrada_pu": ent_dv[1],
+            "Entrada_total": ent_dv[2],
+            "Salida_cant": None,
+            "Salida_pu": None,
+            "Salida_total": None,
+            "Saldo_cant": int(s_q),
+            "Saldo_pu": round(s_pu, 2),
+            "Saldo_total": round(s_v, 2),
+        }
+    )
+
+    # =========================
+    # Métricas PyG del periodo
+    # =========================
+    ventas_brutas = esc_loc["venta_u"] * esc_loc["p_venta"]
+    dev_ventas_brutas = esc_loc["dev_vent"] * esc_loc["p_venta"]
+    ventas_netas = ventas_brutas - dev_ventas_brutas
+
+    compras_brutas = esc_loc["comp1_u"] * esc_loc["comp1_pu"]
+    if metodo == "Promedio Ponderado":
+        dev_compras_valor = 0.0
+        for r in rows:
+            if (
+                r["Fecha"] == "Día 4"
+                and "Devolución de compra" in r["Descripción"]
+            ):
+                dev_compras_valor = (
+                    r["Salida_total"]
+                    if r["Salida_total"] not in (None, "")
+                    else 0.0
+                )
+                break
+    else:
+        try:
+            dev_comp_valor  # noqa
+        except NameError:
+            dev_comp_valor = 0.0
+        dev_compras_valor = dev_comp_valor
+
+    compras_netas = compras_brutas - dev_compras_valor
+
+    cmv_neto = cmv_bruto - costo_dev_venta
+    utilidad_bruta = ventas_netas - cmv_neto
+
+    gastos_op = sum(v for _, v in esc_loc["gastos_operativos"])
+    resultado_operativo = utilidad_bruta - gastos_op
+
+    otros_ingresos = sum(v for _, v in esc_loc["otros_ingresos"])
+    otros_egresos = sum(v for _, v in esc_loc["otros_egresos"])
+    utilidad_ai = resultado_operativo + otros_ingresos - otros_egresos
+    impuesto = max(utilidad_ai, 0) * esc_loc["tasa_impuesto"]
+    utilidad_neta = utilidad_ai - impuesto
+
+    resumen = {
+        "ventas_brutas": ventas_brutas,
+        "dev_ventas_brutas": dev_ventas_brutas,
+        "ventas_netas": ventas_netas,
+        "compras_brutas": compras_brutas,
+        "dev_compras_valor": dev_compras_valor,
+        "compras_netas": compras_netas,
+        "cmv_bruto": cmv_bruto,
+        "costo_dev_venta": costo_dev_venta,
+        "cmv_neto": cmv_neto,
+        "utilidad_bruta": utilidad_bruta,
+        "gastos_op": gastos_op,
+        "resultado_operativo": resultado_operativo,
+        "otros_ingresos": otros_ingresos,
+        "otros_egresos": otros_egresos,
+        "utilidad_ai": utilidad_ai,
+        "impuesto": impuesto,
+        "utilidad_neta": utilidad_neta,
+    }
+    return rows, resumen
+
+# =========================
+# KARDEX de referencia (según método)
+# =========================
+def _build_kardex_expected(esc_loc, method_name):
+    rows, _ = _n4_build_kardex_and_metrics(esc_loc, method_name)
+    return rows
+
+# =========================
+# PyG esperado (para el validador del ER)
+# =========================
+def _build_pyg_expected_from_kardex(esc_loc, method_name):
+    _, resumen = _n4_build_kardex_and_metrics(esc_loc, method_name)
+
+    return {
+        "Ventas brutas": resumen["ventas_brutas"],
+        "(-) Devoluciones en ventas": resumen["dev_ventas_brutas"],
+        "Ventas netas": resumen["ventas_netas"],
+        "Costos de mercancía vendida brutos": resumen["cmv_bruto"],
+        "(-) Costo devolución en ventas": resumen["costo_dev_venta"],
+        "Costos de mercancía vendida netos": resumen["cmv_neto"],
+        "Utilidad bruta": resumen["utilidad_bruta"],
+        "Gastos operativos": resumen["gastos_op"],
+        "Utilidad Operativa": resumen["resultado_operativo"],
+        "Otros ingresos": resumen["otros_ingresos"],
+        "Otros egresos": resumen["otros_egresos"],
+        "Utilidad antes de impuesto": resumen["utilidad_ai"],
+        "Impuesto": resumen["impuesto"],
+        "Utilidad neta": resumen["utilidad_neta"],
+    }
+
+
+def _to_float_or_none(x):
+    try:
+        if x in (None, ""):
+            return None
+        return float(x)
+    except Exception:
+        return None
+
+# =====================================================
+# Escenario base (SOLO Promedio Ponderado)
+# =====================================================
+def exam_scenario_q5():
+    """
+    Este escenario define TODAS las cifras necesarias para:
+    - Construir el KARDEX PP de referencia
+    - Calcular el Estado de Resultados esperado
+    Nota: En la interfaz, SOLO se muestran las variables clave solicitadas.
+    """
+    return {
+        "inv0_u":   90,     # Día 1: inventario inicial (u)
+        "inv0_pu":  10.0,   # Día 1: costo unitario
+        "comp1_u":  50,     # Día 2: compra (u)
+        "comp1_pu": 12.0,   # Día 2: $/u compra
+        "venta_u":  100,    # Día 3: cantidad vendida (u)
+        "p_venta":  20.0,   # Día 3: precio de venta ($/u) — visible
+        "dev_comp": 6,      # Día 4: devolución en compra (u)
+        "dev_venta":8,      # Día 5: devolución en venta (u)
+        "gastos_operativos": [("Publicidad",120.0), ("Servicios",80.0), ("Administrativos",150.0)],
+        "otros_ing": 40.0,  # visible
+        "otros_egr": 20.0,  # visible
+        "tasa": 0.30,       # visible: 30%
+        "metodo": "Promedio Ponderado"
+    }
+
+# =====================================================
+# Helpers: KARDEX & PyG en Promedio Ponderado
+# =====================================================
+def _kardex_pp(sc: dict, rows=None):
+    """
+    Recorre D1–D5 en Promedio Ponderado sobre el motor de lotes (devoluciones
+    al promedio vigente). Si recibe `rows`, agrega las filas del KARDEX.
+    Devuelve (cmv_bruto, dev_compras_valor, costo_dev_venta).
+    """
+    inv = InventarioTrazable("Promedio Ponderado")
+
+    def fila(fecha, desc, mov=None, entrada=False):
+        if rows is None:
+            return
+        s_q, s_p, s_v = inv.saldo()
+        mov = (int(mov[0]), round(mov[1], 2), round(mov[2], 2)) if mov else (None, None, None)
+        ent, sal = (mov, (None, None, None)) if entrada else ((None, None, None), mov)
+        rows.agregar(
+            fecha, desc,
+            Entrada_cant=ent[0], Entrada_pu=ent[1], Entrada_total=ent[2],
+            Salida_cant=sal[0], Salida_pu=sal[1], Salida_total=sal[2],
+            Saldo_cant=int(s_q), Saldo_pu=round(s_p, 2), Saldo_total=round(s_v, 2),
+        )
+
+    inv.entrada(sc["inv0_u"], sc["inv0_pu"])
+    fila("Día 1", "Saldo inicial", (sc["inv0_u"], sc["inv0_pu"], sc["inv0_u"] * sc["inv0_pu"]), entrada=True)
+
+    lote_compra = inv.entrada(sc["comp1_u"], sc["comp1_pu"])
+    fila("Día 2", "Compra", (sc["comp1_u"], sc["comp1_pu"], sc["comp1_u"] * sc["comp1_pu"]), entrada=True)
+
+    venta = inv.venta(sc["venta_u"])
+    fila("Día 3", "Venta", venta[0] if venta else None)
+
+    dev_c = inv.dev_compra(sc["dev_comp"], lote_compra)
+    fila("Día 4", "Devolución de compra", dev_c[0] if dev_c else None)
+
+    dev_v = inv.dev_venta(sc["dev_venta"])
+    fila("Día 5", "Devolución de venta (reingreso)", dev_v[0] if dev_v else None, entrada=True)
+
+    total = lambda tramos: sum(t.total for t in tramos)  # noqa: E731
+    return total(venta), total(dev_c), total(dev_v)
+
+
+def _kardex_rows_pp(sc: dict):
+    """
+    Construye el KARDEX D1–D5 (SOLO PP) para mostrarlo como referencia.
+    """
+    rows = KardexTabla()
+    _kardex_pp(sc, rows)
+    return rows
+
+
+def _pyg_expected_from_scenario_pp(sc: dict):
+    """
+    Calcula el Estado de Resultados esperado (SOLO PP) a partir del escenario.
+    Devuelve un dict con el orden EXACTO de los renglones que mostrará el editor.
+    Incluye la desagregación del CMV: brutos − devoluciones = netos.
+    """
+    c1_u, c1_pu     = sc["comp1_u"], sc["comp1_pu"]
+    v_u, p_venta    = sc["venta_u"], sc["p_venta"]
+    dvent_u         = sc["dev_venta"]
+    go_vals         = [v for _, v in sc["gastos_operativos"]]
+    otros_ing       = float(sc["otros_ing"])
+    otros_egr       = float(sc["otros_egr"])
+    tasa            = float(sc["tasa"])
+
+    cmv_bruto, dev_compras_valor, costo_dev_venta = _kardex_pp(sc)
+
+    # PyG
+    ventas_brutas       = v_u * p_venta
+    dev_ventas_brutas   = dvent_u * p_venta
+    ventas_netas        = ventas_brutas - dev_ventas_brutas
+
+    compras_brutas      = c1_u * c1_pu
+    compras_netas       = compras_brutas - dev_compras_valor
+
+    # CMV neto: brutos − costo devolución en ventas
+    cmv_neto            = cmv_bruto - costo_dev_venta
+    utilidad_bruta      = ventas_netas - cmv_neto
+
+    gastos_op           = sum(go_vals)
+    resultado_operativo = utilidad_bruta - gastos_op
+
+    utilidad_ai         = resultado_operativo + otros_ing - otros_egr
+    impuesto            = max(utilidad_ai, 0.0) * tasa
+    utilidad_neta       = utilidad_ai - impuesto
+
+    # Orden EXACTO que verá el editor (con desagregación de CMV)
+    return {
+        "Ventas brutas": ventas_brutas,
+        "(-) Devoluciones en ventas": dev_ventas_brutas,
+        "Ventas netas": ventas_netas,
+        "Costos de mercancía vendida brutos": cmv_bruto,
+        "(-) Costo devolución en ventas": costo_dev_venta,
+        "Costos de mercancía vendida netos": cmv_neto,
+        "Utilidad bruta": utilidad_bruta,
+        "Gastos operativos": gastos_op,
+        "Utilidad Operativa": resultado_operativo,
+        "Otros ingresos": otros_ing,
+        "Otros egresos": otros_egr,
+        "Utilidad antes de impuesto": utilidad_ai,
+        "Impuesto": impuesto,
+        "Utilidad neta": utilidad_neta
+    }
+
+# =====================================================
+# IA Helpers (opcionales y seguros)
+# =====================================================
+def _on_topic_fallback_open() -> str:
+    return (
+        "En sistema perpetuo, el **CMV** se determina desde el **KARDEX** según el método (PP/PEPS/UEPS), "
+        "incluyendo devoluciones: las **de compras** reducen el pool de costo; las **de ventas** reingresan "
+        "unidades y reducen el **CMV** presentado. Registrar de forma incoherente distorsiona **Utilidad Bruta**, "
+        "**Resultado Operativo** y **Utilidad Neta**, afectando comparabilidad y decisiones."
+    )
+
+
+def _sanitize_on_topic(text: str) -> str:
+    if not text:
+        return _on_topic_fallback_open()
+    banned = [
+        "debe", "haber", "asiento", "apertura", "cierre", "diario",
+        "iva repercutido", "iva soportado", "iva", "cuentas t",
+        "resultado del ejercicio", "balance de comprobación",
+        "pasivo", "patrimonio", "ecuación contable", "activo = pasivo + patrimonio"
+    ]
+    low = text.lower()
+    if any(b in low for b in banned):
+        return _on_topic_fallback_open()
+    return text
+
+
+def safe_ia_feedback(prompt: str, default: str = "") -> str:
+    # Limitador de tasa compartido: sin cupo → default y bandera de rate-limit de la sesión
+    return ia_feedback_or_default(prompt, default=default, flag_key=N4_FINAL_KP + "ai_rate_limited")
+
+def grade_open_generic(text: str, focus: str, ask=safe_ia_feedback, rubrica: str | None = None):
+    t = (text or "").strip()
+    tl = t.lower()
+
+    if len(t.split()) < 3:
+        return 0, "Escribe al menos una idea completa relacionada con el tema."
+
+    # Primer filtro local (rúbrica): si decide con confianza, no se llama a la IA
+    local = decision_local(rubrica, t) if rubrica else None
+    if local is not None:
+        ok, fb = local
+        return (1 if ok else 0), fb
+
+    prompt = (
+        "Evalúa la respuesta del estudiante de forma MUY FLEXIBLE.\n"
+        "Aprueba si contiene al menos una idea coherente relacionada con el tema.\n"
+        "Primera línea EXACTA: 'SCORE: 1' si aprueba, o 'SCORE: 0' si no.\n"
+        "Luego da máximo 4 líneas de feedback amable y pedagógico.\n"
+        f"TEMA: {focus}\n"
+        f"RESPUESTA:\n{t}"
+    )
+
+    raw = ask(prompt, default="")
+    sraw = str(raw or "")
+    first = sraw.strip().splitlines()[0].strip() if sraw.strip() else ""
+    ai_score = 1 if first.upper().endswith("1") else 0
+    fb = "\n".join(sraw.strip().splitlines()[1:]).strip()
+
+    rate_limited = bool(st.session_state.get(N4_FINAL_KP + "ai_rate_limited", False))
+    ai_failed = (not sraw.strip()) or rate_limited
+
+    # Heurística MUY LAXA
+    focus_words = [w for w in rx("palabras").findall(focus.lower()) if len(w) >= 4]
+    generic_words = ["kardex", "estado", "resultados", "cmv", "devoluciones", "inventario", "método", "costo"]
+    heuristic_ok = any(w in tl for w in focus_words + generic_words)
+
+    # En examen: si IA falla -> bueno
+    score1 = 1 if (heuristic_ok or ai_score == 1 or ai_failed) else 0
+
+    if not fb:
+        fb = (
+            "La respuesta se acepta. Puedes fortalecerla mencionando con más claridad "
+            "el efecto en el CMV, inventario o Estado de Resultados."
+        )
+
+    banned_student = ["activo = pasivo + patrimonio", "ecuación contable"]
+    if any(b in tl for b in banned_student) and not heuristic_ok:
+        score1 = 0
+        fb = _on_topic_fallback_open()
+
+    return score1, fb
+
+
+def _to_float_safe(x):
+    try:
+        if x is None:
+            return None
+        x = str(x).strip()
+        if x == "":
+            return None
+        x = x.replace("$", "").replace(" ", "").replace(",", ".")
+        return float(x)
+    except:
+        return None
+
+
+def _near(a, b, tol=0.5):
+    if a is None or b is None:
+        return False
+    try:
+        return abs(float(a) - float(b)) <= tol
+    except:
+        return False
+
+# ===========================
+# NIVEL 4 (Estado de Resultados)
+# ===========================
+def page_level4(username):
+    st.title("Nivel 4 · Construcción del Estado de Resultados (simplificado)")
+
+    progress_col = st.session_state.get("progress_col")
+    set_current_level(progress_col, username, "level4")
+
+    tabs = st.tabs(["🎧 Teoría", "🛠 Ejemplo guiado", "🎮 Práctica (IA)", "🏁 Evaluación final + Encuesta"])
+
+    # =====================================================
+    # TAB 1 — TEORÍA
+    # =====================================================
+    with tabs[0]:
+        st.subheader("Teoría · Estado de Resultados (sistema perpetuo con devoluciones)")
+
+        intro = """
+    En una empresa comercial que utiliza **sistema perpetuo**, el **Estado de Resultados** resume el desempeño del periodo. 
+    El **CMV** no se calcula con la fórmula periódica; **se determina directamente del KARDEX** según el método de inventario (**Promedio Ponderado, PEPS o UEPS**), 
+    incluyendo el tratamiento de **devoluciones en compras** (ajustan el pool de costo) y **devoluciones en ventas** (reingreso que **disminuye el costo de la mercadería vendida** presentado en el Estado de Resultados).
+        """
+        st.markdown(intro)
+
+        st.markdown("#### Estructura general")
+        st.markdown(
+            """
+    - **Ventas netas**  
+    - **Costo de la mercadería vendida (CMV)** → *desde KARDEX (PP/PEPS/UEPS), con devoluciones*  
+    - **Utilidad bruta** = Ventas netas − CMV  
+    - **Gastos operativos** (administración y ventas)  
+    - **Utilidad Operativa** = Utilidad bruta − Gastos operativos  
+    - **Otros ingresos** y **Otros egresos**  
+    - **Utilidad antes de impuesto** = Utilidad Operativa + Otros ingresos − Otros egresos  
+    - **Impuesto**  
+    - **Utilidad neta** = Utilidad antes de impuesto − Impuesto
+            """
+        )
+
+        st.markdown("---")
+        st.markdown("### ¿Cómo se calcula cada rubro? (haz tu selección)")
+        rubro = st.selectbox(
+            "Selecciona un rubro para ver su fórmula y explicación",
+            [
+                "Ventas netas",
+                "CMV",
+                "Utilidad bruta",
+                "Gastos operativos",
+                "Utilidad Operativa",
+                "Otros ingresos",
+                "Otros egresos",
+                "Utilidad antes de impuesto",
+                "Impuesto",
+                "Utilidad neta",
+            ],
+            index=None,
+            placeholder="Elige un rubro…"
+        )
+
+        # Render dinámico por rubro
+        if rubro == "Ventas netas":
+            st.markdown("**Ventas netas**")
+            st.latex(r"\text{Ventas Netas}=\text{Ventas Brutas}-\text{Devoluciones/Descuentos sobre Ventas}")
+            st.caption(
+                "Las devoluciones/descuentos sobre ventas **reducen** las ventas brutas para obtener las ventas netas. "
+                "En el sistema perpetuo, estas partidas también impactan las cuentas de ingresos y la presentación del periodo."
+            )
+
+        elif rubro == "CMV":
+            st.markdown("**Costo de la Mercadería Vendida (CMV) en sistema perpetuo**")
+            st.markdown(
+                """
+    En **perpetuo**, el **CMV** que se presenta en el Estado de Resultados es el **costo neto** de la mercancía vendida,
+    construido directamente desde el **KARDEX**, **según el método**:
+
+    - **Promedio Ponderado (PP):** cada venta usa el **promedio vigente** del momento.  
+      - La **devolución en compras** sale al proveedor al promedio vigente (reduce el pool de costo).  
+      - La **devolución en ventas** reingresa al promedio vigente y **disminuye el CMV presentado**.
+
+    - **PEPS (FIFO):** la venta consume **capas más antiguas** primero.  
+      - La devolución en compras se registra contra la capa correspondiente.  
+      - La devolución en ventas reingresa con el costo de las capas antiguas que habían salido.
+
+    - **UEPS (LIFO):** la venta consume **capas más recientes** primero.  
+      - La devolución en compras afecta las capas recientes.  
+      - La devolución en ventas reingresa con el costo de las capas recientes que habían salido.
+
+    En la práctica, el **CMV del Estado de Resultados** es el **costo definido para las ventas menos el costo de las unidades devueltas por clientes**.
+    """
+            )
+
+        elif rubro == "Utilidad bruta":
+            st.markdown("**Utilidad bruta**")
+            st.latex(r"\text{Utilidad Bruta}=\text{Ventas Netas}-\text{CMV}")
+            st.caption(
+                "El CMV proviene del KARDEX (perpetuo), incorporando devoluciones y el método de valoración aplicado. En el ER solo se muestra un único rubro de CMV."
+            )
+
+        elif rubro == "Gastos operativos":
+            st.markdown("**Gastos operativos**")
+            st.caption(
+                "Incluyen gastos de administración y ventas. No forman parte del CMV; se restan después para obtener el resultado operativo."
+            )
+
+        elif rubro == "Utilidad Operativa":
+            st.markdown("**Utilidad Operativa**")
+            st.latex(r"\text{Resultado Operativo}=\text{Utilidad Bruta}-\text{Gastos Operativos}")
+            st.caption("Mide el desempeño del giro del negocio antes de partidas no operativas e impuestos.")
+
+        elif rubro == "Otros ingresos":
+            st.markdown("**Otros ingresos**")
+            st.caption("Ingresos no operativos (p. ej., rendimientos financieros). Se **suman** al resultado operativo.")
+
+        elif rubro == "Otros egresos":
+            st.markdown("**Otros egresos**")
+            st.caption("Egresos no operativos (p. ej., gastos financieros). Se **restan** del resultado operativo.")
+
+        elif rubro == "Utilidad antes de impuesto":
+            st.markdown("**Utilidad antes de impuesto**")
+            st.latex(r"\text{UAI}=\text{Resultado Operativo}+\text{Otros Ingresos}-\text{Otros Egresos}")
+            st.caption("Base previa al cálculo del impuesto del periodo.")
+
+        elif rubro == "Impuesto":
+            st.markdown("**Impuesto**")
+            st.caption(
+                "Carga tributaria del periodo según normativa aplicable. Puede modelarse como una tasa sobre la UAI o con reglas específicas."
+            )
+
+        elif rubro == "Utilidad neta":
+            st.markdown("**Utilidad neta**")
+            st.latex(r"\text{Utilidad Neta}=\text{UAI}-\text{Impuesto}")
+            st.caption("Resultado final del periodo después de impuestos.")
+
+        st.markdown("---")
+        with st.expander("🔊 Escuchar explicación"):
+            full_text = "\n\n".join([
+                "Resumen: En sistema perpetuo, el CMV se obtiene del KARDEX y no con la fórmula periódica.",
+                "Las devoluciones en compras reducen el pool de costo y las devoluciones en ventas disminuyen el costo de la mercadería vendida.",
+                "Los métodos PP, PEPS y UEPS determinan el costo aplicado en cada movimiento.",
+                "La estructura del estado de resultados incluye ventas netas, CMV, utilidad bruta, gastos operativos, resultado operativo, otros ingresos y egresos, UAI, impuesto y utilidad neta."
+            ])
+            speak_block(full_text, key_prefix="teo-n4", lang_hint="es")
+
+    # =====================================================
+    # TAB 2 — EJEMPLO GUIADO
+    # =====================================================
+    with tabs[1]:
+        st.subheader("Ejemplo guiado: KARDEX + Estado de Resultados")
+
+        # =========================
+        # Parámetros del escenario (default)
+        # =========================
+        esc = {
+            "inv0_u":   80,      # Día 1: inventario inicial (u)
+            "inv0_pu":  10.0,    # Día 1: costo unitario
+            "comp1_u":  40,      # Día 2: compra (u)
+            "comp1_pu": 11.0,    # Día 2: compra ($/u)
+            "venta_u":  90,      # Día 3: venta (u)
+            "p_venta":  20.0,    # Día 3: precio de venta ($/u) para Ventas Brutas
+            "dev_comp": 8,       # Día 4: devolución en compra (u) que salen a proveedor
+            "dev_vent": 6,       # Día 5: devolución en venta (u) que regresan al inventario
+            # PyG del periodo (no inventario): gastos y otros
+            "gastos_operativos": [
+                ("Publicidad y promociones", 120.0),
+                ("Servicios (luz/agua/internet)", 80.0),
+                ("Gastos administrativos", 150.0),
+            ],
+            "otros_ingresos": [
+                ("Intereses ganados", 40.0),
+            ],
+            "otros_egresos": [
+                ("Multas y sanciones", 20.0),
+            ],
+            "tasa_impuesto": 0.30,  # 30%
+        }
+
+        # =========================
+        # Panel de ENTRADA (variables PyG)
+        # =========================
+        st.markdown("### Parámetros del Estado de Resultados (editables)")
+        c1, c2 = st.columns(2)
+        with c1:
+            venta_u_in = st.number_input(
+                "Unidades vendidas (Ventas brutas)",
+                min_value=0, value=int(esc["venta_u"]), step=1, key="n4_venta_u"
+            )
+            dev_vent_in = st.number_input(
+                "Devolución en ventas (unid.)",
+                min_value=0, value=int(esc["dev_vent"]), step=1, key="n4_dev_vent"
+            )
+        with c2:
+            p_venta_in = st.number_input(
+                "Precio de venta ($/u)",
+                min_value=0.0, value=float(esc["p_venta"]), step=0.5, key="n4_p_venta"
+            )
+            tasa_imp_in = st.slider(
+                "Tasa de impuesto (%)",
+                min_value=0, max_value=50, value=int(esc["tasa_impuesto"]*100), step=1, key="n4_tax"
+            )
+
+        st.markdown("#### Gastos operativos (desglosados)")
+        gcol1, gcol2, gcol3 = st.columns(3)
+        g1_name = gcol1.text_input("Ítem 1", value=esc["gastos_operativos"][0][0], key="n4_go_n1")
+        g1_val  = gcol1.number_input("Valor 1", min_value=0.0, value=float(esc["gastos_operativos"][0][1]), step=10.0, key="n4_go_v1")
+        g2_name = gcol2.text_input("Ítem 2", value=esc["gastos_operativos"][1][0], key="n4_go_n2")
+        g2_val  = gcol2.number_input("Valor 2", min_value=0.0, value=float(esc["gastos_operativos"][1][1]), step=10.0, key="n4_go_v2")
+        g3_name = gcol3.text_input("Ítem 3", value=esc["gastos_operativos"][2][0], key="n4_go_n3")
+        g3_val  = gcol3.number_input("Valor 3", min_value=0.0, value=float(esc["gastos_operativos"][2][1]), step=10.0, key="n4_go_v3")
+
+        st.markdown("#### Otros rubros")
+        ocol1, ocol2 = st.columns(2)
+        oi_val = ocol1.number_input("Otros ingresos (total)", min_value=0.0, value=float(esc["otros_ingresos"][0][1]), step=10.0, key="n4_oi")
+        oe_val = ocol2.number_input("Otros egresos (total)", min_value=0.0, value=float(esc["otros_egresos"][0][1]), step=10.0, key="n4_oe")
+
+        # Aplicar entradas al escenario
+        esc["venta_u"] = int(venta_u_in)
+        esc["p_venta"] = float(p_venta_in)
+        esc["dev_vent"] = int(dev_vent_in)
+        esc["tasa_impuesto"] = float(tasa_imp_in) / 100.0
+        esc["gastos_operativos"] = [
+            (g1_name.strip() or "Gasto 1", float(g1_val)),
+            (g2_name.strip() or "Gasto 2", float(g2_val)),
+            (g3_name.strip() or "Gasto 3", float(g3_val)),
+        ]
+        esc["otros_ingresos"] = [("Otros ingresos", float(oi_val))]
+        esc["otros_egresos"] = [("Otros egresos", float(oe_val))]
+
+        # =========================
+        # UI: Selección de método
+        # =========================
+        metodo = st.selectbox(
+            "Método de valoración para el ejemplo",
+            ["Promedio Ponderado", "PEPS (FIFO)", "UEPS (LIFO)"],
+            index=0,
+            key="n4_demo_metodo"
+        )
+
+        kardex_rows, pyg = build_kardex_and_metrics(esc, metodo)
+
+        # =========================
+        # HTML con panel + KARDEX + PYG + NARRACIÓN TTS (con PAUSA)
+        # =========================
+        html_template = """
+        <style>
+        .tbl { border-collapse: collapse; width: 100%; font-size:14px; margin:8px 0 }
+        .tbl th, .tbl td { border:1px solid #eaeaea; padding:6px 8px; text-align:center }
+        .tbl thead th { background:#f8fafc; font-weight:600 }
+        .muted { color:#999 }
+        .hi { background:#fff7e6; transition: background .3s }
+        .controls { display:flex; gap:8px; align-items:center; margin:6px 0; flex-wrap: wrap }
+        .btn { padding:6px 10px; border:1px solid #ddd; background:#fafafa; cursor:pointer; border-radius:6px; }
+        .btn:hover { background:#f0f0f0 }
+        .badge { display:inline-block; background:#eef; border:1px solid #dde; padding:2px 8px; border-radius:12px; font-size:12px; }
+        #narr { margin:6px 0 2px 0; font-size:15px }
+        .chips { display:grid; grid-template-columns: repeat(3, minmax(0,1fr)); gap:8px; margin:10px 0 6px 0 }
+        .chip { background:#f7fafc; border:1px solid #e5e7eb; padding:8px 10px; border-radius:10px; text-align:left; font-size:13px }
+        .chip b { display:block; font-size:12px; color:#555; margin-bottom:2px }
+        .head { display:flex; align-items:center; justify-content:space-between; margin-top:8px }
+        .ratewrap { display:flex; align-items:center; gap:8px; font-size:12px; color:#666 }
+        </style>
+
+        <div class="controls">
+        <button id="play" class="btn">▶️ Reproducir</button>
+        <button id="pause" class="btn">⏸️ Pausa</button>
+        <button id="reset" class="btn">⏹️ Reiniciar</button>
+        <span class="badge">__METODO__</span>
+        <span class="ratewrap">
+            Velocidad voz <input id="rate" type="range" min="0.7" max="1.3" step="0.1" value="1">
+        </span>
+        </div>
+
+        <div class="head">
+        <h4 style="margin:0">🧾 Datos de entrada del Estado de Resultados</h4>
+        <small class="muted">Estos valores se editan arriba y alimentan la narración paso a paso</small>
+        </div>
+        <div class="chips" id="chips"></div>
+
+        <h4>🧮 KARDEX (D1–D5)</h4>
+        <table class="tbl" id="kdx">
+        <thead>
+            <tr>
+            <th></th><th></th>
+            <th colspan="3">Entrada</th>
+            <th colspan="3">Salida</th>
+            <th colspan="3">Saldo</th>
+            </tr>
+            <tr>
+            <th>Fecha</th><th>Descripción</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            <th>Cantidad</th><th>Precio</th><th>Total</th>
+            </tr>
+        </thead>
+        <tbody id="kbody"></tbody>
+        </table>
+
+        <div id="narr"></div>
+
+        <h4>📑 Estado de Resultados (en blanco → se completará paso a paso)</h4>
+        <table class="tbl" id="pyg">
+        <thead>
+            <tr><th>Rubro</th><th>Valor</th></tr>
+        </thead>
+        <tbody>
+            <tr><td>Ventas brutas</td><td id="pyg_vb" class="muted"></td></tr>
+            <tr><td>(-) Devoluciones en ventas</td><td id="pyg_dv" class="muted"></td></tr>
+            <tr><td><b>Ventas netas</b></td><td id="pyg_vn" class="muted"></td></tr>
+
+            <tr><td>Costos de mercancía vendida brutos</td><td id="pyg_cmvb" class="muted"></td></tr>
+            <tr><td>(-) Costo devolución en ventas</td><td id="pyg_cdv" class="muted"></td></tr>
+            <tr><td><b>Costos de mercancía vendida netos</b></td><td id="pyg_cmvn" class="muted"></td></tr>
+
+            <tr><td><b>Utilidad bruta</b></td><td id="pyg_ub" class="muted"></td></tr>
+            <tr><td>Gastos operativos</td><td id="pyg_go" class="muted"></td></tr>
+            <tr><td><b>Utilidad Operativa</b></td><td id="pyg_ro" class="muted"></td></tr>
+
+            <tr><td>Otros ingresos</td><td id="pyg_oi" class="muted"></td></tr>
+            <tr><td>Otros egresos</td><td id="pyg_oe" class="muted"></td></tr>
+            <tr><td><b>Utilidad antes de impuesto</b></td><td id="pyg_uai" class="muted"></td></tr>
+            <tr><td>Impuesto</td><td id="pyg_imp" class="muted"></td></tr>
+            <tr><td><b>Utilidad neta</b></td><td id="pyg_un" class="muted"></td></tr>
+        </tbody>
+        </table>
+
+        <script>
+        (function(){
+        const rows = __ROWS__;
+        const pyg = __PYG__;
+        const params = __PARAMS__;
+        const narr = document.getElementById("narr");
+        const tb = document.getElementById("kbody");
+        const btnPlay = document.getElementById("play");
+        const btnPause = document.getElementById("pause");
+        const btnReset = document.getElementById("reset");
+        const chips = document.getElementById("chips");
+        const rateCtl = document.getElementById("rate");
+        const synth = window.speechSynthesis;
+
+        function pesos(v){
+            try{ return new Intl.NumberFormat('es-CO',{style:'currency',currency:'COP'}).format(v); }
+            catch(e){ return '$'+(Math.round(v*100)/100).toLocaleString('es-CO'); }
+        }
+        function fmt(x){
+            if(x===null||x===undefined||x==="") return "";
+            if(typeof x==="number") return Number.isInteger(x)? x.toString() : (Math.round(x*100)/100).toString().replace(".",",");
+            return x;
+        }
+
+        function buildChips(){
+            const items = [
+            ["Unidades vendidas", params.venta_u],
+            ["Precio de venta", pesos(params.p_venta)],
+            ["Devolución en ventas (u)", params.dev_vent],
+            ["Gastos operativos (Σ)", pesos(params.gastos_op)],
+            ["Otros ingresos", pesos(params.otros_ingresos)],
+            ["Otros egresos", pesos(params.otros_egresos)],
+            ["Tasa de impuesto", (params.tasa*100).toFixed(0) + "%"]
+            ];
+            chips.innerHTML = "";
+            items.forEach(([k,v])=>{
+            const div = document.createElement("div");
+            div.className = "chip";
+            div.innerHTML = "<b>"+k+"</b>"+v;
+            chips.appendChild(div);
+            });
+        }
+
+        function buildKardex(){
+            tb.innerHTML = "";
+            rows.forEach((r,i)=>{
+            const tr = document.createElement("tr");
+            tr.id = "r"+i;
+            tr.innerHTML = `
+                <td>${r.Fecha}</td><td>${r.Descripción}</td>
+                <td>${fmt(r.Entrada_cant)}</td><td>${(r.Entrada_pu==null||r.Entrada_pu==="")?"":pesos(r.Entrada_pu)}</td><td>${(r.Entrada_total==null||r.Entrada_total==="")?"":pesos(r.Entrada_total)}</td>
+                <td>${fmt(r.Salida_cant)}</td><td>${(r.Salida_pu==null||r.Salida_pu==="")?"":pesos(r.Salida_pu)}</td><td>${(r.Salida_total==null||r.Salida_total==="")?"":pesos(r.Salida_total)}</td>
+                <td>${fmt(r.Saldo_cant)}</td><td>${(r.Saldo_pu==null||r.Saldo_pu==="")?"":pesos(r.Saldo_pu)}</td><td>${(r.Saldo_total==null||r.Saldo_total==="")?"":pesos(r.Saldo_total)}</td>
+            `;
+            tb.appendChild(tr);
+            });
+        }
+
+        function clearPYG(){
+            ["vb","dv","vn","cmvb","cdv","cmvn","ub","go","ro","oi","oe","uai","imp","un"].forEach(id=>{
+            const el = document.getElementById("pyg_"+id);
+            el.textContent = ""; el.classList.add("muted");
+            });
+            narr.textContent = "";
+        }
+
+        function fill(id,val){
+            const el = document.getElementById("pyg_"+id);
+            if(!el) return;
+            el.classList.remove("muted");
+            el.textContent = pesos(val);
+            el.parentElement.classList.add("hi");
+            setTimeout(()=>el.parentElement.classList.remove("hi"),300);
+        }
+
+        // --- Estado para pausa / reanudar ---
+        let voices = [];
+        let isRunning = false;
+        let isPaused = false;
+        let shouldStop = false;
+
+        function pickSpanishVoice(){
+            const prefer = v => v.lang && /^es(-CO)?/i.test(v.lang);
+            const prefer2 = v => v.lang && /^es(-MX|-ES)?/i.test(v.lang);
+            return voices.find(prefer) || voices.find(prefer2) || voices.find(v=>/^es/i.test(v.lang)) || null;
+        }
+
+        function speak(text, {rate=1}={}){
+            return new Promise((resolve)=>{
+            if(!('speechSynthesis' in window)){
+                console.warn("SpeechSynthesis no soportado");
+                resolve(); return;
+            }
+            const u = new SpeechSynthesisUtterance(text);
+            const v = pickSpanishVoice();
+            if(v) u.voice = v;
+            u.lang = (v && v.lang) ? v.lang : "es-ES";
+            u.rate = rate;
+            u.onend = ()=>resolve();
+            u.onerror = ()=>resolve();
+            synth.speak(u);
+            });
+        }
+
+        function loadVoices(){
+            voices = synth.getVoices() || [];
+        }
+        loadVoices();
+        if(typeof speechSynthesis !== "undefined"){
+            speechSynthesis.onvoiceschanged = loadVoices;
+        }
+
+        function stopTTS(){
+            try{ synth.cancel(); }catch(e){}
+        }
+
+        async function waitWhilePaused(){
+            while(isPaused && !shouldStop){
+            await new Promise(res=>setTimeout(res,150));
+            }
+        }
+
+        function stepTexts(p){
+            const vb = pesos(pyg.ventas_brutas);
+            const dv = pesos(pyg.dev_ventas_brutas);
+            const vn = pesos(pyg.ventas_netas);
+            const cmvb = pesos(pyg.cmv_bruto);
+            const cdv = pesos(pyg.costo_dev_venta);
+            const cmvn = pesos(pyg.cmv_neto);
+            const ub = pesos(pyg.utilidad_bruta);
+            const go = pesos(pyg.gastos_op);
+            const ro = pesos(pyg.resultado_operativo);
+            const oi = pesos(pyg.otros_ingresos);
+            const oe = pesos(pyg.otros_egresos);
+            const uai = pesos(pyg.utilidad_ai);
+            const imp = pesos(pyg.impuesto);
+            const un = pesos(pyg.utilidad_neta);
+
+            const u = p.venta_u;
+            const pu = pesos(p.p_venta);
+            const dvu = p.dev_vent;
+            const tasa = Math.round(p.tasa*100);
+
+            return [
+            ["vb", pyg.ventas_brutas, `Iniciamos con las ventas brutas. Tomamos ${u} unidades vendidas y las multiplicamos por el precio de venta ${pu}. El resultado es ${vb}.`],
+            ["dv", pyg.dev_ventas_brutas, `A continuación, restamos las devoluciones en ventas. Volvieron ${dvu} unidades, valorizadas al mismo precio de venta ${pu}. Esto equivale a ${dv}.`],
+            ["vn", pyg.ventas_netas, `Las ventas netas resultan de ventas brutas menos devoluciones en ventas. Obtenemos ${vn}.`],
+
+            ["cmvb", pyg.cmv_bruto, `Ahora pasamos a los costos de mercancía vendida brutos. Este valor proviene directamente del KARDEX según el método de inventario aplicado. Su valor es ${cmvb}.`],
+            ["cdv", pyg.costo_dev_venta, `Luego reconocemos el costo de las unidades devueltas por los clientes. Ese costo se resta de los costos de mercancía vendida brutos y asciende a ${cdv}.`],
+            ["cmvn", pyg.cmv_neto, `Los costos de mercancía vendida netos resultan de restar el costo de las devoluciones en ventas a los costos de mercancía vendida brutos. Obtenemos un valor neto de ${cmvn}.`],
+
+            ["ub", pyg.utilidad_bruta, `La utilidad bruta es ventas netas menos los costos de mercancía vendida netos. Esto nos da ${ub}.`],
+            ["go", pyg.gastos_op, `Luego restamos los gastos operativos parametrizados. En total suman ${go}.`],
+            ["ro", pyg.resultado_operativo, `El resultado operativo es la utilidad bruta menos los gastos operativos. Obtenemos ${ro}.`],
+
+            ["oi", pyg.otros_ingresos, `Sumamos otros ingresos por ${oi}.`],
+            ["oe", pyg.otros_egresos, `Restamos otros egresos por ${oe}.`],
+            ["uai", pyg.utilidad_ai, `Llegamos a la utilidad antes de impuesto, que asciende a ${uai}.`],
+            ["imp", pyg.impuesto, `Aplicamos la tasa de impuesto del ${tasa} por ciento. El impuesto calculado es ${imp}.`],
+            ["un", pyg.utilidad_neta, `Finalmente, la utilidad neta del período es ${un}.`]
+            ];
+        }
+
+        async function run(){
+            // Si ya está corriendo y está en pausa → reanudar
+            if (isRunning && isPaused){
+            isPaused = false;
+            btnPause.textContent = "⏸️ Pausa";
+            try{ synth.resume(); }catch(e){}
+            return;
+            }
+            // Si está corriendo y no está en pausa → ignorar
+            if (isRunning) return;
+
+            // Inicio de una nueva narración
+            shouldStop = false;
+            isPaused = false;
+            isRunning = true;
+            btnPause.textContent = "⏸️ Pausa";
+
+            stopTTS();
+            clearPYG();
+            buildChips();
+            const rate = parseFloat(rateCtl.value || "1");
+            const steps = stepTexts(params);
+
+            for(const [id,val,txt] of steps){
+            if (shouldStop) break;
+            await waitWhilePaused();
+            if (shouldStop) break;
+
+            narr.innerHTML = txt;
+            fill(id, val);
+            const pVoice = speak(txt, {rate});
+            await pVoice;
+            if (shouldStop) break;
+            await waitWhilePaused();
+            if (shouldStop) break;
+            await new Promise(r=>setTimeout(r,180));
+            }
+
+            if (!shouldStop){
+            narr.innerHTML = "✅ Estado de Resultados completado a partir de los datos parametrizados y el KARDEX.";
+            }
+
+            isRunning = false;
+            isPaused = false;
+            btnPause.textContent = "⏸️ Pausa";
+        }
+
+        buildChips();
+        buildKardex();
+
+        // Botón Reproducir / Reanudar
+        btnPlay.onclick = run;
+
+        // Botón Pausa / Reanudar
+        btnPause.onclick = ()=>{
+            if (!isRunning) return;
+            if (!isPaused){
+            isPaused = true;
+            btnPause.textContent = "▶️ Reanudar";
+            try{ synth.pause(); }catch(e){}
+            } else {
+            isPaused = false;
+            btnPause.textContent = "⏸️ Pausa";
+            try{ synth.resume(); }catch(e){}
+            }
+        };
+
+        // Botón Reset (detener todo y limpiar)
+        btnReset.onclick = ()=>{
+            shouldStop = true;
+            isPaused = false;
+            isRunning = false;
+            btnPause.textContent = "⏸️ Pausa";
+            stopTTS();
+            buildChips(); buildKardex(); clearPYG();
+        };
+        })();
+        </script>
+        """
+
+        # Serializar y reemplazar placeholders
+        rows_json = _json.dumps([_as_row(r) for r in kardex_rows], ensure_ascii=False)
+        pyg_json  = _json.dumps(pyg, ensure_ascii=False)
+        params_json = _json.dumps({
+            "venta_u": esc["venta_u"],
+            "p_venta": esc["p_venta"],
+            "dev_vent": esc["dev_vent"],
+            "gastos_op": sum(v for _, v in esc["gastos_operativos"]),
+            "otros_ingresos": sum(v for _, v in esc["otros_ingresos"]),
+            "otros_egresos": sum(v for _, v in esc["otros_egresos"]),
+            "tasa": esc["tasa_impuesto"],
+        }, ensure_ascii=False)
+
+        html = (
+            html_template
+            .replace("__METODO__", metodo)
+            .replace("__ROWS__", rows_json)
+            .replace("__PYG__",  pyg_json)
+            .replace("__PARAMS__", params_json)
+        )
+
+        # Render principal
+        components.html(html, height=860, scrolling=True)
+
+        st.markdown("---")
+        n4_sensibilidad(esc, metodo)
+
+    # =====================================================
+    # TAB 3 — PRÁCTICA IA
+    # =====================================================
+    with tabs[2]:
+        st.subheader("Práctica IA: Estado de Resultados (Nivel 4)")
+        st.caption(
+            "Define un escenario, observa el KARDEX de referencia según el método y completa el Estado de Resultados. "
+            "Luego valida y, si quieres, recibe retroalimentación de IA."
+        )
+
+        # ========= Prefijo de claves (namespacing) =========
+        KP = "lvl4_"
+        K = lambda name: f"{KP}{name}"
+
+        _n4_ensure_default_state(K)
+
+        # ====== CONTROLES SUPERIORES: Método (sin botón aleatorio) ======
+        ctop1, _ = st.columns([1.3, 1])
+        with ctop1:
+            st.selectbox(
+                "Método de valoración (afecta CMV y devoluciones de venta)",
+                ["Promedio Ponderado", "PEPS (FIFO)", "UEPS (LIFO)"],
+                key=K("metodo"),
+            )
+
+        # =========================
+        # Escenario visible (inputs)
+        # =========================
+        st.markdown("#### 🎯 Escenario del ejercicio")
+        colA, colB, colC = st.columns(3)
+        with colA:
+            st.number_input(
+                "Día 1: inventario inicial (u)",
+                min_value=0,
+                step=1,
+                key=K("inv0_u"),
+            )
+            st.number_input(
+                "Día 1: costo unitario inicial",
+                min_value=0.0,
+                step=0.1,
+                key=K("inv0_pu"),
+            )
+        with colB:
+            st.number_input(
+                "Día 2: compra (u)",
+                min_value=0,
+                step=1,
+                key=K("comp1_u"),
+            )
+            st.number_input(
+                "Día 2: costo unitario compra",
+                min_value=0.0,
+                step=0.1,
+                key=K("comp1_pu"),
+            )
+        with colC:
+            st.number_input(
+                "Día 3: venta (u)",
+                min_value=0,
+                step=1,
+                key=K("venta_u"),
+            )
+            st.number_input(
+                "Precio de venta ($/u)",
+                min_value=0.0,
+                step=0.5,
+                key=K("p_venta"),
+            )
+
+        colD, colE, colF = st.columns(3)
+        with colD:
+            st.number_input(
+                "Día 4: devolución en compra (u)",
+                min_value=0,
+                step=1,
+                key=K("dev_comp_u"),
+            )
+        with colE:
+            st.number_input(
+                "Día 5: devolución en venta (u)",
+                min_value=0,
+                step=1,
+                key=K("dev_vent_u"),
+            )
+        with colF:
+            st.slider(
+                "Tasa de impuesto (%)",
+                min_value=0,
+                max_value=50,
+                value=int(st.session_state[K("tasa")] * 100),
+                step=1,
+                key=K("tasa_pct"),
+            )
+        st.session_state[K("tasa")] = float(
+            st.session_state[K("tasa_pct")]
+        ) / 100.0
+
+        st.markdown("##### Gastos operativos (edita los tres ítems)")
+        g1, g2, g3 = st.columns(3)
+        with g1:
+            st.text_input("Ítem 1", key=K("go_1_name"))
+            st.number_input(
+                "Valor 1",
+                min_value=0.0,
+                step=10.0,
+                key=K("go_1_val"),
+            )
+        with g2:
+            st.text_input("Ítem 2", key=K("go_2_name"))
+            st.number_input(
+                "Valor 2",
+                min_value=0.0,
+                step=10.0,
+                key=K("go_2_val"),
+            )
+        with g3:
+            st.text_input("Ítem 3", key=K("go_3_name"))
+            st.number_input(
+                "Valor 3",
+                min_value=0.0,
+                step=10.0,
+                key=K("go_3_val"),
+            )
+
+        o1, o2 = st.columns(2)
+        with o1:
+            st.number_input(
+                "Otros ingresos (total)",
+                min_value=0.0,
+                step=10.0,
+                key=K("otros_ing"),
+            )
+        with o2:
+            st.number_input(
+                "Otros egresos (total)",
+                min_value=0.0,
+                step=10.0,
+                key=K("otros_egr"),
+            )
+
+        # =========================
+        # Mostrar KARDEX de referencia
+        # =========================
+        st.markdown("---")
+        st.markdown("### 🧮 KARDEX de referencia")
+        st.caption(
+            "Este KARDEX se construye con la misma lógica del Ejemplo guiado y "
+            "se actualiza con el método de valoración seleccionado arriba."
+        )
+
+        esc_prac = _n4_escenario_practica(K)
+        metodo_actual = st.session_state[K("metodo")]
+        df_kdx_ref = _build_kardex_expected(esc_prac, metodo_actual).to_frame()
+        st.dataframe(df_kdx_ref, use_container_width=True)
+
+        # =========================
+        # Estado de Resultados (editor + validador)
+        # =========================
+        st.markdown("---")
+        st.markdown("### 📑 Estado de Resultados — completa los valores")
+
+        pyg_expected = _build_pyg_expected_from_kardex(esc_prac, metodo_actual)
+
+        order_rows = [
+            "Ventas brutas",
+            "(-) Devoluciones en ventas",
+            "Ventas netas",
+            "Costos de mercancía vendida brutos",
+            "(-) Costo devolución en ventas",
+            "Costos de mercancía vendida netos",
+            "Utilidad bruta",
+            "Gastos operativos",
+            "Utilidad Operativa",
+            "Otros ingresos",
+            "Otros egresos",
+            "Utilidad antes de impuesto",
+            "Impuesto",
+            "Utilidad neta",
+        ]
+        df_blank_pyg = pd.DataFrame({"Rubro": order_rows, "Valor": [None] * len(order_rows)})
+
+        st.caption(
+            "Ingresa los valores numéricos. El validador exige coherencia total con el escenario "
+            "y el método seleccionado (incluyendo CMV brutos, devoluciones y utilidad). "
+            "Se permite un margen de error de ±5 unidades monetarias por renglón para absorber diferencias de redondeo."
+        )
+        edited_pyg = st.data_editor(
+            df_blank_pyg,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Rubro": st.column_config.TextColumn(disabled=True),
+                "Valor": st.column_config.NumberColumn(
+                    step=0.01, help="Valor monetario (usa números)"
+                ),
+            },
+            key=K("pyg_student_editor"),
+            num_rows="fixed",
+            disabled=False,
+        )
+
+        with st.form(K("pyg_check_form")):
+            ask_ai = st.checkbox(
+                "💬 Retroalimentación de IA (opcional)",
+                value=False,
+                key=K("ai_cb"),
+            )
+            submitted = st.form_submit_button("✅ Validar mi Estado de Resultados")
+
+        if submitted:
+            tol = 5.0  # margen de error
+
+            checks = []
+            correct_rows = 0
+            for i, rubro in enumerate(order_rows):
+                usr_val = _to_float_or_none(edited_pyg.iloc[i]["Valor"])
+                exp_val = float(pyg_expected[rubro])
+                ok = _near(usr_val, exp_val, tol)
+                checks.append((rubro, usr_val, exp_val, ok))
+                if ok:
+                    correct_rows += 1
+
+            st.metric(
+                "ER — renglones correctos",
+                f"{correct_rows}/{len(order_rows)}",
+            )
+            for rubro, usr, exp, ok in checks:
+                badge = "✅" if ok else "❌"
+                usr_txt = "—" if usr is None else f"{usr:.2f}"
+                st.write(
+                    f"{badge} **{rubro}** — tu valor: {usr_txt} | esperado: {exp:.2f}"
+                )
+
+            if correct_rows == len(order_rows):
+                st.success(
+                    "¡Excelente! Tu Estado de Resultados es consistente con el escenario, "
+                    "el KARDEX y el método de valoración (dentro del margen de error permitido)."
+                )
+            else:
+                st.warning(
+                    "Hay diferencias. Revisa la secuencia y los vínculos con el KARDEX "
+                    "(ventas, CMV brutos, devoluciones y cálculo del impuesto). "
+                    "Recuerda que hay un margen de ±5 unidades monetarias por renglón."
+                )
+
+            if ask_ai:
+                try:
+                    intento_txt = "\n".join(
+                        [
+                            f"{r}: {('—' if v is None else f'{v:.2f}')}"
+                            for r, v, _, _ in checks
+                        ]
+                    )
+                    esperado_txt = "\n".join(
+                        [
+                            f"{r}: {float(pyg_expected[r]):.2f}"
+                            for r in order_rows
+                        ]
+                    )
+                    metodo_fb = st.session_state[K("metodo")]
+                    tasa_pct = int(st.session_state[K("tasa")] * 100)
+                    prompt_fb = (
+                        "Evalúa el Estado de Resultados diligenciado por el estudiante.\n"
+                        f"Método de valoración: {metodo_fb}. Tasa de impuesto: {tasa_pct}%.\n"
+                        "Usa como base el KARDEX del período (saldo inicial, compra, venta, devoluciones) "
+                        "y los rubros del período.\n\n"
+                        "Valores del estudiante:\n"
+                        + intento_txt
+                        + "\n\n"
+                        "Valores esperados:\n"
+                        + esperado_txt
+                        + "\n\n"
+                        "Indica: (1) errores por renglón, (2) explicación paso a paso, "
+                        "(3) tips para no confundir ventas netas, CMV brutos, devoluciones en ventas, "
+                        "utilidad bruta y cálculo del impuesto."
+                    )
+                    # Streaming: el texto aparece desde el primer token
+                    with st.expander(
+                        "💬 Retroalimentación de la IA (Estado de Resultados)", expanded=True
+                    ):
+                        st.write_stream(ia_feedback_stream(prompt_fb))
+                except Exception as e:
+                    st.info(
+                        "La retroalimentación de IA no está disponible en este entorno."
+                    )
+                    st.caption(f"Detalle técnico: {e}")
+
+    # =====================================================
+    # TAB 4 — EVALUACIÓN FINAL
+    # =====================================================
+    with tabs[3]:
+        st.subheader("Evaluación final del Nivel 4")
+        st.caption("Debes acertar **5 de 5** para aprobar y avanzar.")
+
+        # ---------- Namespacing (CLAVES ÚNICAS) ----------
+        KP = N4_FINAL_KP
+        K = lambda name: f"{KP}{name}"
+
+        # =====================================================
+        # FORM — 2 MCQ + 2 abiertas + 1 ejercicio (tipo práctica)
+        # =====================================================
+        with st.form(K("eval_form")):
+            st.markdown("### Preguntas de selección múltiple")
+
+            q1 = st.radio(
+                "1) En sistema perpetuo, ¿cómo se obtiene el Costo de la Mercancía Vendida (CMV) para el Estado de Resultados?",
+                [
+                    "a) Con la fórmula periódica: saldo inicial + compras – saldo final.",
+                    "b) Directamente del KARDEX según el método (PP/PEPS/UEPS), incluyendo devoluciones.",
+                    "c) Sumando todas las compras netas del período.",
+                    "d) Con el promedio de precios de venta y compra.",
+                ],
+                index=None,
+                key=K("q1")
+            )
+
+            q2 = st.radio(
+                "2) ¿Cuál es el efecto de una devolución en ventas sobre el CMV y las ventas netas?",
+                [
+                    "a) Aumenta el CMV y aumenta las ventas netas.",
+                    "b) Disminuye el CMV y disminuye las ventas netas.",
+                    "c) No afecta el CMV y aumenta las ventas netas.",
+                    "d) Aumenta el CMV y disminuye las ventas netas.",
+                ],
+                index=None,
+                key=K("q2")
+            )
+
+            st.markdown("### Preguntas abiertas")
+            open1 = st.text_area(
+                "3) Explica la relación entre el KARDEX y el Estado de Resultados en sistema perpetuo, "
+                "indicando específicamente cómo influye el método de inventario en el cálculo del CMV.",
+                height=140,
+                key=K("open1")
+            )
+            ask_ai_open1 = st.checkbox("💬 Pedir feedback para la pregunta 3 (opcional)", key=K("ai_open1"), value=False)
+
+            open2 = st.text_area(
+                "4) Bajo el método Promedio Ponderado, describe paso a paso cómo impactan en el Estado de Resultados: "
+                "(i) una devolución en compras y (ii) una devolución en ventas.",
+                height=140,
+                key=K("open2")
+            )
+            ask_ai_open2 = st.checkbox("💬 Pedir feedback para la pregunta 4 (opcional)", key=K("ai_open2"), value=False)
+
+            # ---------- Q5: Ejercicio tipo PRÁCTICA ----------
+            st.markdown("### Ejercicio tipo práctica — Estado de Resultados (Promedio Ponderado)")
+            _sc = exam_scenario_q5()
+            total_gastos = sum(v for _, v in _sc["gastos_operativos"])
+
+            # (1) Escenario — Solo variables clave visibles
+            st.markdown("#### **Escenario — Empresa “Mercantil XYZ S.A.S.”**")
+
+            valores_escenario = {
+                "Cantidad vendida": f"{_sc['venta_u']} unidades",
+                "Precio de venta": f"${_sc['p_venta']:,.2f}",
+                "Gastos operacionales totales": f"${total_gastos:,.2f}",
+                "Otros ingresos": f"${_sc['otros_ing']:,.2f}",
+                "Otros egresos": f"${_sc['otros_egr']:,.2f}",
+                "Tasa de impuesto": f"{int(_sc['tasa']*100)} %",
+                "Método": _sc["metodo"],
+            }
+
+            st.markdown(
+                "\n".join([f"- **{k}:** {v}" for k, v in valores_escenario.items()])
+            )
+
+            # (2) KARDEX de referencia (solo PP)
+            st.markdown("#### 🧮 KARDEX de referencia (Promedio Ponderado)")
+            df_kdx_pp = _kardex_rows_pp(_sc).to_frame()
+            st.dataframe(df_kdx_pp, use_container_width=True)
+
+            # (3) ✍️ Completa tu Estado de Resultados
+            order_rows = [
+                "Ventas brutas",
+                "(-) Devoluciones en ventas",
+                "Ventas netas",
+                "Costos de mercancía vendida brutos",
+                "(-) Costo devolución en ventas",
+                "Costos de mercancía vendida netos",
+                "Utilidad bruta",
+                "Gastos operativos",
+                "Utilidad Operativa",
+                "Otros ingresos",
+                "Otros egresos",
+                "Utilidad antes de impuesto",
+                "Impuesto",
+                "Utilidad neta"
+            ]
+            df_er_blank = _pd.DataFrame({"Rubro": order_rows, "Valor": [""]*len(order_rows)})
+
+            st.markdown("#### ✍️ Completa el **Estado de Resultados**")
+            st.caption("Diligencia los valores numéricos. El validador verificará rubro por rubro con tolerancia ±5.")
+            edited_er = st.data_editor(
+                df_er_blank,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Rubro": st.column_config.TextColumn(disabled=True),
+                    "Valor": st.column_config.NumberColumn(step=0.01, help="Valor monetario (usa números)"),
+                },
+                key=K("er_editor"),
+                num_rows="fixed",
+                disabled=False
+            )
+
+            # Feedback IA específico del ejercicio (opcional)
+            ask_ai_q5 = st.checkbox("💬 Retroalimentación de IA para el ejercicio (opcional)", key=K("ai_q5"), value=False)
+
+            submitted = st.form_submit_button("🧪 Enviar evaluación")
+
+        # =====================================================
+        # Corrección y resultado
+        # =====================================================
+        if submitted:
+            # --- MCQ ---
+            correct_mcq = {
+                K("q1"): "b) Directamente del KARDEX según el método (PP/PEPS/UEPS), incluyendo devoluciones.",
+                K("q2"): "b) Disminuye el CMV y disminuye las ventas netas.",
+            }
+            q1_ok = (st.session_state.get(K("q1")) == correct_mcq[K("q1")])
+            q2_ok = (st.session_state.get(K("q2")) == correct_mcq[K("q2")])
+
+            # --- Abiertas ---
+            open1_text = st.session_state.get(K("open1"), "") or ""
+            open2_text = st.session_state.get(K("open2"), "") or ""
+            focus_q3 = "Relación KARDEX ↔ Estado de Resultados en sistema perpetuo; impacto del método de inventario en el CMV."
+            focus_q4 = "Efecto en el Estado de Resultados de devoluciones en compras y en ventas bajo Promedio Ponderado."
+
+            expected_pyg = {
+                "Ventas brutas": 2000.00,
+                "(-) Devoluciones en ventas": 160.00,
+                "Ventas netas": 1840.00,
+                "Costos de mercancía vendida brutos": 1071.43,
+                "(-) Costo devolución en ventas": 85.71,
+                "Costos de mercancía vendida netos": 985.71,
+                "Utilidad bruta": 854.29,
+                "Gastos operativos": 350.00,
+                "Utilidad Operativa": 504.29,
+                "Otros ingresos": 40.00,
+                "Otros egresos": 20.00,
+                "Utilidad antes de impuesto": 524.29,
+                "Impuesto": 157.29,
+                "Utilidad neta": 367.00
+            }
+
+            # ===== Q5: Validación detallada del Estado de Resultados =====
+            TOL = 0.5
+
+            er_checks = []
+            er_errors = []
+            er_ok_count = 0
+
+            for i, row in edited_er.iterrows():
+                rubro = str(row.get("Rubro", "")).strip()
+                usr_val = _to_float_safe(row.get("Valor", ""))
+                exp_val = expected_pyg.get(rubro, None)
+
+                ok = _near(usr_val, exp_val, TOL)
+                er_checks.append((rubro, usr_val, exp_val, ok))
+
+                if ok:
+                    er_ok_count += 1
+                else:
+                    uv = "—" if usr_val is None else f"{usr_val:.2f}"
+                    ev = "—" if exp_val is None else f"{exp_val:.2f}"
+                    er_errors.append(
+                        f"{rubro}: registraste {uv} y el valor correcto era {ev}"
+                    )
+
+            q5_ok = (er_ok_count == len(order_rows))
+
+            # --- Feedback IA específico Q5 (opcional) ---
+            q5_fb = ""
+            prompt_q5 = None
+            if st.session_state.get(K("ai_q5"), False):
+                intento_lines = []
+                for rubro, usr_val, exp_val, ok in er_checks:
+                    uv = "—" if usr_val is None else f"{usr_val:.2f}"
+                    intento_lines.append(f"{rubro}: {uv}")
+                intento_txt = "\n".join(intento_lines)
+                exp_txt = "\n".join([f"{k}: {v:.2f}" for k, v in expected_pyg.items()])
+
+                prompt_q5 = (
+                    "Evalúa el Estado de Resultados diligenciado por el estudiante. "
+                    "Centra el feedback en: coherencia con KARDEX PP (CMV brutos y costo de devoluciones), "
+                    "ventas netas, CMV neto y derivación de utilidades e impuesto. "
+                    "Primera línea EXACTA: 'SCORE: 1' si ≥80% de rubros están correctos y no hay errores conceptuales graves; "
+                    "si no, 'SCORE: 0'. Luego 3–5 líneas con correcciones puntuales.\n\n"
+                    f"INTENTO (valores del estudiante):\n{intento_txt}\n\n"
+                    f"ESPERADO (PP):\n{exp_txt}"
+                )
+
+            # --- Todas las llamadas de IA del envío en paralelo, con un plazo único ---
+            # Lo que no responda a tiempo se califica como "IA falló" (heurística local)
+            sin_ia = lambda prompt, default="": default
+            jobs = {
+                "q3": lambda: grade_open_generic(open1_text, focus_q3, rubrica="n4_q3_kardex_er"),
+                "q4": lambda: grade_open_generic(open2_text, focus_q4, rubrica="n4_q4_devoluciones_er"),
+            }
+            fallbacks = {
+                "q3": lambda: grade_open_generic(open1_text, focus_q3, ask=sin_ia, rubrica="n4_q3_kardex_er"),
+                "q4": lambda: grade_open_generic(open2_text, focus_q4, ask=sin_ia, rubrica="n4_q4_devoluciones_er"),
+            }
+            if prompt_q5:
+                jobs["q5"] = lambda: safe_ia_feedback(prompt_q5, default="")
+                fallbacks["q5"] = lambda: ""
+            abiertas = grade_open_answers(jobs, fallbacks)
+
+            q3_score1, q3_fb = abiertas["q3"]
+            q4_score1, q4_fb = abiertas["q4"]
+
+            if not st.session_state.get(K("ai_open1"), False):
+                q3_fb = ""
+            else:
+                q3_fb = _sanitize_on_topic(q3_fb)
+
+            if not st.session_state.get(K("ai_open2"), False):
+                q4_fb = ""
+            else:
+                q4_fb = _sanitize_on_topic(q4_fb)
+
+            if prompt_q5:
+                q5_fb = _sanitize_on_topic(abiertas["q5"])
+
+            # --- Resultado global ---
+            total_hits = int(q1_ok) + int(q2_ok) + int(q3_score1) + int(q4_score1) + int(q5_ok)
+            passed = (total_hits == 5)
+
+            try:
+                record_attempt(username, level=4, score=total_hits, passed=passed)  # noqa: F821
+            except Exception:
+                pass
+
+            st.markdown("### Resultado")
+            cA, cB = st.columns(2)
+            with cA: st.metric("Aciertos", f"{total_hits}/5")
+            with cB: st.metric("Estado", "APROBADO ✅" if passed else "NO APROBADO ❌")
+
+            with st.expander("Detalle de corrección"):
+                st.write(f"**Q1 (MCQ):** {'✅' if q1_ok else '❌'}")
+                st.write(f"**Q2 (MCQ):** {'✅' if q2_ok else '❌'}")
+                st.write(f"**Q3 (abierta):** {'✅' if q3_score1==1 else '❌'}")
+                if q3_fb:
+                    st.write("**Feedback Q3 (IA):**")
+                    st.write(q3_fb)
+                st.write(f"**Q4 (abierta):** {'✅' if q4_score1==1 else '❌'}")
+                if q4_fb:
+                    st.write("**Feedback Q4 (IA):**")
+                    st.write(q4_fb)
+
+                st.write(f"**Q5 (Estado de Resultados PP):** {'✅' if q5_ok else '❌'}")
+
+                st.markdown(f"**Rubros correctos en Q5:** {er_ok_count}/{len(order_rows)}")
+
+                for rubro, usr_val, exp_val, ok in er_checks:
+                    uv = "—" if usr_val is None else f"{usr_val:.2f}"
+                    ev = "—" if exp_val is None else f"{exp_val:.2f}"
+
+                    if ok:
+                        st.write(f"✅ **{rubro}** — tu valor: {uv} | esperado: {ev}")
+                    else:
+                        st.write(f"❌ **{rubro}** — tu valor: {uv} | esperado: {ev}")
+
+                if er_errors:
+                    st.warning("Rubros con error en el Estado de Resultados:")
+                    for err in er_errors:
+                        st.write("- " + err)
+
+                if q5_fb:
+                    st.write("**Feedback Q5 (IA):**")
+                    st.write(q5_fb)
+
+                if not q5_ok:
+                    st.caption(
+                        "Pistas: (1) Ventas netas = Ventas brutas − Dev. ventas; "
+                        "(2) El CMV se presenta desagregado: primero costos brutos, luego el costo de las unidades devueltas; "
+                        "(3) CMV neto = CMV brutos − costo de devoluciones en ventas; "
+                        "(4) Utilidad bruta = Ventas netas − CMV neto; "
+                        "(5) Utilidad Operativa, UAI, Impuesto y UN en ese orden."
+                    )
+
+            if passed:
+                try:
+                    set_level_passed(st.session_state.get('progress_col'), username, "level4", total_hits)  # noqa: F821
+                except Exception:
+                    pass
+
+                st.success("🎉 ¡Aprobaste la Evaluación del Nivel 4! Avanzas al siguiente módulo.")
+
+                try:
+                    # NUEVO: guardar resultado y respuestas para la pantalla de celebración
+                    st.session_state["celebrate_score_text"] = f"{total_hits}/5"
+                    st.session_state["celebrate_answers_title"] = "✅ Respuestas correctas del Nivel 4"
+                    st.session_state["celebrate_answers"] = [
+                        "1) Selección múltiple: la opción correcta identificaba la estructura adecuada del Estado de Resultados en sistema perpetuo.",
+                        "2) Selección múltiple: la opción correcta explicaba el efecto de las devoluciones en ventas sobre las ventas netas y el CMV.",
+                        "3) Pregunta abierta: era válida una respuesta que explicara que el KARDEX alimenta directamente el CMV y que el método de inventario modifica el valor que pasa al Estado de Resultados.",
+                        "4) Pregunta abierta: era válida una respuesta que describiera paso a paso cómo impactan una devolución en compras y una devolución en ventas bajo Promedio Ponderado.",
+                        "5) Ejercicio final: diligenciaste correctamente el Estado de Resultados con base en el KARDEX y los rubros del período."
+                    ]
+
+                    start_celebration(
+                        message_md=(
+                            "<b>¡Nivel 4 aprobado!</b> 🏆<br><br>"
+                            f"<b>Aciertos:</b> {total_hits}/5<br><br>"
+                            "Completaste el módulo de <b>Estado de Resultados</b>. "
+                            "Ya puedes volver al menú principal."
+                        ),
+                        next_label="Volver al menú",
+                        next_key_value="🏠 Inicio"
+                    )
+
+                except Exception:
+                    pass
+
+            else:
+                st.error(
+                    "No aprobado. Debes acertar 5/5. Repasa la integración KARDEX ↔ ER, "
+                    "el tratamiento de devoluciones y el CMV desagregado (brutos − devoluciones)."
+                )
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Prueba de carga de la app completa, sin red
+#   Levanta el repositorio embebido (REPO_BACKEND=memory), siembra cuentas de
+#   estudiantes y simula N sesiones concurrentes con streamlit.testing
+#   (AppTest): login + M reruns del Nivel 1. Reporta latencia por rerun.
+#   Uso:
+#     python load_test.py                        # 16 sesiones x 10 reruns
+#     python load_test.py --sesiones 64 --reruns 20 --out bench_output.txt
+# =========================================================
+
+import argparse
+import os
+import statistics
+import threading
+import time
+
+os.environ["REPO_BACKEND"] = "memory"
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import storage  # noqa: E402
+
+ADMIN_USER = "admin"
+ADMIN_PASS = "carga-admin-1234"
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Accounting_Learning.py")
+
+
+def sembrar(n: int):
+    # Mismos argumentos que usará repo_init dentro de la app → mismo almacén en memoria
+    _, users_col, progress_col, _ = storage.repo_init_embedded("memory", storage.REPO_SQLITE_PATH, ADMIN_USER, ADMIN_PASS)
+    filas = [{"username": f"alumno{i:04d}", "password": "clave1234", "role": "user"} for i in range(n)]
+    storage.bulk_create_users(users_col, progress_col, filas)
+    return [f["username"] for f in filas]
+
+
+def sesion(usuario: str, reruns: int, lat_ms: list, errores: list, lock: threading.Lock):
+    at = AppTest.from_file(SCRIPT, default_timeout=120)
+    at.secrets["OPENROUTER_API_KEY"] = "carga-dummy-key"
+    at.secrets["admin"] = {"username": ADMIN_USER, "password": ADMIN_PASS}
+    try:
+        at.run()
+        at.text_input(key="login_raw_user").input(usuario)
+        at.text_input(key="login_password").input("clave1234")
+        at.button[0].click().run()
+        if not at.session_state["authenticated"]:
+            raise RuntimeError("login falló")
+        propias = []
+        for _ in range(reruns):
+            t0 = time.perf_counter()
+            at.run()
+            propias.append((time.perf_counter() - t0) * 1000.0)
+            if at.exception:
+                raise RuntimeError(at.exception[0].value)
+        with lock:
+            lat_ms.extend(propias)
+    except Exception as e:
+        with lock:
+            errores.append(f"{usuario}: {e}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga concurrente sobre el backend embebido")
+    ap.add_argument("--sesiones", type=int, default=16)
+    ap.add_argument("--reruns", type=int, default=10)
+    ap.add_argument("--out", default=None, help="Archivo donde anexar el resultado")
+    args = ap.parse_args()
+
+    usuarios = sembrar(args.sesiones)
+    lat_ms, errores, lock = [], [], threading.Lock()
+    hilos = [threading.Thread(target=sesion, args=(u, args.reruns, lat_ms, errores, lock)) for u in usuarios]
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    total_s = time.perf_counter() - t0
+
+    if lat_ms:
+        lat_ms.sort()
+        linea = (
+            f"{args.sesiones} sesiones x {args.reruns} reruns en {total_s:.1f} s · "
+            f"rerun mediana={statistics.median(lat_ms):.1f} ms · p95={lat_ms[int(len(lat_ms) * 0.95) - 1]:.1f} ms · "
+            f"máx={lat_ms[-1]:.1f} ms · reruns/s={len(lat_ms) / total_s:.1f} · errores={len(errores)}"
+        )
+    else:
+        linea = f"sin reruns exitosos · errores={len(errores)}"
+    print(linea)
+    for e in errores[:5]:
+        print("  -", e)
+    if args.out:
+        with open(args.out, "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+
+
+if __name__ == "__main__":
+    main()
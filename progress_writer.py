@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Escritura coalescida de progress.current_level
+#   Las páginas de nivel marcan el nivel actual en cada rerun; aquí:
+#   - storage recuerda por sesión el último valor persistido y descarta
+#     las escrituras que no cambian nada (la mayoría).
+#   - Los cambios reales se encolan y un hilo del proceso los escribe;
+#     si llegan varios para el mismo usuario antes del flush, solo sale
+#     el último.
+#   - Contadores de escrituras evitadas / emitidas para el panel admin.
+# =========================================================
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import streamlit as st
+
+# Espera (ms) antes de vaciar la cola, para juntar ráfagas de cambios
+PROGRESS_FLUSH_MS = float(os.getenv("PROGRESS_FLUSH_MS", "200"))
+
+
+class ProgressWriter:
+    def __init__(self, flush_ms: float = PROGRESS_FLUSH_MS):
+        self._flush_s = flush_ms / 1000.0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()   # tomado mientras se escribe un lote
+        self._pendientes = {}                 # (id(col), username) -> (col, username, level_key, ts)
+        self.solicitadas = 0
+        self.evitadas = 0
+        self.coalescidas = 0
+        self.emitidas = 0
+        self.fallidas = 0
+        self._hilo = threading.Thread(target=self._loop, name="progress-writer", daemon=True)
+        self._hilo.start()
+
+    def contar_evitada(self):
+        with self._cond:
+            self.solicitadas += 1
+            self.evitadas += 1
+
+    def encolar(self, progress_col, username: str, level_key: str | None):
+        """Programa la escritura de current_level; reemplaza la pendiente del mismo usuario."""
+        clave = (id(progress_col), username)
+        with self._cond:
+            self.solicitadas += 1
+            if clave in self._pendientes:
+                self.coalescidas += 1
+            self._pendientes[clave] = (progress_col, username, level_key, datetime.now(timezone.utc))
+            self._cond.notify()
+
+    def descartar(self, progress_col, username: str):
+        """
+        Quita la escritura pendiente del usuario y espera la que esté en curso.
+        Se usa antes de una escritura síncrona de current_level (p. ej. al aprobar
+        un nivel) para que un flush tardío no la pise.
+        """
+        with self._cond:
+            self._pendientes.pop((id(progress_col), username), None)
+        with self._flush_lock:
+            pass
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pendientes:
+                    self._cond.wait()
+            time.sleep(self._flush_s)
+            self.flush()
+
+    def flush(self):
+        """Escribe todo lo pendiente (también se llama al cerrar el proceso)."""
+        with self._flush_lock:
+            with self._cond:
+                lote = list(self._pendientes.values())
+                self._pendientes.clear()
+            for progress_col, username, level_key, ts in lote:
+                try:
+                    progress_col.update_one(
+                        {"username": username},
+                        {"$set": {"current_level": level_key, "updated_at": ts}},
+                        upsert=True,
+                    )
+                    ok = True
+                except Exception:
+                    ok = False
+                with self._cond:
+                    if ok:
+                        self.emitidas += 1
+                    else:
+                        self.fallidas += 1
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "solicitadas": self.solicitadas,
+                "evitadas": self.evitadas,
+                "coalescidas": self.coalescidas,
+                "emitidas": self.emitidas,
+                "fallidas": self.fallidas,
+                "pendientes": len(self._pendientes),
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_progress_writer() -> ProgressWriter:
+    writer = ProgressWriter()
+    atexit.register(writer.flush)
+    return writer
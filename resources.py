@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Registro de recursos de proceso
+#   Todo lo costoso de construir (cliente OpenAI/OpenRouter, certificados,
+#   variables de entorno, regex compiladas) se crea UNA sola vez por
+#   proceso vía st.cache_resource y se reutiliza en cada rerun.
+# =========================================================
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Hilos compartidos para calificar preguntas abiertas en paralelo
+GRADING_MAX_WORKERS = int(os.getenv("GRADING_MAX_WORKERS", "8"))
+
+
+@st.cache_resource(show_spinner=False)
+def load_env_once() -> bool:
+    """Carga el .env local una vez por proceso."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return True
+
+
+@st.cache_resource(show_spinner=False)
+def setup_certifi() -> str:
+    """Fuerza el bundle de certificados de certifi (una vez por proceso)."""
+    import certifi
+
+    ca = certifi.where()
+    os.environ.setdefault("SSL_CERT_FILE", ca)
+    return ca
+
+
+def get_openrouter_api_key():
+    """API Key desde secrets (Streamlit Cloud) o variables de entorno (.env local)."""
+    load_env_once()
+    try:
+        key = st.secrets.get("OPENROUTER_API_KEY")
+    except Exception:
+        key = None
+    return key or os.getenv("OPENROUTER_API_KEY")
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key: str):
+    """
+    Cliente OpenRouter compartido por todas las sesiones del proceso.
+    Usa el transporte keep-alive con plazos explícitos; los reintentos
+    los hace _chat_with_model (acotados y con jitter), no el SDK.
+    """
+    from openai import OpenAI
+
+    from ia_transport import build_http_client, build_timeout
+
+    return OpenAI(
+        base_url=OPENROUTER_BASE_URL,
+        api_key=api_key,
+        http_client=build_http_client(),
+        timeout=build_timeout(),
+        max_retries=0,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_grading_pool() -> ThreadPoolExecutor:
+    """Pool acotado para las llamadas de IA de los exámenes (compartido entre sesiones)."""
+    return ThreadPoolExecutor(max_workers=GRADING_MAX_WORKERS, thread_name_prefix="ia-grading")
+
+
+@st.cache_resource(show_spinner=False)
+def get_hedge_pool() -> ThreadPoolExecutor:
+    """Pool aparte para las llamadas con hedging (no compite con el de calificación)."""
+    return ThreadPoolExecutor(max_workers=GRADING_MAX_WORKERS * 2, thread_name_prefix="ia-hedge")
+
+
+@st.cache_resource(show_spinner=False)
+def compiled_patterns() -> dict:
+    """Regex usadas en la lectura de puntajes de IA y en las heurísticas."""
+    return {
+        "score_line": re.compile(r"SCORE:\s*([01])\s*"),
+        "palabras": re.compile(r"[a-zA-ZáéíóúÁÉÍÓÚñÑ]+"),
+    }
+
+
+def rx(name: str):
+    """Atajo: patrón compilado por nombre."""
+    return compiled_patterns()[name]
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Clasificador local de respuestas abiertas (primer filtro antes de la IA)
+#   - Normaliza (minúsculas, sin tildes), tokeniza y aplica un stemmer
+#     ligero en español (recorte de sufijos).
+#   - Conceptos por pregunta: frases de raíces y "cercanías" (A seguido de B
+#     a pocas palabras, sin cruzar comas/puntos).
+#   - Los prefijos cortos ("sub", "baj") o marcados con "=" ("=mayor") deben
+#     ser la palabra o la raíz completa: "sube" cuenta, "subjetivo" y
+#     "mayoría" no.
+#   - Negación: "no", "nunca", "ni", "sin"... anulan el concepto que sigue
+#     (así "no aumenta" no aprueba). "Nada que ver", "sin relación" o "no
+#     tiene relación" niegan la relación y el resto de la cláusula. Una
+#     cláusula que termina en "?" es una pregunta, no una afirmación, y se
+#     descarta.
+#   - Aprobar exige que los conceptos vayan con la relación que pide la
+#     pregunta ("requiere"), no que solo se mencionen; y una respuesta de
+#     menos de 3 palabras nunca se aprueba localmente.
+#   - Devuelve (decisión, confianza, motivo). Solo los rechazos claros se
+#     deciden localmente; una aprobación sale con confianza baja y la
+#     confirma la IA.
+# =========================================================
+
+import re
+import unicodedata
+
+# Umbral para decidir sin llamar a la IA
+CONFIANZA_MIN = 0.8
+# Las aprobaciones quedan por debajo del umbral: la rúbrica las sugiere, la IA decide
+CONFIANZA_APROBAR = 0.7
+# Prefijos más cortos que esto deben coincidir con la palabra o la raíz completa
+_PREFIJO_MIN = 4
+
+_TOKEN = re.compile(r"[a-z0-9ñ]+|[.,;:!?()]")
+_SEPARADORES = frozenset(".,;:!?()")
+_NEGADORES = frozenset({"no", "nunca", "ni", "tampoco", "sin", "jamas", "ningun", "ninguna", "nada"})
+# Frases que niegan la relación misma ("no tiene nada que ver con..."): se reemplazan
+# por una marca que cuenta como "relación" negada y niega el resto de la cláusula
+_SIN_RELACION = re.compile(
+    r"\b(?:no\s+(?:tiene|tienen|hay)\s+(?:nada\s+)?que\s+ver|nada\s+que\s+ver"
+    r"|(?:no\s+(?:tiene|tienen|hay)|sin)\s+(?:ninguna\s+)?relacion\w*|ninguna\s+relacion\w*"
+    r"|no\s+se\s+relaciona\w*|no\s+esta\w*\s+relacionad\w*)\b"
+)
+_MARCA_SIN_RELACION = "sinrelacionmarca"
+_STOPWORDS = frozenset({
+    "de", "la", "el", "los", "las", "del", "al", "en", "que", "se", "y", "o", "u", "un", "una",
+    "lo", "por", "es", "son", "su", "sus", "le", "les", "me", "mi", "tu", "porque", "pues",
+    "cuando", "si", "como", "esto", "eso", "este", "esta", "ese", "esa", "muy", "mas",
+})
+# Sufijos de mayor a menor longitud (stemmer ligero, estilo Snowball simplificado)
+_SUFIJOS = (
+    "amientos", "imientos", "amiento", "imiento", "aciones", "uciones", "adoras", "adores",
+    "ancias", "amente", "mente", "acion", "ucion", "ancia", "ando", "iendo", "yendo",
+    "aron", "ieron", "ados", "idos", "adas", "idas", "ado", "ido", "ada", "ida",
+    "ar", "er", "ir", "as", "es", "os", "an", "en", "a", "e", "o", "s",
+)
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin tildes (la ñ se conserva)."""
+    t = (text or "").lower().replace("ñ", "\x00")
+    t = unicodedata.normalize("NFKD", t)
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return t.replace("\x00", "ñ")
+
+
+def stem(word: str) -> str:
+    for suf in _SUFIJOS:
+        if word.endswith(suf) and len(word) - len(suf) >= 3:
+            return word[: -len(suf)]
+    return word
+
+
+def analizar(text: str) -> list:
+    """
+    Tokens listos para comparar: [(palabra, raíz, negado), ...] sin stopwords.
+    Los separadores se conservan como (",", ",", False) para cortar cercanías y negaciones;
+    las palabras de una cláusula interrogativa ("¿el CMV sube?") se descartan.
+    """
+    out = []
+    negar = 0
+    inicio = 0  # primera posición de la cláusula actual
+    texto = _SIN_RELACION.sub(f" {_MARCA_SIN_RELACION} ", fold(text))
+    for tok in _TOKEN.findall(texto):
+        if tok == _MARCA_SIN_RELACION:
+            out.append(("relacion", "relacion", True))
+            negar = len(texto)  # hasta el fin de la cláusula
+        elif tok in _SEPARADORES:
+            if tok == "?":
+                del out[inicio:]
+            out.append((tok, tok, False))
+            inicio = len(out)
+            negar = 0
+        elif tok in _NEGADORES:
+            negar = 3  # alcance: las 3 palabras de contenido siguientes
+        elif tok in _STOPWORDS:
+            continue
+        else:
+            out.append((tok, stem(tok), negar > 0))
+            negar = max(0, negar - 1)
+    return out
+
+
+# ---------- Patrones ----------
+def _frase(spec: str):
+    """
+    Frase de prefijos: cada palabra se compara contra la palabra y contra su raíz.
+    Con "=" delante, o si es más corta que _PREFIJO_MIN, debe coincidir completa.
+    """
+    out = []
+    for w in fold(spec).split():
+        completa = w.startswith("=")
+        w = w.lstrip("=")
+        if w not in _STOPWORDS:
+            out.append((w, stem(w), completa or len(w) < _PREFIJO_MIN))
+    return tuple(out)
+
+
+def _compilar(conceptos: dict) -> dict:
+    comp = {}
+    for nombre, alternativas in conceptos.items():
+        lista = []
+        for alt in alternativas:
+            if isinstance(alt, tuple):  # ("cerca", conceptoA, conceptoB, ventana)
+                lista.append(alt)
+            else:
+                lista.append(_frase(alt))
+        comp[nombre] = lista
+    return comp
+
+
+def _match_frase(tokens, frase):
+    """Posiciones (inicio, fin, negado) donde aparece la frase (prefijo por palabra o por raíz)."""
+    hits = []
+    n = len(frase)
+    for i in range(len(tokens) - n + 1):
+        ok = True
+        for k in range(n):
+            palabra, raiz, _ = tokens[i + k]
+            pref, pref_raiz, completa = frase[k]
+            if completa:
+                coincide = palabra == pref or raiz in (pref, pref_raiz)
+            else:
+                coincide = palabra.startswith(pref) or raiz.startswith(pref_raiz)
+            if palabra in _SEPARADORES or not coincide:
+                ok = False
+                break
+        if ok:
+            hits.append((i, i + n - 1, tokens[i][2]))
+    return hits
+
+
+def _buscar(tokens, comp, nombre, memo):
+    if nombre in memo:
+        return memo[nombre]
+    hits = []
+    for alt in comp[nombre]:
+        if alt and alt[0] == "cerca":
+            _, a, b, ventana = alt
+            for ia, fa, na in _buscar(tokens, comp, a, memo):
+                for ib, fb, nb in _buscar(tokens, comp, b, memo):
+                    if 0 < ib - fa <= ventana and not any(
+                        tokens[j][0] in _SEPARADORES for j in range(fa + 1, ib)
+                    ):
+                        hits.append((ia, fb, na or nb))
+        else:
+            hits.extend(_match_frase(tokens, alt))
+    memo[nombre] = hits
+    return hits
+
+
+# ---------- Rúbricas por pregunta ----------
+_CMV = ["cmv", "costo venta", "costo mercancia vendida", "costos ventas"]
+_SUBE = ["aument", "sub", "subi", "increment", "=mayor", "crec", "elev"]
+_BAJA = ["disminu", "baj", "reduc", "=menor", "decrec", "cae", "caen", "caer", "cayo"]
+# Verbos de relación/efecto: si aparecen negados ("no afecta", "no tiene relación") la
+# respuesta contradice la idea central
+_RELACION = ["relacion", "afect", "cambi", "influ", "impact", "modific", "ajust", "aliment",
+             "conect", "vincul", "determin", "refle"]
+# Verbos de traslado ("el KARDEX da el CMV que va al ER"): relacionan sin ser efecto
+_TRASLADO = ["da", "dan", "va", "van", "pasa", "llev", "calcul", "registr", "gener", "trasl", "sirv"]
+# Conceptos que solo conectan ideas: por sí solos no cuentan como contenido
+_CONECTORES = frozenset({"relacion"})
+
+RUBRICAS = {
+    # Nivel 1: si disminuye el inventario final, el CMV aumenta
+    "n1_cmv_inv_final": {
+        "conceptos": {
+            "cmv": _CMV,
+            "sube": _SUBE,
+            "baja": _BAJA,
+            "cmv_sube": [("cerca", "cmv", "sube", 3), ("cerca", "sube", "cmv", 1)],
+            "cmv_baja": [("cerca", "cmv", "baja", 3), ("cerca", "baja", "cmv", 1)],
+            "resta_menos": ["rest menos", "descuent menos", "rest poc"],
+            "sin_cambio": ["igual", "mantien", "qued igual"],
+            "cambia": ["cambi", "vari", "afect", "modific", "relacion"],
+        },
+        "aprobar": [["cmv_sube"], ["resta_menos", "cmv"]],
+        "reprobar": [["cmv_baja"], ["sin_cambio"]],
+        "negados_reprueban": ["sube", "cmv_sube", "cambia"],
+        "fb_aprobado": "Correcto: con menos inventario final se resta menos en la fórmula y el CMV aumenta.",
+        "fb_reprobado": "Revisa la fórmula CMV = Inv. inicial + Compras netas − Inv. final: si el inventario final baja, se resta menos y el CMV sube.",
+    },
+    # Nivel 2 · Q2: importancia de elegir el método de valoración
+    "n2_q2_importancia_metodo": {
+        "conceptos": {
+            "cmv": _CMV,
+            "utilidad": ["utilid", "gananci", "margen", "rentabil"],
+            "estados": ["estad financ", "estado result", "balanc", "informe"],
+            "impuestos": ["impuest", "tribut", "renta"],
+            "decisiones": ["decision", "decid", "gestion"],
+            "comparabilidad": ["compar", "consisten", "uniform"],
+            "inventario": ["inventari", "valor inventari", "sald"],
+            "precios": ["preci", "inflacion"],
+            "fuera_tema": ["gasto financier", "pasiv", "endeud", "apalanc"],
+            "importa": ["import", "afect", "impact", "influy", "influ", "cambi", "determin",
+                        "defin", "permit", "modific", "tom decision", "relacion"],
+        },
+        "aprobar_min": (2, ["cmv", "utilidad", "estados", "impuestos", "decisiones", "comparabilidad", "inventario", "precios"]),
+        "requiere": ["importa"],
+        "reprobar": [["fuera_tema"]],
+        "negados_reprueban": ["importa"],
+        "fb_aprobado": "Bien: el método cambia el CMV y la utilidad, y con ello los estados financieros, los impuestos y las decisiones.",
+        "fb_reprobado": "Relaciona el método con su efecto en el CMV, la utilidad o los estados financieros.",
+    },
+    # Nivel 2 · Q3: cuándo conviene Promedio Ponderado
+    "n2_q3_cuando_pp": {
+        "conceptos": {
+            "promedio": ["promedi", "ponder"],
+            "frecuentes": ["frecuent", "much compr", "compr much", "much vec", "vari compr", "constant compr", "continu"],
+            "variables": ["variabl", "fluctu", "volatil", "cambi preci", "preci distint", "distint preci", "oscil"],
+            "estable": ["establ", "suaviz", "uniform", "simplif", "facil", "homogen", "equilibr"],
+            "cmv": _CMV,
+        },
+        "aprobar_min": (2, ["frecuentes", "variables", "estable", "promedio", "cmv"]),
+        "requiere": ["frecuentes", "variables", "estable"],
+        "fb_aprobado": "Bien: el Promedio Ponderado conviene con compras frecuentes a costos variables porque suaviza el costo.",
+        "fb_reprobado": "Piensa en compras frecuentes con costos que cambian: el promedio suaviza el costo unitario.",
+    },
+    # Nivel 3 · Q4: devoluciones y coherencia con el método
+    "n3_q4_devoluciones": {
+        "conceptos": {
+            "devol": ["devol", "reintegr", "regres", "retorn"],
+            "efecto": _CMV + ["inventari", "sald", "unitari", "capa", "metod", "peps", "ueps", "pp", "promedi"],
+            "relacion": _RELACION,
+            "mueve": _SUBE + _BAJA + _RELACION + ["reingres", "sal", "sac", "entr", "registr", "valor"],
+            "ecuacion": ["activ pasiv patrimoni", "ecuacion contabl"],
+            "fuera_tema": ["pasiv", "patrimoni"],
+        },
+        "aprobar": [["devol", "efecto"]],
+        "requiere": ["mueve"],
+        "reprobar": [["ecuacion"], ["fuera_tema"]],
+        "negados_reprueban": ["devol", "relacion"],
+        "fb_aprobado": "Bien: relacionas la devolución con su efecto en el CMV, el inventario o el costo según el método.",
+        "fb_reprobado": "Enfócate en las devoluciones: a qué costo se registran y cómo afectan el CMV y el saldo.",
+    },
+    # Nivel 4 · Q3: KARDEX ↔ Estado de Resultados (sistema perpetuo)
+    "n4_q3_kardex_er": {
+        "conceptos": {
+            "kardex": ["kardex", "inventari perpetu", "perpetu", "tarjet"],
+            "er": ["estado result", "pyg", "perdid gananci"],
+            "cmv": _CMV,
+            "metodo": ["metod", "peps", "ueps", "promedi", "pp"],
+            "utilidad": ["utilid", "gananci", "margen"],
+            "relacion": _RELACION,
+            "traslado": _TRASLADO,
+            "ecuacion": ["activ pasiv patrimoni", "ecuacion contabl"],
+        },
+        "aprobar_min": (2, ["kardex", "er", "cmv", "metodo", "utilidad"]),
+        "requiere": ["relacion", "traslado"],
+        "reprobar": [["ecuacion"]],
+        "negados_reprueban": ["relacion"],
+        "fb_aprobado": "Bien: el KARDEX alimenta el CMV del Estado de Resultados y el método cambia ese valor.",
+        "fb_reprobado": "Conecta el KARDEX (CMV por método) con el Estado de Resultados.",
+    },
+    # Nivel 4 · Q4: devoluciones en compras y ventas en el ER (PP)
+    "n4_q4_devoluciones_er": {
+        "conceptos": {
+            "devol": ["devol", "reintegr", "regres", "retorn"],
+            "efecto": _CMV + ["venta net", "utilid", "inventari", "promedi", "estado result"],
+            "mueve": _SUBE + _BAJA + _RELACION,
+            "ventas": ["vent", "ingres"],
+            # "vent" solo cuenta como efecto si algo la mueve ("reduce las ventas")
+            "mueve_ventas": [("cerca", "mueve", "ventas", 2)],
+            "ecuacion": ["activ pasiv patrimoni", "ecuacion contabl"],
+        },
+        "aprobar": [["devol", "efecto"], ["devol", "mueve_ventas"]],
+        "requiere": ["mueve"],
+        "reprobar": [["ecuacion"]],
+        "negados_reprueban": ["devol", "mueve"],
+        "fb_aprobado": "Bien: las devoluciones ajustan ventas netas y CMV, y eso cambia la utilidad.",
+        "fb_reprobado": "Explica cómo las devoluciones en ventas y compras cambian ventas netas, CMV y utilidad.",
+    },
+}
+_COMPILADAS = {k: _compilar(v["conceptos"]) for k, v in RUBRICAS.items()}
+
+
+def clasificar(pregunta_id: str, texto: str):
+    """
+    Clasifica una respuesta abierta con la rúbrica de la pregunta.
+    Devuelve (decision, confianza, motivo):
+    - decision: True (aprueba), False (no aprueba) o None (ambiguo → IA).
+    - confianza: 0..1; solo se decide localmente si es ≥ CONFIANZA_MIN. Las
+      aprobaciones salen con CONFIANZA_APROBAR (< CONFIANZA_MIN): van a la IA.
+    """
+    rub = RUBRICAS[pregunta_id]
+    comp = _COMPILADAS[pregunta_id]
+    tokens = analizar(texto)
+    palabras = len((texto or "").split())
+
+    memo = {}
+    presentes, negados = set(), set()
+    for nombre in comp:
+        hits = _buscar(tokens, comp, nombre, memo)
+        if any(not neg for _, _, neg in hits):
+            presentes.add(nombre)
+        if any(neg for _, _, neg in hits):
+            negados.add(nombre)
+
+    aprueba = any(all(c in presentes for c in regla) for regla in rub.get("aprobar", []))
+    minimo, lista = rub.get("aprobar_min", (0, []))
+    distintos = sum(1 for c in lista if c in presentes)
+    if minimo and distintos >= minimo:
+        aprueba = True
+    # Mencionar los conceptos no basta: deben ir con la relación que pide la pregunta
+    requiere = rub.get("requiere")
+    sin_relacion = aprueba and bool(requiere) and not any(c in presentes for c in requiere)
+    if sin_relacion:
+        aprueba = False
+    if aprueba and palabras < 3:
+        return None, 0.5, "rubrica: palabras clave sueltas"
+
+    reprueba = any(all(c in presentes for c in regla) for regla in rub.get("reprobar", []))
+    reprueba = reprueba or any(c in negados for c in rub.get("negados_reprueban", []))
+
+    if aprueba and not reprueba:
+        return True, CONFIANZA_APROBAR, "rubrica: cumple (la IA confirma)"
+    if reprueba and not aprueba:
+        return False, 0.9, "rubrica: contradice o niega la idea central"
+    if aprueba and reprueba:
+        return None, 0.3, "rubrica: señales mezcladas"
+    if palabras == 0:
+        return False, 0.95, "respuesta vacía"
+    if not (presentes - _CONECTORES) and palabras < 3:
+        # Misma regla que los evaluadores: menos de 3 palabras no es una idea completa
+        return False, 0.85, "respuesta demasiado corta y sin conceptos"
+    if sin_relacion:
+        return None, 0.4, "rubrica: conceptos sin la relación pedida"
+    if minimo and distintos == minimo - 1:
+        return None, 0.6, "rubrica: cumplimiento parcial"
+    return None, 0.4, "rubrica: sin evidencia suficiente"
+
+
+def decision_local(pregunta_id: str, texto: str):
+    """
+    Atajo para los evaluadores: (aprobado, feedback) si la rúbrica decide con
+    confianza suficiente (en la práctica, solo rechazos claros); None si hay que
+    consultar a la IA.
+    """
+    decision, confianza, _ = clasificar(pregunta_id, texto)
+    if decision is None or confianza < CONFIANZA_MIN:
+        return None
+    rub = RUBRICAS[pregunta_id]
+    return decision, (rub["fb_aprobado"] if decision else rub["fb_reprobado"])
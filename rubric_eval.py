@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Reporte de precisión/latencia del clasificador local de rúbricas
+#   Uso:
+#     python rubric_eval.py                  # usa rubric_eval.jsonl
+#     python rubric_eval.py --verbose        # lista los casos fallidos
+#
+#   rubric_eval.jsonl: {"pregunta", "respuesta", "etiqueta"} donde etiqueta es
+#   true/false (decisión esperada) o null (ambigua: debería ir a la IA).
+#   Solo los rechazos se deciden localmente; las aprobaciones de la rúbrica van
+#   a la IA como sugerencia y se miden aparte (no deben aprobar lo incorrecto).
+# =========================================================
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+from rubric_classifier import CONFIANZA_MIN, clasificar
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Evalúa rubric_classifier contra el set etiquetado")
+    ap.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "rubric_eval.jsonl"))
+    ap.add_argument("--repeticiones", type=int, default=200, help="Repeticiones por caso para medir latencia")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        casos = [json.loads(l) for l in f if l.strip()]
+
+    por_pregunta = {}
+    lat_us = []
+    fallos = []
+    for c in casos:
+        t0 = time.perf_counter()
+        for _ in range(args.repeticiones):
+            decision, conf, motivo = clasificar(c["pregunta"], c["respuesta"])
+        lat_us.append((time.perf_counter() - t0) / args.repeticiones * 1e6)
+
+        local = decision if (decision is not None and conf >= CONFIANZA_MIN) else None
+        sugerida = decision is True and local is None
+        s = por_pregunta.setdefault(c["pregunta"], {
+            "casos": 0, "decididos": 0, "aciertos": 0, "a_ia": 0, "ambiguos_decididos": 0,
+            "sugeridas": 0, "sugeridas_ok": 0,
+        })
+        s["casos"] += 1
+        if local is None:
+            s["a_ia"] += 1
+        else:
+            s["decididos"] += 1
+            if c["etiqueta"] is None:
+                s["ambiguos_decididos"] += 1
+            elif local == c["etiqueta"]:
+                s["aciertos"] += 1
+        if sugerida:
+            s["sugeridas"] += 1
+            s["sugeridas_ok"] += c["etiqueta"] is True
+        if (local is not None and local != c["etiqueta"]) or \
+           (sugerida and c["etiqueta"] is not True) or \
+           (c["etiqueta"] is False and local is None):
+            fallos.append((c, decision, conf, motivo))
+
+    print(f"{'pregunta':28} {'casos':>5} {'local':>6} {'a IA':>5} {'precisión local':>16} {'sugeridas ok':>13}")
+    tot = dict.fromkeys(next(iter(por_pregunta.values())), 0)
+    for q, s in por_pregunta.items():
+        etiquetados = s["decididos"] - s["ambiguos_decididos"]
+        prec = (s["aciertos"] / etiquetados * 100.0) if etiquetados else 0.0
+        print(f"{q:28} {s['casos']:>5} {s['decididos']:>6} {s['a_ia']:>5} {prec:>15.1f}% "
+              f"{s['sugeridas_ok']:>6}/{s['sugeridas']:<6}")
+        for k in tot:
+            tot[k] += s[k]
+
+    etiquetados = tot["decididos"] - tot["ambiguos_decididos"]
+    print("-" * 64)
+    print(f"Cobertura local: {tot['decididos'] / tot['casos'] * 100.0:.1f}% "
+          f"({tot['decididos']}/{tot['casos']}) · a la IA: {tot['a_ia']}")
+    print(f"Precisión en decisiones locales: {tot['aciertos'] / max(1, etiquetados) * 100.0:.1f}% "
+          f"· ambiguos decididos localmente: {tot['ambiguos_decididos']}")
+    print(f"Aprobaciones sugeridas a la IA: {tot['sugeridas']} · correctas: "
+          f"{tot['sugeridas_ok'] / max(1, tot['sugeridas']) * 100.0:.1f}%")
+    lat_sorted = sorted(lat_us)
+    print(f"Latencia por respuesta: mediana={statistics.median(lat_us):.1f} µs · "
+          f"p95={lat_sorted[int(len(lat_sorted) * 0.95) - 1]:.1f} µs · máx={lat_sorted[-1]:.1f} µs")
+
+    if args.verbose and fallos:
+        print("\nCasos mal resueltos (decisión o sugerencia errada, o rechazo que no se detectó):")
+        for c, decision, conf, motivo in fallos:
+            print(f"- [{c['pregunta']}] «{c['respuesta']}» esperado={c['etiqueta']} → {decision} ({conf:.2f}, {motivo})")
+
+
+if __name__ == "__main__":
+    main()
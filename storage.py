@@ -0,0 +1,543 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Repositorio (Mongo o embebido)
+#   Conexión cacheada, usuarios, progreso e intentos.
+#   Los helpers reciben colecciones con la API de pymongo; REPO_BACKEND elige
+#   quién las provee: "mongo" (Atlas), "memory" o "sqlite" (embedded_store,
+#   sin red: desarrollo, CI y pruebas de carga).
+# =========================================================
+
+import os
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import streamlit as st
+from pymongo.mongo_client import MongoClient
+from pymongo.server_api import ServerApi
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from attempt_stats import FACET_INDEX_KEYS, FACET_INDEX_NAME, STATS_COLLECTION, rebuild_rollup
+from attempt_writer import get_attempt_writer
+from embedded_store import EmbeddedDB
+from ia_cache import AI_CACHE_COLLECTION, AI_CACHE_TTL_DAYS
+from progress_writer import get_progress_writer
+from resources import setup_certifi
+
+# Fuerza el bundle de certificados de certifi (una vez por proceso)
+setup_certifi()
+
+# Backend del repositorio: mongo | memory | sqlite
+REPO_BACKEND = os.getenv("REPO_BACKEND", "mongo").strip().lower()
+REPO_SQLITE_PATH = os.getenv(
+    "REPO_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "accounting_local.db"),
+)
+
+# Presupuesto de conexión: si el cluster no responde en este plazo, se falla rápido
+MONGO_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+
+log = logging.getLogger("storage.startup")
+
+# Segundos que la foto de usuario (rol + progreso) de la sesión se usa sin revalidar
+USER_SNAPSHOT_TTL_S = float(os.getenv("USER_SNAPSHOT_TTL_S", "60"))
+
+# Hashing simple
+def hash_password(p: str) -> str:
+    return hashlib.sha256(("pepper123::" + p).encode("utf-8")).hexdigest()
+
+def verify_password(p: str, h: str) -> bool:
+    return hash_password(p) == h
+
+def _connect_mongo(uri: str, insecure: bool = False):
+    """
+    Crea un MongoClient con TLS y CA de certifi.
+    Si insecure=True, permite certificados inválidos (solo desarrollo).
+    """
+    kwargs = dict(
+        server_api=ServerApi('1'),
+        tls=True,
+        tlsCAFile=setup_certifi(),
+        socketTimeoutMS=30000,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SELECTION_TIMEOUT_MS,
+        retryReads=True,
+        retryWrites=True,
+    )
+    if insecure:
+        kwargs["tlsAllowInvalidCertificates"] = True
+    return MongoClient(uri, **kwargs)
+
+def _ping(uri: str, insecure: bool):
+    t0 = time.perf_counter()
+    client = _connect_mongo(uri, insecure=insecure)
+    try:
+        client.admin.command('ping')
+    except Exception:
+        client.close()
+        raise
+    return client, (time.perf_counter() - t0) * 1000.0
+
+def _connect_fast(uri: str, report: dict):
+    """
+    Prueba la conexión segura y la de respaldo (certificados inválidos) EN PARALELO,
+    cada una con el presupuesto corto de selección de servidor. Se prefiere la
+    segura; la otra solo se usa si la segura falla.
+    """
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mongo-connect")
+    seguro = pool.submit(_ping, uri, False)
+    respaldo = pool.submit(_ping, uri, True)
+    pool.shutdown(wait=False)
+    try:
+        client, ms = seguro.result()
+        report["modo_tls"] = "seguro"
+        # El cliente de respaldo no se usa: se cierra cuando termine de conectar
+        respaldo.add_done_callback(lambda f: f.exception() is None and f.result()[0].close())
+    except Exception as e:
+        report["error_seguro"] = str(e)[:200]
+        client, ms = respaldo.result()  # si también falla, el error sube a main()
+        report["modo_tls"] = "inseguro"
+    report["conexion_ms"] = ms
+    return client
+
+@st.cache_resource(show_spinner=False)
+def get_startup_report() -> dict:
+    """Tiempos del arranque (conexión + tareas en segundo plano) de este proceso."""
+    return {"estado": "sin iniciar"}
+
+def _medir(report: dict, paso: str, fn):
+    t0 = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        report.setdefault("errores", {})[paso] = str(e)[:200]
+    report[f"{paso}_ms"] = (time.perf_counter() - t0) * 1000.0
+
+def _startup_tasks(db, users_col, progress_col, attempts_col, admin_user: str, admin_pass: str, report: dict):
+    """Siembra del admin, índices y rollup: idempotente, fuera del camino del login."""
+    t0 = time.perf_counter()
+
+    def sembrar_admin():
+        try:
+            users_col.update_one(
+                {"username": admin_user},
+                {"$setOnInsert": {
+                    "username": admin_user,
+                    "password_hash": hash_password(admin_pass),
+                    "role": "admin",
+                    "created_at": datetime.now(timezone.utc),
+                }},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass  # otro proceso lo creó al mismo tiempo
+
+    def indices():
+        users_col.create_index("username", unique=True)
+        users_col.create_index([("role", 1), ("username", 1)])  # filtro por rol en el panel admin
+        progress_col.create_index("username", unique=True)
+        attempts_col.create_index([("username", 1), ("level", 1), ("created_at", -1)])
+        attempts_col.create_index([("created_at", -1)])  # "últimos 25" del panel
+        attempts_col.create_index(FACET_INDEX_KEYS, name=FACET_INDEX_NAME)  # backend de estadísticas "facet"
+        # Caché de calificaciones IA: Mongo borra las entradas vencidas (TTL)
+        db[AI_CACHE_COLLECTION].create_index("created_at", expireAfterSeconds=AI_CACHE_TTL_DAYS * 86400)
+
+    def rollup():
+        # Primera vez con el rollup de estadísticas: se arma desde los intentos existentes
+        if db[STATS_COLLECTION].estimated_document_count() == 0 and attempts_col.estimated_document_count() > 0:
+            rebuild_rollup(db, pausa=get_attempt_writer().pausado())
+
+    _medir(report, "admin", sembrar_admin)
+    _medir(report, "indices", indices)
+    _medir(report, "rollup", rollup)
+    report["segundo_plano_ms"] = (time.perf_counter() - t0) * 1000.0
+    report["estado"] = "listo" if not report.get("errores") else "listo con errores"
+    log.info("arranque: %s", {k: (round(v) if isinstance(v, float) else v) for k, v in report.items()})
+
+def _open_collections(db):
+    users_col    = db["users"]
+    progress_col = db["progress"]
+    # attempts con w=1: las escrituras salen en lotes desde attempt_writer, fuera del hilo de UI
+    attempts_col = db.get_collection("attempts").with_options(write_concern=WriteConcern(w=1))
+    return users_col, progress_col, attempts_col
+
+# ---------- Versión cacheada de la conexión ----------
+@st.cache_resource(show_spinner=False)
+def repo_init_cached(uri: str, admin_user: str, admin_pass: str):
+    report = get_startup_report()
+    report.clear()
+    report["estado"] = "conectando"
+    t0 = time.perf_counter()
+    client = _connect_fast(uri, report)
+
+    db = client["accounting_app"]
+    users_col, progress_col, attempts_col = _open_collections(db)
+    report["bloqueante_ms"] = (time.perf_counter() - t0) * 1000.0
+    report["estado"] = "tareas en segundo plano"
+
+    threading.Thread(
+        target=_startup_tasks,
+        args=(db, users_col, progress_col, attempts_col, admin_user, admin_pass, report),
+        name="repo-startup",
+        daemon=True,
+    ).start()
+
+    return db, users_col, progress_col, attempts_col
+
+@st.cache_resource(show_spinner=False)
+def repo_init_embedded(backend: str, sqlite_path: str | None, admin_user: str, admin_pass: str):
+    """Mismo contrato que repo_init_cached, con el almacén embebido (memoria o SQLite)."""
+    report = get_startup_report()
+    report.clear()
+    t0 = time.perf_counter()
+    db = EmbeddedDB(sqlite_path if backend == "sqlite" else None)
+    users_col, progress_col, attempts_col = _open_collections(db)
+    report["modo_tls"] = f"embebido ({backend})"
+    report["conexion_ms"] = (time.perf_counter() - t0) * 1000.0
+    # Sin red las tareas de arranque son instantáneas: se hacen en línea
+    _startup_tasks(db, users_col, progress_col, attempts_col, admin_user, admin_pass, report)
+    report["bloqueante_ms"] = (time.perf_counter() - t0) * 1000.0
+    return db, users_col, progress_col, attempts_col
+
+def _admin_credentials():
+    try:
+        return st.secrets["admin"]["username"], st.secrets["admin"]["password"]
+    except Exception:
+        return "admin", "AdminSeguro#2025"
+
+def repo_init():
+    """
+    Abre el repositorio cacheado y retorna (db, users_col, progress_col, attempts_col).
+    """
+    admin_user, admin_pass = _admin_credentials()
+    if REPO_BACKEND in ("memory", "sqlite"):
+        return repo_init_embedded(REPO_BACKEND, REPO_SQLITE_PATH, admin_user, admin_pass)
+    if REPO_BACKEND != "mongo":
+        raise RuntimeError(f"REPO_BACKEND desconocido: '{REPO_BACKEND}' (usa mongo, memory o sqlite).")
+
+    uri = None
+    try:
+        uri = st.secrets["mongodb"]["uri"]
+    except Exception:
+        uri = os.getenv("MONGODB_URI")
+
+    if not uri:
+        raise RuntimeError("No encuentro la URI de MongoDB. Define [mongodb].uri en secrets.toml o MONGODB_URI en el entorno.")
+
+    return repo_init_cached(uri, admin_user, admin_pass)
+
+# --------- PROGRESO (Gamificación) ----------
+def _default_progress_doc(username: str) -> dict:
+    return {
+        "username": username,
+        "levels": {
+            "level1": {"passed": False, "date": None, "score": None},
+            "level2": {"passed": False, "date": None, "score": None},
+            "level3": {"passed": False, "date": None, "score": None},
+            "level4": {"passed": False, "date": None, "score": None},
+        },
+        "current_level": None,
+        "drafts": {
+            "level1": {},
+            "level2": {},
+            "level3": {},
+            "level4": {}
+        },
+        "completed_survey": False,
+        "updated_at": datetime.now(timezone.utc),
+        "created_at": datetime.now(timezone.utc),
+    }
+
+def ensure_progress(progress_col, username: str) -> dict:
+    doc = progress_col.find_one({"username": username})
+    if doc is None:
+        doc = _default_progress_doc(username)
+        progress_col.insert_one(doc)
+    return doc
+
+def load_progress(progress_col, username: str) -> dict:
+    return ensure_progress(progress_col, username)
+
+# current_level ya persistido en esta sesión: (username, level_key)
+_NIVEL_PERSISTIDO_KEY = "_current_level_persistido"
+
+def remember_current_level(username: str, level_key: str | None):
+    """Anota en la sesión el current_level que ya está en Mongo para este usuario."""
+    try:
+        st.session_state[_NIVEL_PERSISTIDO_KEY] = (username, level_key)
+    except Exception:
+        pass
+
+def _nivel_persistido(username: str):
+    try:
+        guardado = st.session_state.get(_NIVEL_PERSISTIDO_KEY)
+    except Exception:
+        return None, False
+    if guardado and guardado[0] == username:
+        return guardado[1], True
+    return None, False
+
+def set_level_passed(progress_col, username: str, level_key: str, score: int | None):
+    now = datetime.now(timezone.utc)
+    get_progress_writer().descartar(progress_col, username)
+    progress_col.update_one(
+        {"username": username},
+        {
+            "$set": {
+                f"levels.{level_key}.passed": True,
+                f"levels.{level_key}.date": now,
+                f"levels.{level_key}.score": score,
+                "current_level": None,
+                "updated_at": now,
+            },
+            "$unset": {
+                f"drafts.{level_key}": ""
+            }
+        },
+        upsert=True
+    )
+    remember_current_level(username, None)
+    invalidate_user_snapshot(username)
+
+def save_partial_progress(progress_col, username: str, level_key: str, payload: dict):
+    now = datetime.now(timezone.utc)
+    get_progress_writer().descartar(progress_col, username)
+    progress_col.update_one(
+        {"username": username},
+        {
+            "$set": {
+                f"drafts.{level_key}": payload,
+                "current_level": level_key,
+                "updated_at": now,
+            }
+        },
+        upsert=True
+    )
+    remember_current_level(username, level_key)
+
+def load_partial_progress(progress_col, username: str, level_key: str) -> dict:
+    doc = progress_col.find_one(
+        {"username": username},
+        {f"drafts.{level_key}": 1, "_id": 0}
+    ) or {}
+    return doc.get("drafts", {}).get(level_key, {})
+
+def clear_partial_progress(progress_col, username: str, level_key: str):
+    now = datetime.now(timezone.utc)
+    progress_col.update_one(
+        {"username": username},
+        {
+            "$unset": {f"drafts.{level_key}": ""},
+            "$set": {"updated_at": now}
+        },
+        upsert=True
+    )
+
+def set_current_level(progress_col, username: str, level_key: str | None):
+    """
+    Marca el nivel actual. Las páginas lo llaman en cada rerun: si la sesión ya
+    lo persistió no se escribe nada; si cambió, la escritura va en segundo plano.
+    """
+    writer = get_progress_writer()
+    actual, conocido = _nivel_persistido(username)
+    if conocido and actual == level_key:
+        writer.contar_evitada()
+        return
+    remember_current_level(username, level_key)
+    writer.encolar(progress_col, username, level_key)
+
+def set_completed_survey(progress_col, username: str, value: bool = True):
+    now = datetime.now(timezone.utc)
+    progress_col.update_one(
+        {"username": username},
+        {"$set": {"completed_survey": value, "updated_at": now}},
+        upsert=True
+    )
+
+# --------- FOTO DE USUARIO POR SESIÓN ----------
+# Rol y progreso del usuario logueado, guardados en la sesión para que el
+# sidebar y el router no consulten Mongo en cada rerun. Se revalida cada
+# USER_SNAPSHOT_TTL_S o cuando un helper de escritura sube la versión del usuario
+# (la versión es del proceso, así también se entera la sesión del afectado).
+_SNAPSHOT_KEY = "user_snapshot"
+
+@st.cache_resource(show_spinner=False)
+def _snapshot_versions():
+    return {"lock": threading.Lock(), "v": {}}
+
+def _snapshot_version(username: str) -> int:
+    vs = _snapshot_versions()
+    with vs["lock"]:
+        return vs["v"].get(username, 0)
+
+def invalidate_user_snapshot(username: str):
+    """Marca como vencida la foto de ese usuario en todas las sesiones del proceso."""
+    vs = _snapshot_versions()
+    with vs["lock"]:
+        vs["v"][username] = vs["v"].get(username, 0) + 1
+
+def store_user_snapshot(username: str, user_doc: dict | None, progress_doc: dict | None) -> dict:
+    """Guarda en la sesión la foto armada con documentos ya leídos (p. ej. en el login)."""
+    user_doc = user_doc or {}
+    progress_doc = progress_doc or {}
+    snap = {
+        "username": username,
+        "role": user_doc.get("role", "user"),
+        "levels": progress_doc.get("levels", {}),
+        "current_level": progress_doc.get("current_level"),
+        "version": _snapshot_version(username),
+        "loaded_at": time.monotonic(),
+    }
+    st.session_state[_SNAPSHOT_KEY] = snap
+    return snap
+
+def get_user_snapshot(users_col, progress_col, username: str) -> dict:
+    """
+    Foto vigente de la sesión; solo vuelve a Mongo si no hay, es de otro usuario,
+    venció el TTL o fue invalidada.
+    """
+    snap = st.session_state.get(_SNAPSHOT_KEY)
+    if (snap is not None
+            and snap["username"] == username
+            and snap["version"] == _snapshot_version(username)
+            and time.monotonic() - snap["loaded_at"] < USER_SNAPSHOT_TTL_S):
+        return snap
+
+    user_doc = None
+    if users_col is not None and username:
+        user_doc = users_col.find_one({"username": username}, {"role": 1, "_id": 0})
+    progress_doc = load_progress(progress_col, username) if progress_col is not None else None
+    return store_user_snapshot(username, user_doc, progress_doc)
+
+# --------- ATTEMPTS (Estadísticas) ----------
+def record_attempt(username: str, level: int, score: int | None, passed: bool):
+    """
+    Registra cada validación de evaluación que haga el estudiante.
+    level: 1..4
+    score: aciertos (p.ej. 0..3)
+    passed: True/False
+    """
+    attempts_col = st.session_state.get("attempts_col")
+
+    # ⬅️ Importante: NO usar la colección en contexto booleano.
+    if attempts_col is None or not username:
+        return
+
+    try:
+        # Se encola; el writer del proceso lo inserta en lote (o lo guarda en disco si Mongo cae)
+        get_attempt_writer().encolar(attempts_col, {
+            "username": username,
+            "level": int(level),
+            "score": int(score) if score is not None else None,
+            "passed": bool(passed),
+            "created_at": datetime.now(timezone.utc)
+        })
+    except Exception:
+        # No bloquear UI si falla el log
+        pass
+
+
+# --------- USERS (CRUD) ----------
+def verify_credentials(users_col, username: str, password: str):
+    if users_col is None:
+        return None
+    doc = users_col.find_one({"username": username})
+    if not doc:
+        return None
+    if verify_password(password, doc.get("password_hash", "")):
+        return doc
+    return None
+
+def create_user(users_col, progress_col, username: str, password: str, role: str = "user"):
+    users_col.insert_one({
+        "username": username.strip().lower(),
+        "password_hash": hash_password(password),
+        "role": role,
+        "created_at": datetime.now(timezone.utc)
+    })
+    if progress_col is not None:
+        try:
+            progress_col.insert_one(_default_progress_doc(username.strip().lower()))
+        except Exception:
+            pass
+
+def validate_new_user(username: str, password: str, role: str = "user") -> str | None:
+    """Mensaje de error si los datos no sirven para crear la cuenta; None si están bien."""
+    if not username or len(username) < 3 or " " in username:
+        return "Usuario inválido. Debe tener al menos 3 caracteres y sin espacios."
+    if not password or len(password) < 4:
+        return "Contraseña demasiado corta (mínimo 4)."
+    if role not in ("user", "admin"):
+        return f"Rol inválido: '{role}' (usa user o admin)."
+    return None
+
+def bulk_create_users(users_col, progress_col, rows: list, chunk_size: int = 500) -> list:
+    """
+    Alta masiva: rows = [{"username", "password", "role"}] ya validadas y sin
+    repetidos. Una consulta $in por bloque para descartar existentes, luego
+    insert_many(ordered=False) de usuarios y de sus documentos de progreso.
+    Devuelve [(username, ok, mensaje)] en el orden de entrada.
+    """
+    resultado = {}
+    for i in range(0, len(rows), chunk_size):
+        bloque = rows[i:i + chunk_size]
+        nombres = [r["username"] for r in bloque]
+        existentes = {u["username"] for u in users_col.find({"username": {"$in": nombres}}, {"username": 1, "_id": 0})}
+        ahora = datetime.now(timezone.utc)
+        nuevos = []
+        for r in bloque:
+            if r["username"] in existentes:
+                resultado[r["username"]] = (False, "Ya existe.")
+            else:
+                nuevos.append({
+                    "username": r["username"],
+                    "password_hash": hash_password(r["password"]),
+                    "role": r.get("role") or "user",
+                    "created_at": ahora,
+                })
+        if not nuevos:
+            continue
+
+        fallidos = {}
+        try:
+            users_col.insert_many(nuevos, ordered=False)
+        except BulkWriteError as e:
+            for err in (e.details or {}).get("writeErrors", []):
+                dup = err.get("code") == 11000
+                fallidos[err["index"]] = "Ya existe." if dup else err.get("errmsg", "Error al insertar.")
+        creados = []
+        for idx, doc in enumerate(nuevos):
+            if idx in fallidos:
+                resultado[doc["username"]] = (False, fallidos[idx])
+            else:
+                resultado[doc["username"]] = (True, "Creado.")
+                creados.append(doc["username"])
+
+        if progress_col is not None and creados:
+            try:
+                progress_col.insert_many([_default_progress_doc(u) for u in creados], ordered=False)
+            except BulkWriteError:
+                pass  # progreso ya existente (p. ej. cuenta borrada y recreada): se conserva
+
+    return [(r["username"],) + resultado[r["username"]] for r in rows]
+
+def update_user(users_col, username: str, new_password: str | None, new_role: str | None):
+    update = {}
+    if new_password:
+        update["password_hash"] = hash_password(new_password)
+    if new_role:
+        update["role"] = new_role
+    if update:
+        users_col.update_one({"username": username}, {"$set": update})
+        invalidate_user_snapshot(username)
+
+def delete_user(users_col, progress_col, username: str):
+    users_col.delete_one({"username": username})
+    if progress_col is not None:
+        progress_col.delete_many({"username": username})
+    invalidate_user_snapshot(username)
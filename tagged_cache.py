@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Caché con etiquetas para datos del panel admin
+#   Reemplaza st.cache_data.clear() (que borra TODO el caché del proceso,
+#   incluidas las soluciones cacheadas de los niveles de cada estudiante):
+#   - Cada función declara etiquetas: @tagged_cache("users", ttl=15).
+#   - invalidate("users") borra solo las entradas con esa etiqueta.
+#   - Contadores por etiqueta: aciertos, fallos, desalojos (TTL, tamaño o
+#     invalidación) y entradas vivas.
+#   Como st.cache_data, los argumentos con guion bajo no se hashean y se
+#   devuelve una copia del valor; si son colecciones (tienen full_name, como
+#   las de pymongo o las embebidas) la clave sí incluye ese nombre, así dos
+#   colecciones distintas nunca comparten entrada.
+# =========================================================
+
+import copy
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+TAGGED_CACHE_MAX_ENTRIES = int(os.getenv("TAGGED_CACHE_MAX_ENTRIES", "512"))
+
+
+class TaggedCache:
+    def __init__(self, max_entries: int = TAGGED_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # clave -> (vence, tags, valor)
+        self._stats = {}                 # tag -> {"hits", "misses", "evictions", "invalidations"}
+
+    def _st(self, tag) -> dict:
+        s = self._stats.get(tag)
+        if s is None:
+            s = self._stats[tag] = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        return s
+
+    def _desalojar(self, clave):
+        _, tags, _ = self._entradas.pop(clave)
+        for t in tags:
+            self._st(t)["evictions"] += 1
+
+    def get(self, clave, tags):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] is not None and entrada[0] <= time.monotonic():
+                self._desalojar(clave)
+                entrada = None
+            for t in tags:
+                self._st(t)["hits" if entrada is not None else "misses"] += 1
+            if entrada is None:
+                return False, None
+            self._entradas.move_to_end(clave)
+            return True, entrada[2]
+
+    def put(self, clave, tags, valor, ttl: float | None):
+        with self._lock:
+            vence = None if ttl is None else time.monotonic() + ttl
+            self._entradas[clave] = (vence, tags, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entries:
+                self._desalojar(next(iter(self._entradas)))
+
+    def invalidate(self, *tags) -> int:
+        """Borra las entradas que tengan alguna de las etiquetas; devuelve cuántas."""
+        objetivo = set(tags)
+        with self._lock:
+            for t in objetivo:
+                self._st(t)["invalidations"] += 1
+            claves = [c for c, (_, ts, _) in self._entradas.items() if objetivo.intersection(ts)]
+            for c in claves:
+                self._desalojar(c)
+            return len(claves)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            vivas = {}
+            for _, ts, _ in self._entradas.values():
+                for t in ts:
+                    vivas[t] = vivas.get(t, 0) + 1
+            filas = []
+            for tag, s in sorted(self._stats.items()):
+                total = s["hits"] + s["misses"]
+                filas.append({
+                    "etiqueta": tag,
+                    "entradas": vivas.get(tag, 0),
+                    "aciertos": s["hits"],
+                    "fallos": s["misses"],
+                    "tasa_acierto_%": round(s["hits"] / total * 100.0, 1) if total else 0.0,
+                    "desalojos": s["evictions"],
+                    "invalidaciones": s["invalidations"],
+                })
+            return filas
+
+
+@st.cache_resource(show_spinner=False)
+def get_tagged_cache() -> TaggedCache:
+    return TaggedCache()
+
+
+def _parte_clave(nombre: str, valor):
+    if not nombre.startswith("_"):
+        return (nombre, repr(valor))
+    # Sin hashear: de una colección solo cuenta a qué base y colección apunta
+    full_name = getattr(valor, "full_name", None)
+    return (nombre, full_name) if isinstance(full_name, str) else None
+
+
+def tagged_cache(*tags, ttl: float | None = None):
+    """
+    Decorador: cachea el resultado por los argumentos reales de la llamada
+    (los que empiezan con '_' solo aportan su full_name, si lo tienen).
+    """
+    tags = tuple(tags)
+
+    def deco(fn):
+        firma = inspect.signature(fn)
+        nombre = f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            ligados = firma.bind(*args, **kwargs)
+            ligados.apply_defaults()
+            partes = (_parte_clave(k, v) for k, v in ligados.arguments.items())
+            clave = (nombre,) + tuple(p for p in partes if p is not None)
+            cache = get_tagged_cache()
+            hit, valor = cache.get(clave, tags)
+            if not hit:
+                valor = fn(*args, **kwargs)
+                cache.put(clave, tags, valor, ttl)
+            return copy.deepcopy(valor)
+        return wrapper
+    return deco
+
+
+def invalidate(*tags) -> int:
+    return get_tagged_cache().invalidate(*tags)
+
+
+def cache_tag_stats() -> list:
+    return get_tagged_cache().snapshot()
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# =========================================================
+#   Utilidades UI compartidas
+#   Formatos, lectura en voz alta, confeti y pantalla de celebración.
+# =========================================================
+
+import os
+
+import numpy as np
+import streamlit as st
+import streamlit.components.v1 as components
+
+# ===========================
+# Utilidades UI
+# ===========================
+def fmt(v, dec=1):
+    """Formato ES para miles y coma decimal."""
+    if isinstance(v, (int, np.integer)) or (isinstance(v, float) and abs(v - int(v)) < 1e-12):
+        try:
+            s = f"{int(round(v)):,}".replace(",", ".")
+            return s
+        except Exception:
+            return str(v)
+    try:
+        s = f"{v:,.{dec}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        return s
+    except Exception:
+        return str(v)
+
+def peso(v):
+    return f"${fmt(v,2)}"
+
+def speak_block(texto: str, key_prefix: str, lang_hint="es"):
+    """
+    Control TTS del navegador con selector de voz + velocidad + tono.
+    (Web Speech API del navegador) — Montaje perezoso vía expander.
+    """
+    escaped = (
+        texto.replace("\\", "\\\\")
+             .replace("`", "\\`")
+             .replace("\n", "\\n")
+             .replace('"', '\\"')
+    )
+    html = f"""
+    <div style="padding:8px;border:1px solid #eee;border-radius:10px;margin-bottom:8px;">
+      <div style="display:flex;gap:8px;align-items:center;flex-wrap:wrap;">
+        <label for="{key_prefix}-voice">Voz:</label>
+        <select id="{key_prefix}-voice"></select>
+
+        <label for="{key_prefix}-rate">Velocidad:</label>
+        <input id="{key_prefix}-rate" type="range" min="0.7" max="1.3" step="0.05" value="1.0" />
+
+        <label for="{key_prefix}-pitch">Tono:</label>
+        <input id="{key_prefix}-pitch" type="range" min="0.7" max="1.3" step="0.05" value="1.0" />
+
+        <button id="{key_prefix}-play">🔊 Escuchar</button>
+        <button id="{key_prefix}-pause">⏸️ Pausar</button>
+        <button id="{key_prefix}-stop">⏹️ Detener</button>
+      </div>
+      <small>Tip: prueba voces como <em>Google español</em> o <em>Microsoft Sabina</em>. Algunas respetan mejor velocidad y tono.</small>
+    </div>
+    <script>
+      (function() {{
+        const text = "{escaped}";
+        const langHint = "{lang_hint}".toLowerCase();
+        const sel = document.getElementById("{key_prefix}-voice");
+        const rate = document.getElementById("{key_prefix}-rate");
+        const pitch = document.getElementById("{key_prefix}-pitch");
+        const btnPlay = document.getElementById("{key_prefix}-play");
+        const btnPause = document.getElementById("{key_prefix}-pause");
+        const btnStop = document.getElementById("{key_prefix}-stop");
+
+        function populateVoices() {{
+          const voices = window.speechSynthesis.getVoices();
+          sel.innerHTML = "";
+          const score = (v) => {{
+            const n = (v.name + " " + v.lang).toLowerCase();
+            let s = 0;
+            if (n.includes("es")) s += 5;
+            if (n.includes("spanish")) s += 4;
+            if (n.includes("mex")) s += 3;
+            if (n.includes("col")) s += 3;
+            if (n.includes("sabina")) s += 3;
+            if (n.includes("google")) s += 2;
+            if (n.includes(langHint)) s += 2;
+            return s;
+          }};
+          const sorted = voices.slice().sort((a,b)=>score(b)-score(a));
+          sorted.forEach((v, i) => {{
+            const opt = document.createElement("option");
+            opt.value = voices.indexOf(v);
+            opt.textContent = v.name + " (" + v.lang + ")";
+            sel.appendChild(opt);
+          }});
+        }}
+
+        populateVoices();
+        if (typeof speechSynthesis !== "undefined") {{
+          speechSynthesis.onvoiceschanged = populateVoices;
+        }}
+
+        btnPlay.onclick = () => {{
+          try {{
+            if (speechSynthesis.speaking) speechSynthesis.cancel();
+            const voices = window.speechSynthesis.getVoices();
+            const idx = parseInt(sel.value, 10);
+            const u = new SpeechSynthesisUtterance(text);
+            if (!isNaN(idx) && voices[idx]) {{
+              u.voice = voices[idx];
+            }}
+            u.rate = parseFloat(rate.value);
+            u.pitch = parseFloat(pitch.value);
+            speechSynthesis.speak(u);
+            btnPause.textContent = "⏸️ Pausar";
+          }} catch (e) {{}}
+        }};
+
+        btnPause.onclick = () => {{
+          try {{
+            if (!speechSynthesis.speaking && !speechSynthesis.paused) return;
+            if (speechSynthesis.paused) {{
+              speechSynthesis.resume();
+              btnPause.textContent = "⏸️ Pausar";
+            }} else {{
+              speechSynthesis.pause();
+              btnPause.textContent = "▶️ Reanudar";
+            }}
+          }} catch (e) {{}}
+        }};
+
+        btnStop.onclick = () => {{
+          try {{
+            speechSynthesis.cancel();
+            btnPause.textContent = "⏸️ Pausar";
+          }} catch (e) {{}}
+        }};
+      }})();
+    </script>
+    """
+    components.html(html, height=160)
+
+# ===========================
+# Config encuesta
+# ===========================
+SURVEY_URL = os.getenv("SURVEY_URL", "https://forms.cloud.microsoft/r/gjyYwHDxwh")
+
+# ===========================
+# Pantalla de Celebración (aparte) — liviana
+# ===========================
+def confetti_block(duration_ms: int = 3500, height_px: int = 320):
+    """
+    Confeti y 'globos' simples 100% inline (sin CDNs) — parámetros reducidos.
+    """
+    try:
+        st.balloons()
+    except Exception:
+        pass
+
+    html = f"""
+    <div id="confetti-wrapper" style="position:relative;width:100%;height:{height_px-10}px;overflow:hidden;border-radius:12px;border:1px solid #eee;background:transparent;">
+      <canvas id="confetti-canvas" style="position:absolute;inset:0;width:100%;height:100%;"></canvas>
+    </div>
+    <script>
+    (function() {{
+      const wrapper = document.getElementById('confetti-wrapper');
+      const canvas = document.getElementById('confetti-canvas');
+      const ctx = canvas.getContext('2d');
+
+      function resize() {{
+        const r = wrapper.getBoundingClientRect();
+        canvas.width = Math.max(200, r.width);
+        canvas.height = Math.max(120, r.height);
+      }}
+      resize();
+      if (typeof ResizeObserver !== 'undefined') {{
+        new ResizeObserver(resize).observe(wrapper);
+      }} else {{
+        window.addEventListener('resize', resize);
+      }}
+
+      const colors = ['#ff6b6b','#ffd93d','#6BCB77','#4D96FF','#845EC2','#FF9671','#FFC75F'];
+      const rand = (a,b)=>a+Math.random()*(b-a);
+      const pick = (arr)=>arr[Math.floor(Math.random()*arr.length)];
+
+      const pieces = [];
+      const N = 90;  // antes 180
+      for (let i=0;i<N;i++) {{
+        pieces.push({{
+          type: Math.random()<0.4 ? 'tri' : 'rect',
+          x: Math.random()*canvas.width,
+          y: rand(-canvas.height, 0),
+          w: rand(6, 12),
+          h: rand(8, 18),
+          r: rand(0, Math.PI*2),
+          vr: rand(-0.1, 0.1),
+          vx: rand(-0.6, 0.6),
+          vy: rand(1.8, 3.2),
+          color: pick(colors),
+          alpha: rand(0.85, 1)
+        }});
+      }}
+
+      const balloons = [];
+      for (let i=0;i<4;i++) {{
+        balloons.push({{
+          x: Math.random()*canvas.width,
+          y: canvas.height + rand(20, 120),
+          r: rand(14, 22),
+          vy: rand(0.4, 0.8),
+          color: pick(colors)
+        }});
+      }}
+
+      function burst(x, y, count=22) {{
+        for (let i=0;i<count;i++) {{
+          pieces.push({{
+            type: Math.random()<0.5 ? 'tri' : 'rect',
+            x, y,
+            w: rand(5, 10),
+            h: rand(6, 14),
+            r: rand(0, Math.PI*2),
+            vr: rand(-0.2, 0.2),
+            vx: rand(-3, 3),
+            vy: rand(-3, 1),
+            color: pick(colors),
+            alpha: 1
+          }});
+        }}
+      }}
+      burst(canvas.width*0.5, canvas.height*0.3);
+      burst(canvas.width*0.2, canvas.height*0.2);
+      burst(canvas.width*0.8, canvas.height*0.25);
+
+      const start = performance.now();
+      (function draw(now){{
+        const elapsed = now - start;
+        ctx.clearRect(0,0,canvas.width,canvas.height);
+
+        for (const p of pieces) {{
+          p.x += p.vx + Math.sin(p.y*0.02)*0.2;
+          p.y += p.vy;
+          p.r += p.vr;
+
+          if (p.y > canvas.height + 20) {{
+            p.y = -20;
+            p.x = Math.random()*canvas.width;
+            p.vx = rand(-0.6, 0.6);
+            p.vy = rand(1.8, 3.2);
+            p.r = rand(0, Math.PI*2);
+            p.color = pick(colors);
+            p.alpha = rand(0.85, 1);
+          }}
+
+          ctx.save();
+          ctx.globalAlpha = p.alpha;
+          ctx.translate(p.x, p.y);
+          ctx.rotate(p.r);
+          ctx.fillStyle = p.color;
+
+          if (p.type === 'rect') {{
+            ctx.fillRect(-p.w/2, -p.h/2, p.w, p.h);
+          }} else {{
+            ctx.beginPath();
+            ctx.moveTo(0, -p.h/2);
+            ctx.lineTo(-p.w/2, p.h/2);
+            ctx.lineTo(p.w/2, p.h/2);
+            ctx.closePath();
+            ctx.fill();
+          }}
+          ctx.restore();
+        }}
+
+        for (const b of balloons) {{
+          b.y -= b.vy;
+          if (b.y + b.r < -30) {{
+            b.y = canvas.height + rand(30, 120);
+            b.x = Math.random()*canvas.width;
+            b.vy = rand(0.4, 0.8);
+            b.color = pick(colors);
+          }}
+          ctx.beginPath();
+          ctx.fillStyle = b.color;
+          ctx.arc(b.x, b.y, b.r, 0, Math.PI*2);
+          ctx.fill();
+          ctx.beginPath();
+          ctx.strokeStyle = '#888';
+          ctx.moveTo(b.x, b.y + b.r);
+          ctx.lineTo(b.x, b.y + b.r + 26);
+          ctx.stroke();
+        }}
+
+        if (elapsed < {duration_ms}) {{
+          requestAnimationFrame(draw);
+        }}
+      }})(performance.now());
+    }})();
+    </script>
+    """
+    components.html(html, height=height_px)
+
+def start_celebration(message_md: str, next_label: str, next_key_value: str):
+    st.session_state["celebrate_active"] = True
+    st.session_state["celebrate_message"] = message_md
+    st.session_state["celebrate_next_label"] = next_label
+    st.session_state["celebrate_next_key"] = next_key_value
+    st.rerun()
+
+def celebration_screen():
+    if not st.session_state.get("celebrate_active"):
+        return False
+
+    st.markdown("# 🎉 ¡Lo lograste!")
+    confetti_block(duration_ms=3500, height_px=320)
+
+    msg = st.session_state.get("celebrate_message", "¡Felicidades!")
+    st.markdown(
+        f"""
+        <div style="margin-top:10px;margin-bottom:16px;padding:16px;border:1px solid #eee;border-radius:12px;background:#fffaf0">
+          <div style="font-size:1.1rem;line-height:1.6">{msg}</div>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+
+    score_text = st.session_state.get("celebrate_score_text")
+    answers_title = st.session_state.get("celebrate_answers_title")
+    answers = st.session_state.get("celebrate_answers", [])
+
+    if score_text:
+        st.info(f"Resultado final: {score_text}")
+
+    if answers:
+        with st.expander(answers_title or "Ver respuestas correctas"):
+            for ans in answers:
+                st.write(ans)    
+
+    col1, col2, col3 = st.columns([1,2,1])
+    with col2:
+        label = st.session_state.get("celebrate_next_label", "siguiente nivel")
+        if st.button(f"➡️ Ir al {label}", key="celebrate_go_next_btn", use_container_width=True):
+            next_key = st.session_state.get("celebrate_next_key")
+            if next_key:
+                st.session_state["sidebar_level_select"] = next_key
+            st.session_state["celebrate_active"] = False
+            st.session_state["celebrate_message"] = ""
+            st.session_state["celebrate_next_label"] = ""
+            st.session_state["celebrate_next_key"] = ""
+            st.session_state["celebrate_score_text"] = ""
+            st.session_state["celebrate_answers_title"] = ""
+            st.session_state["celebrate_answers"] = []
+            st.rerun()
+    return True